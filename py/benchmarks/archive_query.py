@@ -0,0 +1,111 @@
+"""Benchmark of writing a result archive and querying it.
+
+A `DetectionData` of N synthetic detections is written as an archive,
+which is then opened and queried by ID, by detection type and by (level, detection type).
+It reports the wall time of writing and opening the archive, its size,
+the mean time of each kind of lookup, and the growth of the peak RSS caused by opening and querying,
+which should be small since the archive is not loaded into memory.
+
+usage:
+    PYTHONPATH=src python benchmarks/archive_query.py --detections 100000 1000000
+"""
+
+import argparse
+import os
+import random
+import resource
+import tempfile
+import time
+import typing as t
+
+from validb import DetectionData, EmbeddedVariables, ResultArchive, TextDetected
+
+NO_VARS = EmbeddedVariables((), {})
+TYPES = 10
+LOOKUPS = 1000
+
+
+def detection_data(n: int) -> DetectionData[str, str, str]:
+    """n detections of n // 2 IDs, each detected by two detection types"""
+    data: DetectionData[str, str, str] = DetectionData(max_detection=None)
+    for i in range(n):
+        data.append(
+            TextDetected(
+                f"{i // 2:012d}", i % 3, f"TYPE_{i % TYPES}", f"anomaly {i}", NO_VARS
+            )
+        )
+    return data
+
+
+def peak_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def mean_usec(lookup: t.Callable[[int], int], keys: t.Sequence[int]) -> float:
+    started = time.perf_counter()
+    for key in keys:
+        lookup(key)
+    return (time.perf_counter() - started) / len(keys) * 1e6
+
+
+def run(n: int, workdir: str) -> t.Dict[str, float]:
+    path = os.path.join(workdir, f"archive_{n}.result")
+    data = detection_data(n)
+    started = time.perf_counter()
+    ResultArchive.write(path, data)
+    write_elapsed = time.perf_counter() - started
+    del data
+
+    keys = [random.randrange(n // 2) for _ in range(LOOKUPS)]
+    rss_before = peak_rss_mib()
+    started = time.perf_counter()
+    with ResultArchive(path) as archive:
+        open_elapsed = time.perf_counter() - started
+        # the detections are read, not only counted
+        by_id = mean_usec(lambda key: len(list(archive.of_id(f"{key:012d}"))), keys)
+        # each detection type has n // TYPES detections, and a key is less than n // 2
+        by_type = mean_usec(
+            lambda key: archive.of_detection_type(f"TYPE_{key % TYPES}")[
+                key // (TYPES // 2)
+            ].level,
+            keys,
+        )
+        by_level_type = mean_usec(
+            lambda key: len(
+                archive.of_level_detection_type(key % 3, f"TYPE_{key % TYPES}")[:10]
+            ),
+            keys,
+        )
+
+    return {
+        "detections": n,
+        "write_sec": write_elapsed,
+        "open_ms": open_elapsed * 1e3,
+        "archive_mib": os.path.getsize(path) / 2**20,
+        "by_id_usec": by_id,
+        "by_type_usec": by_type,
+        "by_level_type_usec": by_level_type,
+        "query_peak_rss_growth_mib": peak_rss_mib() - rss_before,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--detections", type=int, nargs="+", default=[100_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.detections:
+            result = run(n, workdir)
+            print(
+                "  ".join(
+                    f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in result.items()
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
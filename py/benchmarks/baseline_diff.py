@@ -0,0 +1,89 @@
+"""Benchmark of writing a baseline and diffing detections against it.
+
+A `DetectionData` of N synthetic detections is written as a baseline,
+then a second one where some detections are new, changed or resolved is compared with it.
+It reports the wall time of each step, the size of the baseline and the growth of the peak RSS
+caused by the comparison, which should be small since the baseline is not loaded into memory.
+
+usage:
+    PYTHONPATH=src python benchmarks/baseline_diff.py --detections 100000 1000000
+"""
+
+import argparse
+import os
+import resource
+import tempfile
+import time
+import typing as t
+
+from validb import Baseline, DetectionData, EmbeddedVariables, TextDetected
+
+NO_VARS = EmbeddedVariables((), {})
+
+
+def detection_data(n: int, offset: int, changed_every: int) -> DetectionData[str, str, str]:
+    """detections of IDs `offset` to `offset + n`, whose messages differ every `changed_every` IDs"""
+    data: DetectionData[str, str, str] = DetectionData(max_detection=None)
+    for i in range(offset, offset + n):
+        version = 1 if changed_every > 0 and i % changed_every == 0 else 0
+        data.append(
+            TextDetected(
+                f"{i:012d}", i % 3, f"TYPE_{i % 10}", f"anomaly {i} v{version}", NO_VARS
+            )
+        )
+    return data
+
+
+def peak_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(n: int, workdir: str) -> t.Dict[str, float]:
+    path = os.path.join(workdir, f"baseline_{n}.result")
+    previous = detection_data(n, 0, 0)
+    started = time.perf_counter()
+    Baseline.write(path, previous)
+    write_elapsed = time.perf_counter() - started
+    del previous
+
+    # 1% resolved, 1% new and 1% changed
+    current = detection_data(n, n // 100, 100)
+    rss_before = peak_rss_mib()
+    started = time.perf_counter()
+    with Baseline(path) as baseline:
+        diff = current.diff(baseline)
+    diff_elapsed = time.perf_counter() - started
+
+    return {
+        "detections": n,
+        "write_sec": write_elapsed,
+        "diff_sec": diff_elapsed,
+        "keys_per_sec": n / diff_elapsed,
+        "baseline_mib": os.path.getsize(path) / 2**20,
+        "diff_peak_rss_growth_mib": peak_rss_mib() - rss_before,
+        "new": len(diff.new),
+        "changed": len(diff.changed),
+        "resolved": len(diff.resolved),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--detections", type=int, nargs="+", default=[100_000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in args.detections:
+            result = run(n, workdir)
+            print(
+                "  ".join(
+                    f"{key}={value:.2f}" if isinstance(value, float) else f"{key}={value}"
+                    for key, value in result.items()
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare the throughput of SQLAlchemy and DB-API rules on a synthetic SQLite table.
+
+usage: python benchmarks/dbapi_throughput.py [--rows N] [--repeat N]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+import typing as t
+
+from validb import DataSources, validate_db
+from validb.datasources.dbapi import DBAPIDataSource
+from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+from validb.rules import Rule
+from validb.rules.dbapi import SimpleDBAPIRule
+from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+SQL = "SELECT id, amount, note FROM item WHERE amount >= 0"
+RULE_ARGS: t.Mapping[str, t.Any] = {
+    "sql": SQL,
+    "id": "{id}",
+    "detection_type": "ITEM",
+    "msg": "amount={amount}, note={2}",
+    "datasource": "db",
+}
+
+
+def create_database(path: str, rows: int) -> None:
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("CREATE TABLE item (id INTEGER PRIMARY KEY, amount INTEGER, note TEXT)")
+        connection.executemany(
+            "INSERT INTO item VALUES (?, ?, ?)",
+            ((i, i % 1000, f"note {i}") for i in range(rows)),
+        )
+        connection.commit()
+    finally:
+        connection.close()
+
+
+def measure(rule: Rule[t.Any, t.Any, t.Any], datasources: DataSources, repeat: int) -> float:
+    """best wall time of the validation in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        detection_data = validate_db(rules=[rule], datasources=datasources, embedders={})
+        best = min(best, time.perf_counter() - started)
+        assert detection_data.total_count > 0
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "bench.db")
+        create_database(path, args.rows)
+
+        cases = [
+            (
+                "sqlalchemy",
+                SimpleSQLAlchemyRule(**RULE_ARGS),
+                SQLAlchemyDataSource(url=f"sqlite:///{path}"),
+            ),
+            (
+                "dbapi",
+                SimpleDBAPIRule(**RULE_ARGS),
+                DBAPIDataSource(driver="sqlite3", database=path),
+            ),
+            (
+                "dbapi (defer_msg)",
+                SimpleDBAPIRule(**RULE_ARGS, defer_msg=True),
+                DBAPIDataSource(driver="sqlite3", database=path),
+            ),
+        ]
+        for name, rule, datasource in cases:
+            with DataSources({"db": datasource}) as datasources:
+                elapsed = measure(rule, datasources, args.repeat)
+            print(f"{name:<20} {elapsed:8.3f}s {args.rows / elapsed:12,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
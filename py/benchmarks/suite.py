@@ -0,0 +1,265 @@
+"""End-to-end benchmark of validb on synthetic SQLite databases.
+
+Each case validates a generated table with a number of `SimpleSQLAlchemyRule`s
+and measures the wall time, rows/s and detections/s of `validate_db()`,
+appending to `DetectionData`, CSV output and the peak RSS.
+Each case runs in its own process so that the peak RSS is not shared between cases.
+
+usage:
+    python benchmarks/suite.py --rows 10000 1000000 --anomaly-rates 0.001 0.1 --rules 1 100 -o result.json
+    python benchmarks/suite.py ... -o new.json --baseline result.json
+"""
+
+import argparse
+import csv
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import typing as t
+
+# number of distinct categories; each rule validates the categories assigned to it
+CATEGORIES = 1000
+INSERT_BATCH = 100_000
+# metrics where a larger value is better; the others are better when smaller
+HIGHER_IS_BETTER = ("rows_per_sec", "detections_per_sec", "appends_per_sec", "csv_rows_per_sec")
+
+
+def database_path(workdir: str, rows: int, anomaly_rate: float) -> str:
+    return os.path.join(workdir, f"bench_{rows}_{anomaly_rate:g}.db")
+
+
+def create_database(path: str, rows: int, anomaly_rate: float, seed: int = 0) -> None:
+    """create the table `item` where about `anomaly_rate` of the rows have a negative amount
+
+    An existing database is reused since generating a large one takes long.
+    """
+    if os.path.exists(path):
+        return
+
+    rng = random.Random(seed)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute(
+            "CREATE TABLE item ("
+            "id INTEGER PRIMARY KEY, category INTEGER NOT NULL, amount INTEGER NOT NULL,"
+            " price REAL NOT NULL, note TEXT NOT NULL)"
+        )
+        ids = iter(range(rows))
+        while True:
+            batch = [
+                (
+                    i,
+                    i % CATEGORIES,
+                    -rng.randint(1, 100) if rng.random() < anomaly_rate else rng.randint(0, 10_000),
+                    rng.random() * 1000,
+                    f"note {i}",
+                )
+                for i in itertools.islice(ids, INSERT_BATCH)
+            ]
+            if not batch:
+                break
+            connection.executemany("INSERT INTO item VALUES (?, ?, ?, ?, ?)", batch)
+        connection.execute("CREATE INDEX item_category ON item (category)")
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_path, path)
+
+
+def create_rules(rule_count: int) -> t.List[t.Any]:
+    """rules which detect negative amounts; the categories are divided among them"""
+    from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+    return [
+        SimpleSQLAlchemyRule(
+            sql=(
+                "SELECT id, category, amount, price FROM item"
+                f" WHERE category % {rule_count} = {k} AND amount < 0"
+            ),
+            id="{id}",
+            detection_type=f"NEGATIVE_AMOUNT_{k}",
+            msg="negative amount; category={category}, amount={amount}, price={3}",
+            datasource="db",
+        )
+        for k in range(rule_count)
+    ]
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(path: str, rule_count: int, workers: int) -> t.Dict[str, t.Any]:
+    """run a case in the current process"""
+    from validb import DataSources, DetectionData, validate_db
+    from validb.csvmapping import SimpleDetectionCsvMapping
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+
+    rules = create_rules(rule_count)
+    with DataSources({"db": SQLAlchemyDataSource(url=f"sqlite:///{path}")}) as datasources:
+        started = time.perf_counter()
+        detection_data = validate_db(
+            rules=rules, datasources=datasources, embedders={}, workers=workers
+        )
+        validate_elapsed = time.perf_counter() - started
+
+    connection = sqlite3.connect(path)
+    try:
+        (table_rows,) = connection.execute("SELECT COUNT(*) FROM item").fetchone()
+    finally:
+        connection.close()
+    result_rows = sum(result.rows for result in detection_data.rule_results)
+    detections = detection_data.total_count
+    detected_list = list(detection_data.values())
+
+    # appending to DetectionData alone, with the detections of the run
+    appended = DetectionData[t.Any, t.Any, t.Any](max_detection=None)
+    started = time.perf_counter()
+    for detected in detected_list:
+        appended.append(detected)
+    append_elapsed = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        started = time.perf_counter()
+        with open(os.path.join(tmpdir, "out.csv"), mode="w", newline="", encoding="utf_8") as fp:
+            csv.writer(fp).writerows(SimpleDetectionCsvMapping().rows(detection_data))
+        csv_elapsed = time.perf_counter() - started
+
+    return {
+        "validate_elapsed": validate_elapsed,
+        "result_rows": result_rows,
+        "detections": detections,
+        # rows of the table validated per second
+        "rows_per_sec": table_rows / validate_elapsed if validate_elapsed > 0 else None,
+        "detections_per_sec": detections / validate_elapsed if validate_elapsed > 0 else None,
+        "append_elapsed": append_elapsed,
+        "appends_per_sec": len(detected_list) / append_elapsed if append_elapsed > 0 else None,
+        "csv_elapsed": csv_elapsed,
+        "csv_rows_per_sec": len(detected_list) / csv_elapsed if csv_elapsed > 0 else None,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def case_key(case: t.Mapping[str, t.Any]) -> t.Tuple[t.Any, ...]:
+    return (case["rows_in_table"], case["anomaly_rate"], case["rules"], case["workers"])
+
+
+def compare(
+    result: t.Mapping[str, t.Any], baseline: t.Mapping[str, t.Any], tolerance: float
+) -> t.List[str]:
+    """describe the metrics worse than the baseline by more than the tolerance"""
+    baseline_cases = {case_key(case): case for case in baseline["cases"]}
+    regressions: t.List[str] = []
+    for case in result["cases"]:
+        base = baseline_cases.get(case_key(case))
+        if base is None:
+            continue
+        for metric, value in case["metrics"].items():
+            base_value = base["metrics"].get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(base_value, (int, float)):
+                continue
+            if metric in ("result_rows", "detections") or base_value <= 0:
+                continue
+            ratio = value / base_value
+            worse = ratio < 1 - tolerance if metric in HIGHER_IS_BETTER else ratio > 1 + tolerance
+            if worse:
+                regressions.append(
+                    f"{case_key(case)} {metric}: {base_value:.4g} -> {value:.4g} ({ratio - 1:+.1%})"
+                )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--anomaly-rates", type=float, nargs="+", default=[0.01])
+    parser.add_argument("--rules", type=int, nargs="+", default=[1, 10])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "validb-bench"))
+    parser.add_argument("--output", "-o", help="JSON file to write the results")
+    parser.add_argument("--baseline", help="JSON file of previous results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--case", nargs=3, metavar=("DB", "RULES", "WORKERS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        # child process
+        path, rule_count, workers = args.case
+        json.dump(run_case(path, int(rule_count), int(workers)), sys.stdout)
+        return
+
+    import validb
+
+    os.makedirs(args.workdir, exist_ok=True)
+    cases: t.List[t.Dict[str, t.Any]] = []
+    for rows, anomaly_rate, rule_count, workers in itertools.product(
+        args.rows, args.anomaly_rates, args.rules, args.workers
+    ):
+        path = database_path(args.workdir, rows, anomaly_rate)
+        create_database(path, rows, anomaly_rate)
+        completed = subprocess.run(
+            [sys.executable, __file__, "--case", path, str(rule_count), str(workers)],
+            check=True,
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        metrics = json.loads(completed.stdout)
+        cases.append(
+            {
+                "rows_in_table": rows,
+                "anomaly_rate": anomaly_rate,
+                "rules": rule_count,
+                "workers": workers,
+                "metrics": metrics,
+            }
+        )
+        print(
+            f"rows={rows:<10} anomaly_rate={anomaly_rate:<6g} rules={rule_count:<4} workers={workers:<3}"
+            f" {metrics['validate_elapsed']:8.3f}s {metrics['rows_per_sec'] or 0:12,.0f} rows/s"
+            f" {metrics['detections_per_sec'] or 0:10,.0f} det/s"
+            f" rss={metrics['peak_rss_bytes'] / 2**20:7.1f}MiB",
+            file=sys.stderr,
+        )
+
+    result = {
+        "validb_version": validb.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "cases": cases,
+    }
+    if args.output is not None:
+        with open(args.output, mode="w", encoding="utf_8") as fp:
+            json.dump(result, fp, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, mode="r", encoding="utf_8") as fp:
+            regressions = compare(result, json.load(fp), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
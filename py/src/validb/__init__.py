@@ -1,23 +1,108 @@
-from .datasources import DataSource, DataSources
-from ._detected import Detected, TextDetected
-from ._embedded_vars import EmbeddedVariables
-from .csvmapping import DetectionCsvMapping
-from ._embedder import Embedder
-from ._detectiondata import DetectionData
-from .rules import Rule
-from ._validate import validate_db
+import typing as t
+
+from ._lazy import lazy_attributes
+
+if t.TYPE_CHECKING:
+    from .datasources import DataSource, DataSources
+    from ._archive import ResultArchive
+    from ._baseline import Baseline, BaselineEntry, DetectionDiff
+    from ._checkpoint import Checkpoint
+    from ._costguard import CostBudget, CostBudgetExceededError, CostGuard, CostGuardAction
+    from ._detected import DeferredMessage, Detected, TextDetected
+    from ._embedded_vars import EmbeddedVariables
+    from .csvmapping import DetectionCsvMapping
+    from ._embedder import Embedder
+    from ._detectiondata import DetectionData
+    from ._execution import (
+        Phase,
+        PhaseTimings,
+        RuleExecution,
+        RuleTimeoutError,
+        current_execution,
+    )
+    from ._hooks import ValidationHook
+    from ._memory import MemoryProfiler, RuleMemoryProfile
+    from ._profiling import Profiler, RuleProfile
+    from ._ruleresult import RuleOutcome, RuleResult
+    from .rules import Rule
+    from ._targets import TargetResult, validate_targets
+    from ._validate import validate_db
+
+# the module defining each attribute, imported on first access so that `import validb` is fast
+_ATTRIBUTES = {
+    "Baseline": "._baseline",
+    "BaselineEntry": "._baseline",
+    "Checkpoint": "._checkpoint",
+    "CostBudget": "._costguard",
+    "CostBudgetExceededError": "._costguard",
+    "CostGuard": "._costguard",
+    "CostGuardAction": "._costguard",
+    "DetectionCsvMapping": ".csvmapping",
+    "DataSource": ".datasources",
+    "DataSources": ".datasources",
+    "DeferredMessage": "._detected",
+    "Detected": "._detected",
+    "DetectionData": "._detectiondata",
+    "DetectionDiff": "._baseline",
+    "Embedder": "._embedder",
+    "EmbeddedVariables": "._embedded_vars",
+    "MemoryProfiler": "._memory",
+    "Phase": "._execution",
+    "PhaseTimings": "._execution",
+    "Profiler": "._profiling",
+    "ResultArchive": "._archive",
+    "Rule": ".rules",
+    "RuleExecution": "._execution",
+    "RuleMemoryProfile": "._memory",
+    "RuleOutcome": "._ruleresult",
+    "RuleProfile": "._profiling",
+    "RuleResult": "._ruleresult",
+    "RuleTimeoutError": "._execution",
+    "TargetResult": "._targets",
+    "TextDetected": "._detected",
+    "ValidationHook": "._hooks",
+    "current_execution": "._execution",
+    "validate_db": "._validate",
+    "validate_targets": "._targets",
+}
+
+__getattr__, __dir__ = lazy_attributes(__name__, _ATTRIBUTES, globals())
 
 __all__ = [
+    "Baseline",
+    "BaselineEntry",
+    "Checkpoint",
+    "CostBudget",
+    "CostBudgetExceededError",
+    "CostGuard",
+    "CostGuardAction",
     "DetectionCsvMapping",
     "DataSource",
     "DataSources",
+    "DeferredMessage",
     "Detected",
     "DetectionData",
+    "DetectionDiff",
     "Embedder",
     "EmbeddedVariables",
+    "MemoryProfiler",
+    "Phase",
+    "PhaseTimings",
+    "Profiler",
+    "ResultArchive",
     "Rule",
+    "RuleExecution",
+    "RuleMemoryProfile",
+    "RuleOutcome",
+    "RuleProfile",
+    "RuleResult",
+    "RuleTimeoutError",
+    "TargetResult",
     "TextDetected",
+    "ValidationHook",
+    "current_execution",
     "validate_db",
+    "validate_targets",
 ]
 
 __version__ = "0.0.6"
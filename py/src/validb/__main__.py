@@ -1,65 +1,815 @@
+import contextlib
 import csv
+import json
+import os
 import typing as t
 
 import click
 
-from validb import validate_db, DetectionData
-from validb.config import load_config, Config
+# Only the modules needed to build the command are imported here so that `--help` is fast;
+# the others are imported by `main()` when they are used.
+from validb import (
+    CostBudget,
+    CostBudgetExceededError,
+    CostGuard,
+    CostGuardAction,
+    Phase,
+    RuleOutcome,
+)
 from validb.csvmapping import SimpleDetectionCsvMapping
 
+if t.TYPE_CHECKING:
+    from validb import (
+        Detected,
+        DetectionData,
+        DetectionDiff,
+        MemoryProfiler,
+        Profiler,
+        ResultArchive,
+        RuleProfile,
+        TargetResult,
+    )
+    from validb.config import Config
+    from validb.metrics import OpenMetricsExporter
+    from validb.scheduling import Scheduler
+
+EXIT_NO_ANOMALY = 0
+EXIT_DETECTED = 10
+EXIT_COST_BUDGET_EXCEEDED = 11
+EXIT_FAILED_FAST = 12
+EXIT_TARGET_FAILED = 13
+
 
-@click.command()
+@click.group(invoke_without_command=True)
+@click.option("--config", "-c", "config_path", type=click.Path(exists=True))
 @click.option(
-    "--config", "-c", "config_path", required=True, type=click.Path(exists=True)
+    "--config-cache",
+    "config_cache_dir",
+    type=click.Path(file_okay=False),
+    envvar="VALIDB_CONFIG_CACHE",
+    help="Directory to cache the parsed config in, so that it is parsed again only when it is changed.",
 )
 @click.option("--dest-csv", "-D", "dest_csv_path", type=click.Path())
-def main(config_path: str, dest_csv_path: t.Union[str, None]):
-    config = load_config(config_path)
+@click.option(
+    "--max-detection-per-type",
+    "max_detection_per_type",
+    type=click.IntRange(min=0),
+    help="Maximum number of detections kept for each detection type; the rest are only counted.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    "workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of rules executed in parallel; with targets, number of targets validated in parallel.",
+)
+@click.option(
+    "--target",
+    "-t",
+    "target_names",
+    multiple=True,
+    help="Name of the target to be validated; all targets in the config if not specified.",
+)
+@click.option(
+    "--stats-file",
+    "stats_file_path",
+    type=click.Path(dir_okay=False),
+    help="File to record wall time of each rule; it is used to execute the longest rules first.",
+)
+@click.option(
+    "--cost-guard",
+    "cost_guard_action",
+    type=click.Choice([action.value for action in CostGuardAction]),
+    help="What to do with rules whose estimated cost (EXPLAIN) is over budget.",
+)
+@click.option(
+    "--max-estimated-rows",
+    "max_estimated_rows",
+    type=click.FloatRange(min=0),
+    help="Global budget of the number of rows estimated to be examined by each rule.",
+)
+@click.option(
+    "--max-estimated-cost",
+    "max_estimated_cost",
+    type=click.FloatRange(min=0),
+    help="Global budget of the cost of each rule estimated by the datasource.",
+)
+@click.option(
+    "--fail-fast-level",
+    "fail_fast_level",
+    type=int,
+    help="Stop the validation as soon as an anomaly of this level or higher is detected.",
+)
+@click.option(
+    "--default-timeout",
+    "default_timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Time limit in seconds of each rule without its own timeout.",
+)
+@click.option(
+    "--profile-report",
+    "profile_report_path",
+    type=click.Path(dir_okay=False),
+    help="JSON file to write the time spent in each phase of each rule; the slowest rules are also printed.",
+)
+@click.option(
+    "--profile-top",
+    "profile_top",
+    type=click.IntRange(min=0),
+    default=10,
+    show_default=True,
+    help="Number of the slowest rules printed with --profile-report.",
+)
+@click.option(
+    "--memory-profile",
+    "memory_profile",
+    is_flag=True,
+    help="Record the memory used by each rule into the report of --profile-report.",
+)
+@click.option(
+    "--memory-sampling-interval",
+    "memory_sampling_interval",
+    type=click.FloatRange(min=0, min_open=True),
+    default=0.1,
+    show_default=True,
+    help="Interval in seconds to sample the RSS with --memory-profile.",
+)
+@click.option(
+    "--memory-trace-rate",
+    "memory_trace_rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    show_default=True,
+    help="Fraction of rules traced with tracemalloc with --memory-profile; tracing slows the rules down.",
+)
+@click.option(
+    "--metrics-file",
+    "metrics_file_path",
+    type=click.Path(dir_okay=False),
+    help="File to write metrics of the run in the OpenMetrics text format, e.g. for the textfile collector.",
+)
+@click.option(
+    "--metrics-push-url",
+    "metrics_push_url",
+    help="URL to push metrics of the run to, e.g. http://localhost:9091/metrics/job/validb of a Pushgateway.",
+)
+@click.option(
+    "--checkpoint-dir",
+    "checkpoint_dir",
+    type=click.Path(file_okay=False),
+    help="Directory to persist the detections of each finished rule into, so that the run can be resumed.",
+)
+@click.option(
+    "--resume",
+    "resume",
+    is_flag=True,
+    help="Skip the rules completed in --checkpoint-dir and merge their stored detections.",
+)
+@click.option(
+    "--baseline",
+    "baseline_path",
+    type=click.Path(dir_okay=False),
+    help="Baseline of a previous run to report only new, changed and resolved detections against; all are new if it does not exist.",
+)
+@click.option(
+    "--save-baseline",
+    "save_baseline_path",
+    type=click.Path(dir_okay=False),
+    help="File to write the detections of this run into as a baseline; it can be the same as --baseline.",
+)
+@click.option(
+    "--archive",
+    "archive_path",
+    type=click.Path(dir_okay=False),
+    help="File to write the detections of this run into as an indexed archive, which can be queried by `validb query`.",
+)
+@click.pass_context
+def main(
+    ctx: click.Context,
+    config_path: t.Optional[str],
+    config_cache_dir: t.Optional[str],
+    dest_csv_path: t.Union[str, None],
+    max_detection_per_type: t.Optional[int],
+    workers: int,
+    target_names: t.Tuple[str, ...],
+    stats_file_path: t.Optional[str],
+    cost_guard_action: t.Optional[str],
+    max_estimated_rows: t.Optional[float],
+    max_estimated_cost: t.Optional[float],
+    fail_fast_level: t.Optional[int],
+    default_timeout: t.Optional[float],
+    profile_report_path: t.Optional[str],
+    profile_top: int,
+    memory_profile: bool,
+    memory_sampling_interval: float,
+    memory_trace_rate: float,
+    metrics_file_path: t.Optional[str],
+    metrics_push_url: t.Optional[str],
+    checkpoint_dir: t.Optional[str],
+    resume: bool,
+    baseline_path: t.Optional[str],
+    save_baseline_path: t.Optional[str],
+    archive_path: t.Optional[str],
+):
+    """validate the data in the databases with the rules of the config"""
+    if ctx.invoked_subcommand is not None:
+        return
+    if config_path is None:
+        raise click.UsageError("Missing option '--config' / '-c'.")
+    if memory_profile and profile_report_path is None:
+        raise click.BadParameter(
+            "--profile-report is required", param_hint="--memory-profile"
+        )
+    if resume and checkpoint_dir is None:
+        raise click.BadParameter("--checkpoint-dir is required", param_hint="--resume")
+
+    from validb import (
+        Checkpoint,
+        MemoryProfiler,
+        Profiler,
+        ResultArchive,
+        validate_db,
+        validate_targets,
+    )
+    from validb.config import load_config
+    from validb.metrics import OpenMetricsExporter
+    from validb.scheduling import CostAwareScheduler, RuleStatsStore
+
+    config = load_config(config_path, cache_dir=config_cache_dir)
+    profiler = Profiler() if profile_report_path is not None else None
+    memory_profiler = (
+        MemoryProfiler(
+            sampling_interval=memory_sampling_interval, trace_rate=memory_trace_rate
+        )
+        if memory_profile
+        else None
+    )
+    exporter = (
+        OpenMetricsExporter()
+        if metrics_file_path is not None or metrics_push_url is not None
+        else None
+    )
+    hooks = [
+        hook for hook in (profiler, memory_profiler, exporter) if hook is not None
+    ]
+
+    checkpoint = (
+        Checkpoint(checkpoint_dir, resume=resume) if checkpoint_dir is not None else None
+    )
+
+    scheduler: t.Optional["Scheduler"] = None
+    if stats_file_path is not None:
+        scheduler = CostAwareScheduler(RuleStatsStore(stats_file_path))
+
+    cost_guard = config.cost_guard
+    if (
+        cost_guard_action is not None
+        or max_estimated_rows is not None
+        or max_estimated_cost is not None
+    ):
+        cost_guard = CostGuard(
+            CostBudget(max_rows=max_estimated_rows, max_cost=max_estimated_cost),
+            action=(
+                CostGuardAction(cost_guard_action)
+                if cost_guard_action is not None
+                else CostGuardAction.WARN
+            ),
+        )
 
-    with config.datasources:
-        detection_data = validate_db(
+    if default_timeout is None:
+        default_timeout = config.default_timeout
+
+    if len(config.targets) > 0:
+        if baseline_path is not None or save_baseline_path is not None:
+            raise click.UsageError("--baseline and --save-baseline do not support targets")
+        if archive_path is not None:
+            raise click.UsageError("--archive does not support targets")
+        unknown_targets = [name for name in target_names if name not in config.targets]
+        if len(unknown_targets) > 0:
+            raise click.BadParameter(
+                f"unknown targets: {', '.join(unknown_targets)}",
+                param_hint="--target",
+            )
+        target_results = validate_targets(
+            targets={
+                name: datasources
+                for name, datasources in config.targets.items()
+                if len(target_names) == 0 or name in target_names
+            },
             rules=config.rules,
-            datasources=config.datasources,
             embedders=config.embedders,
+            max_workers=workers,
+            max_detection_per_type=max_detection_per_type,
+            scheduler=scheduler,
+            cost_guard=cost_guard,
+            fail_fast_level=fail_fast_level,
+            default_timeout=default_timeout,
+            hooks=hooks,
+            checkpoint=checkpoint,
         )
+        exit_code = _output_targets(target_results, dest_csv_path, config, profiler)
+        _output_profile(profiler, memory_profiler, profile_report_path, profile_top)
+        _export_metrics(exporter, metrics_file_path, metrics_push_url)
+        exit(exit_code)
+    elif len(target_names) > 0:
+        raise click.BadParameter("no targets are defined in the config", param_hint="--target")
 
-    if detection_data.count <= 0:
+    try:
+        with config.datasources:
+            detection_data = validate_db(
+                rules=config.rules,
+                datasources=config.datasources,
+                embedders=config.embedders,
+                max_detection_per_type=max_detection_per_type,
+                workers=workers,
+                scheduler=scheduler,
+                cost_guard=cost_guard,
+                fail_fast_level=fail_fast_level,
+                default_timeout=default_timeout,
+                hooks=hooks,
+                checkpoint=checkpoint,
+            )
+    except CostBudgetExceededError as e:
+        for rule, violation in e.violations:
+            click.echo(
+                f"Over budget: {rule.detection_type()} ({violation})", err=True
+            )
+        exit(EXIT_COST_BUDGET_EXCEEDED)
+
+    diff: t.Optional["DetectionDiff[str, str, str]"] = None
+    if baseline_path is not None:
+        with _measure_output(profiler, "baseline"):
+            diff = _diff_baseline(detection_data, baseline_path)
+
+    if detection_data.total_count <= 0:
         click.echo(f"No anomalies detected.")
-        exit(0)
+        if diff is not None:
+            _output_diff(diff)
+            if dest_csv_path is not None:
+                with _measure_output(profiler, "csv"):
+                    _output_diff_csv(dest_csv_path, diff, config)
+        if save_baseline_path is not None:
+            with _measure_output(profiler, "baseline"):
+                _save_baseline(save_baseline_path, detection_data, baseline_path)
+        if archive_path is not None:
+            with _measure_output(profiler, "archive"):
+                ResultArchive.write(archive_path, detection_data)
+        _output_unfinished(detection_data)
+        if stats_file_path is not None:
+            click.echo()
+            _output_elapsed(detection_data)
+        _output_profile(profiler, memory_profiler, profile_report_path, profile_top)
+        _export_metrics(exporter, metrics_file_path, metrics_push_url)
+        exit(EXIT_NO_ANOMALY)
     else:
-        _output_summary(detection_data)
+        with _measure_output(profiler, "summary"):
+            _output_summary(detection_data)
         click.echo()
-        click.echo(f"Detected: {detection_data.count}")
+        click.echo(f"Detected: {detection_data.total_count}")
+        if detection_data.count < detection_data.total_count:
+            click.echo(
+                f"Kept: {detection_data.count} (at most {max_detection_per_type} per detection type)"
+            )
+        _output_unfinished(detection_data)
+        if stats_file_path is not None:
+            click.echo()
+            _output_elapsed(detection_data)
 
+        if detection_data.failed_fast:
+            click.echo(
+                f"Stopped: an anomaly of level {fail_fast_level} or higher was detected."
+            )
+
+        if diff is not None:
+            _output_diff(diff)
         if dest_csv_path is not None:
-            _output_csv(dest_csv_path, detection_data, config)
+            with _measure_output(profiler, "csv"):
+                if diff is not None:
+                    _output_diff_csv(dest_csv_path, diff, config)
+                else:
+                    _output_csv(dest_csv_path, detection_data, config)
+        if save_baseline_path is not None:
+            with _measure_output(profiler, "baseline"):
+                _save_baseline(save_baseline_path, detection_data, baseline_path)
+        if archive_path is not None:
+            with _measure_output(profiler, "archive"):
+                ResultArchive.write(archive_path, detection_data)
 
-        exit(10)
+        _output_profile(profiler, memory_profiler, profile_report_path, profile_top)
+        _export_metrics(exporter, metrics_file_path, metrics_push_url)
+        exit(EXIT_FAILED_FAST if detection_data.failed_fast else EXIT_DETECTED)
 
 
-def _output_summary(detection_data: DetectionData[str, str, str]):
-    title_row = ("DETECTION_TYPE", "COUNT")
-    rows = [
-        (detection_name, len(detection_data[detection_name]))
-        for detection_name in detection_data.detection_types()
-    ]
+@main.command()
+@click.option(
+    "--config", "-c", "config_path", required=True, type=click.Path(exists=True)
+)
+@click.option(
+    "--config-cache",
+    "config_cache_dir",
+    type=click.Path(file_okay=False),
+    envvar="VALIDB_CONFIG_CACHE",
+    help="Directory to cache the parsed config in, so that it is parsed again only when it is changed.",
+)
+@click.option(
+    "--host",
+    "host",
+    default="127.0.0.1",
+    show_default=True,
+    help="Address to listen on; the endpoint has no authentication, so keep it local.",
+)
+@click.option(
+    "--port",
+    "port",
+    type=click.IntRange(min=0, max=65535),
+    default=8765,
+    show_default=True,
+    help="Port to listen on.",
+)
+@click.option(
+    "--socket",
+    "unix_socket",
+    type=click.Path(dir_okay=False),
+    help="Unix socket to listen on instead of --host and --port.",
+)
+@click.option(
+    "--reload-interval",
+    "reload_interval",
+    type=click.FloatRange(min=0),
+    default=2.0,
+    show_default=True,
+    help="Interval in seconds to check whether the config is changed; 0 disables reloading (SIGHUP still reloads).",
+)
+@click.option(
+    "--max-concurrent-runs",
+    "max_concurrent_runs",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of validations executed at once; the other requests wait for them.",
+)
+@click.option(
+    "--max-detection-per-type",
+    "max_detection_per_type",
+    type=click.IntRange(min=0),
+    help="Maximum number of detections kept for each detection type; the rest are only counted.",
+)
+@click.option(
+    "--workers",
+    "-j",
+    "workers",
+    type=click.IntRange(min=1),
+    default=1,
+    help="Number of rules executed in parallel; with targets, number of targets validated in parallel.",
+)
+@click.option(
+    "--stats-file",
+    "stats_file_path",
+    type=click.Path(dir_okay=False),
+    help="File to record wall time of each rule; it is used to execute the longest rules first.",
+)
+@click.option(
+    "--fail-fast-level",
+    "fail_fast_level",
+    type=int,
+    help="Stop the validation as soon as an anomaly of this level or higher is detected.",
+)
+@click.option(
+    "--default-timeout",
+    "default_timeout",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Time limit in seconds of each rule without its own timeout.",
+)
+def serve(
+    config_path: str,
+    config_cache_dir: t.Optional[str],
+    host: str,
+    port: int,
+    unix_socket: t.Optional[str],
+    reload_interval: float,
+    max_concurrent_runs: int,
+    max_detection_per_type: t.Optional[int],
+    workers: int,
+    stats_file_path: t.Optional[str],
+    fail_fast_level: t.Optional[int],
+    default_timeout: t.Optional[float],
+):
+    """keep the datasources open and validate on schedules and on request
+
+    The rules are validated on the cron-like `schedules` of the config
+    and on `POST /validate` to the HTTP endpoint; see `GET /health` for the state.
+    The config is reloaded when it is changed.
+    """
+    import logging
+    import signal
+    import threading
+
+    from validb.scheduling import CostAwareScheduler, RuleStatsStore
+    from validb.serve import ValidationService, create_server
+
+    logging.basicConfig(
+        level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+
+    service = ValidationService(
+        config_path,
+        cache_dir=config_cache_dir,
+        reload_interval=reload_interval,
+        max_concurrent_runs=max_concurrent_runs,
+        workers=workers,
+        max_detection_per_type=max_detection_per_type,
+        fail_fast_level=fail_fast_level,
+        default_timeout=default_timeout,
+        scheduler=(
+            CostAwareScheduler(RuleStatsStore(stats_file_path))
+            if stats_file_path is not None
+            else None
+        ),
+    )
+    service.start()
+    try:
+        server = create_server(service, host=host, port=port, unix_socket=unix_socket)
+    except OSError:
+        service.close()
+        raise
+
+    def shutdown(signum: int, frame: t.Any) -> None:
+        # shutdown() waits for serve_forever(), which runs in this thread
+        threading.Thread(target=server.shutdown).start()
+
+    def reload(signum: int, frame: t.Any) -> None:
+        threading.Thread(target=service.reload, kwargs={"force": True}).start()
+
+    signal.signal(signal.SIGTERM, shutdown)
+    if hasattr(signal, "SIGHUP"):
+        signal.signal(signal.SIGHUP, reload)
+
+    click.echo(
+        "Serving on "
+        + (unix_socket if unix_socket is not None else f"http://{host}:{server.server_address[1]}"),
+        err=True,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+
+
+@main.command()
+@click.argument("archive_path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--id",
+    "ids",
+    multiple=True,
+    help="ID of the detections to be listed; it can be specified more than once.",
+)
+@click.option(
+    "--detection-type",
+    "detection_types",
+    multiple=True,
+    help="Detection type of the detections to be listed; it can be specified more than once.",
+)
+@click.option("--level", "level", type=int, help="Level of the detections to be listed.")
+@click.option(
+    "--count",
+    "count_only",
+    is_flag=True,
+    help="Print the number of the detections of each detection type instead of the detections.",
+)
+@click.option(
+    "--dest-csv",
+    "-D",
+    "dest_csv_path",
+    type=click.Path(),
+    help="CSV file to write the detections into instead of the standard output.",
+)
+def query(
+    archive_path: str,
+    ids: t.Tuple[str, ...],
+    detection_types: t.Tuple[str, ...],
+    level: t.Optional[int],
+    count_only: bool,
+    dest_csv_path: t.Optional[str],
+):
+    """list the detections in an archive written by --archive
+
+    The detections are looked up in the indexes of the archive, so the archive is not loaded.
+    """
+    from validb import ResultArchive
+
+    with ResultArchive(archive_path) as archive:
+        detecteds = _query_archive(archive, ids, detection_types, level)
+        if count_only:
+            if len(ids) == 0 and len(detection_types) == 0 and level is None:
+                counts = {
+                    detection_type: archive.count_of(detection_type)
+                    for detection_type in archive.detection_types()
+                }
+            else:
+                counts = {}
+                for detected in detecteds:
+                    counts[detected.detection_type] = (
+                        counts.get(detected.detection_type, 0) + 1
+                    )
+            if len(counts) > 0:
+                _output_table(("DETECTION_TYPE", "COUNT"), list(counts.items()))
+                click.echo()
+            click.echo(f"Detected: {sum(counts.values())}")
+            return
+
+        csv_mapping = SimpleDetectionCsvMapping()
+        if dest_csv_path is not None:
+            with open(dest_csv_path, mode="w", newline="", encoding="utf_8") as fp:
+                csv.writer(fp).writerows(csv_mapping(d) for d in detecteds)
+        else:
+            csv.writer(click.get_text_stream("stdout")).writerows(
+                csv_mapping(d) for d in detecteds
+            )
+
+
+def _query_archive(
+    archive: "ResultArchive",
+    ids: t.Sequence[str],
+    detection_types: t.Sequence[str],
+    level: t.Optional[int],
+) -> t.Iterator["Detected[str, str, str]"]:
+    """the detections matching all the conditions, looked up in the most selective index"""
+    if len(ids) > 0:
+        for id_ in ids:
+            for detected in archive.of_id(id_):
+                if (
+                    len(detection_types) == 0
+                    or detected.detection_type in detection_types
+                ) and (level is None or detected.level == level):
+                    yield detected
+    elif len(detection_types) > 0:
+        for detection_type in detection_types:
+            if level is not None:
+                yield from archive.of_level_detection_type(level, detection_type)
+            else:
+                yield from archive.of_detection_type(detection_type)
+    elif level is not None:
+        for level_, detection_type in archive.levels_detection_types():
+            if level_ == level:
+                yield from archive.of_level_detection_type(level, detection_type)
+    else:
+        yield from archive.values()
+
+
+def _output_targets(
+    target_results: t.Mapping[str, "TargetResult[str, str, str]"],
+    dest_csv_path: t.Optional[str],
+    config: "Config[str, str, str]",
+    profiler: t.Optional["Profiler"] = None,
+) -> int:
+    """output the results of targets and return the exit code"""
+    rows: t.List[t.Tuple[str, t.Union[int, str]]] = []
+    counts: t.Dict[str, int] = {}
+    for name, result in target_results.items():
+        if result.error is not None or result.detection_data is None:
+            rows.append((name, "FAILED"))
+            continue
+        rows.append((name, result.detection_data.total_count))
+        for detection_type in result.detection_data.detection_types():
+            counts[detection_type] = counts.get(
+                detection_type, 0
+            ) + result.detection_data.count_of(detection_type)
+
+    _output_table(("TARGET", "COUNT"), rows)
+    if len(counts) > 0:
+        click.echo()
+        _output_table(("DETECTION_TYPE", "COUNT"), list(counts.items()))
+
+    for name, result in target_results.items():
+        if result.error is not None:
+            click.echo(f"Failed: {name} ({result.error})", err=True)
+        elif result.detection_data is not None:
+            _output_unfinished(result.detection_data, target=name)
+
+    if dest_csv_path is not None and len(counts) > 0:
+        detected_csvmapping = (
+            config.detected_csvmapping
+            if config.detected_csvmapping is not None
+            else SimpleDetectionCsvMapping()
+        )
+        with _measure_output(profiler, "csv"), open(
+            dest_csv_path, mode="w", newline="", encoding="utf_8"
+        ) as fp:
+            csv_writer = csv.writer(fp)
+            for name, result in target_results.items():
+                if result.detection_data is not None:
+                    csv_writer.writerows(
+                        (name, *row)
+                        for row in detected_csvmapping.rows(result.detection_data)
+                    )
 
-    max_detection_type_len = max(len(title_row[0]), max(len(name) for name, _ in rows))
+    if any(result.error is not None for result in target_results.values()):
+        return EXIT_TARGET_FAILED
+    if any(
+        result.detection_data is not None and result.detection_data.failed_fast
+        for result in target_results.values()
+    ):
+        return EXIT_FAILED_FAST
+    if len(counts) > 0:
+        return EXIT_DETECTED
+    return EXIT_NO_ANOMALY
+
+
+def _output_summary(detection_data: "DetectionData[str, str, str]"):
+    _output_table(
+        ("DETECTION_TYPE", "COUNT"),
+        [
+            (detection_name, detection_data.count_of(detection_name))
+            for detection_name in detection_data.detection_types()
+        ],
+    )
+
+
+def _output_table(
+    title_row: t.Tuple[str, str], rows: t.Sequence[t.Tuple[str, t.Union[int, str]]]
+):
+    max_name_len = max(len(title_row[0]), max(len(name) for name, _ in rows))
     max_count_len = max(len(title_row[1]), max(len(str(count)) for _, count in rows))
 
-    for detection_type, count in (title_row, *rows):
+    for name, count in (title_row, *rows):
         click.echo(
             "{}  {}".format(
-                format(detection_type, f"<{max_detection_type_len}"),
+                format(name, f"<{max_name_len}"),
                 format(count, f">{max_count_len}"),
             )
         )
 
 
+_UNFINISHED_LABELS: t.Mapping[RuleOutcome, str] = {
+    RuleOutcome.SKIPPED: "Skipped",
+    RuleOutcome.TIMED_OUT: "Timed out",
+    RuleOutcome.CANCELLED: "Cancelled",
+    RuleOutcome.ABORTED: "Aborted",
+    RuleOutcome.FAILED_FAST: "Failed fast",
+}
+
+
+def _output_unfinished(
+    detection_data: "DetectionData[t.Any, t.Any, t.Any]",
+    target: t.Optional[str] = None,
+):
+    for result in detection_data.rule_results:
+        label = _UNFINISHED_LABELS.get(result.outcome)
+        if label is None:
+            continue
+        if result.outcome == RuleOutcome.SKIPPED:
+            reason = str(result.detail)
+        elif result.outcome == RuleOutcome.ABORTED:
+            reason = "too many detections"
+        elif result.outcome == RuleOutcome.CANCELLED and result.detail is not None:
+            reason = f"{result.detail}, after {result.elapsed:.2f}s"
+        else:
+            reason = f"after {result.elapsed:.2f}s"
+        name = (
+            f"{target} {result.rule.detection_type()}"
+            if target is not None
+            else result.rule.detection_type()
+        )
+        click.echo(f"{label}: {name} ({reason})")
+
+
+# a rule is reported as slower than predicted if it exceeds the prediction by this ratio
+_SLOWER_THAN_PREDICTED_RATIO = 1.5
+
+
+def _output_elapsed(detection_data: "DetectionData[t.Any, t.Any, t.Any]"):
+    predicted = detection_data.predicted_elapsed
+    click.echo(
+        "Elapsed: {:.2f}s (predicted: {})".format(
+            detection_data.elapsed or 0.0,
+            f"{predicted:.2f}s" if predicted is not None else "unknown",
+        )
+    )
+
+    slower_results = [
+        result
+        for result in detection_data.rule_results
+        if result.predicted_elapsed is not None
+        and result.elapsed > result.predicted_elapsed * _SLOWER_THAN_PREDICTED_RATIO
+    ]
+    for result in sorted(slower_results, key=lambda r: r.elapsed, reverse=True):
+        click.echo(
+            "Slower than predicted: {} {:.2f}s (predicted: {:.2f}s)".format(
+                result.rule.detection_type(),
+                result.elapsed,
+                result.predicted_elapsed,
+            )
+        )
+
+
 def _output_csv(
     dest_csv_path: str,
-    detection_data: DetectionData[str, str, str],
-    config: Config[str, str, str],
+    detection_data: "DetectionData[str, str, str]",
+    config: "Config[str, str, str]",
 ):
     detected_csvmapping = (
         config.detected_csvmapping
@@ -72,5 +822,195 @@ def _output_csv(
         csv_writer.writerows(detected_csvmapping.rows(detection_data))
 
 
+def _save_baseline(
+    save_baseline_path: str,
+    detection_data: "DetectionData[str, str, str]",
+    baseline_path: t.Optional[str],
+):
+    """write the baseline, keeping the keys of the previous one of the rules not completed"""
+    from validb import Baseline
+
+    if baseline_path is None or not os.path.exists(baseline_path):
+        Baseline.write(save_baseline_path, detection_data)
+        return
+    with Baseline(baseline_path) as previous:
+        Baseline.write(save_baseline_path, detection_data, previous=previous)
+
+
+def _diff_baseline(
+    detection_data: "DetectionData[str, str, str]", baseline_path: str
+) -> "DetectionDiff[str, str, str]":
+    from validb import Baseline, DetectionDiff
+
+    if not os.path.exists(baseline_path):
+        click.echo(f"Baseline {baseline_path} does not exist; all detections are new.")
+        return DetectionDiff(new=list(detection_data.values()))
+    with Baseline(baseline_path) as baseline:
+        return detection_data.diff(baseline)
+
+
+def _output_diff(diff: "DetectionDiff[str, str, str]"):
+    counts: t.Dict[str, t.List[int]] = {}
+    for index, detections in enumerate((diff.new, diff.changed)):
+        for detected in detections:
+            counts.setdefault(str(detected.detection_type), [0, 0, 0])[index] += 1
+    for entry in diff.resolved:
+        counts.setdefault(str(entry.detection_type), [0, 0, 0])[2] += 1
+
+    click.echo()
+    if len(counts) > 0:
+        _output_columns(
+            ("DETECTION_TYPE", "NEW", "CHANGED", "RESOLVED"),
+            [
+                (detection_type, *(str(count) for count in type_counts))
+                for detection_type, type_counts in counts.items()
+            ],
+        )
+        click.echo()
+    click.echo(
+        f"New: {len(diff.new)}, Changed: {len(diff.changed)}, "
+        f"Resolved: {len(diff.resolved)}, Unchanged: {diff.unchanged}"
+    )
+
+
+def _output_diff_csv(
+    dest_csv_path: str,
+    diff: "DetectionDiff[str, str, str]",
+    config: "Config[str, str, str]",
+):
+    """output the new, changed and resolved detections with their status in the first column
+
+    Resolved detections are in the columns of `SimpleDetectionCsvMapping`,
+    since only their IDs, levels, detection types and messages are stored in the baseline.
+    """
+    detected_csvmapping = (
+        config.detected_csvmapping
+        if config.detected_csvmapping is not None
+        else SimpleDetectionCsvMapping()
+    )
+
+    with open(dest_csv_path, mode="w", newline="", encoding="utf_8") as fp:
+        csv_writer = csv.writer(fp)
+        for status, detections in (("NEW", diff.new), ("CHANGED", diff.changed)):
+            csv_writer.writerows(
+                (status, *detected_csvmapping(detected)) for detected in detections
+            )
+        csv_writer.writerows(
+            ("RESOLVED", entry.id, entry.level, entry.detection_type, entry.msg)
+            for entry in diff.resolved
+        )
+
+
+def _measure_output(
+    profiler: t.Optional["Profiler"], name: str
+) -> t.ContextManager[None]:
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.measure_output(name)
+
+
+def _output_profile(
+    profiler: t.Optional["Profiler"],
+    memory_profiler: t.Optional["MemoryProfiler"],
+    profile_report_path: t.Optional[str],
+    top: int,
+):
+    if profiler is None or profile_report_path is None:
+        return
+    report = profiler.report()
+    if memory_profiler is not None:
+        report["memory"] = memory_profiler.report()
+    with open(profile_report_path, mode="w", encoding="utf_8") as fp:
+        json.dump(report, fp, indent=2)
+
+    profiles = profiler.top(top)
+    if len(profiles) > 0:
+        click.echo()
+        click.echo(f"Slowest rules (report: {profile_report_path}):")
+        _output_profile_table(profiles)
+
+    memory_profiles = memory_profiler.top(top) if memory_profiler is not None else []
+    if len(memory_profiles) > 0:
+        click.echo()
+        click.echo("Rules using the most memory:")
+        _output_columns(
+            ("RULE", "PEAK_RSS_DELTA", "RSS_DELTA", "TRACED_PEAK"),
+            [
+                (
+                    _profile_name(profile.target, profile.detection_type),
+                    _format_bytes(profile.peak_rss_delta),
+                    _format_bytes(profile.rss_delta),
+                    _format_bytes(profile.traced_peak),
+                )
+                for profile in memory_profiles
+            ],
+        )
+
+
+def _output_profile_table(profiles: t.Sequence["RuleProfile"]):
+    title_row = (
+        "RULE",
+        "ELAPSED",
+        *(phase.value.upper() for phase in Phase),
+        "ROWS",
+        "DETECTIONS",
+        "DET/S",
+    )
+    rows = [
+        (
+            _profile_name(profile.target, profile.detection_type),
+            f"{profile.elapsed:.3f}",
+            *(f"{profile.phases.get(phase, 0.0):.3f}" for phase in Phase),
+            str(profile.rows),
+            str(profile.detections),
+            f"{profile.detections_per_sec or 0.0:.0f}",
+        )
+        for profile in profiles
+    ]
+    _output_columns(title_row, rows)
+
+
+def _profile_name(target: t.Optional[str], detection_type: str) -> str:
+    return f"{target}/{detection_type}" if target is not None else detection_type
+
+
+def _format_bytes(size: t.Optional[int]) -> str:
+    if size is None:
+        return "-"
+    return f"{size / 2**20:.1f}MiB"
+
+
+def _output_columns(
+    title_row: t.Tuple[str, ...], rows: t.Sequence[t.Tuple[str, ...]]
+):
+    widths = [
+        max(len(row[i]) for row in (title_row, *rows)) for i in range(len(title_row))
+    ]
+    for row in (title_row, *rows):
+        click.echo(
+            "  ".join(
+                format(value, f"<{width}" if i == 0 else f">{width}")
+                for i, (value, width) in enumerate(zip(row, widths))
+            )
+        )
+
+
+def _export_metrics(
+    exporter: t.Optional["OpenMetricsExporter"],
+    metrics_file_path: t.Optional[str],
+    metrics_push_url: t.Optional[str],
+):
+    if exporter is None:
+        return
+    if metrics_file_path is not None:
+        exporter.write(metrics_file_path)
+    if metrics_push_url is not None:
+        try:
+            exporter.push(metrics_push_url)
+        except OSError as e:
+            # the result of the validation is more important than its metrics
+            click.echo(f"Failed to push metrics: {e}", err=True)
+
+
 if __name__ == "__main__":
     main()
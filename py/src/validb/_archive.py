@@ -0,0 +1,587 @@
+from array import array
+from itertools import accumulate, chain
+import json
+import mmap
+import os
+import pathlib
+import struct
+import sys
+import typing as t
+
+from ._detected import Detected, TextDetected
+from ._detectiondata import DetectionData
+from ._embedded_vars import EmbeddedVariables
+from ._ruleresult import RuleResult
+
+_MAGIC = b"VALIDBRA"
+# incremented when the format of the file changes
+ARCHIVE_FORMAT = 2
+
+# magic, format, byte order (0: little, 1: big), number of rows, number of strings
+_HEADER = struct.Struct("<8sIIQQ")
+_SECTION_NAMES = (
+    "metadata",
+    "string_offsets",
+    "strings",
+    "ids",
+    "levels",
+    "detection_types",
+    "msgs",
+    "by_id",
+    "by_detection_type",
+    "by_level_detection_type",
+)
+# offset and length of each section
+_SECTIONS = struct.Struct("<" + "QQ" * len(_SECTION_NAMES))
+# sections are aligned so that they can be cast to arrays
+_ALIGNMENT = 8
+
+# the index of a string standing for None
+_NONE = 0xFFFFFFFF
+
+# the variables of archived detections, which are not archived
+_NO_VARS = EmbeddedVariables((), {})
+
+
+class ResultArchive(DetectionData[str, str, str]):
+    """Detections of a past run in a file read through `mmap`, which can be queried without loading it
+
+    The file holds the IDs, levels, detection types and messages of the detections as columns,
+    with the strings stored once in a sorted table,
+    and three indexes of the rows sorted by ID, by detection type and by (level, detection type).
+    A lookup by `of_id()`, `of_detection_type()`, `of_level_detection_type()` or `archive[key]`
+    is a binary search of the string table and of an index,
+    and the detections are read from the file only when they are accessed.
+
+    It can be used in place of the `DetectionData` of the run, with some differences:
+
+    - IDs, detection types and messages are strings, as written by `Detected.id_str` and the like.
+    - the variables of the detections (`Detected.embedded_vars`) and `rule_results` are not archived,
+      though `unfinished_detection_types()` is.
+    - `ids()` is in the order of the IDs, and the detections of a detection type
+      are in the order of `values()` instead of the order in which they were detected.
+    """
+
+    _path: pathlib.Path
+    _fp: t.BinaryIO
+    _mmap: mmap.mmap
+    _views: t.List[memoryview]
+    _row_count: int
+    _string_offsets: memoryview
+    _strings: memoryview
+    _ids: memoryview
+    _levels: memoryview
+    _detection_types: memoryview
+    _msgs: memoryview
+    _by_id_rows: memoryview
+    _by_detection_type_rows: memoryview
+    _by_level_detection_type_rows: memoryview
+    _count_by_type: t.Dict[str, int]
+    _kept_by_type: t.Dict[str, int]
+    _levels_types: t.List[t.Tuple[int, str]]
+    _metadata: t.Dict[str, t.Any]
+    _decoded_types: t.Dict[int, t.Optional[str]]
+
+    def __init__(self, path: t.Union[str, pathlib.Path]) -> None:
+        """open an archive file
+
+        Parameters
+        ----------
+        path : str | Path
+            the file written by `ResultArchive.write()`
+
+        Raises
+        ------
+        ValueError
+            If the file is not an archive of this version or was written on a machine of another byte order.
+        """
+        self._path = pathlib.Path(path)
+        self._fp = open(self._path, mode="rb")
+        try:
+            header = self._fp.read(_HEADER.size + _SECTIONS.size)
+            if len(header) < _HEADER.size + _SECTIONS.size:
+                raise ValueError(f"archive is broken: {path}")
+            magic, format, byteorder, row_count, _ = _HEADER.unpack_from(header)
+            if magic != _MAGIC or format != ARCHIVE_FORMAT:
+                raise ValueError(
+                    f"archive must be written by validb of format {ARCHIVE_FORMAT}: {path}"
+                )
+            if byteorder != _byteorder():
+                raise ValueError(
+                    f"archive must be read on a machine of the byte order it was written on: {path}"
+                )
+            sections = _SECTIONS.unpack_from(header, _HEADER.size)
+            self._mmap = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self._fp.close()
+            raise
+
+        self._row_count = row_count
+        whole = memoryview(self._mmap)
+        self._views = [whole]
+        views: t.Dict[str, memoryview] = {}
+        for i, name in enumerate(_SECTION_NAMES):
+            offset, length = sections[2 * i], sections[2 * i + 1]
+            view = whole[offset : offset + length]
+            self._views.append(view)
+            views[name] = view
+
+        def cast(name: str, format: str) -> memoryview:
+            view = views[name].cast(format)
+            self._views.append(view)
+            return view
+
+        self._string_offsets = cast("string_offsets", "Q")
+        self._strings = views["strings"]
+        self._ids = cast("ids", "I")
+        self._levels = cast("levels", "i")
+        self._detection_types = cast("detection_types", "I")
+        self._msgs = cast("msgs", "I")
+        self._by_id_rows = cast("by_id", "I")
+        self._by_detection_type_rows = cast("by_detection_type", "I")
+        self._by_level_detection_type_rows = cast("by_level_detection_type", "I")
+
+        metadata = json.loads(views["metadata"].tobytes().decode("utf_8"))
+        self._metadata = metadata
+        self._count_by_type = {
+            detection_type: count
+            for detection_type, count, _ in metadata["detection_types"]
+        }
+        self._kept_by_type = {
+            detection_type: kept for detection_type, _, kept in metadata["detection_types"]
+        }
+        self._levels_types = [
+            (level, detection_type)
+            for level, detection_type in metadata["levels_detection_types"]
+        ]
+        self._decoded_types = {}
+
+    def close(self) -> None:
+        # the views must be released before the map is closed
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+        self._fp.close()
+
+    def __enter__(self) -> "ResultArchive":
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.close()
+
+    @staticmethod
+    def write(
+        path: t.Union[str, pathlib.Path],
+        detection_data: DetectionData[t.Any, t.Any, t.Any],
+    ) -> None:
+        """write the detections as an archive
+
+        The file is replaced atomically.
+        Detections not kept because of `max_detection_per_type` cannot be written,
+        but they are counted in `count_of()` and `total_count` of the archive.
+
+        Parameters
+        ----------
+        path : str | Path
+            the file
+        detection_data : DetectionData
+            the detections
+
+        Raises
+        ------
+        ValueError
+            If there are 2**32 - 1 or more distinct strings.
+        """
+        detecteds = list(detection_data.values())
+        id_strs = [d.id_str for d in detecteds]
+        type_strs = [d.detection_type_str for d in detecteds]
+        msg_strs = [d.msg_str for d in detecteds]
+        levels = array("i", (d.level for d in detecteds))
+        del detecteds
+
+        # in the order of str, which is the order of the UTF-8 bytes
+        strings = sorted(
+            {s for s in chain(id_strs, type_strs, msg_strs) if s is not None}
+        )
+        if len(strings) >= _NONE:
+            raise ValueError(
+                f"archive cannot hold {_NONE} or more distinct strings; actually specified: {len(strings)}"
+            )
+        index_of = {s: i for i, s in enumerate(strings)}
+        index_of_none = index_of.get
+
+        def column(values: t.List[t.Optional[str]]) -> "array[int]":
+            return array("I", (index_of_none(s, _NONE) for s in values))  # type: ignore
+
+        ids = column(id_strs)
+        detection_types = column(type_strs)
+        msgs = column(msg_strs)
+        del id_strs, msg_strs
+
+        row_count = len(levels)
+        # sorted is stable, so the rows of a key are in the order of values()
+        by_id = array("I", sorted(range(row_count), key=ids.__getitem__))
+        by_detection_type = array(
+            "I", sorted(range(row_count), key=detection_types.__getitem__)
+        )
+        by_level_detection_type = array(
+            "I",
+            sorted(
+                range(row_count),
+                key=lambda row: (levels[row], detection_types[row]),
+            ),
+        )
+
+        encoded = [s.encode("utf_8") for s in strings]
+        del strings, index_of
+        string_offsets = array("Q", accumulate(chain((0,), map(len, encoded))))
+
+        kept: t.Dict[t.Optional[str], int] = {}
+        for detection_type in type_strs:
+            kept[detection_type] = kept.get(detection_type, 0) + 1
+        del type_strs
+        metadata = {
+            "detection_types": [
+                [
+                    _str_or_none(detection_type),
+                    detection_data.count_of(detection_type),
+                    kept.get(_str_or_none(detection_type), 0),
+                ]
+                for detection_type in detection_data.detection_types()
+            ],
+            "levels_detection_types": [
+                [level, _str_or_none(detection_type)]
+                for level, detection_type in detection_data.levels_detection_types()
+            ],
+            "unfinished_detection_types": [
+                _str_or_none(detection_type)
+                for detection_type in detection_data.unfinished_detection_types()
+            ],
+            "too_many_detection": detection_data.too_many_detection,
+            "failed_fast": detection_data.failed_fast,
+            "elapsed": detection_data.elapsed,
+            "predicted_elapsed": detection_data.predicted_elapsed,
+        }
+
+        path = pathlib.Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, mode="wb") as fp:
+            fp.write(b"\0" * (_HEADER.size + _SECTIONS.size))
+            sections: t.List[int] = []
+            for section in (
+                json.dumps(metadata).encode("utf_8"),
+                string_offsets,
+                encoded,
+                ids,
+                levels,
+                detection_types,
+                msgs,
+                by_id,
+                by_detection_type,
+                by_level_detection_type,
+            ):
+                fp.write(b"\0" * (-fp.tell() % _ALIGNMENT))
+                offset = fp.tell()
+                if isinstance(section, list):
+                    fp.writelines(section)
+                else:
+                    fp.write(section)
+                sections.extend((offset, fp.tell() - offset))
+
+            fp.seek(0)
+            fp.write(
+                _HEADER.pack(
+                    _MAGIC, ARCHIVE_FORMAT, _byteorder(), row_count, len(encoded)
+                )
+            )
+            fp.write(_SECTIONS.pack(*sections))
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+
+    def of_id(self, id: t.Any) -> t.Sequence[Detected[str, str, str]]:
+        """the detections of an ID
+
+        Parameters
+        ----------
+        id : Any
+            the ID; compared as a string
+
+        Returns
+        -------
+        Sequence[Detected]
+            the detections, read when accessed; empty if the ID is not detected
+        """
+        rows = self._by_id_rows
+        key = self._string_index(id)
+        if key is None:
+            return _ArchivedDetections(self, rows, range(0))
+        return _ArchivedDetections(
+            self, rows, _equal_range(rows, self._ids.__getitem__, key)
+        )
+
+    def of_detection_type(
+        self, detection_type: t.Any
+    ) -> t.Sequence[Detected[str, str, str]]:
+        """the detections of a detection type
+
+        Parameters
+        ----------
+        detection_type : Any
+            the detection type; compared as a string
+
+        Returns
+        -------
+        Sequence[Detected]
+            the detections, read when accessed; empty if the detection type is not detected
+        """
+        rows = self._by_detection_type_rows
+        key = self._string_index(detection_type)
+        if key is None:
+            return _ArchivedDetections(self, rows, range(0))
+        return _ArchivedDetections(
+            self, rows, _equal_range(rows, self._detection_types.__getitem__, key)
+        )
+
+    def of_level_detection_type(
+        self, level: int, detection_type: t.Any
+    ) -> t.Sequence[Detected[str, str, str]]:
+        """the detections of a level and a detection type
+
+        Parameters
+        ----------
+        level : int
+            the level
+        detection_type : Any
+            the detection type; compared as a string
+
+        Returns
+        -------
+        Sequence[Detected]
+            the detections, read when accessed; empty if none is detected
+        """
+        rows = self._by_level_detection_type_rows
+        key = self._string_index(detection_type)
+        if key is None:
+            return _ArchivedDetections(self, rows, range(0))
+        levels = self._levels
+        detection_types = self._detection_types
+        return _ArchivedDetections(
+            self,
+            rows,
+            _equal_range(
+                rows, lambda row: (levels[row], detection_types[row]), (level, key)
+            ),
+        )
+
+    def detected_at(self, row: int) -> Detected[str, str, str]:
+        """the detection of a row, in the order of `values()`"""
+        detection_type = self._detection_types[row]
+        decoded_type = self._decoded_types.get(detection_type)
+        if decoded_type is None:
+            decoded_type = self._decoded_types[detection_type] = self._string(
+                detection_type
+            )
+        return TextDetected(
+            self._string(self._ids[row]),  # type: ignore
+            self._levels[row],
+            decoded_type,  # type: ignore
+            self._string(self._msgs[row]),  # type: ignore
+            _NO_VARS,
+        )
+
+    def _string(self, index: int) -> t.Optional[str]:
+        if index == _NONE:
+            return None
+        offsets = self._string_offsets
+        return str(self._strings[offsets[index] : offsets[index + 1]], "utf_8")
+
+    def _string_index(self, value: t.Any) -> t.Optional[int]:
+        """the index of the string of a value in the string table; None if it is not in the table"""
+        if value is None:
+            return _NONE
+        s = str(value)
+        low, high = 0, len(self._string_offsets) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if t.cast(str, self._string(middle)) < s:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self._string_offsets) - 1 and self._string(low) == s:
+            return low
+        return None
+
+    def append(self, detected: Detected[str, str, str]):
+        raise TypeError("ResultArchive is read-only")
+
+    def extend(self, detecteds: t.Iterable[Detected[str, str, str]]):
+        raise TypeError("ResultArchive is read-only")
+
+    def add_rule_result(self, rule_result: RuleResult):
+        raise TypeError("ResultArchive is read-only")
+
+    def record_elapsed(
+        self, elapsed: float, predicted_elapsed: t.Optional[float] = None
+    ):
+        raise TypeError("ResultArchive is read-only")
+
+    def mark_failed_fast(self):
+        raise TypeError("ResultArchive is read-only")
+
+    def ids(self) -> t.Iterable[str]:
+        """create the iterator of IDs of records for which anomalies were detected, in the order of the IDs"""
+        previous = -1
+        ids = self._ids
+        for row in self._by_id_rows:
+            index = ids[row]
+            if index != previous:
+                previous = index
+                yield self._string(index)  # type: ignore
+
+    def detection_types(self) -> t.Iterable[str]:
+        return self._count_by_type.keys()
+
+    def levels_detection_types(self) -> t.Iterable[t.Tuple[int, str]]:
+        return iter(self._levels_types)
+
+    @property
+    def count(self) -> int:
+        return self._row_count
+
+    @property
+    def total_count(self) -> int:
+        return sum(self._count_by_type.values())
+
+    def count_of(self, detection_type: t.Any) -> int:
+        return self._count_by_type.get(_str_or_none(detection_type), 0)  # type: ignore
+
+    def truncated_detection_types(self) -> t.Iterable[str]:
+        return (
+            detection_type
+            for detection_type, count in self._count_by_type.items()
+            if count > self._kept_by_type[detection_type]
+        )
+
+    def unfinished_detection_types(self) -> t.Iterable[str]:
+        return iter(self._metadata["unfinished_detection_types"])
+
+    @property
+    def too_many_detection(self) -> bool:
+        return self._metadata["too_many_detection"]
+
+    @property
+    def failed_fast(self) -> bool:
+        return self._metadata["failed_fast"]
+
+    @property
+    def rule_results(self) -> t.Sequence[RuleResult]:
+        """Results of execution of each rule, which are not archived; always empty"""
+        return ()
+
+    @property
+    def elapsed(self) -> t.Optional[float]:
+        return self._metadata["elapsed"]
+
+    @property
+    def predicted_elapsed(self) -> t.Optional[float]:
+        return self._metadata["predicted_elapsed"]
+
+    def __getitem__(self, key: t.Any) -> t.Sequence[Detected[str, str, str]]:
+        of_id = self.of_id(key)
+        if len(of_id) > 0:
+            return of_id
+        of_detection_type = self.of_detection_type(key)
+        if len(of_detection_type) > 0:
+            return of_detection_type
+
+        if (
+            isinstance(key, t.Sized)
+            and len(key) == 2
+            and isinstance(key, t.Sequence)
+            and not isinstance(key, str)
+            and isinstance(key[0], int)
+        ):
+            of_level_detection_type = self.of_level_detection_type(key[0], key[1])
+            if len(of_level_detection_type) > 0:
+                return of_level_detection_type
+
+        raise KeyError(key)
+
+    def values(self) -> t.Generator[Detected[str, str, str], None, None]:
+        return (self.detected_at(row) for row in range(self._row_count))
+
+
+class _ArchivedDetections(t.Sequence[Detected[str, str, str]]):
+    """the detections of a range of an index of an archive, read when accessed
+
+    The range is kept apart from the index, which is released when the archive is closed.
+    """
+
+    _archive: ResultArchive
+    _rows: memoryview
+    _positions: range
+
+    def __init__(
+        self, archive: ResultArchive, rows: memoryview, positions: range
+    ) -> None:
+        self._archive = archive
+        self._rows = rows
+        self._positions = positions
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    @t.overload
+    def __getitem__(self, index: int) -> Detected[str, str, str]: ...
+
+    @t.overload
+    def __getitem__(self, index: slice) -> "_ArchivedDetections": ...
+
+    def __getitem__(
+        self, index: t.Union[int, slice]
+    ) -> t.Union[Detected[str, str, str], "_ArchivedDetections"]:
+        if isinstance(index, slice):
+            return _ArchivedDetections(
+                self._archive, self._rows, self._positions[index]
+            )
+        return self._archive.detected_at(self._rows[self._positions[index]])
+
+    def __iter__(self) -> t.Iterator[Detected[str, str, str]]:
+        detected_at = self._archive.detected_at
+        rows = self._rows
+        return (detected_at(rows[position]) for position in self._positions)
+
+    def __repr__(self) -> str:
+        return f"<_ArchivedDetections: {len(self._positions)} detections>"
+
+
+_K = t.TypeVar("_K")
+
+
+def _equal_range(rows: memoryview, key_of: t.Callable[[int], _K], key: _K) -> range:
+    """the positions of the rows of an index whose keys are equal to the key, found by binary search"""
+    low, high = 0, len(rows)
+    while low < high:
+        middle = (low + high) // 2
+        if key_of(rows[middle]) < key:  # type: ignore
+            low = middle + 1
+        else:
+            high = middle
+    start = low
+    high = len(rows)
+    while low < high:
+        middle = (low + high) // 2
+        if key < key_of(rows[middle]):  # type: ignore
+            high = middle
+        else:
+            low = middle + 1
+    return range(start, low)
+
+
+def _str_or_none(value: t.Any) -> t.Optional[str]:
+    return str(value) if value is not None else None
+
+
+def _byteorder() -> int:
+    return 0 if sys.byteorder == "little" else 1
@@ -0,0 +1,403 @@
+from dataclasses import dataclass, field
+from hashlib import blake2b
+from itertools import chain
+import logging
+import marshal
+import mmap
+import os
+import pathlib
+import struct
+import typing as t
+
+from ._detected import Detected, ID, MSG, DETECTION_TYPE
+
+if t.TYPE_CHECKING:
+    from ._detectiondata import DetectionData
+
+logger = logging.getLogger(__name__)
+
+_MAGIC = b"VALIDBBL"
+# incremented when the format of the file changes
+BASELINE_FORMAT = 1
+
+# magic, format, number of keys, offset of the records
+_HEADER = struct.Struct(">8sIxxxxQQ")
+# hash of (detection_type, id), hash of the detections of the key, offset of the entry
+# big endian, so that the order of the bytes is the order of the hashes
+_RECORD = struct.Struct(">QQQ")
+# length of an entry, which is a tuple (detection_type, id, level, msg) serialized with marshal
+_ENTRY_LENGTH = struct.Struct(">I")
+# the version of marshal supported by all the versions of Python which validb supports
+_MARSHAL_VERSION = 4
+
+_MASK = (1 << 64) - 1
+
+
+@dataclass(frozen=True)
+class BaselineEntry:
+    """A detection recorded in a baseline
+
+    If several anomalies of the same detection type are detected for an ID,
+    the first one is recorded.
+
+    Attributes
+    ----------
+    detection_type : str | None
+        the detection type
+    id : str | None
+        the ID
+    level : int
+        the level
+    msg : str | None
+        the message
+    """
+
+    detection_type: t.Optional[str]
+    id: t.Optional[str]
+    level: int
+    msg: t.Optional[str]
+
+
+@dataclass
+class DetectionDiff(t.Generic[ID, DETECTION_TYPE, MSG]):
+    """Difference of detections from a baseline, keyed by (detection type, ID)
+
+    Attributes
+    ----------
+    new : Sequence[Detected]
+        the detections whose keys are not in the baseline
+    changed : Sequence[Detected]
+        the detections whose keys are in the baseline with different levels or messages
+    resolved : Sequence[BaselineEntry]
+        the detections of the baseline whose keys are no longer detected;
+        the detection types whose detections were not all kept (`max_detection_per_type`)
+        and those of the rules which were not completed (`DetectionData.unfinished_detection_types()`)
+        are not included, since their keys may still be detected
+    unchanged : int
+        the number of keys detected in the same way as the baseline
+    """
+
+    new: t.List[Detected[ID, DETECTION_TYPE, MSG]] = field(default_factory=list)
+    changed: t.List[Detected[ID, DETECTION_TYPE, MSG]] = field(default_factory=list)
+    resolved: t.List[BaselineEntry] = field(default_factory=list)
+    unchanged: int = 0
+
+
+class Baseline:
+    """Keys of the detections of a past run, in a file read through `mmap`
+
+    The file holds a record of fixed width for each (detection type, ID),
+    sorted by the 64-bit hash of the key, followed by the hash of the levels and messages of its detections,
+    so that a run can be compared with it by merging without loading it,
+    and a key can be looked up by binary search.
+    The detection type, ID, level and message of a key are stored apart from the records
+    and read only when the key is resolved.
+
+    Distinct keys sharing a 64-bit hash are regarded as the same key,
+    which is unlikely unless there are billions of keys.
+    """
+
+    _path: pathlib.Path
+    _fp: t.BinaryIO
+    _mmap: t.Optional[mmap.mmap]
+    _records: memoryview
+    _count: int
+
+    def __init__(self, path: t.Union[str, pathlib.Path]) -> None:
+        """open a baseline file
+
+        Parameters
+        ----------
+        path : str | Path
+            the file written by `Baseline.write()`
+
+        Raises
+        ------
+        ValueError
+            If the file is not a baseline of this version.
+        """
+        self._path = pathlib.Path(path)
+        self._fp = open(self._path, mode="rb")
+        try:
+            header = self._fp.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError(f"baseline is broken: {path}")
+            magic, format, count, records_offset = _HEADER.unpack(header)
+            if magic != _MAGIC or format != BASELINE_FORMAT:
+                raise ValueError(
+                    f"baseline must be written by validb of format {BASELINE_FORMAT}: {path}"
+                )
+            self._count = count
+            # an empty file cannot be mapped
+            self._mmap = (
+                mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+                if count > 0
+                else None
+            )
+        except BaseException:
+            self._fp.close()
+            raise
+        self._records = (
+            memoryview(self._mmap)[
+                records_offset : records_offset + count * _RECORD.size
+            ]
+            if self._mmap is not None
+            else memoryview(b"")
+        )
+
+    def __len__(self) -> int:
+        """the number of keys"""
+        return self._count
+
+    def close(self) -> None:
+        self._records.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._fp.close()
+
+    def __enter__(self) -> "Baseline":
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.close()
+
+    def records(self) -> t.Iterator[t.Tuple[int, int, int]]:
+        """the records `(key hash, value hash, offset of the entry)` in the order of the key hash"""
+        return _RECORD.iter_unpack(self._records)
+
+    def entry(self, offset: int) -> BaselineEntry:
+        """the entry at the offset of a record"""
+        detection_type, id_, level, msg = marshal.loads(self._entry_bytes(offset))
+        return BaselineEntry(detection_type=detection_type, id=id_, level=level, msg=msg)
+
+    def _entry_bytes(self, offset: int) -> bytes:
+        assert self._mmap is not None
+        (length,) = _ENTRY_LENGTH.unpack_from(self._mmap, offset)
+        start = offset + _ENTRY_LENGTH.size
+        return self._mmap[start : start + length]
+
+    def lookup(self, detection_type: t.Any, id: t.Any) -> t.Optional[BaselineEntry]:
+        """find the entry of a key by binary search
+
+        Parameters
+        ----------
+        detection_type : Any
+            the detection type; compared as a string
+        id : Any
+            the ID; compared as a string
+
+        Returns
+        -------
+        BaselineEntry | None
+            the entry; None if the key is not in the baseline
+        """
+        key = _key_hash(
+            str(detection_type) if detection_type is not None else None,
+            str(id) if id is not None else None,
+        )
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            key_at, _, offset = _RECORD.unpack_from(self._records, middle * _RECORD.size)
+            if key_at < key:
+                low = middle + 1
+            elif key_at > key:
+                high = middle
+            else:
+                return self.entry(offset)
+        return None
+
+    @staticmethod
+    def write(
+        path: t.Union[str, pathlib.Path],
+        detection_data: "DetectionData[t.Any, t.Any, t.Any]",
+        *,
+        previous: t.Optional["Baseline"] = None,
+    ) -> None:
+        """write the detections as a baseline
+
+        The file is replaced atomically, so it can be the baseline the detections are compared with.
+        Detections not kept because of `max_detection_per_type` and those of the rules which were not completed
+        cannot be written; if `previous` is specified, its keys of these detection types are kept instead,
+        otherwise they will be reported as new in the next comparison.
+
+        Parameters
+        ----------
+        path : str | Path
+            the file
+        detection_data : DetectionData
+            the detections
+        previous : Baseline, optional
+            the baseline the detections were compared with; it may be of the same file
+        """
+        incomplete = {
+            str(d)
+            for d in chain(
+                detection_data.truncated_detection_types(),
+                detection_data.unfinished_detection_types(),
+            )
+        }
+        hashed = _HashedDetections(detection_data)
+        # the keys of the previous baseline kept for the incomplete detection types
+        carried: t.Dict[int, t.Tuple[int, bytes]] = {}
+        if len(incomplete) > 0:
+            if previous is None:
+                logger.warning(
+                    "baseline lacks detections not kept or not completed of detection types: %s",
+                    ", ".join(sorted(incomplete)),
+                )
+            else:
+                for key, value, offset in previous.records():
+                    if key in hashed.values:
+                        continue
+                    entry = previous._entry_bytes(offset)
+                    if marshal.loads(entry)[0] in incomplete:
+                        carried[key] = (value, entry)
+
+        path = pathlib.Path(path)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, mode="wb") as fp:
+            fp.write(b"\0" * _HEADER.size)
+            # the entries first, since the offsets are needed by the records
+            values = hashed.values
+            sorted_keys = sorted(chain(values, carried))
+            offsets: t.List[int] = []
+            for key in sorted_keys:
+                offsets.append(fp.tell())
+                detected = hashed.first.get(key)
+                if detected is not None:
+                    entry = marshal.dumps(
+                        (
+                            detected.detection_type_str,
+                            detected.id_str,
+                            detected.level,
+                            detected.msg_str,
+                        ),
+                        _MARSHAL_VERSION,
+                    )
+                else:
+                    entry = carried[key][1]
+                fp.write(_ENTRY_LENGTH.pack(len(entry)))
+                fp.write(entry)
+
+            records_offset = fp.tell()
+            pack = _RECORD.pack
+            fp.writelines(
+                pack(key, values[key] if key in values else carried[key][0], offset)
+                for key, offset in zip(sorted_keys, offsets)
+            )
+
+            fp.seek(0)
+            fp.write(
+                _HEADER.pack(_MAGIC, BASELINE_FORMAT, len(sorted_keys), records_offset)
+            )
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+
+
+def diff_detections(
+    detection_data: "DetectionData[ID, DETECTION_TYPE, MSG]", baseline: Baseline
+) -> DetectionDiff[ID, DETECTION_TYPE, MSG]:
+    """compare detections with a baseline; see `DetectionData.diff()`"""
+    diff: DetectionDiff[ID, DETECTION_TYPE, MSG] = DetectionDiff()
+    hashed = _HashedDetections(detection_data)
+    values = hashed.values
+    incomplete = {
+        str(d)
+        for d in chain(
+            detection_data.truncated_detection_types(),
+            detection_data.unfinished_detection_types(),
+        )
+    }
+
+    current = iter(sorted(values))
+    key = next(current, None)
+    for baseline_key, baseline_value, offset in baseline.records():
+        # the keys only in the current detections
+        while key is not None and key < baseline_key:
+            diff.new.extend(hashed.of(key))
+            key = next(current, None)
+
+        if key == baseline_key:
+            if values[key] == baseline_value:
+                diff.unchanged += 1
+            else:
+                diff.changed.extend(hashed.of(key))
+            key = next(current, None)
+        else:
+            entry = baseline.entry(offset)
+            if entry.detection_type not in incomplete:
+                diff.resolved.append(entry)
+
+    while key is not None:
+        diff.new.extend(hashed.of(key))
+        key = next(current, None)
+    return diff
+
+
+def _key_prefix(detection_type: t.Optional[str]) -> str:
+    # repr distinguishes None from "None"
+    return f"{detection_type!r}\0"
+
+
+def _key_hash(detection_type: t.Optional[str], id: t.Optional[str]) -> int:
+    return int.from_bytes(
+        blake2b(
+            f"{_key_prefix(detection_type)}{id!r}".encode("utf_8"), digest_size=8
+        ).digest(),
+        "big",
+    )
+
+
+class _HashedDetections(t.Generic[ID, DETECTION_TYPE, MSG]):
+    """detections keyed by the hash of (detection type, ID)"""
+
+    values: t.Dict[int, int]
+    """the hash of the levels and messages of the detections of each key"""
+    first: t.Dict[int, Detected[ID, DETECTION_TYPE, MSG]]
+    """the first detection of each key"""
+    others: t.Dict[int, t.List[Detected[ID, DETECTION_TYPE, MSG]]]
+    """the other detections of the keys detected more than once"""
+
+    def __init__(self, detection_data: "DetectionData[ID, DETECTION_TYPE, MSG]"):
+        values: t.Dict[int, int] = {}
+        first: t.Dict[int, Detected[ID, DETECTION_TYPE, MSG]] = {}
+        others: t.Dict[int, t.List[Detected[ID, DETECTION_TYPE, MSG]]] = {}
+        # the prefixes of the keys, computed once for each detection type
+        prefixes: t.Dict[t.Any, str] = {}
+        from_bytes = int.from_bytes
+        for detected in detection_data.values():
+            detection_type = detected.detection_type
+            prefix = prefixes.get(detection_type)
+            if prefix is None:
+                prefix = prefixes[detection_type] = _key_prefix(
+                    detected.detection_type_str
+                )
+            key = from_bytes(
+                blake2b(
+                    f"{prefix}{detected.id_str!r}".encode("utf_8"), digest_size=8
+                ).digest(),
+                "big",
+            )
+            value = from_bytes(
+                blake2b(
+                    f"{detected.level}\0{detected.msg_str}".encode("utf_8"),
+                    digest_size=8,
+                ).digest(),
+                "big",
+            )
+            if key not in values:
+                values[key] = value
+                first[key] = detected
+            else:
+                # the sum does not depend on the order of the detections
+                values[key] = (values[key] + value) & _MASK
+                others.setdefault(key, []).append(detected)
+        self.values = values
+        self.first = first
+        self.others = others
+
+    def of(self, key: int) -> t.List[Detected[ID, DETECTION_TYPE, MSG]]:
+        """all the detections of a key"""
+        return [self.first[key], *self.others.get(key, ())]
@@ -0,0 +1,393 @@
+import json
+import logging
+import marshal
+import os
+import pathlib
+import threading
+import typing as t
+
+from . import __version__
+from ._detected import Detected, DetectedType, ID, MSG, DETECTION_TYPE
+from ._embedded_vars import EmbeddedVariables
+from ._ruleresult import RuleOutcome, RuleResult
+
+if t.TYPE_CHECKING:
+    from .rules import Rule
+
+logger = logging.getLogger(__name__)
+
+# incremented when the format of the manifest or the detection files changes
+CHECKPOINT_FORMAT = 1
+
+_MANIFEST = "manifest.json"
+_COMPLETED_SUFFIX = ".detections"
+_PARTIAL_SUFFIX = ".partial"
+
+# the variables of restored detections, which are not persisted
+_NO_VARS = EmbeddedVariables((), {})
+
+
+class Checkpoint:
+    """Progress of `validate_db()` persisted in a directory, so that an interrupted validation can be resumed
+
+    The detections of each rule are appended to a file of the rule while it runs,
+    as a stream of `marshal` records `(id, level, detection_type, msg)`.
+    When the rule completes, it is recorded in the manifest (`manifest.json`) keyed by `Rule.fingerprint()`.
+    A resumed validation skips the completed rules and merges their stored detections instead;
+    the variables of the stored detections (`Detected.embedded_vars`) are not restored.
+
+    Rules reading their rows page by page can record their progress with `RuleExecution.commit_progress()`;
+    a resumed validation restores the detections up to the last committed key
+    and lets the rule continue from `RuleExecution.resume_key`.
+
+    Only ids, detection types and messages serializable with `marshal` (e.g. str, int, tuple) are supported;
+    rules with other detections are executed again when resumed.
+    """
+
+    _directory: pathlib.Path
+    _lock: threading.Lock
+    _completed: t.Dict[str, t.Dict[str, t.Any]]
+    _progress: t.Dict[str, t.Dict[str, t.Any]]
+    _started: t.Set[str]
+    _resume: bool
+
+    def __init__(
+        self, directory: t.Union[str, pathlib.Path], *, resume: bool = False
+    ) -> None:
+        """open a checkpoint directory
+
+        Parameters
+        ----------
+        directory : str | Path
+            the directory; it is created if it does not exist
+        resume : bool
+            whether to resume the validation recorded in the directory;
+            If False, the previous records in the directory are removed.
+        """
+        self._directory = pathlib.Path(directory)
+        self._lock = threading.Lock()
+        self._completed = {}
+        self._progress = {}
+        self._started = set()
+        self._resume = resume
+
+        self._directory.mkdir(parents=True, exist_ok=True)
+        if resume:
+            self._load_manifest()
+        else:
+            self._clear()
+
+    @property
+    def directory(self) -> pathlib.Path:
+        return self._directory
+
+    def for_target(self, target: str) -> "Checkpoint":
+        """the checkpoint of a target validated by `validate_targets()`, in a subdirectory
+
+        Parameters
+        ----------
+        target : str
+            the name of the target;
+            It must not contain path separators or `..`, since it names a subdirectory.
+        """
+        if (
+            target in ("", ".")
+            or ".." in target
+            or os.sep in target
+            or (os.altsep is not None and os.altsep in target)
+        ):
+            raise ValueError(
+                f"target must be a name without path separators or '..'; actually specified: {target!r}"
+            )
+        return Checkpoint(self._directory / "targets" / target, resume=self._resume)
+
+    def _load_manifest(self) -> None:
+        try:
+            with open(self._directory / _MANIFEST, encoding="utf_8") as fp:
+                manifest = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning(
+                "ignored a broken checkpoint manifest in %s",
+                self._directory,
+                exc_info=True,
+            )
+            return
+
+        if (
+            manifest.get("format") != CHECKPOINT_FORMAT
+            or manifest.get("version") != __version__
+        ):
+            logger.warning(
+                "ignored a checkpoint made by another version of validb in %s",
+                self._directory,
+            )
+            return
+        self._completed = dict(manifest.get("completed", {}))
+        self._progress = dict(manifest.get("progress", {}))
+
+    def _clear(self) -> None:
+        for path in self._directory.iterdir():
+            if path.name == _MANIFEST or path.suffix in (
+                _COMPLETED_SUFFIX,
+                _PARTIAL_SUFFIX,
+            ):
+                path.unlink()
+
+    def _write_manifest(self) -> None:
+        """write the manifest atomically; called with the lock held"""
+        path = self._directory / _MANIFEST
+        tmp_path = path.with_name(f"{_MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp_path, mode="w", encoding="utf_8") as fp:
+            json.dump(
+                {
+                    "format": CHECKPOINT_FORMAT,
+                    "version": __version__,
+                    "completed": self._completed,
+                    "progress": self._progress,
+                },
+                fp,
+            )
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.replace(tmp_path, path)
+
+    def completed_result(
+        self, rule: "Rule[t.Any, t.Any, t.Any]"
+    ) -> t.Optional[RuleResult]:
+        """the result of the rule if it has been completed; None otherwise"""
+        with self._lock:
+            entry = self._completed.get(rule.fingerprint())
+        if entry is None:
+            return None
+        return RuleResult(
+            rule=rule,
+            outcome=RuleOutcome.COMPLETED,
+            elapsed=entry["elapsed"],
+            rows=entry["rows"],
+            detections=entry["detections"],
+            detail="checkpoint",
+        )
+
+    def restore(
+        self,
+        rule: "Rule[ID, DETECTION_TYPE, MSG]",
+        detected: DetectedType[ID, DETECTION_TYPE, MSG],
+    ) -> t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]:
+        """the stored detections of a completed rule
+
+        Parameters
+        ----------
+        rule : Rule
+            the rule, for which `completed_result()` is not None
+        detected : DetectedType
+            the constructor of the restored detections
+        """
+        path = self._directory / (rule.fingerprint() + _COMPLETED_SUFFIX)
+        return _read_detections(path, None, detected)
+
+    def start(
+        self, rule: "Rule[t.Any, t.Any, t.Any]"
+    ) -> t.Optional["RuleCheckpoint"]:
+        """start recording the detections of a rule
+
+        Returns
+        -------
+        RuleCheckpoint | None
+            the recorder; None if the same rule is already being recorded
+        """
+        fingerprint = rule.fingerprint()
+        with self._lock:
+            if fingerprint in self._started:
+                return None
+            self._started.add(fingerprint)
+            progress = self._progress.get(fingerprint)
+        return RuleCheckpoint(self, fingerprint, progress)
+
+    def _commit(
+        self,
+        fingerprint: str,
+        progress: t.Optional[t.Mapping[str, t.Any]],
+        completed: t.Optional[t.Mapping[str, t.Any]] = None,
+    ) -> None:
+        with self._lock:
+            if progress is not None:
+                self._progress[fingerprint] = dict(progress)
+            else:
+                self._progress.pop(fingerprint, None)
+            if completed is not None:
+                self._completed[fingerprint] = dict(completed)
+            self._write_manifest()
+
+    def _finish(self, fingerprint: str) -> None:
+        with self._lock:
+            self._started.discard(fingerprint)
+
+
+class RuleCheckpoint:
+    """recorder of the detections of a rule into a checkpoint
+
+    Normally, this class is used only inside validb.
+    """
+
+    _checkpoint: Checkpoint
+    _fingerprint: str
+    _path: pathlib.Path
+    _fp: t.Optional[t.BinaryIO]
+    _resume_key: t.Any
+    _restored_size: int
+    _restored_detections: int
+    _restored_rows: int
+    _detections: int
+    _broken: bool
+
+    def __init__(
+        self,
+        checkpoint: Checkpoint,
+        fingerprint: str,
+        progress: t.Optional[t.Mapping[str, t.Any]],
+    ) -> None:
+        self._checkpoint = checkpoint
+        self._fingerprint = fingerprint
+        self._path = checkpoint.directory / (fingerprint + _PARTIAL_SUFFIX)
+        self._fp = None
+        self._resume_key = progress["key"] if progress is not None else None
+        self._restored_size = progress["size"] if progress is not None else 0
+        self._restored_detections = (
+            progress["detections"] if progress is not None else 0
+        )
+        self._restored_rows = progress["rows"] if progress is not None else 0
+        self._detections = self._restored_detections
+        self._broken = False
+
+    @property
+    def resume_key(self) -> t.Any:
+        """the key committed last by the rule; None to start from the beginning"""
+        return self._resume_key
+
+    @property
+    def restored_rows(self) -> int:
+        """the number of rows read up to the key committed last"""
+        return self._restored_rows
+
+    def restored(
+        self, detected: DetectedType[ID, DETECTION_TYPE, MSG]
+    ) -> t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]:
+        """the detections up to the key committed last"""
+        if self._restored_size <= 0:
+            return iter(())
+        return _read_detections(self._path, self._restored_size, detected)
+
+    def write(self, detected: Detected[t.Any, t.Any, t.Any]) -> None:
+        """record a detection of the rule"""
+        if self._broken:
+            return
+        try:
+            record = marshal.dumps(
+                (detected.id, detected.level, detected.detection_type, detected.msg)
+            )
+        except ValueError:
+            logger.warning(
+                "detections of rule %s are not recorded into the checkpoint since they are not serializable",
+                detected.detection_type_str,
+            )
+            self._broken = True
+            return
+
+        if self._fp is None:
+            self._fp = open(self._path, mode="r+b" if self._restored_size > 0 else "wb")
+            # drop the detections after the key committed last
+            self._fp.truncate(self._restored_size)
+            self._fp.seek(self._restored_size)
+        self._fp.write(record)
+        self._detections += 1
+
+    def _sync(self) -> int:
+        """make the recorded detections durable and return the size of the file"""
+        if self._fp is None:
+            # nothing is detected after the key committed last
+            with open(
+                self._path, mode="r+b" if self._restored_size > 0 else "wb"
+            ) as fp:
+                fp.truncate(self._restored_size)
+            return self._restored_size
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+        return self._fp.tell()
+
+    def commit_progress(self, key: t.Any, rows: int) -> None:
+        """record that the rule has processed the rows up to the key
+
+        Parameters
+        ----------
+        key : Any
+            the key from which the rule resumes; it must be JSON-serializable
+        rows : int
+            the number of rows read by the rule so far in this execution
+        """
+        if self._broken:
+            return
+        try:
+            json.dumps(key)
+        except (TypeError, ValueError):
+            raise TypeError(
+                f"key of progress must be JSON-serializable; actually specified: {key!r}"
+            )
+        self._checkpoint._commit(
+            self._fingerprint,
+            {
+                "key": key,
+                "size": self._sync(),
+                "detections": self._detections,
+                "rows": self._restored_rows + rows,
+            },
+        )
+
+    def complete(self, result: RuleResult) -> None:
+        """record that the rule is completed
+
+        Parameters
+        ----------
+        result : RuleResult
+            the result of the rule, which includes the restored detections and rows
+        """
+        try:
+            if self._broken:
+                return
+            self._sync()
+            self.close()
+            self._path.replace(self._path.with_suffix(_COMPLETED_SUFFIX))
+            self._checkpoint._commit(
+                self._fingerprint,
+                None,
+                {
+                    "detection_type": str(result.rule.detection_type()),
+                    "elapsed": result.elapsed,
+                    "rows": result.rows,
+                    "detections": result.detections,
+                },
+            )
+        finally:
+            self._checkpoint._finish(self._fingerprint)
+
+    def close(self) -> None:
+        """stop recording; the progress committed so far is kept"""
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+        self._checkpoint._finish(self._fingerprint)
+
+
+def _read_detections(
+    path: pathlib.Path,
+    size: t.Optional[int],
+    detected: DetectedType[ID, DETECTION_TYPE, MSG],
+) -> t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]:
+    with open(path, mode="rb") as fp:
+        while size is None or fp.tell() < size:
+            try:
+                id_, level, detection_type, msg = marshal.load(fp)
+            except EOFError:
+                return
+            yield detected(id_, level, detection_type, msg, _NO_VARS)
@@ -1,3 +1,4 @@
+import functools
 import importlib
 import typing as t
 
@@ -34,11 +35,7 @@ def import_class_dinamically(
     if len(path_parts) < 2:
         raise IllegalPathError(path)
 
-    module_str = ".".join(path_parts[:-1])
-    class_name = path_parts[-1]
-    module = importlib.import_module(module_str)
-
-    class_loaded: t.Type[t.Any] = getattr(module, class_name)
+    class_loaded = _load_attribute(path)
 
     if not isinstance(class_loaded, t.Type):
         raise NonClassLoadedError(class_loaded)
@@ -48,6 +45,17 @@ def import_class_dinamically(
     return class_loaded
 
 
+@functools.lru_cache(maxsize=None)
+def _load_attribute(path: str) -> t.Any:
+    """the attribute of a module specified by a path like `module.attribute`
+
+    It is memoized since configs often specify the same class for many rules.
+    """
+    module_str, _, attribute_name = path.rpartition(".")
+    module = importlib.import_module(module_str)
+    return getattr(module, attribute_name)
+
+
 def construct_imported_dinamically(
     attr: t.Mapping[str, t.Any],
     expected_class: t.Type[T],
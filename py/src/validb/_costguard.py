@@ -0,0 +1,173 @@
+from dataclasses import dataclass
+import enum
+import logging
+import typing as t
+
+from .datasources import DataSources, QueryEstimate
+
+if t.TYPE_CHECKING:
+    from .rules import Rule
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CostBudget:
+    """Upper limits of the estimated cost of a query
+
+    Attributes
+    ----------
+    max_rows : float | None
+        maximum number of rows estimated to be examined; None means unlimited
+    max_cost : float | None
+        maximum cost estimated by the planner; None means unlimited
+    """
+
+    max_rows: t.Optional[float] = None
+    max_cost: t.Optional[float] = None
+
+    def violation(self, estimate: QueryEstimate) -> t.Optional[str]:
+        """check the estimation against the budget
+
+        Parameters
+        ----------
+        estimate : QueryEstimate
+            the estimation of the query
+
+        Returns
+        -------
+        str | None
+            the description of the violation; None if the estimation is within the budget
+        """
+        if (
+            self.max_rows is not None
+            and estimate.rows is not None
+            and estimate.rows > self.max_rows
+        ):
+            return f"estimated rows {estimate.rows:g} > {self.max_rows:g}"
+        if (
+            self.max_cost is not None
+            and estimate.cost is not None
+            and estimate.cost > self.max_cost
+        ):
+            return f"estimated cost {estimate.cost:g} > {self.max_cost:g}"
+        return None
+
+
+class CostGuardAction(enum.Enum):
+    """What to do with rules over budget"""
+
+    SKIP = "skip"
+    """the rule is not executed"""
+
+    WARN = "warn"
+    """a warning is logged and the rule is executed"""
+
+    FAIL = "fail"
+    """the validation fails before executing any rule"""
+
+
+class CostBudgetExceededError(Exception):
+    """An exception thrown when rules are over budget and the action is `CostGuardAction.FAIL`."""
+
+    def __init__(
+        self, violations: t.Sequence[t.Tuple["Rule[t.Any, t.Any, t.Any]", str]]
+    ) -> None:
+        super().__init__(
+            "; ".join(
+                f"{rule.detection_type()}: {violation}" for rule, violation in violations
+            )
+        )
+        self.violations = violations
+
+
+class CostGuard:
+    """Pre-flight check of the estimated cost of rules
+
+    Before the validation, each rule is estimated with `Rule.estimate()`
+    (e.g. `EXPLAIN` of the datasource) and compared to its budget.
+    The budget of a rule is `Rule.cost_budget()` if specified, otherwise the global budget.
+    Rules which cannot be estimated always pass.
+    """
+
+    _budget: t.Optional[CostBudget]
+    _action: CostGuardAction
+
+    def __init__(
+        self,
+        budget: t.Optional[CostBudget] = None,
+        *,
+        action: CostGuardAction = CostGuardAction.WARN,
+    ) -> None:
+        """Initialize object
+
+        Parameters
+        ----------
+        budget : CostBudget | None
+            the global budget applied to rules without their own budget
+        action : CostGuardAction
+            what to do with rules over budget
+        """
+        self._budget = budget
+        self._action = action
+
+    @property
+    def action(self) -> CostGuardAction:
+        return self._action
+
+    def check(
+        self,
+        rules: t.Iterable["Rule[t.Any, t.Any, t.Any]"],
+        *,
+        datasources: DataSources,
+    ) -> t.Sequence[t.Tuple["Rule[t.Any, t.Any, t.Any]", str]]:
+        """find rules over budget
+
+        Parameters
+        ----------
+        rules : Iterable[Rule]
+            rules to be checked
+        datasources : DataSources
+            datasources used to estimate the rules
+
+        Returns
+        -------
+        Sequence[tuple[Rule, str]]
+            rules over budget with the description of the violation
+
+        Raises
+        ------
+        CostBudgetExceededError
+            If some rules are over budget and the action is `CostGuardAction.FAIL`.
+        """
+        violations: t.List[t.Tuple["Rule[t.Any, t.Any, t.Any]", str]] = []
+        for rule in rules:
+            budget = rule.cost_budget()
+            if budget is None:
+                budget = self._budget
+            if budget is None:
+                continue
+
+            estimate = rule.estimate(datasources=datasources)
+            if estimate is None:
+                logger.debug(
+                    "the cost of rule %s cannot be estimated", rule.detection_type()
+                )
+                continue
+
+            violation = budget.violation(estimate)
+            if violation is not None:
+                violations.append((rule, violation))
+
+        if self._action == CostGuardAction.FAIL and len(violations) > 0:
+            raise CostBudgetExceededError(violations)
+        for rule, violation in violations:
+            logger.warning(
+                "rule %s is over budget (%s)%s",
+                rule.detection_type(),
+                violation,
+                "; skipped" if self._action == CostGuardAction.SKIP else "",
+            )
+
+        return violations
@@ -1,7 +1,9 @@
 import abc
+import sys
 import typing as t
 
 from ._embedded_vars import EmbeddedVariables
+from .formatter import MessageTemplate
 
 
 ID = t.TypeVar("ID")
@@ -9,13 +11,42 @@ DETECTION_TYPE = t.TypeVar("DETECTION_TYPE")
 MSG = t.TypeVar("MSG")
 
 
+class DeferredMessage:
+    """A message rendered on demand
+
+    It holds the compiled template and the variables of the detection,
+    which the detection keeps anyway, instead of the rendered string.
+    The message is rendered when `Detected.msg` is accessed for the first time,
+    so no message is rendered if only the counts of detections are used.
+    Rendered messages are interned, so identical messages share memory.
+    """
+
+    __slots__ = ("_template", "_embedded_vars")
+
+    _template: MessageTemplate
+    _embedded_vars: EmbeddedVariables
+
+    def __init__(
+        self, template: MessageTemplate, embedded_vars: EmbeddedVariables
+    ) -> None:
+        self._template = template
+        self._embedded_vars = embedded_vars
+
+    def render(self) -> str:
+        """render the message"""
+        embedded_vars = self._embedded_vars
+        return sys.intern(
+            self._template.render(embedded_vars.sequence, embedded_vars.mapping)
+        )
+
+
 class Detected(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
     """detected anomaly"""
 
     _id: ID
     _level: int
     _detection_type: DETECTION_TYPE
-    _msg: MSG
+    _msg: t.Union[MSG, DeferredMessage]
     _embedded_vars: EmbeddedVariables
 
     def __init__(
@@ -23,7 +54,7 @@ class Detected(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
         id: ID,
         level: int,
         detection_type: DETECTION_TYPE,
-        msg: MSG,
+        msg: t.Union[MSG, DeferredMessage],
         embedded_vars: EmbeddedVariables,
     ) -> None:
         """create detection object
@@ -38,8 +69,8 @@ class Detected(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
             The higher the number, the more serious the detection is treated as.
         detection_type : DETECTION_TYPE
             Type of anomaly detected.
-        msg : MSG
-            The message.
+        msg : MSG | DeferredMessage
+            The message; a DeferredMessage is rendered on first access of `self.msg`.
         embedded_vars : EmbeddedVariables
             variables embedded while the detection
         """
@@ -88,7 +119,10 @@ class Detected(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
     @property
     def msg(self) -> MSG:
         """The message"""
-        return self._msg
+        msg = self._msg
+        if isinstance(msg, DeferredMessage):
+            msg = self._msg = t.cast(MSG, msg.render())
+        return msg
 
     @property
     def msg_str(self) -> t.Optional[str]:
@@ -118,6 +152,6 @@ class DetectedType(t.Protocol, t.Generic[ID, DETECTION_TYPE, MSG]):
         id: ID,
         level: int,
         detection_type: DETECTION_TYPE,
-        msg: MSG,
+        msg: t.Union[MSG, DeferredMessage],
         embedded_vars: EmbeddedVariables,
     ) -> Detected[ID, DETECTION_TYPE, MSG]: ...
@@ -3,6 +3,10 @@ from itertools import chain
 import typing as t
 
 from ._detected import Detected
+from ._ruleresult import RuleOutcome, RuleResult
+
+if t.TYPE_CHECKING:
+    from ._baseline import Baseline, DetectionDiff
 
 
 ID = t.TypeVar("ID")
@@ -25,7 +29,13 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
 
     _append_cnt: int
     _max_detection: int
+    _max_detection_per_type: int
     _too_many_detection_flag: bool
+    _failed_fast_flag: bool
+    _count_by_detection_type: t.MutableMapping[DETECTION_TYPE, int]
+    _rule_results: t.List[RuleResult]
+    _elapsed: t.Optional[float]
+    _predicted_elapsed: t.Optional[float]
     _by_id: t.MutableMapping[ID, t.List[Detected[ID, DETECTION_TYPE, MSG]]]
     _by_detection_type: t.MutableMapping[
         DETECTION_TYPE, t.List[Detected[ID, DETECTION_TYPE, MSG]]
@@ -34,7 +44,11 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
         int, t.MutableMapping[DETECTION_TYPE, t.List[Detected[ID, DETECTION_TYPE, MSG]]]
     ]
 
-    def __init__(self, max_detection: t.Optional[int]) -> None:
+    def __init__(
+        self,
+        max_detection: t.Optional[int],
+        max_detection_per_type: t.Optional[int] = None,
+    ) -> None:
         """Initialize object
 
         Parameters
@@ -42,10 +56,22 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
         max_detection : int | None
             the maximum number of detections;
             An exception will be raised when an attempt is made to register a detection that exceeds this number.
+        max_detection_per_type : int | None
+            the maximum number of detections kept for each detection type;
+            Detections exceeding this number are not kept but only counted,
+            so `count_of()` and `total_count` remain exact.
         """
         self._max_detection = max_detection if max_detection is not None else 1 << 31
+        self._max_detection_per_type = (
+            max_detection_per_type if max_detection_per_type is not None else 1 << 31
+        )
         self._append_cnt = 0
         self._too_many_detection_flag = False
+        self._failed_fast_flag = False
+        self._count_by_detection_type = defaultdict(lambda: 0)
+        self._rule_results = []
+        self._elapsed = None
+        self._predicted_elapsed = None
         self._by_id = defaultdict(lambda: [])
         self._by_detection_type = defaultdict(lambda: [])
         self._by_level_detection_type = defaultdict(lambda: defaultdict(lambda: []))
@@ -60,21 +86,30 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
         detected : Detected
             detected anomaly
 
+        If the maximum number of detections per detection type has already been
+        kept for the detection type, the detection is only counted and discarded.
+
         Raises
         ------
         TooManyDetectionException
             If the maximum number of detections specified at the time of instance creation is exceeded.
         """
+        detection_type = detected.detection_type
+        # the list is not created here, so that a rejected detection leaves no empty list
+        kept = len(self._by_detection_type.get(detection_type, ()))
+        if kept >= self._max_detection_per_type:
+            self._count_by_detection_type[detection_type] += 1
+            return
+
         if self._append_cnt >= self._max_detection:
             self._too_many_detection_flag = True
             raise TooManyDetectionException()
         self._append_cnt += 1
+        self._count_by_detection_type[detection_type] += 1
 
         self._by_id[detected.id].append(detected)
-        self._by_detection_type[detected.detection_type].append(detected)
-        self._by_level_detection_type[detected.level][detected.detection_type].append(
-            detected
-        )
+        self._by_detection_type[detection_type].append(detected)
+        self._by_level_detection_type[detected.level][detection_type].append(detected)
 
     def extend(self, detecteds: t.Iterable[Detected[ID, DETECTION_TYPE, MSG]]):
         """append detecteds anomaly
@@ -94,6 +129,42 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
         for detected in detecteds:
             self.append(detected)
 
+    def add_rule_result(self, rule_result: RuleResult):
+        """append a result of execution of a rule
+
+        Normally, this function is used only inside validb.
+
+        Parameters
+        ----------
+        rule_result : RuleResult
+            the result of execution of a rule
+        """
+        self._rule_results.append(rule_result)
+
+    def record_elapsed(
+        self, elapsed: float, predicted_elapsed: t.Optional[float] = None
+    ):
+        """record wall time of the whole validation
+
+        Normally, this function is used only inside validb.
+
+        Parameters
+        ----------
+        elapsed : float
+            wall time in seconds
+        predicted_elapsed : float | None
+            wall time predicted by the scheduler in seconds
+        """
+        self._elapsed = elapsed
+        self._predicted_elapsed = predicted_elapsed
+
+    def mark_failed_fast(self):
+        """record that the validation was stopped by fail-fast
+
+        Normally, this function is used only inside validb.
+        """
+        self._failed_fast_flag = True
+
     def ids(self) -> t.Iterable[ID]:
         """create the iterator of IDs of records for which anomalies were detected.
 
@@ -107,8 +178,11 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
         return self._by_id.keys()
 
     def detection_types(self) -> t.Iterable[DETECTION_TYPE]:
-        """create the iterator of detection types for which anomalies were detected."""
-        return self._by_detection_type.keys()
+        """create the iterator of detection types for which anomalies were detected.
+
+        It includes detection types none of whose anomalies were kept because of `max_detection_per_type`.
+        """
+        return self._count_by_detection_type.keys()
 
     def levels_detection_types(self) -> t.Iterable[t.Tuple[int, DETECTION_TYPE]]:
         """create the iterator of tupels of levels and detection types for which anomalies were detected.
@@ -123,9 +197,52 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
 
     @property
     def count(self) -> int:
-        """Number of anomalies detected"""
+        """Number of anomalies kept in this object"""
         return self._append_cnt
 
+    @property
+    def total_count(self) -> int:
+        """Number of anomalies detected, including those not kept because of `max_detection_per_type`"""
+        return sum(self._count_by_detection_type.values())
+
+    def count_of(self, detection_type: DETECTION_TYPE) -> int:
+        """Number of anomalies detected of the specified detection type
+
+        Unlike `len(self[detection_type])`, it includes anomalies
+        not kept because of `max_detection_per_type`.
+
+        Parameters
+        ----------
+        detection_type : DETECTION_TYPE
+            the detection type
+
+        Returns
+        -------
+        int
+            the number of anomalies of the detection type
+        """
+        return self._count_by_detection_type.get(detection_type, 0)
+
+    def truncated_detection_types(self) -> t.Iterable[DETECTION_TYPE]:
+        """create the iterator of detection types for which some anomalies were not kept because of `max_detection_per_type`."""
+        return (
+            detection_type
+            for detection_type, count in self._count_by_detection_type.items()
+            if count > len(self._by_detection_type.get(detection_type, ()))
+        )
+
+    def unfinished_detection_types(self) -> t.Iterable[DETECTION_TYPE]:
+        """create the iterator of detection types of the rules which were not completed
+
+        The anomalies of these detection types may have been detected only partly or not at all,
+        e.g. since the rules were skipped, timed out, cancelled or not started after fail-fast.
+        """
+        unfinished: t.Dict[DETECTION_TYPE, None] = {}
+        for rule_result in self._rule_results:
+            if rule_result.outcome != RuleOutcome.COMPLETED:
+                unfinished.update(dict.fromkeys(rule_result.rule.detection_types()))
+        return unfinished.keys()
+
     @property
     def too_many_detection(self) -> bool:
         """Whether the number of detections exceeds the initially specified maximum number of detections
@@ -135,11 +252,36 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
         """
         return self._too_many_detection_flag
 
+    @property
+    def failed_fast(self) -> bool:
+        """Whether the validation was stopped because an anomaly of a level at or above the fail-fast level was detected
+
+        This value of true means that the remaining rules were not executed
+        and the running rules were cancelled.
+        """
+        return self._failed_fast_flag
+
+    @property
+    def rule_results(self) -> t.Sequence[RuleResult]:
+        """Results of execution of each rule, in the order of completion"""
+        return self._rule_results
+
+    @property
+    def elapsed(self) -> t.Optional[float]:
+        """Wall time of the whole validation in seconds"""
+        return self._elapsed
+
+    @property
+    def predicted_elapsed(self) -> t.Optional[float]:
+        """Wall time of the whole validation predicted by the scheduler in seconds; None if unknown"""
+        return self._predicted_elapsed
+
     def __getitem__(self, key: t.Any) -> t.Sequence[Detected[ID, DETECTION_TYPE, MSG]]:
         if key in self._by_id:
             return self._by_id[key]
-        if key in self._by_detection_type:
-            return self._by_detection_type[key]
+        if key in self._count_by_detection_type:
+            # empty if no anomaly of the detection type was kept
+            return self._by_detection_type.get(key, [])
 
         if isinstance(key, t.Sized) and len(key) == 2 and isinstance(key, t.Sequence):
             key_level: t.Any = key[0]
@@ -155,3 +297,24 @@ class DetectionData(t.Generic[ID, DETECTION_TYPE, MSG]):
     def values(self) -> t.Generator[Detected[ID, DETECTION_TYPE, MSG], None, None]:
         """create the iterator of detection"""
         return (detected for detected in chain(*self._by_id.values()))
+
+    def diff(
+        self, baseline: "Baseline"
+    ) -> "DetectionDiff[ID, DETECTION_TYPE, MSG]":
+        """compare the detections with those of a past run, keyed by (detection type, ID)
+
+        The baseline is merged with the sorted keys of the detections without being loaded into memory.
+
+        Parameters
+        ----------
+        baseline : Baseline
+            the baseline written by `Baseline.write()` after the past run
+
+        Returns
+        -------
+        DetectionDiff
+            the new, changed and resolved detections
+        """
+        from ._baseline import diff_detections
+
+        return diff_detections(self, baseline)
@@ -30,3 +30,16 @@ class Embedder(EmbeddedVariablesExtender, abc.ABC):
             It is usually a dictionary with some fields added to the argument `vars_map`.
         """
         return vars_map
+
+    def scalar_variables(self) -> t.Optional[t.Mapping[str, t.Any]]:
+        """variables generated by this embedder which do not depend on the row
+
+        If the embedder only adds these variables, templates referring to them can be rendered
+        by the database (see `render_in_sql` of `SimpleSQLAlchemyRule`).
+
+        Returns
+        -------
+        Mapping[str, Any] | None
+            the variables; None if the generated variables depend on the row
+        """
+        return None
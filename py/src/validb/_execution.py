@@ -0,0 +1,340 @@
+import contextlib
+import contextvars
+import enum
+import logging
+import threading
+import time
+import typing as t
+
+if t.TYPE_CHECKING:
+    from .rules import Rule
+
+logger = logging.getLogger(__name__)
+
+
+TIMEOUT_REASON = "timeout"
+
+
+class RuleTimeoutError(Exception):
+    """An exception thrown when a rule exceeds its timeout.
+
+    Normally, there is no need to be aware of the existence of this exception,
+    since it is caught inside validb and recorded as `RuleOutcome.TIMED_OUT`.
+    """
+
+    pass
+
+
+class Phase(enum.Enum):
+    """A phase of the execution of a rule measured by `PhaseTimings`"""
+
+    QUERY = "query"
+    """executing the query until its result is available"""
+
+    FETCH = "fetch"
+    """reading rows and evaluating them in the rule; the time not attributed to the other phases"""
+
+    DETECT = "detect"
+    """constructing detections, including their record IDs"""
+
+    EMBED = "embed"
+    """extending variables with embedders"""
+
+    FORMAT = "format"
+    """rendering messages"""
+
+    SINK = "sink"
+    """storing detections into `DetectionData`"""
+
+
+class PhaseTimings:
+    """wall time spent in each phase of the execution of a rule
+
+    It is not thread-safe; it is updated only by the thread executing the rule.
+    """
+
+    _seconds: t.Dict[Phase, float]
+
+    def __init__(self) -> None:
+        self._seconds = {phase: 0.0 for phase in Phase}
+
+    def add(self, phase: Phase, seconds: float) -> None:
+        """add time spent in a phase
+
+        Parameters
+        ----------
+        phase : Phase
+            the phase
+        seconds : float
+            the time in seconds
+        """
+        self._seconds[phase] += seconds
+
+    @contextlib.contextmanager
+    def measure(self, phase: Phase) -> t.Iterator[None]:
+        """add the wall time of the block to a phase"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._seconds[phase] += time.perf_counter() - started
+
+    def seconds(self, elapsed: t.Optional[float] = None) -> t.Mapping[Phase, float]:
+        """the time spent in each phase
+
+        Parameters
+        ----------
+        elapsed : float, optional
+            the wall time of the whole execution;
+            If specified, `Phase.FETCH` is the rest of it not spent in the other phases.
+        """
+        seconds = dict(self._seconds)
+        if elapsed is not None:
+            seconds[Phase.FETCH] = max(
+                elapsed
+                - sum(value for phase, value in seconds.items() if phase != Phase.FETCH),
+                0.0,
+            )
+        return seconds
+
+
+class RuleExecution:
+    """state of a rule being executed
+
+    It is available from inside `Rule.exec()` through `current_execution()`,
+    so that rules can report what they did without changing the signature of `exec()`.
+
+    The execution can be cancelled from another thread.
+    Rules should stop reading rows once `cancelled` is true, and can register
+    callbacks with `on_cancel()` to interrupt the running query.
+    """
+
+    _rule: "Rule[t.Any, t.Any, t.Any]"
+    _timeout: t.Optional[float]
+    _rows: int
+    _timings: t.Optional[PhaseTimings]
+    _cancelled: threading.Event
+    _cancel_reason: t.Optional[str]
+    _cancel_callbacks: t.List[t.Callable[[], None]]
+    _cancel_callbacks_lock: threading.Lock
+    _resume_key: t.Any
+    _progress_callbacks: t.List[t.Callable[[t.Any], None]]
+    _lock: threading.Lock
+
+    def __init__(
+        self,
+        rule: "Rule[t.Any, t.Any, t.Any]",
+        *,
+        timeout: t.Optional[float] = None,
+        resume_key: t.Any = None,
+    ) -> None:
+        self._rule = rule
+        self._timeout = timeout
+        self._resume_key = resume_key
+        self._progress_callbacks = []
+        self._rows = 0
+        self._timings = None
+        self._cancelled = threading.Event()
+        self._cancel_reason = None
+        self._cancel_callbacks = []
+        # held while the callbacks are called, so that a removed callback is never called afterwards
+        self._cancel_callbacks_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    @property
+    def rule(self) -> "Rule[t.Any, t.Any, t.Any]":
+        """the rule being executed"""
+        return self._rule
+
+    @property
+    def timeout(self) -> t.Optional[float]:
+        """time limit of the rule in seconds; None means unlimited
+
+        When the time limit is exceeded, the execution is cancelled with reason `"timeout"`.
+        Rules can also pass it to the datasource to be enforced on the server side.
+        """
+        return self._timeout
+
+    @property
+    def timed_out(self) -> bool:
+        """whether the execution is cancelled because of the timeout"""
+        return self.cancelled and self._cancel_reason == TIMEOUT_REASON
+
+    @property
+    def rows(self) -> int:
+        """number of rows read by the rule so far"""
+        return self._rows
+
+    def add_rows(self, n: int = 1) -> None:
+        """count rows read by the rule
+
+        Parameters
+        ----------
+        n : int
+            number of rows read
+        """
+        self._rows += n
+
+    @property
+    def resume_key(self) -> t.Any:
+        """the key from which the rule should resume reading rows; None to read from the beginning
+
+        It is the key committed last with `commit_progress()` by the interrupted execution
+        resumed from a `Checkpoint`.
+        """
+        return self._resume_key
+
+    def commit_progress(self, key: t.Any) -> None:
+        """record that the rule has processed the rows up to the key
+
+        Rules reading their rows page by page (e.g. keyset pagination) call this after each page,
+        once all the detections of the page have been yielded,
+        so that a resumed execution can continue from the key instead of the beginning.
+
+        Parameters
+        ----------
+        key : Any
+            the key of the last processed row, such as a tuple of primary key values;
+            It must be JSON-serializable and is given back as `resume_key`.
+        """
+        with self._lock:
+            callbacks = list(self._progress_callbacks)
+        for callback in callbacks:
+            callback(key)
+
+    def on_progress(self, callback: t.Callable[[t.Any], None]) -> None:
+        """register a function called with the key each time `commit_progress()` is called
+
+        Parameters
+        ----------
+        callback : Callable[[Any], None]
+            the function, typically persisting the progress
+        """
+        with self._lock:
+            self._progress_callbacks.append(callback)
+
+    @property
+    def timings(self) -> t.Optional[PhaseTimings]:
+        """time spent in each phase; None unless enabled by `enable_timings()`
+
+        Rules and datasources add the time of the phases they know to it, only if it is not None,
+        so that the execution is not slowed down when nobody is interested in it.
+        """
+        return self._timings
+
+    def enable_timings(self) -> PhaseTimings:
+        """start measuring the time spent in each phase
+
+        It is typically called by `ValidationHook.rule_started()`.
+
+        Returns
+        -------
+        PhaseTimings
+            the timings, shared by all the callers
+        """
+        if self._timings is None:
+            self._timings = PhaseTimings()
+        return self._timings
+
+    @property
+    def cancelled(self) -> bool:
+        """whether the execution is cancelled"""
+        return self._cancelled.is_set()
+
+    @property
+    def cancel_reason(self) -> t.Optional[str]:
+        """the reason of the cancellation; None if not cancelled"""
+        return self._cancel_reason
+
+    def cancel(self, reason: str) -> None:
+        """cancel the execution
+
+        The callbacks registered with `on_cancel()` are called in the calling thread.
+
+        Parameters
+        ----------
+        reason : str
+            the reason of the cancellation
+        """
+        with self._cancel_callbacks_lock:
+            with self._lock:
+                if self._cancelled.is_set():
+                    return
+                self._cancel_reason = reason
+                self._cancelled.set()
+                callbacks = list(self._cancel_callbacks)
+
+            for callback in callbacks:
+                _call_cancel_callback(callback)
+
+    def on_cancel(self, callback: t.Callable[[], None]) -> t.Callable[[], None]:
+        """register a function called when the execution is cancelled
+
+        If the execution has already been cancelled, the function is called immediately.
+
+        Parameters
+        ----------
+        callback : Callable[[], None]
+            the function, typically interrupting the running query
+
+        Returns
+        -------
+        Callable[[], None]
+            the function removing the callback;
+            Once it returns, the callback is not being called and will never be called.
+            It must be called before the resource interrupted by the callback (e.g. a connection)
+            is released, since another rule may use it afterwards.
+        """
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._cancel_callbacks.append(callback)
+                return lambda: self._remove_cancel_callback(callback)
+
+        _call_cancel_callback(callback)
+        return _no_op
+
+    def _remove_cancel_callback(self, callback: t.Callable[[], None]) -> None:
+        with self._cancel_callbacks_lock:
+            with self._lock:
+                try:
+                    self._cancel_callbacks.remove(callback)
+                except ValueError:
+                    pass
+
+
+def _no_op() -> None:
+    pass
+
+
+def _call_cancel_callback(callback: t.Callable[[], None]) -> None:
+    try:
+        callback()
+    except Exception:
+        logger.warning("failed to interrupt the query", exc_info=True)
+
+
+_current_execution: "contextvars.ContextVar[t.Optional[RuleExecution]]" = (
+    contextvars.ContextVar("validb_current_execution", default=None)
+)
+
+
+def current_execution() -> t.Optional[RuleExecution]:
+    """get the state of the rule being executed in the current thread
+
+    Returns
+    -------
+    RuleExecution | None
+        the state of the rule being executed;
+        None if no rule is being executed by `validate_db()`.
+    """
+    return _current_execution.get()
+
+
+@contextlib.contextmanager
+def executing(execution: RuleExecution) -> t.Iterator[RuleExecution]:
+    """make the specified execution current while the block"""
+    token = _current_execution.set(execution)
+    try:
+        yield execution
+    finally:
+        _current_execution.reset(token)
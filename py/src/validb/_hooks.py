@@ -0,0 +1,91 @@
+import logging
+import typing as t
+
+if t.TYPE_CHECKING:
+    from ._detectiondata import DetectionData
+    from ._execution import RuleExecution
+    from ._ruleresult import RuleResult
+    from .datasources import DataSources
+
+logger = logging.getLogger(__name__)
+
+
+class ValidationHook:
+    """observer of the execution of `validate_db()`
+
+    Subclasses override the methods they need; the default ones do nothing.
+    The methods about rules are called in the thread executing the rule,
+    so they may be called from multiple threads at once when `workers` of `validate_db()` is more than 1.
+    An exception raised by a hook is logged and does not stop the validation.
+    """
+
+    def for_target(self, target: str) -> "ValidationHook":
+        """the hook observing the validation of a target by `validate_targets()`
+
+        By default, the hook itself is shared by all the targets.
+
+        Parameters
+        ----------
+        target : str
+            the name of the target
+        """
+        return self
+
+    def run_started(self, *, datasources: "DataSources") -> None:
+        """called when the validation starts, before the datasources are opened
+
+        Parameters
+        ----------
+        datasources : DataSources
+            the datasources of the validation
+        """
+        pass
+
+    def rule_started(self, execution: "RuleExecution") -> None:
+        """called before a rule is executed
+
+        Parameters
+        ----------
+        execution : RuleExecution
+            the state of the rule, which is also available through `current_execution()`
+        """
+        pass
+
+    def rule_finished(self, execution: "RuleExecution", result: "RuleResult") -> None:
+        """called after a rule is executed, including when it is cancelled or times out
+
+        It is not called for rules which are skipped.
+
+        Parameters
+        ----------
+        execution : RuleExecution
+            the state of the rule
+        result : RuleResult
+            the result of the rule
+        """
+        pass
+
+    def run_finished(
+        self, detection_data: "DetectionData[t.Any, t.Any, t.Any]"
+    ) -> None:
+        """called when the validation ends
+
+        Parameters
+        ----------
+        detection_data : DetectionData
+            the result data
+        """
+        pass
+
+
+def call_hooks(
+    hooks: t.Iterable[ValidationHook], method: str, *args: t.Any, **kwargs: t.Any
+) -> None:
+    """call a method of each hook, logging the exceptions"""
+    for hook in hooks:
+        try:
+            getattr(hook, method)(*args, **kwargs)
+        except Exception:
+            logger.warning(
+                "hook %s.%s failed", type(hook).__name__, method, exc_info=True
+            )
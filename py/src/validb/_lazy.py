@@ -0,0 +1,36 @@
+import importlib
+import typing as t
+
+
+def lazy_attributes(
+    package: str, attributes: t.Mapping[str, str], namespace: t.Dict[str, t.Any]
+) -> t.Tuple[t.Callable[[str], t.Any], t.Callable[[], t.List[str]]]:
+    """create `__getattr__` and `__dir__` of a package which imports its attributes on first access (PEP 562)
+
+    Parameters
+    ----------
+    package : str
+        the name of the package, i.e. `__name__`
+    attributes : Mapping[str, str]
+        the relative name of the module defining each attribute, such as `{"validate_db": "._validate"}`
+    namespace : dict[str, Any]
+        the namespace of the package, i.e. `globals()`; imported attributes are cached in it
+
+    Returns
+    -------
+    tuple[Callable[[str], Any], Callable[[], list[str]]]
+        `__getattr__` and `__dir__` of the package
+    """
+
+    def __getattr__(name: str) -> t.Any:
+        module_name = attributes.get(name)
+        if module_name is None:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(module_name, package), name)
+        namespace[name] = value
+        return value
+
+    def __dir__() -> t.List[str]:
+        return sorted({*namespace, *attributes})
+
+    return __getattr__, __dir__
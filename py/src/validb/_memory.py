@@ -0,0 +1,415 @@
+from dataclasses import dataclass, field
+import os
+import random
+import sys
+import threading
+import tracemalloc
+import typing as t
+
+from ._detectiondata import DetectionData
+from ._execution import RuleExecution
+from ._hooks import ValidationHook
+from ._ruleresult import RuleResult
+from .datasources import DataSources
+
+# stages of traced allocations, recognized by the file where they are allocated
+_STAGE_FILES: t.Sequence[t.Tuple[str, t.Tuple[str, ...]]] = (
+    ("detection_data", (os.path.join("validb", "_detectiondata.py"),)),
+    ("embedded_vars", (os.path.join("validb", "_embedded_vars.py"),)),
+    ("messages", (os.path.join("validb", "formatter"),)),
+    (
+        "query_result",
+        tuple(
+            f"{os.sep}{package}{os.sep}"
+            for package in ("sqlalchemy", "pandas", "pymysql", "MySQLdb", "psycopg2")
+        )
+        + (os.path.join("validb", "datasources"),),
+    ),
+)
+
+
+@dataclass
+class RuleMemoryProfile:
+    """Memory used by the execution of a rule
+
+    Attributes
+    ----------
+    detection_type : str
+        the detection type of the rule
+    fingerprint : str
+        the fingerprint of the rule
+    rss_delta : int | None
+        difference of RSS in bytes between the end and the start of the rule,
+        which includes both `Rule.exec()` and storing its detections into `DetectionData`;
+        None if the RSS cannot be read on the platform
+    peak_rss_delta : int | None
+        difference in bytes between the highest RSS sampled while the rule ran and the RSS at its start;
+        None if the RSS cannot be read on the platform
+    traced_peak : int | None
+        peak size in bytes of the memory traced by `tracemalloc` while the rule ran; None if not traced
+    traced_by_stage : Mapping[str, int]
+        size in bytes of the memory allocated while the rule ran and still held at its end,
+        by stage (`query_result`, `embedded_vars`, `messages`, `detection_data` or `other`); empty if not traced
+    top_allocations : Sequence[tuple[str, int]]
+        the locations (`file:line`) allocating the most memory held at the end of the rule, with the sizes in bytes;
+        empty if not traced
+    target : str | None
+        the name of the target validated by `validate_targets()`; None for `validate_db()`
+    """
+
+    detection_type: str
+    fingerprint: str
+    rss_delta: t.Optional[int]
+    peak_rss_delta: t.Optional[int]
+    traced_peak: t.Optional[int] = None
+    traced_by_stage: t.Mapping[str, int] = field(default_factory=dict)
+    top_allocations: t.Sequence[t.Tuple[str, int]] = field(default_factory=list)
+    target: t.Optional[str] = None
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        """the profile as a JSON-serializable dict"""
+        return {
+            "target": self.target,
+            "detection_type": self.detection_type,
+            "fingerprint": self.fingerprint,
+            "rss_delta": self.rss_delta,
+            "peak_rss_delta": self.peak_rss_delta,
+            "traced_peak": self.traced_peak,
+            "traced_by_stage": dict(self.traced_by_stage),
+            "top_allocations": [
+                {"location": location, "size": size}
+                for location, size in self.top_allocations
+            ],
+        }
+
+
+class _RuleMemory:
+    """memory of a rule being executed"""
+
+    rss_start: t.Optional[int]
+    rss_peak: t.Optional[int]
+    snapshot: t.Optional[tracemalloc.Snapshot]
+
+    def __init__(
+        self, rss_start: t.Optional[int], snapshot: t.Optional[tracemalloc.Snapshot]
+    ):
+        self.rss_start = rss_start
+        self.rss_peak = rss_start
+        self.snapshot = snapshot
+
+
+class _State:
+    """state shared by a memory profiler and its views for targets"""
+
+    lock: threading.Lock
+    profiles: t.List[RuleMemoryProfile]
+    running: t.Dict[int, _RuleMemory]
+    tracing: int
+    started_tracing: bool
+    runs: int
+    sampler: t.Optional[threading.Thread]
+    stop_sampler: threading.Event
+    random: random.Random
+
+    def __init__(self, seed: t.Optional[int]) -> None:
+        self.lock = threading.Lock()
+        self.profiles = []
+        self.running = {}
+        self.tracing = 0
+        self.started_tracing = False
+        self.runs = 0
+        self.sampler = None
+        self.stop_sampler = threading.Event()
+        self.random = random.Random(seed)
+
+
+class MemoryProfiler(ValidationHook):
+    """hook recording the memory used by each rule
+
+    The RSS of the process is sampled by a background thread every `sampling_interval` seconds,
+    and the highest sample while a rule runs is recorded as its peak,
+    which costs almost nothing even in production.
+
+    In addition, a fraction `trace_rate` of the rules are traced with `tracemalloc`
+    to find where the memory is allocated. Tracing slows the rule down considerably,
+    so keep `trace_rate` small in production.
+
+    The memory of the process is shared by the rules executed in parallel,
+    so the figures of a rule include the memory used by the others when `workers` of `validate_db()` is more than 1.
+    """
+
+    _state: _State
+    _sampling_interval: float
+    _trace_rate: float
+    _trace_frames: int
+    _top: int
+    _target: t.Optional[str]
+
+    def __init__(
+        self,
+        *,
+        sampling_interval: float = 0.1,
+        trace_rate: float = 0.0,
+        trace_frames: int = 1,
+        top: int = 5,
+        seed: t.Optional[int] = None,
+    ) -> None:
+        """create a memory profiler
+
+        Parameters
+        ----------
+        sampling_interval : float
+            interval in seconds to sample the RSS
+        trace_rate : float
+            probability that a rule is traced with `tracemalloc`, between 0 and 1
+        trace_frames : int
+            number of frames stored for each traced allocation
+        top : int
+            number of the locations allocating the most memory recorded for each traced rule
+        seed : int, optional
+            seed of the random choice of the traced rules
+        """
+        if sampling_interval <= 0:
+            raise ValueError(
+                f"sampling_interval must be positive; actually specified: {sampling_interval}"
+            )
+        if not 0 <= trace_rate <= 1:
+            raise ValueError(
+                f"trace_rate must be between 0 and 1; actually specified: {trace_rate}"
+            )
+        if trace_frames <= 0:
+            raise ValueError(
+                f"trace_frames must be positive; actually specified: {trace_frames}"
+            )
+        self._state = _State(seed)
+        self._sampling_interval = sampling_interval
+        self._trace_rate = trace_rate
+        self._trace_frames = trace_frames
+        self._top = top
+        self._target = None
+
+    def for_target(self, target: str) -> "MemoryProfiler":
+        profiler = MemoryProfiler.__new__(MemoryProfiler)
+        profiler._state = self._state
+        profiler._sampling_interval = self._sampling_interval
+        profiler._trace_rate = self._trace_rate
+        profiler._trace_frames = self._trace_frames
+        profiler._top = self._top
+        profiler._target = target
+        return profiler
+
+    def run_started(self, *, datasources: DataSources) -> None:
+        state = self._state
+        with state.lock:
+            state.runs += 1
+            if state.sampler is not None:
+                return
+            state.stop_sampler.clear()
+            state.sampler = threading.Thread(
+                target=self._sample, name="validb-memory-sampler", daemon=True
+            )
+            state.sampler.start()
+
+    def run_finished(
+        self, detection_data: DetectionData[t.Any, t.Any, t.Any]
+    ) -> None:
+        state = self._state
+        with state.lock:
+            state.runs -= 1
+            if state.runs > 0 or state.sampler is None:
+                return
+            sampler, state.sampler = state.sampler, None
+            state.stop_sampler.set()
+            # rules which never finished, e.g. since a hook failed
+            unfinished = [
+                memory for memory in state.running.values() if memory.snapshot is not None
+            ]
+            state.running.clear()
+        sampler.join()
+        for _ in unfinished:
+            self._release_tracing()
+
+    def _sample(self) -> None:
+        state = self._state
+        while not state.stop_sampler.wait(self._sampling_interval):
+            rss = current_rss()
+            if rss is None:
+                # never readable on the platform
+                return
+            with state.lock:
+                for memory in state.running.values():
+                    if memory.rss_peak is not None and rss > memory.rss_peak:
+                        memory.rss_peak = rss
+
+    def rule_started(self, execution: RuleExecution) -> None:
+        state = self._state
+        snapshot: t.Optional[tracemalloc.Snapshot] = None
+        with state.lock:
+            traced = self._trace_rate > 0 and state.random.random() < self._trace_rate
+            if traced:
+                if state.tracing <= 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start(self._trace_frames)
+                    state.started_tracing = True
+                state.tracing += 1
+                reset_peak = getattr(tracemalloc, "reset_peak", None)
+                if reset_peak is not None:
+                    # Python 3.9+
+                    reset_peak()
+        if traced:
+            try:
+                snapshot = tracemalloc.take_snapshot()
+            except BaseException:
+                self._release_tracing()
+                raise
+
+        rss = current_rss()
+        with state.lock:
+            state.running[id(execution)] = _RuleMemory(rss, snapshot)
+
+    def rule_finished(self, execution: RuleExecution, result: RuleResult) -> None:
+        state = self._state
+        rss = current_rss()
+        with state.lock:
+            memory = state.running.pop(id(execution), None)
+        if memory is None:
+            return
+
+        rss_start, rss_peak = memory.rss_start, memory.rss_peak
+        profile = RuleMemoryProfile(
+            detection_type=str(result.rule.detection_type()),
+            fingerprint=result.rule.fingerprint(),
+            rss_delta=(
+                rss - rss_start if rss is not None and rss_start is not None else None
+            ),
+            peak_rss_delta=(
+                max(rss_peak, rss) - rss_start
+                if rss is not None and rss_start is not None and rss_peak is not None
+                else None
+            ),
+            target=self._target,
+        )
+        if memory.snapshot is not None:
+            self._add_traced(profile, memory.snapshot)
+
+        with state.lock:
+            state.profiles.append(profile)
+
+    def _add_traced(
+        self, profile: RuleMemoryProfile, start: tracemalloc.Snapshot
+    ) -> None:
+        try:
+            end = tracemalloc.take_snapshot()
+            _, traced_peak = tracemalloc.get_traced_memory()
+        finally:
+            self._release_tracing()
+
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        differences = [
+            difference
+            for difference in end.filter_traces(filters).compare_to(
+                start.filter_traces(filters), "lineno"
+            )
+            if difference.size_diff > 0
+        ]
+
+        by_stage: t.Dict[str, int] = {}
+        for difference in differences:
+            stage = _stage_of(difference.traceback[0].filename)
+            by_stage[stage] = by_stage.get(stage, 0) + difference.size_diff
+
+        profile.traced_peak = traced_peak
+        profile.traced_by_stage = by_stage
+        profile.top_allocations = [
+            (
+                f"{difference.traceback[0].filename}:{difference.traceback[0].lineno}",
+                difference.size_diff,
+            )
+            for difference in sorted(
+                differences, key=lambda d: d.size_diff, reverse=True
+            )[: self._top]
+        ]
+
+    def _release_tracing(self) -> None:
+        """stop tracing started by `rule_started()` when no other rule is traced"""
+        state = self._state
+        with state.lock:
+            state.tracing -= 1
+            if state.tracing <= 0 and state.started_tracing:
+                # tracing started by others is left as it is
+                tracemalloc.stop()
+                state.started_tracing = False
+
+    @property
+    def profiles(self) -> t.Sequence[RuleMemoryProfile]:
+        """the profiles of the executed rules in the order they finished"""
+        with self._state.lock:
+            return list(self._state.profiles)
+
+    def top(self, n: t.Optional[int] = None) -> t.Sequence[RuleMemoryProfile]:
+        """the profiles of the rules whose peak RSS grew the most, the largest first
+
+        The profiles without RSS are the last.
+
+        Parameters
+        ----------
+        n : int, optional
+            the number of profiles; all if not specified
+        """
+        profiles = sorted(
+            self.profiles,
+            key=lambda profile: (
+                profile.peak_rss_delta is not None,
+                profile.peak_rss_delta or 0,
+            ),
+            reverse=True,
+        )
+        return profiles if n is None else profiles[:n]
+
+    def report(self) -> t.Dict[str, t.Any]:
+        """the profiles as a JSON-serializable dict, the largest first"""
+        return {
+            "sampling_interval": self._sampling_interval,
+            "trace_rate": self._trace_rate,
+            "rules": [profile.to_dict() for profile in self.top()],
+        }
+
+
+def current_rss() -> t.Optional[int]:
+    """the current resident set size of the process in bytes
+
+    It is read from `/proc` on Linux and from psutil if installed on the other platforms.
+    Otherwise the peak RSS so far is returned instead,
+    or None on the platforms without the `resource` module such as Windows.
+    """
+    try:
+        with open("/proc/self/statm", mode="rb") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+
+    try:
+        import psutil  # type: ignore
+
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        # Windows without psutil
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _stage_of(filename: str) -> str:
+    for stage, patterns in _STAGE_FILES:
+        if any(pattern in filename for pattern in patterns):
+            return stage
+    return "other"
@@ -0,0 +1,175 @@
+import contextlib
+from dataclasses import dataclass, field
+import json
+import threading
+import time
+import typing as t
+
+from ._execution import Phase, RuleExecution
+from ._hooks import ValidationHook
+from ._ruleresult import RuleResult
+
+
+@dataclass
+class RuleProfile:
+    """Profile of the execution of a rule
+
+    Attributes
+    ----------
+    detection_type : str
+        the detection type of the rule
+    fingerprint : str
+        the fingerprint of the rule
+    outcome : str
+        how the execution ended; a value of `RuleOutcome`
+    elapsed : float
+        wall time of the rule in seconds
+    rows : int
+        number of rows read by the rule
+    detections : int
+        number of anomalies detected by the rule
+    phases : Mapping[Phase, float]
+        wall time spent in each phase in seconds
+    target : str | None
+        the name of the target validated by `validate_targets()`; None for `validate_db()`
+    """
+
+    detection_type: str
+    fingerprint: str
+    outcome: str
+    elapsed: float
+    rows: int
+    detections: int
+    phases: t.Mapping[Phase, float] = field(default_factory=dict)
+    target: t.Optional[str] = None
+
+    @property
+    def rows_per_sec(self) -> t.Optional[float]:
+        return self.rows / self.elapsed if self.elapsed > 0 else None
+
+    @property
+    def detections_per_sec(self) -> t.Optional[float]:
+        return self.detections / self.elapsed if self.elapsed > 0 else None
+
+    def to_dict(self) -> t.Dict[str, t.Any]:
+        """the profile as a JSON-serializable dict"""
+        return {
+            "target": self.target,
+            "detection_type": self.detection_type,
+            "fingerprint": self.fingerprint,
+            "outcome": self.outcome,
+            "elapsed": self.elapsed,
+            "rows": self.rows,
+            "detections": self.detections,
+            "rows_per_sec": self.rows_per_sec,
+            "detections_per_sec": self.detections_per_sec,
+            "phases": {phase.value: self.phases.get(phase, 0.0) for phase in Phase},
+        }
+
+
+class Profiler(ValidationHook):
+    """hook recording the time spent in each phase of each rule
+
+    Pass it to `validate_db()` or `validate_targets()` as one of `hooks`.
+    Rules are executed as usual unless a profiler is passed,
+    since the phases are measured only for executions whose `RuleExecution.timings` is enabled.
+
+    >>> profiler = Profiler()
+    >>> detection_data = validate_db(..., hooks=[profiler])
+    >>> with profiler.measure_output("csv"):
+    >>>     write_csv(detection_data)
+    >>> profiler.write_report("profile.json")
+    """
+
+    _profiles: t.List[RuleProfile]
+    _output: t.Dict[str, float]
+    _lock: threading.Lock
+    _target: t.Optional[str]
+
+    def __init__(self) -> None:
+        self._profiles = []
+        self._output = {}
+        self._lock = threading.Lock()
+        self._target = None
+
+    def for_target(self, target: str) -> "Profiler":
+        """a profiler sharing the profiles with self, which labels them with the target"""
+        profiler = Profiler.__new__(Profiler)
+        profiler._profiles = self._profiles
+        profiler._output = self._output
+        profiler._lock = self._lock
+        profiler._target = target
+        return profiler
+
+    def rule_started(self, execution: RuleExecution) -> None:
+        execution.enable_timings()
+
+    def rule_finished(self, execution: RuleExecution, result: RuleResult) -> None:
+        timings = execution.timings
+        profile = RuleProfile(
+            detection_type=str(result.rule.detection_type()),
+            fingerprint=result.rule.fingerprint(),
+            outcome=result.outcome.value,
+            elapsed=result.elapsed,
+            rows=result.rows,
+            detections=result.detections,
+            phases=timings.seconds(result.elapsed) if timings is not None else {},
+            target=self._target,
+        )
+        with self._lock:
+            self._profiles.append(profile)
+
+    @contextlib.contextmanager
+    def measure_output(self, name: str) -> t.Iterator[None]:
+        """record the wall time of the block as the output named `name`, such as writing CSV
+
+        Messages deferred by rules are rendered while they are output,
+        so that their time is recorded here rather than in `Phase.FORMAT`.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._output[name] = self._output.get(name, 0.0) + elapsed
+
+    @property
+    def profiles(self) -> t.Sequence[RuleProfile]:
+        """the profiles of the executed rules in the order they finished"""
+        with self._lock:
+            return list(self._profiles)
+
+    @property
+    def output(self) -> t.Mapping[str, float]:
+        """wall time of each output in seconds"""
+        with self._lock:
+            return dict(self._output)
+
+    def top(self, n: t.Optional[int] = None) -> t.Sequence[RuleProfile]:
+        """the profiles of the slowest rules, the slowest first
+
+        Parameters
+        ----------
+        n : int, optional
+            the number of profiles; all if not specified
+        """
+        profiles = sorted(self.profiles, key=lambda profile: profile.elapsed, reverse=True)
+        return profiles if n is None else profiles[:n]
+
+    def report(self) -> t.Dict[str, t.Any]:
+        """the profiles as a JSON-serializable dict, the slowest rule first"""
+        profiles = self.top()
+        return {
+            "phases": {
+                phase.value: sum(profile.phases.get(phase, 0.0) for profile in profiles)
+                for phase in Phase
+            },
+            "output": self.output,
+            "rules": [profile.to_dict() for profile in profiles],
+        }
+
+    def write_report(self, path: str) -> None:
+        """write `self.report()` to a JSON file"""
+        with open(path, mode="w", encoding="utf_8") as fp:
+            json.dump(self.report(), fp, indent=2)
@@ -0,0 +1,60 @@
+from dataclasses import dataclass
+import enum
+import typing as t
+
+if t.TYPE_CHECKING:
+    from .rules import Rule
+
+
+class RuleOutcome(enum.Enum):
+    """How the execution of a rule ended"""
+
+    COMPLETED = "COMPLETED"
+    """the rule was executed to the end"""
+
+    ABORTED = "ABORTED"
+    """the rule was stopped because too many anomalies were detected"""
+
+    SKIPPED = "SKIPPED"
+    """the rule was not executed"""
+
+    CANCELLED = "CANCELLED"
+    """the rule was cancelled on the way"""
+
+    TIMED_OUT = "TIMED_OUT"
+    """the rule was stopped because it exceeded its timeout"""
+
+    FAILED_FAST = "FAILED_FAST"
+    """the rule was stopped because it detected an anomaly at or above the fail-fast level,
+    which cancelled the other rules"""
+
+
+@dataclass
+class RuleResult:
+    """Result of execution of a rule
+
+    Attributes
+    ----------
+    rule : Rule
+        the executed rule
+    outcome : RuleOutcome
+        how the execution ended
+    elapsed : float
+        wall time spent for the rule, in seconds
+    rows : int
+        number of rows read by the rule
+    detections : int
+        number of anomalies detected by the rule, including those not kept
+    predicted_elapsed : float | None
+        wall time predicted by the scheduler, in seconds; None if unknown
+    detail : str | None
+        the reason of the outcome, if any
+    """
+
+    rule: "Rule[t.Any, t.Any, t.Any]"
+    outcome: RuleOutcome
+    elapsed: float
+    rows: int
+    detections: int
+    predicted_elapsed: t.Optional[float] = None
+    detail: t.Optional[str] = None
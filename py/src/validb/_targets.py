@@ -0,0 +1,136 @@
+import contextlib
+from dataclasses import dataclass
+import logging
+import typing as t
+
+from ._checkpoint import Checkpoint
+from ._costguard import CostGuard
+from ._detected import DetectedType, ID, MSG, DETECTION_TYPE, TextDetected
+from ._detectiondata import DetectionData
+from ._embedder import Embedder
+from ._hooks import ValidationHook
+from ._validate import validate_db
+from .datasources import DataSources
+from .rules import Rule
+from .scheduling import Scheduler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TargetResult(t.Generic[ID, DETECTION_TYPE, MSG]):
+    """Result of validation of a target
+
+    Attributes
+    ----------
+    target : str
+        the name of the target
+    detection_data : DetectionData | None
+        the result data; None if the validation failed
+    error : BaseException | None
+        the error which made the validation fail; None if it succeeded
+    """
+
+    target: str
+    detection_data: t.Optional[DetectionData[ID, DETECTION_TYPE, MSG]]
+    error: t.Optional[BaseException] = None
+
+
+def validate_targets(
+    *,
+    targets: t.Mapping[str, DataSources],
+    rules: t.Collection[Rule[ID, DETECTION_TYPE, MSG]],
+    detected: DetectedType[ID, DETECTION_TYPE, MSG] = TextDetected,
+    embedders: t.Mapping[str, Embedder],
+    max_workers: int = 4,
+    max_detection: t.Optional[int] = None,
+    max_detection_per_type: t.Optional[int] = None,
+    scheduler: t.Optional[Scheduler] = None,
+    cost_guard: t.Optional[CostGuard] = None,
+    fail_fast_level: t.Optional[int] = None,
+    default_timeout: t.Optional[float] = None,
+    hooks: t.Sequence[ValidationHook] = (),
+    close_datasources: bool = True,
+    checkpoint: t.Optional[Checkpoint] = None,
+) -> t.Mapping[str, TargetResult[ID, DETECTION_TYPE, MSG]]:
+    """Validate data of many targets (e.g. tenant databases) with the same rules.
+
+    Targets are validated in parallel, and the rules of each target are executed one by one.
+    The datasources of a target are opened when its validation starts
+    and closed when it ends, so at most `max_workers` targets hold connections at once
+    unless `close_datasources` is False.
+    A target whose validation fails does not stop the others.
+
+    Parameters
+    ----------
+    targets : Mapping[str, DataSources]
+        datasources of each target, keyed by the name of the target
+    rules : Collection[Rule]
+        the list of validation rules
+    detected : Callable[[ID, DETECTION_TYPE, MSG], Detected]
+        the constructor of Detected class
+    embedders : Mapping[str, Embedder]
+        Embedder that can be used.
+    max_workers : int
+        number of targets validated in parallel;
+        It is also the maximum number of queries running at once.
+    max_detection : int, optional
+        maximum number of detections of each target; see `validate_db()`
+    max_detection_per_type : int, optional
+        maximum number of detections kept for each detection type of each target; see `validate_db()`
+    scheduler : Scheduler, optional
+        the scheduler shared by all the targets; see `validate_db()`
+    cost_guard : CostGuard, optional
+        the pre-flight check of the estimated cost of rules; see `validate_db()`
+    fail_fast_level : int, optional
+        the level which stops the validation of each target; see `validate_db()`
+    default_timeout : float, optional
+        time limit in seconds of each rule without its own timeout; see `validate_db()`
+    hooks : Sequence[ValidationHook]
+        observers of the validation; `ValidationHook.for_target()` of each hook is passed to `validate_db()`
+    close_datasources : bool
+        whether to close the datasources of each target when its validation ends;
+        If False, they are kept open for later validations and the caller must close them.
+    checkpoint : Checkpoint, optional
+        the directory to persist the progress into; `Checkpoint.for_target()` is passed to `validate_db()`
+
+    Returns
+    -------
+    Mapping[str, TargetResult]
+        the results keyed by the name of the target, in the order of `targets`
+    """
+
+    def validate_target(
+        name: str, datasources: DataSources
+    ) -> TargetResult[ID, DETECTION_TYPE, MSG]:
+        try:
+            with datasources if close_datasources else contextlib.nullcontext():
+                detection_data = validate_db(
+                    rules=rules,
+                    detected=detected,
+                    datasources=datasources,
+                    embedders=embedders,
+                    max_detection=max_detection,
+                    max_detection_per_type=max_detection_per_type,
+                    scheduler=scheduler,
+                    cost_guard=cost_guard,
+                    fail_fast_level=fail_fast_level,
+                    default_timeout=default_timeout,
+                    hooks=[hook.for_target(name) for hook in hooks],
+                    checkpoint=(
+                        checkpoint.for_target(name) if checkpoint is not None else None
+                    ),
+                )
+            return TargetResult(target=name, detection_data=detection_data)
+        except Exception as e:
+            logger.error("validation of target %s failed", name, exc_info=True)
+            return TargetResult(target=name, detection_data=None, error=e)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+        futures = {
+            name: executor.submit(validate_target, name, datasources)
+            for name, datasources in targets.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
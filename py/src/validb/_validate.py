@@ -1,11 +1,29 @@
+from collections import defaultdict
+import logging
+import threading
+import time
 import typing as t
 
 
+from ._checkpoint import Checkpoint, RuleCheckpoint
+from ._costguard import CostGuard, CostGuardAction
 from ._embedder import Embedder
 from .datasources import DataSources
-from ._detected import DetectedType, ID, MSG, DETECTION_TYPE, TextDetected
+from ._detected import Detected, DetectedType, ID, MSG, DETECTION_TYPE, TextDetected
 from ._detectiondata import DetectionData, TooManyDetectionException
+from ._execution import (
+    TIMEOUT_REASON,
+    Phase,
+    RuleExecution,
+    RuleTimeoutError,
+    executing,
+)
+from ._hooks import ValidationHook, call_hooks
+from ._ruleresult import RuleOutcome, RuleResult
 from .rules import Rule
+from .scheduling import LevelScheduler, ScheduledRule, Scheduler
+
+logger = logging.getLogger(__name__)
 
 
 def validate_db(
@@ -15,6 +33,14 @@ def validate_db(
     datasources: DataSources,
     embedders: t.Mapping[str, Embedder],
     max_detection: t.Optional[int] = None,
+    max_detection_per_type: t.Optional[int] = None,
+    workers: int = 1,
+    scheduler: t.Optional[Scheduler] = None,
+    cost_guard: t.Optional[CostGuard] = None,
+    fail_fast_level: t.Optional[int] = None,
+    default_timeout: t.Optional[float] = None,
+    hooks: t.Sequence[ValidationHook] = (),
+    checkpoint: t.Optional[Checkpoint] = None,
 ) -> DetectionData[ID, DETECTION_TYPE, MSG]:
     """Validate data in the database.
 
@@ -35,23 +61,412 @@ def validate_db(
         maximum number of detections.
         More detections than the specified number is ignored.
         If more incorrect data are detected than the specified number, flag `too_many_detection` of the result is set to True.
+    max_detection_per_type : int, optional
+        maximum number of detections kept for each detection type.
+        More detections of a type than the specified number are only counted,
+        so the other rules are still executed and the counts of the result are exact.
+    workers : int
+        number of rules executed in parallel.
+        Rules of different levels are never executed in parallel;
+        rules of a higher level are finished before rules of a lower level start.
+    scheduler : Scheduler, optional
+        the scheduler which decides the order of execution of rules.
+        If not specified, `LevelScheduler` is used.
+    cost_guard : CostGuard, optional
+        the pre-flight check of the estimated cost of rules.
+        Rules over budget are skipped or warned about according to the guard.
+        It is applied after prechecks (`Rule.precheck`), so rules skipped by them are not estimated.
+    fail_fast_level : int, optional
+        the level which stops the validation.
+        As soon as an anomaly of this level or higher is detected, no more rules are started
+        and the running rules are cancelled (including their queries if the datasource supports it).
+        Then flag `failed_fast` of the result is set to True.
+        The rule which detected the anomaly is recorded as `RuleOutcome.FAILED_FAST`,
+        the cancelled rules as `RuleOutcome.CANCELLED` and the rules not started as `RuleOutcome.SKIPPED`.
+    default_timeout : float, optional
+        time limit in seconds of each rule without its own `Rule.timeout()`.
+        A rule exceeding its time limit is cancelled and recorded as `RuleOutcome.TIMED_OUT`,
+        and the other rules are executed as usual.
+    hooks : Sequence[ValidationHook]
+        observers of the validation, such as `Profiler`
+    checkpoint : Checkpoint, optional
+        the directory to persist the detections of each rule into as it finishes;
+        If it is resumed, the rules completed in it are not executed again
+        and their stored detections are merged into the result.
 
     Returns
     -------
     DetectionData
         the result data
+
+    Raises
+    ------
+    CostBudgetExceededError
+        If some rules are over budget and the action of `cost_guard` is `CostGuardAction.FAIL`.
+        No rule is executed in this case.
     """
     detection_data: DetectionData[ID, DETECTION_TYPE, MSG] = DetectionData(
         max_detection=max_detection,
+        max_detection_per_type=max_detection_per_type,
     )
+    if scheduler is None:
+        scheduler = LevelScheduler()
 
-    try:
-        for rule in sorted(rules, key=lambda r: r.level(), reverse=True):
-            detected_list = rule.exec(
-                datasources=datasources, detected=detected, embedders=embedders
+    call_hooks(hooks, "run_started", datasources=datasources)
+    started = time.perf_counter()
+    if checkpoint is not None:
+        rules = _restore_completed(rules, checkpoint, detection_data, detected)
+    # open the datasources used by the rules in parallel; the others are opened on first use
+    datasources.open(name for rule in rules for name in rule.datasource_names())
+
+    skipped_by_precheck = _failed_prechecks(rules, datasources=datasources)
+    if len(skipped_by_precheck) > 0:
+        rules = [rule for rule in rules if id(rule) not in skipped_by_precheck]
+        for rule in skipped_by_precheck.values():
+            detection_data.add_rule_result(
+                RuleResult(
+                    rule=rule,
+                    outcome=RuleOutcome.SKIPPED,
+                    elapsed=0.0,
+                    rows=0,
+                    detections=0,
+                    detail="precheck",
+                )
             )
-            detection_data.extend(detected_list)
-    except TooManyDetectionException:
-        pass
+
+    if cost_guard is not None:
+        violations = cost_guard.check(rules, datasources=datasources)
+        if cost_guard.action == CostGuardAction.SKIP and len(violations) > 0:
+            skipped_rules = {id(rule) for rule, _ in violations}
+            rules = [rule for rule in rules if id(rule) not in skipped_rules]
+            for rule, violation in violations:
+                detection_data.add_rule_result(
+                    RuleResult(
+                        rule=rule,
+                        outcome=RuleOutcome.SKIPPED,
+                        elapsed=0.0,
+                        rows=0,
+                        detections=0,
+                        detail=violation,
+                    )
+                )
+
+    plan = scheduler.plan(rules, datasources=datasources, workers=workers)
+
+    runner = _RuleRunner(
+        detection_data=detection_data,
+        detected=detected,
+        datasources=datasources,
+        embedders=embedders,
+        fail_fast_level=fail_fast_level,
+        default_timeout=default_timeout,
+        hooks=hooks,
+        checkpoint=checkpoint,
+    )
+    for stage_index, stage in enumerate(plan.stages):
+        if workers <= 1:
+            for scheduled in stage:
+                runner.run(scheduled)
+        else:
+            # imported here since it takes long and is unnecessary for a single worker
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                # raise the exception in the worker if any
+                for future in [
+                    executor.submit(runner.run, scheduled) for scheduled in stage
+                ]:
+                    future.result()
+
+        if runner.stopped:
+            # the rules of the later stages are never started
+            for later_stage in plan.stages[stage_index + 1 :]:
+                for scheduled in later_stage:
+                    runner.skip(scheduled)
+            break
+
+    detection_data.record_elapsed(
+        time.perf_counter() - started, plan.predicted_elapsed(workers)
+    )
+    scheduler.record(detection_data.rule_results)
+    call_hooks(hooks, "run_finished", detection_data)
 
     return detection_data
+
+
+def _restore_completed(
+    rules: t.Collection[Rule[ID, DETECTION_TYPE, MSG]],
+    checkpoint: Checkpoint,
+    detection_data: DetectionData[ID, DETECTION_TYPE, MSG],
+    detected: DetectedType[ID, DETECTION_TYPE, MSG],
+) -> t.List[Rule[ID, DETECTION_TYPE, MSG]]:
+    """merge the results of the rules completed in the checkpoint and return the other rules"""
+    remaining: t.List[Rule[ID, DETECTION_TYPE, MSG]] = []
+    for rule in rules:
+        rule_result = checkpoint.completed_result(rule)
+        if rule_result is None:
+            remaining.append(rule)
+            continue
+        try:
+            detection_data.extend(checkpoint.restore(rule, detected))
+        except TooManyDetectionException:
+            # the rules to be executed are aborted as well
+            pass
+        detection_data.add_rule_result(rule_result)
+    return remaining
+
+
+def _failed_prechecks(
+    rules: t.Iterable[Rule[ID, DETECTION_TYPE, MSG]],
+    *,
+    datasources: DataSources,
+) -> t.Mapping[int, Rule[ID, DETECTION_TYPE, MSG]]:
+    """evaluate prechecks of rules, batched by datasource
+
+    Returns
+    -------
+    Mapping[int, Rule]
+        rules whose prechecks failed, keyed by their `id()`
+    """
+    rules_by_datasource: t.MutableMapping[str, t.List[Rule[ID, DETECTION_TYPE, MSG]]]
+    rules_by_datasource = defaultdict(lambda: [])
+    for rule in rules:
+        if rule.precheck is None:
+            continue
+        datasource_name = next(rule.datasource_names(), None)
+        if datasource_name is None:
+            logger.warning(
+                "precheck of rule %s is ignored since it has no datasource",
+                rule.detection_type(),
+            )
+            continue
+        rules_by_datasource[datasource_name].append(rule)
+
+    failed: t.MutableMapping[int, Rule[ID, DETECTION_TYPE, MSG]] = {}
+    for datasource_name, rules_of_datasource in rules_by_datasource.items():
+        try:
+            passed_list = datasources[datasource_name].evaluate_prechecks(
+                [t.cast(str, rule.precheck) for rule in rules_of_datasource]
+            )
+        except NotImplementedError as e:
+            logger.warning("prechecks are ignored: %s", e)
+            continue
+
+        for rule, passed in zip(rules_of_datasource, passed_list):
+            if not passed:
+                failed[id(rule)] = rule
+
+    return failed
+
+
+class _RuleRunner(t.Generic[ID, DETECTION_TYPE, MSG]):
+    """executes rules and collects their detections into a DetectionData
+
+    It can be used from multiple threads.
+    """
+
+    _detection_data: DetectionData[ID, DETECTION_TYPE, MSG]
+    _detected: DetectedType[ID, DETECTION_TYPE, MSG]
+    _datasources: DataSources
+    _embedders: t.Mapping[str, Embedder]
+    _fail_fast_level: t.Optional[int]
+    _default_timeout: t.Optional[float]
+    _hooks: t.Sequence[ValidationHook]
+    _checkpoint: t.Optional[Checkpoint]
+    _lock: threading.Lock
+    _stopped: threading.Event
+    _stop_reason: t.Optional[str]
+    _running: t.Set[RuleExecution]
+
+    def __init__(
+        self,
+        *,
+        detection_data: DetectionData[ID, DETECTION_TYPE, MSG],
+        detected: DetectedType[ID, DETECTION_TYPE, MSG],
+        datasources: DataSources,
+        embedders: t.Mapping[str, Embedder],
+        fail_fast_level: t.Optional[int] = None,
+        default_timeout: t.Optional[float] = None,
+        hooks: t.Sequence[ValidationHook] = (),
+        checkpoint: t.Optional[Checkpoint] = None,
+    ) -> None:
+        self._detection_data = detection_data
+        self._detected = detected
+        self._datasources = datasources
+        self._embedders = embedders
+        self._fail_fast_level = fail_fast_level
+        self._default_timeout = default_timeout
+        self._hooks = hooks
+        self._checkpoint = checkpoint
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._stop_reason = None
+        self._running = set()
+
+    @property
+    def stopped(self) -> bool:
+        """whether the execution of rules is stopped"""
+        return self._stopped.is_set()
+
+    def stop(self, reason: str):
+        """stop starting rules and cancel the running rules"""
+        with self._lock:
+            self._stopped.set()
+            if self._stop_reason is None:
+                self._stop_reason = reason
+            running = list(self._running)
+
+        for execution in running:
+            execution.cancel(reason)
+
+    def skip(self, scheduled: ScheduledRule):
+        """record a rule which is not started since the execution is stopped"""
+        with self._lock:
+            self._detection_data.add_rule_result(
+                RuleResult(
+                    rule=scheduled.rule,
+                    outcome=RuleOutcome.SKIPPED,
+                    elapsed=0.0,
+                    rows=0,
+                    detections=0,
+                    predicted_elapsed=scheduled.predicted_elapsed,
+                    detail=self._stop_reason,
+                )
+            )
+
+    def run(self, scheduled: ScheduledRule):
+        rule = scheduled.rule
+        detection_data = self._detection_data
+        fail_fast_level = self._fail_fast_level
+        detection_cnt = 0
+        outcome = RuleOutcome.COMPLETED
+
+        timeout = rule.timeout()
+        if timeout is None:
+            timeout = self._default_timeout
+
+        rule_checkpoint: t.Optional[RuleCheckpoint] = None
+        if self._checkpoint is not None:
+            rule_checkpoint = self._checkpoint.start(rule)
+
+        execution = RuleExecution(
+            rule,
+            timeout=timeout,
+            resume_key=(
+                rule_checkpoint.resume_key if rule_checkpoint is not None else None
+            ),
+        )
+        with self._lock:
+            stopped = self.stopped
+            if not stopped:
+                self._running.add(execution)
+        if stopped:
+            if rule_checkpoint is not None:
+                rule_checkpoint.close()
+            self.skip(scheduled)
+            return
+        if rule_checkpoint is not None:
+            execution.on_progress(
+                lambda key: rule_checkpoint.commit_progress(key, execution.rows)
+            )
+
+        # cancel the rule from the client side too, in case the server does not enforce the timeout
+        watchdog: t.Optional[threading.Timer] = None
+        if timeout is not None:
+            watchdog = threading.Timer(timeout, execution.cancel, (TIMEOUT_REASON,))
+            watchdog.daemon = True
+            watchdog.start()
+
+        started = time.perf_counter()
+        with executing(execution):
+            call_hooks(self._hooks, "rule_started", execution)
+            timings = execution.timings
+            detecteds: t.Optional[t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]] = None
+            try:
+                detecteds = rule.exec(
+                    datasources=self._datasources,
+                    detected=self._detected,
+                    embedders=self._embedders,
+                )
+                if rule_checkpoint is not None:
+                    # the detections before the key from which the rule resumes
+                    for restored in rule_checkpoint.restored(self._detected):
+                        with self._lock:
+                            detection_data.append(restored)
+                        detection_cnt += 1
+
+                for detected in detecteds:
+                    if timings is None:
+                        with self._lock:
+                            detection_data.append(detected)
+                        if rule_checkpoint is not None:
+                            rule_checkpoint.write(detected)
+                    else:
+                        with timings.measure(Phase.SINK):
+                            with self._lock:
+                                detection_data.append(detected)
+                            if rule_checkpoint is not None:
+                                rule_checkpoint.write(detected)
+                    detection_cnt += 1
+
+                    if fail_fast_level is not None and detected.level >= fail_fast_level:
+                        outcome = RuleOutcome.FAILED_FAST
+                        with self._lock:
+                            detection_data.mark_failed_fast()
+                            # only the other rules are cancelled
+                            self._running.discard(execution)
+                        self.stop("fail-fast")
+                        break
+                    if execution.cancelled:
+                        break
+            except TooManyDetectionException:
+                outcome = RuleOutcome.ABORTED
+                with self._lock:
+                    self._stopped.set()
+                    if self._stop_reason is None:
+                        self._stop_reason = "too many detections"
+            except RuleTimeoutError:
+                outcome = RuleOutcome.TIMED_OUT
+            except BaseException as e:
+                # the query may fail because it is interrupted
+                if not isinstance(e, Exception) or not execution.cancelled:
+                    if rule_checkpoint is not None:
+                        rule_checkpoint.close()
+                    raise
+            finally:
+                if watchdog is not None:
+                    watchdog.cancel()
+                # release the query result if the rule is stopped on the way
+                close = getattr(detecteds, "close", None)
+                if close is not None:
+                    close()
+                with self._lock:
+                    self._running.discard(execution)
+
+        if outcome == RuleOutcome.COMPLETED and execution.cancelled:
+            outcome = (
+                RuleOutcome.TIMED_OUT if execution.timed_out else RuleOutcome.CANCELLED
+            )
+
+        rule_result = RuleResult(
+            rule=rule,
+            outcome=outcome,
+            elapsed=time.perf_counter() - started,
+            rows=execution.rows
+            + (rule_checkpoint.restored_rows if rule_checkpoint is not None else 0),
+            detections=detection_cnt,
+            predicted_elapsed=scheduled.predicted_elapsed,
+            detail=(
+                TIMEOUT_REASON
+                if outcome == RuleOutcome.TIMED_OUT
+                else execution.cancel_reason
+            ),
+        )
+        if rule_checkpoint is not None:
+            if outcome == RuleOutcome.COMPLETED:
+                rule_checkpoint.complete(rule_result)
+            else:
+                rule_checkpoint.close()
+        with self._lock:
+            detection_data.add_rule_result(rule_result)
+        call_hooks(self._hooks, "rule_finished", execution, rule_result)
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import marshal
+import os
+import pathlib
+import time
+import typing as t
+
+from .. import __version__
+
+logger = logging.getLogger(__name__)
+
+T = t.TypeVar("T")
+
+# incremented when the format of cache entries or compiled configs changes
+CACHE_FORMAT = 2
+
+# the coarsest resolution of modification times among common filesystems (FAT)
+_MTIME_GRANULARITY_NS = 2_000_000_000
+
+
+def load_cached(
+    filepath: t.Union[str, bytes, pathlib.Path],
+    cache_dir: t.Union[str, pathlib.Path],
+    compile: t.Callable[[bytes], T],
+) -> T:
+    """compile a file, or get the result of the previous compilation from the cache
+
+    The cache entry of a file is used if its modification time and size are unchanged,
+    or else if the SHA-256 hash of its content is unchanged.
+    The hash is also checked if the file was modified within the granularity of modification times
+    before the entry was written, since the file may have been modified again without changing them.
+    Entries made by other versions of validb are ignored.
+    The result of the compilation must be serializable with `marshal`; otherwise it is not cached.
+
+    Parameters
+    ----------
+    filepath : str | bytes | Path
+        the file
+    cache_dir : str | Path
+        the directory of cache entries; it is created if it does not exist
+    compile : Callable[[bytes], T]
+        the function compiling the content of the file
+
+    Returns
+    -------
+    T
+        the result of the compilation
+    """
+    path = os.path.abspath(os.fsdecode(filepath))
+    cache_path = os.path.join(
+        cache_dir, hashlib.sha256(path.encode("utf_8")).hexdigest() + ".marshal"
+    )
+    stat = os.stat(path)
+    entry = _read_entry(cache_path)
+    if (
+        entry is not None
+        and entry["mtime_ns"] == stat.st_mtime_ns
+        and entry["size"] == stat.st_size
+        and stat.st_mtime_ns + _MTIME_GRANULARITY_NS < entry["cached_at_ns"]
+    ):
+        return entry["data"]
+
+    with open(path, mode="rb") as fp:
+        source = fp.read()
+    digest = hashlib.sha256(source).hexdigest()
+    if entry is not None and entry["digest"] == digest:
+        data = entry["data"]
+    else:
+        data = compile(source)
+
+    # rewritten even if the content is unchanged, so that the hash is not checked again once it is old enough
+    _write_entry(
+        cache_path,
+        {
+            "format": CACHE_FORMAT,
+            "version": __version__,
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "digest": digest,
+            "cached_at_ns": time.time_ns(),
+            "data": data,
+        },
+    )
+    return data
+
+
+def _read_entry(cache_path: str) -> t.Optional[t.Mapping[str, t.Any]]:
+    try:
+        with open(cache_path, mode="rb") as fp:
+            entry = marshal.load(fp)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError):
+        logger.warning("ignored a broken config cache %s", cache_path, exc_info=True)
+        return None
+
+    if (
+        not isinstance(entry, dict)
+        or entry.get("format") != CACHE_FORMAT
+        or entry.get("version") != __version__
+    ):
+        return None
+    return entry
+
+
+def _write_entry(cache_path: str, entry: t.Mapping[str, t.Any]) -> None:
+    try:
+        serialized = marshal.dumps(dict(entry))
+    except ValueError:
+        # e.g. dates in YAML
+        logger.debug("config cannot be cached since it is not serializable")
+        return
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, mode="wb") as fp:
+            fp.write(serialized)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        logger.warning("failed to write config cache %s", cache_path, exc_info=True)
@@ -1,11 +1,13 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import typing as t
 
+from .._costguard import CostGuard
 from .._embedder import Embedder
 from .._detected import ID, MSG, DETECTION_TYPE
 from ..rules import Rule
 from ..datasources import DataSources
 from ..csvmapping import DetectionCsvMapping
+from ..scheduling import Schedule
 
 
 @dataclass
@@ -16,3 +18,9 @@ class Config(t.Generic[ID, DETECTION_TYPE, MSG]):
     datasources: DataSources
     embedders: t.Mapping[str, Embedder]
     detected_csvmapping: t.Optional[DetectionCsvMapping]
+    cost_guard: t.Optional[CostGuard] = None
+    default_timeout: t.Optional[float] = None
+    targets: t.Mapping[str, DataSources] = field(default_factory=dict)
+    """datasources of each target, keyed by the name of the target; empty if no target is defined"""
+    schedules: t.Sequence[Schedule] = field(default_factory=list)
+    """rules validated periodically by `validb serve`"""
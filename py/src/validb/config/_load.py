@@ -1,4 +1,5 @@
 import pathlib
+import re
 import typing as t
 
 from .._classloader import (
@@ -7,55 +8,153 @@ from .._classloader import (
     NonClassLoadedError,
     UnexpectedClassLoadedError,
 )
+from .._costguard import CostBudget, CostGuard, CostGuardAction
 from ..csvmapping import DetectionCsvMapping
 from ..datasources import DataSource, DataSources
 from .._embedder import Embedder
 from ..rules import Rule
-from ._type import ConfigFile
+from ..scheduling import CronSchedule, Schedule
+from ._cache import load_cached
+from ._type import CompiledConfig, ConfigFile, CostGuardDef, ScheduleDef
 from ._config import Config
 
+# placeholders in datasource attributes templated for targets
+_PLACEHOLDER = re.compile(r"\{([A-Za-z_][A-Za-z0-9_]*)\}")
 
-def load_config(filepath: t.Union[str, bytes, pathlib.Path]) -> Config[str, str, str]:
+
+def load_config(
+    filepath: t.Union[str, bytes, pathlib.Path],
+    *,
+    cache_dir: t.Union[str, pathlib.Path, None] = None,
+) -> Config[str, str, str]:
     """Load validation config from the YAML file.
 
     Parameters
     ----------
     filepath : str | bytes | Path
         filepath to the YAML file
+    cache_dir : str | Path, optional
+        directory to cache the parsed and normalized config in;
+        If specified, the YAML file is parsed again only when it is changed.
+        The rules, datasources and others are still constructed on every load,
+        since only plain data can be cached.
 
     Returns
     -------
     Config
         the configuration of validation
     """
-    import yaml
-
-    with open(filepath, mode="r") as fp:
-        config_dict: ConfigFile = yaml.safe_load(fp)
+    compiled: CompiledConfig
+    if cache_dir is not None:
+        compiled = load_cached(filepath, cache_dir, _compile_config)
+    else:
+        with open(filepath, mode="rb") as fp:
+            compiled = _compile_config(fp.read())
 
     embedders: t.MutableMapping[str, Embedder] = {
         name: _construct_embedder(attr)
-        for name, attr in config_dict.get("embedders", {}).items()
+        for name, attr in compiled.get("embedders", {}).items()
     }
 
     datasources: t.Mapping[str, DataSource] = {
         name: _construct_datasource(attr)
-        for name, attr in config_dict.get("datasources", {}).items()
+        for name, attr in compiled.get("datasources", {}).items()
+    }
+
+    targets: t.Dict[str, DataSources] = {
+        target_name: DataSources(
+            {
+                name: _construct_datasource(attr)
+                for name, attr in datasource_attrs.items()
+            }
+        )
+        for target_name, datasource_attrs in compiled.get("targets", {}).items()
     }
 
     csvmappings: t.Mapping[str, DetectionCsvMapping] = {
         name: _construct_csvmapping(attr)
-        for name, attr in config_dict.get("csvmappings", {}).items()
+        for name, attr in compiled.get("csvmappings", {}).items()
     }
 
+    cost_guard_attr = compiled.get("cost_guard")
+
+    schedules = [
+        _construct_schedule(schedule_attr, targets)
+        for schedule_attr in compiled.get("schedules", [])
+    ]
+    schedule_names = [schedule.name for schedule in schedules]
+    if len(set(schedule_names)) < len(schedule_names):
+        duplicated = sorted(
+            {name for name in schedule_names if schedule_names.count(name) > 1}
+        )
+        raise ValueError(f"schedules.*.name must be unique; duplicated: {duplicated}")
+
     return Config(
-        rules=[_construct_rule(rule) for rule in config_dict.get("rules", [])],
+        rules=[_construct_rule(rule) for rule in compiled.get("rules", [])],
         datasources=DataSources(datasources),
         detected_csvmapping=csvmappings.get("detected"),
         embedders=embedders,
+        cost_guard=(
+            _construct_cost_guard(cost_guard_attr)
+            if cost_guard_attr is not None
+            else None
+        ),
+        default_timeout=compiled.get("default_timeout"),
+        targets=targets,
+        schedules=schedules,
     )
 
 
+def _compile_config(source: bytes) -> CompiledConfig:
+    """parse the YAML config and normalize it"""
+    import yaml
+
+    # the loader implemented in C is much faster if libyaml is available
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    config_dict: t.Optional[ConfigFile] = yaml.load(source, Loader=loader)
+    if config_dict is None:
+        config_dict = {}
+
+    compiled: CompiledConfig = {
+        key: value  # type: ignore
+        for key, value in config_dict.items()
+        if key != "targets"
+    }
+
+    datasource_attrs: t.Mapping[str, t.Mapping[str, t.Any]] = config_dict.get(
+        "datasources", {}
+    )
+    parsed_targets = [
+        _parse_target(target_attr) for target_attr in config_dict.get("targets", [])
+    ]
+    # placeholders of the other names are not templates, such as braces in regular expressions
+    placeholders = {"target"}
+    for _, target_vars in parsed_targets:
+        placeholders.update(target_vars.keys())
+
+    targets: t.Dict[str, t.Mapping[str, t.Any]] = {}
+    for target_name, target_vars in parsed_targets:
+        if target_name in targets:
+            raise ValueError(f"targets.*.name must be unique; duplicated: {target_name}")
+        targets[target_name] = {
+            name: {
+                key: (
+                    value
+                    if key == "class"
+                    else _substitute_target(
+                        value, target_name, target_vars, placeholders
+                    )
+                )
+                for key, value in attr.items()
+            }
+            for name, attr in datasource_attrs.items()
+        }
+    if len(targets) > 0:
+        compiled["targets"] = targets
+
+    return compiled
+
+
 def _construct_rule(rule_attr: t.Mapping[str, t.Any]) -> Rule[t.Any, t.Any, t.Any]:
     try:
         return construct_imported_dinamically(
@@ -120,3 +219,107 @@ def _construct_csvmapping(
         raise TypeError(
             f"csvmapping must be instance of {DetectionCsvMapping.__name__}; actual loaded: {e.actual_loaded}"
         )
+
+
+def _construct_cost_guard(cost_guard_attr: CostGuardDef) -> CostGuard:
+    action_str = cost_guard_attr.get("action", CostGuardAction.WARN.value)
+    try:
+        action = CostGuardAction(action_str)
+    except ValueError:
+        raise ValueError(
+            f"cost_guard.action must be one of {[a.value for a in CostGuardAction]}; actually specified: {action_str}"
+        )
+
+    return CostGuard(
+        CostBudget(
+            max_rows=cost_guard_attr.get("max_estimated_rows"),
+            max_cost=cost_guard_attr.get("max_estimated_cost"),
+        ),
+        action=action,
+    )
+
+
+def _construct_schedule(
+    schedule_attr: ScheduleDef, targets: t.Mapping[str, DataSources]
+) -> Schedule:
+    name = schedule_attr.get("name")
+    if not isinstance(name, str):
+        raise ValueError(
+            f"schedules.*.name must be a string; actually specified: {name}"
+        )
+    cron = schedule_attr.get("cron")
+    if not isinstance(cron, str):
+        raise ValueError(
+            f"schedules.*.cron must be a string; actually specified: {cron}"
+        )
+
+    target_names = schedule_attr.get("targets")
+    if target_names is not None:
+        unknown = [target for target in target_names if target not in targets]
+        if len(unknown) > 0:
+            raise ValueError(
+                f"schedules.*.targets must be names of targets; unknown: {unknown}"
+            )
+
+    detection_types = schedule_attr.get("detection_types")
+    return Schedule(
+        name=name,
+        cron=CronSchedule(cron),
+        detection_types=(
+            [str(d) for d in detection_types] if detection_types is not None else None
+        ),
+        targets=list(target_names) if target_names is not None else None,
+    )
+
+
+def _parse_target(
+    target_attr: t.Union[str, t.Mapping[str, t.Any]]
+) -> t.Tuple[str, t.Mapping[str, t.Any]]:
+    if isinstance(target_attr, str):
+        return target_attr, {}
+    if not isinstance(target_attr, t.Mapping) or not isinstance(
+        target_attr.get("name"), str
+    ):
+        raise ValueError(
+            f"targets.* must be a string or a mapping with 'name'; actually specified: {target_attr}"
+        )
+    target_vars = {k: v for k, v in target_attr.items() if k != "name"}
+    return target_attr["name"], target_vars
+
+
+def _substitute_target(
+    value: t.Any,
+    target_name: str,
+    target_vars: t.Mapping[str, t.Any],
+    placeholders: t.AbstractSet[str],
+) -> t.Any:
+    """replace placeholders like `{target}` in strings of a datasource attribute for the target
+
+    Only `{target}` and the names of the variables of targets in `placeholders` are replaced,
+    and the other braces are kept as they are.
+    """
+    if isinstance(value, str):
+
+        def replace(match: t.Match[str]) -> str:
+            name = match.group(1)
+            if name not in placeholders:
+                return match.group(0)
+            if name == "target":
+                return target_name
+            if name not in target_vars:
+                raise ValueError(
+                    f"datasources.* cannot be templated for target {target_name}: {name!r} in {value!r}"
+                )
+            return str(target_vars[name])
+
+        return _PLACEHOLDER.sub(replace, value)
+    if isinstance(value, t.Mapping):
+        return {
+            k: _substitute_target(v, target_name, target_vars, placeholders)
+            for k, v in value.items()
+        }
+    if isinstance(value, list):
+        return [
+            _substitute_target(v, target_name, target_vars, placeholders) for v in value
+        ]
+    return value
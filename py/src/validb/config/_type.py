@@ -12,9 +12,54 @@ class RuleDefRequired(t.TypedDict):
 class RuleDef(RuleDefRequired, total=False):
     level: int
     embedders: t.List[str]
+    max_estimated_rows: float
+    max_estimated_cost: float
+    precheck: str
+    timeout: float
+    render_in_sql: bool
+    defer_msg: bool
+    page_by: t.List[str]
+    page_size: int
+
+
+class CostGuardDef(t.TypedDict, total=False):
+    action: t.Literal["skip", "warn", "fail"]
+    max_estimated_rows: float
+    max_estimated_cost: float
+
+
+class ScheduleDefRequired(t.TypedDict):
+    name: str
+    cron: str
+
+
+class ScheduleDef(ScheduleDefRequired, total=False):
+    detection_types: t.List[str]
+    targets: t.List[str]
 
 
 class ConfigFile(t.TypedDict, total=False):
     rules: t.Sequence[RuleDef]
     embedders: t.Mapping[str, t.Any]
     datasources: t.Mapping[str, t.Any]
+    csvmappings: t.Mapping[str, t.Any]
+    cost_guard: CostGuardDef
+    default_timeout: float
+    targets: t.Sequence[t.Union[str, t.Mapping[str, t.Any]]]
+    schedules: t.Sequence[ScheduleDef]
+
+
+class CompiledConfig(t.TypedDict, total=False):
+    """ConfigFile normalized by `load_config()`, which can be cached
+
+    The datasources of each target are expanded in `targets`.
+    """
+
+    rules: t.Sequence[RuleDef]
+    embedders: t.Mapping[str, t.Any]
+    datasources: t.Mapping[str, t.Any]
+    csvmappings: t.Mapping[str, t.Any]
+    cost_guard: CostGuardDef
+    default_timeout: float
+    targets: t.Mapping[str, t.Mapping[str, t.Any]]
+    schedules: t.Sequence[ScheduleDef]
@@ -1,6 +1,7 @@
-from ._datasource import DataSource, DataSources
+from ._datasource import DataSource, DataSources, QueryEstimate
 
 __all__ = [
     "DataSource",
     "DataSources",
+    "QueryEstimate",
 ]
@@ -1,8 +1,93 @@
 import abc
+from dataclasses import dataclass
+import logging
+import threading
 import typing as t
 
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class QueryEstimate:
+    """Estimation of a query by the planner of a datasource
+
+    Attributes
+    ----------
+    rows : float | None
+        estimated number of rows to be examined, including the rows scanned repeatedly by nested-loop joins;
+        None if unknown.
+        Planners estimate it differently, e.g. PostgreSQL only reports the rows of scans after their filters,
+        so budgets on `cost` are more reliable for such datasources.
+    cost : float | None
+        estimated cost in the unit of the planner; None if unknown
+    """
+
+    rows: t.Optional[float]
+    cost: t.Optional[float]
+
 
 class DataSource(t.ContextManager, abc.ABC):
+    @property
+    def connect_seconds(self) -> t.Optional[float]:
+        """wall time of the first connection to the database in seconds
+
+        Datasources which connect to a database override this so that slow connection setup can be monitored.
+        It is None if the datasource has not connected yet or does not know the time.
+        """
+        return None
+
+    def explain(self, sql: str) -> t.Optional[QueryEstimate]:
+        """estimate the cost of a query without executing it
+
+        Datasources which have a query planner can override this to use it (e.g. `EXPLAIN`).
+
+        Parameters
+        ----------
+        sql : str
+            the query
+
+        Returns
+        -------
+        QueryEstimate | None
+            the estimation; None if the datasource cannot estimate it
+        """
+        return None
+
+    def evaluate_prechecks(self, sqls: t.Sequence[str]) -> t.Sequence[bool]:
+        """evaluate cheap queries which gate rules
+
+        A precheck passes unless its query returns no rows, NULL or zero.
+        Datasources should evaluate all the prechecks in as few round trips as possible.
+
+        Parameters
+        ----------
+        sqls : Sequence[str]
+            queries of the prechecks; each of them should return a single value
+
+        Returns
+        -------
+        Sequence[bool]
+            whether each precheck passed
+
+        Raises
+        ------
+        NotImplementedError
+            If the datasource does not support prechecks.
+        """
+        raise NotImplementedError(
+            f"{self.__class__.__name__} does not support prechecks"
+        )
+
+    def reset(self) -> None:
+        """release the resources held for threads, keeping the datasource open
+
+        Datasources which give each thread its own resources (e.g. a session) override this,
+        so that a long-lived process does not accumulate those of finished threads.
+        Shared resources such as connection pools must be kept.
+        It is called only while no query is running on the datasource.
+        """
+        pass
+
     @abc.abstractmethod
     def close(self):
         """close this datasource
@@ -25,23 +110,94 @@ class DataSource(t.ContextManager, abc.ABC):
 
 
 class DataSources(t.ContextManager):
+    """Named datasources
+
+    Each datasource is opened (`DataSource.__enter__()`) lazily on first access,
+    so datasources which no rule uses are never opened.
+    Datasources known to be needed can be opened in advance, in parallel, with `open()`.
+    """
+
     _datasources: t.MutableMapping[str, DataSource]
+    _opened: t.Set[str]
+    _lock: threading.Lock
+    _open_locks: t.MutableMapping[str, threading.Lock]
 
     def __init__(
         self, datasources: t.Optional[t.MutableMapping[str, DataSource]] = None
     ) -> None:
         self._datasources = datasources if datasources is not None else {}
+        self._opened = set()
+        self._lock = threading.Lock()
+        self._open_locks = {}
 
     def __getitem__(self, key: str) -> DataSource:
-        return self._datasources[key]
+        datasource = self._datasources[key]
+        if key not in self._opened:
+            self._open(key)
+        return datasource
+
+    def names(self) -> t.Iterable[str]:
+        """names of all the datasources, including those not opened yet"""
+        return self._datasources.keys()
+
+    def open(self, names: t.Iterable[str], *, parallel: bool = True) -> None:
+        """open the specified datasources in advance
+
+        Datasources already opened are ignored.
+
+        Parameters
+        ----------
+        names : Iterable[str]
+            names of the datasources
+        parallel : bool
+            whether to open the datasources in parallel;
+            It shortens startup when connection setup is slow.
+        """
+        names = [
+            name
+            for name in dict.fromkeys(names)
+            if name in self._datasources and name not in self._opened
+        ]
+        if not parallel or len(names) <= 1:
+            for name in names:
+                self._open(name)
+            return
+
+        # imported here since it takes long and is unnecessary for a single datasource
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            for future in [executor.submit(self._open, name) for name in names]:
+                future.result()
+
+    def connect_seconds(self) -> t.Mapping[str, float]:
+        """wall time of the first connection of each opened datasource in seconds
+
+        Datasources which have not connected yet, or do not know the time, are omitted.
+        Since the time belongs to the opened datasources, it must be read before they are closed.
+        """
+        with self._lock:
+            opened = list(self._opened)
+        seconds: t.Dict[str, float] = {}
+        for name in opened:
+            elapsed = self._datasources[name].connect_seconds
+            if elapsed is not None:
+                seconds[name] = elapsed
+        return seconds
+
+    def _open(self, name: str) -> None:
+        # each datasource has its own lock so that others can be opened meanwhile
+        with self._lock:
+            open_lock = self._open_locks.setdefault(name, threading.Lock())
+
+        with open_lock:
+            if name in self._opened:
+                return
+            self._datasources[name].__enter__()
+            with self._lock:
+                self._opened.add(name)
 
     def __enter__(self) -> "DataSources":
-        try:
-            for datasource in self._datasources.values():
-                datasource.__enter__()
-        except:
-            # TODO: logging ERROR
-            self.close()
         return self
 
     def __exit__(
@@ -52,11 +208,25 @@ class DataSources(t.ContextManager):
     ) -> t.Optional[bool]:
         self.close()
 
+    def reset(self) -> None:
+        """release the resources held for threads by the opened datasources, keeping them open
+
+        It must be called only while no validation is using the datasources.
+        """
+        with self._lock:
+            opened = list(self._opened)
+        for name in opened:
+            try:
+                self._datasources[name].reset()
+            except Exception:
+                logger.warning("failed to reset datasource %s", name, exc_info=True)
+
     def close(self):
-        # close all datasources
-        for datasource in self._datasources.values():
+        # close all opened datasources
+        with self._lock:
+            opened, self._opened = self._opened, set()
+        for name in opened:
             try:
-                datasource.close()
+                self._datasources[name].close()
             except:
-                # TODO: logging WARNING
-                pass
+                logger.warning("failed to close datasource %s", name, exc_info=True)
@@ -0,0 +1,122 @@
+import typing as t
+
+from ._datasource import QueryEstimate
+
+
+def parse_mysql_plan(plan: t.Mapping[str, t.Any]) -> QueryEstimate:
+    """estimation from the result of `EXPLAIN FORMAT=JSON` of MySQL
+
+    The tables of a nested loop are scanned once for each row produced by the tables before them,
+    so the rows examined by a join are the sum of the running products of the rows of its tables.
+    """
+    query_block = plan.get("query_block", {})
+    cost = query_block.get("cost_info", {}).get("query_cost")
+
+    return QueryEstimate(
+        rows=_mysql_rows_examined(query_block),
+        cost=float(cost) if cost is not None else None,
+    )
+
+
+def parse_postgresql_plan(plan: t.Sequence[t.Mapping[str, t.Any]]) -> QueryEstimate:
+    """estimation from the result of `EXPLAIN (FORMAT JSON)` of PostgreSQL
+
+    The rows are the largest estimate of the rows read by a scan,
+    multiplied by the loops of the inner side of nested loops.
+    They are the rows of the scans after their filters,
+    since the planner does not report the rows before them.
+    If the plan has no scan, the rows output by the query are used.
+    """
+    root = plan[0].get("Plan", {})
+    rows = _postgresql_rows_scanned(root)
+    if rows is None and root.get("Plan Rows") is not None:
+        rows = float(root["Plan Rows"])
+    cost = root.get("Total Cost")
+
+    return QueryEstimate(
+        rows=rows,
+        cost=float(cost) if cost is not None else None,
+    )
+
+
+def _mysql_rows_examined(node: t.Any) -> t.Optional[float]:
+    rows: t.Optional[float] = None
+    if isinstance(node, t.Mapping):
+        for key, value in node.items():
+            if key == "nested_loop" and isinstance(value, list):
+                rows = _add(rows, _mysql_nested_loop_rows_examined(value))
+            elif key == "table" and isinstance(value, t.Mapping):
+                rows = _add(rows, _mysql_table_rows_examined(value))
+            else:
+                rows = _add(rows, _mysql_rows_examined(value))
+    elif isinstance(node, list):
+        for value in node:
+            rows = _add(rows, _mysql_rows_examined(value))
+    return rows
+
+
+def _mysql_nested_loop_rows_examined(
+    entries: t.Sequence[t.Any],
+) -> t.Optional[float]:
+    rows: t.Optional[float] = None
+    # the rows produced by the tables joined so far, for each of which the next table is scanned
+    loops = 1.0
+    for entry in entries:
+        table = entry.get("table") if isinstance(entry, t.Mapping) else None
+        if not isinstance(table, t.Mapping):
+            rows = _add(rows, _mysql_rows_examined(entry))
+            continue
+
+        examined = table.get("rows_examined_per_scan")
+        if examined is not None:
+            rows = _add(rows, loops * float(examined))
+            produced = table.get("rows_produced_per_join")
+            loops = float(produced) if produced is not None else loops * float(examined)
+        # subqueries of the table, such as a derived table
+        rows = _add(rows, _mysql_subqueries_rows_examined(table))
+    return rows
+
+
+def _mysql_table_rows_examined(table: t.Mapping[str, t.Any]) -> t.Optional[float]:
+    examined = table.get("rows_examined_per_scan")
+    return _add(
+        float(examined) if examined is not None else None,
+        _mysql_subqueries_rows_examined(table),
+    )
+
+
+def _mysql_subqueries_rows_examined(
+    table: t.Mapping[str, t.Any],
+) -> t.Optional[float]:
+    return _mysql_rows_examined(
+        [value for value in table.values() if isinstance(value, (t.Mapping, list))]
+    )
+
+
+def _postgresql_rows_scanned(node: t.Mapping[str, t.Any]) -> t.Optional[float]:
+    children = [child for child in node.get("Plans", ()) if isinstance(child, t.Mapping)]
+    children_rows = [_postgresql_rows_scanned(child) for child in children]
+    rows = _max(*children_rows)
+
+    if node.get("Node Type") == "Nested Loop" and len(children) == 2:
+        # the inner side is executed once for each row of the outer side
+        loops = children[0].get("Plan Rows")
+        if loops is not None and children_rows[1] is not None:
+            rows = _max(rows, float(loops) * children_rows[1])
+    if str(node.get("Node Type", "")).endswith("Scan"):
+        plan_rows = node.get("Plan Rows")
+        if plan_rows is not None:
+            rows = _max(rows, float(plan_rows))
+    return rows
+
+
+def _add(a: t.Optional[float], b: t.Optional[float]) -> t.Optional[float]:
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a + b
+
+
+def _max(*values: t.Optional[float]) -> t.Optional[float]:
+    return max((value for value in values if value is not None), default=None)
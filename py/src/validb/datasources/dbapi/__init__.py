@@ -0,0 +1,7 @@
+from ._datasource import ColumnIndex, DBAPIDataSource, RowMapping
+
+__all__ = [
+    "ColumnIndex",
+    "DBAPIDataSource",
+    "RowMapping",
+]
@@ -0,0 +1,431 @@
+import contextlib
+import importlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+import typing as t
+
+from .._datasource import DataSource, QueryEstimate
+from .._plans import parse_mysql_plan, parse_postgresql_plan
+from ..._execution import Phase, RuleTimeoutError, current_execution
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_POOL_SIZE = 5
+DEFAULT_ARRAYSIZE = 1000
+
+
+class ColumnIndex(t.Mapping[str, int]):
+    """positions of the columns of a query result by name
+
+    It is created once for each query and shared by all the rows.
+    """
+
+    _positions: t.Mapping[str, int]
+    _names: t.Sequence[str]
+
+    def __init__(self, names: t.Sequence[str]) -> None:
+        self._names = tuple(names)
+        # the first column wins if names are duplicated, like sqlalchemy
+        positions: t.Dict[str, int] = {}
+        for i, name in enumerate(self._names):
+            positions.setdefault(name, i)
+        self._positions = positions
+
+    @property
+    def names(self) -> t.Sequence[str]:
+        """names of the columns in order"""
+        return self._names
+
+    def __getitem__(self, name: str) -> int:
+        return self._positions[name]
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self._positions)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def mapping(self, row: t.Sequence[t.Any]) -> "RowMapping":
+        """view of a row by column name"""
+        return RowMapping(self, row)
+
+
+class RowMapping(t.Mapping[str, t.Any]):
+    """read-only view of a tuple row by column name
+
+    It only refers to the row and the shared `ColumnIndex`, so creating it for each row is cheap.
+    """
+
+    __slots__ = ("_index", "_row")
+
+    _index: ColumnIndex
+    _row: t.Sequence[t.Any]
+
+    def __init__(self, index: ColumnIndex, row: t.Sequence[t.Any]) -> None:
+        self._index = index
+        self._row = row
+
+    def __getitem__(self, name: str) -> t.Any:
+        return self._row[self._index[name]]
+
+    def __iter__(self) -> t.Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+
+class DBAPIDataSource(DataSource):
+    """Datasource using connections of a DB-API 2.0 driver (PEP 249) directly
+
+    It has less overhead per row than `SQLAlchemyDataSource` since rows are plain tuples
+    of the driver, with no ORM session nor row objects.
+    It is suitable for read-only queries of validation which return many rows.
+    """
+
+    _driver: t.Any
+    _connect_kwargs: t.Mapping[str, t.Any]
+    _pool: "queue.LifoQueue[t.Any]"
+    _pool_size: int
+    _arraysize: int
+    _connections: t.List[t.Any]
+    _lock: threading.Lock
+    _warm_up: bool
+    _connect_seconds: t.Optional[float]
+
+    def __init__(
+        self,
+        *,
+        driver: str,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        arraysize: int = DEFAULT_ARRAYSIZE,
+        warm_up: bool = False,
+        **kwargs: t.Any,
+    ) -> None:
+        """create a datasource
+
+        Connections are not made until they are used.
+
+        Parameters
+        ----------
+        driver : str
+            name of the module of the DB-API driver, such as "sqlite3" or "pymysql"
+        pool_size : int
+            the number of idle connections kept for reuse
+        arraysize : int
+            the number of rows fetched from the driver at once
+        warm_up : bool
+            whether to connect to the database when the datasource is opened
+        **kwargs
+            arguments passed to `connect()` of the driver, such as `database` or `host`.
+            For sqlite3, `check_same_thread` is False by default so that connections can be pooled.
+        """
+        if pool_size <= 0:
+            raise ValueError(
+                f"pool_size must be positive; actually specified: {pool_size}"
+            )
+        if arraysize <= 0:
+            raise ValueError(
+                f"arraysize must be positive; actually specified: {arraysize}"
+            )
+
+        self._driver = importlib.import_module(driver)
+        connect_kwargs = dict(kwargs)
+        if driver == "sqlite3":
+            connect_kwargs.setdefault("check_same_thread", False)
+        self._connect_kwargs = connect_kwargs
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+        self._pool_size = pool_size
+        self._arraysize = arraysize
+        self._connections = []
+        self._lock = threading.Lock()
+        self._warm_up = warm_up
+        self._connect_seconds = None
+
+    @property
+    def driver(self) -> t.Any:
+        """the module of the DB-API driver"""
+        return self._driver
+
+    def __enter__(self) -> DataSource:
+        if self._warm_up:
+            with self.connection():
+                pass
+        return super().__enter__()
+
+    @property
+    def connect_seconds(self) -> t.Optional[float]:
+        return self._connect_seconds
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        while True:
+            try:
+                self._pool.get_nowait()
+            except queue.Empty:
+                break
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                logger.warning("failed to close a connection", exc_info=True)
+
+    def _connect(self) -> t.Any:
+        return self._driver.connect(**self._connect_kwargs)
+
+    @contextlib.contextmanager
+    def connection(self) -> t.Iterator[t.Any]:
+        """borrow a connection from the pool
+
+        The connection is returned to the pool at the end of the block,
+        or closed if the pool is full.
+        """
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            started = time.perf_counter()
+            connection = self._connect()
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._connections.append(connection)
+                if self._connect_seconds is None:
+                    self._connect_seconds = elapsed
+
+        try:
+            yield connection
+        except BaseException:
+            # the state of the connection is unknown
+            self._discard(connection)
+            raise
+
+        try:
+            connection.rollback()
+            self._pool.put_nowait(connection)
+        except queue.Full:
+            self._discard(connection)
+        except Exception:
+            logger.debug("failed to reset a connection", exc_info=True)
+            self._discard(connection)
+
+    def _discard(self, connection: t.Any) -> None:
+        with self._lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        try:
+            connection.close()
+        except Exception:
+            logger.debug("failed to close a connection", exc_info=True)
+
+    @contextlib.contextmanager
+    def query(
+        self,
+        sql: str,
+        *,
+        params: t.Optional[t.Union[t.Sequence[t.Any], t.Mapping[str, t.Any]]] = None,
+        timeout: t.Optional[float] = None,
+    ) -> t.Iterator[t.Tuple[ColumnIndex, t.Iterator[t.Sequence[t.Any]]]]:
+        """execute a read-only query on a pooled connection
+
+        Rows are fetched from the driver `arraysize` rows at a time, with a server-side cursor
+        for the drivers which buffer all rows otherwise (pymysql, MySQLdb, psycopg2).
+
+        Parameters
+        ----------
+        sql : str
+            the query
+        params : Sequence[Any] | Mapping[str, Any], optional
+            parameters of the query in the paramstyle of the driver
+        timeout : float, optional
+            time limit in seconds enforced by the server for MySQL (`MAX_EXECUTION_TIME` hint);
+            For other databases, the query is interrupted when the rule is cancelled by `validate_db()`.
+
+        Returns
+        -------
+        tuple[ColumnIndex, Iterator[Sequence[Any]]]
+            the columns and the rows as tuples of the driver
+
+        Raises
+        ------
+        RuleTimeoutError
+            If the server stops the query because of the timeout.
+        """
+        driver_name = self._driver.__name__
+        if timeout is not None and driver_name in _MYSQL_DRIVERS:
+            sql = _SELECT_PATTERN.sub(
+                rf"\1 /*+ MAX_EXECUTION_TIME({max(int(timeout * 1000), 1)}) */",
+                sql,
+                count=1,
+            )
+
+        execution = current_execution()
+        timings = execution.timings if execution is not None else None
+        query_started = time.perf_counter()
+        with self.connection() as connection, contextlib.ExitStack() as stack:
+            if execution is not None:
+                # removed before the connection is returned to the pool, where other rules can check it out
+                stack.callback(
+                    execution.on_cancel(self._query_canceller(connection))
+                )
+
+            cursor = _open_cursor(self._driver, connection)
+            try:
+                try:
+                    if params is None:
+                        cursor.execute(sql)
+                    else:
+                        cursor.execute(sql, params)
+                except self._driver.Error as e:
+                    if timeout is not None and _is_mysql_timeout(e):
+                        raise RuleTimeoutError(f"exceeded {timeout}s") from e
+                    raise
+                if timings is not None:
+                    timings.add(Phase.QUERY, time.perf_counter() - query_started)
+
+                first_rows = None
+                if cursor.description is None:
+                    # named cursors of psycopg2 describe the result after the first fetch
+                    first_rows = cursor.fetchmany(self._arraysize)
+                columns = ColumnIndex(
+                    [description[0] for description in cursor.description or ()]
+                )
+                yield columns, _fetch(cursor, self._arraysize, first_rows)
+            finally:
+                cursor.close()
+
+    def _query_canceller(self, connection: t.Any) -> t.Callable[[], None]:
+        # sqlite3
+        interrupt = getattr(connection, "interrupt", None)
+        if callable(interrupt):
+            return interrupt
+
+        # psycopg2, psycopg
+        cancel = getattr(connection, "cancel", None)
+        if callable(cancel):
+            return cancel
+
+        # pymysql, MySQLdb
+        thread_id = getattr(connection, "thread_id", None)
+        if callable(thread_id):
+            connection_id = int(thread_id())
+
+            def kill_query():
+                killer = self._connect()
+                try:
+                    cursor = killer.cursor()
+                    cursor.execute(f"KILL QUERY {connection_id}")
+                    cursor.close()
+                finally:
+                    killer.close()
+
+            return kill_query
+
+        return lambda: None
+
+    def explain(self, sql: str) -> t.Optional[QueryEstimate]:
+        """estimate the cost of a query by `EXPLAIN` of MySQL or PostgreSQL
+
+        It returns None for the other drivers.
+        """
+        driver_name = self._driver.__name__
+        sql = sql.strip().rstrip(";")
+        if driver_name in _MYSQL_DRIVERS:
+            explain_sql = f"EXPLAIN FORMAT=JSON {sql}"
+        elif driver_name in _POSTGRESQL_DRIVERS:
+            explain_sql = f"EXPLAIN (FORMAT JSON) {sql}"
+        else:
+            return None
+
+        with self.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(explain_sql)
+                row = cursor.fetchone()
+            finally:
+                cursor.close()
+
+        plan = row[0] if row is not None else None
+        if isinstance(plan, (str, bytes)):
+            plan = json.loads(plan)
+        if not plan:
+            return None
+        if driver_name in _MYSQL_DRIVERS:
+            return parse_mysql_plan(plan)
+        return parse_postgresql_plan(plan)
+
+    def evaluate_prechecks(self, sqls: t.Sequence[str]) -> t.Sequence[bool]:
+        if len(sqls) <= 0:
+            return []
+
+        with self.connection() as connection:
+            cursor = connection.cursor()
+            try:
+                # evaluate all prechecks as scalar subqueries in a single round trip
+                columns = ", ".join(f"({sql.strip().rstrip(';')})" for sql in sqls)
+                try:
+                    cursor.execute(f"SELECT {columns}")
+                    row = cursor.fetchone()
+                    return [_precheck_passed(value) for value in row]
+                except self._driver.Error as e:
+                    # e.g. a precheck returns more than one row; evaluate them one by one
+                    logger.debug("batched prechecks failed; evaluate one by one: %s", e)
+                    connection.rollback()
+
+                results: t.List[bool] = []
+                for sql in sqls:
+                    cursor.execute(sql)
+                    first_row = cursor.fetchone()
+                    results.append(
+                        first_row is not None and _precheck_passed(first_row[0])
+                    )
+                return results
+            finally:
+                cursor.close()
+
+
+# module names of MySQL drivers
+_MYSQL_DRIVERS = ("pymysql", "MySQLdb")
+# module names of PostgreSQL drivers
+_POSTGRESQL_DRIVERS = ("psycopg2", "psycopg")
+# error codes of MySQL (ER_QUERY_TIMEOUT) and MariaDB (ER_STATEMENT_TIMEOUT)
+_MYSQL_TIMEOUT_ERRORS = (3024, 1969)
+
+_SELECT_PATTERN = re.compile(r"^(\s*SELECT\b)", re.IGNORECASE)
+
+
+def _open_cursor(driver: t.Any, connection: t.Any) -> t.Any:
+    """open a cursor which does not buffer the whole result if the driver supports it"""
+    driver_name = driver.__name__
+    if driver_name in _MYSQL_DRIVERS:
+        cursors = importlib.import_module(f"{driver_name}.cursors")
+        return connection.cursor(cursors.SSCursor)
+    if driver_name == "psycopg2":
+        return connection.cursor(name=f"validb_{id(connection):x}")
+    return connection.cursor()
+
+
+def _fetch(
+    cursor: t.Any,
+    arraysize: int,
+    rows: t.Optional[t.Sequence[t.Sequence[t.Any]]] = None,
+) -> t.Iterator[t.Sequence[t.Any]]:
+    """rows of the cursor, following `rows` if they have been fetched already"""
+    if rows is None:
+        rows = cursor.fetchmany(arraysize)
+    while rows:
+        yield from rows
+        rows = cursor.fetchmany(arraysize)
+
+
+def _is_mysql_timeout(e: Exception) -> bool:
+    args = getattr(e, "args", ())
+    return len(args) > 0 and args[0] in _MYSQL_TIMEOUT_ERRORS
+
+
+def _precheck_passed(value: t.Any) -> bool:
+    return value is not None and value != 0
@@ -1,5 +1,7 @@
 from ._datasource import SQLAlchemyDataSource
+from ._routing import ReplicaRouting
 
 __all__ = [
+    "ReplicaRouting",
     "SQLAlchemyDataSource",
 ]
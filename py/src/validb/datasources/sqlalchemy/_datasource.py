@@ -1,25 +1,397 @@
+import contextlib
+import json
+import logging
+import re
+import threading
+import time
 import typing as t
 
-from sqlalchemy import create_engine, Engine
-from sqlalchemy.orm import Session, scoped_session
+from sqlalchemy import Connection, Engine, Result
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import text
 
-from .._datasource import DataSource
+from .._datasource import DataSource, QueryEstimate
+from .._plans import parse_mysql_plan, parse_postgresql_plan
+from ..._execution import Phase, RuleTimeoutError, current_execution
+from ._routing import Replica, ReplicaRouter, ReplicaRouting
+
+logger = logging.getLogger(__name__)
 
 
 class SQLAlchemyDataSource(DataSource):
-    _engine: Engine
-    _session: t.Union[Session, scoped_session[Session]]
+    _router: ReplicaRouter
+    _warm_up: bool
+    _local: threading.local
+    _sessions: t.List[Session]
+    _sessions_lock: threading.Lock
+
+    def __init__(
+        self,
+        *,
+        pool_size: t.Optional[int] = None,
+        max_overflow: t.Optional[int] = None,
+        pool_pre_ping: bool = False,
+        warm_up: bool = False,
+        replicas: t.Optional[t.Sequence[str]] = None,
+        routing: t.Union[ReplicaRouting, str] = ReplicaRouting.ROUND_ROBIN,
+        lag_query: t.Optional[str] = None,
+        max_lag: t.Optional[float] = None,
+        lag_probe_interval: float = 10.0,
+        **kwargs: t.Any,
+    ) -> None:
+        """create a datasource
+
+        The engines are not created until they are used.
+
+        Parameters
+        ----------
+        pool_size : int, optional
+            the number of connections kept in the pool;
+            It is passed to `sqlalchemy.create_engine()`.
+        max_overflow : int, optional
+            the number of connections allowed beyond `pool_size`;
+            It is passed to `sqlalchemy.create_engine()`.
+        pool_pre_ping : bool
+            whether to test connections when they are checked out of the pool;
+            It is passed to `sqlalchemy.create_engine()`.
+        warm_up : bool
+            whether to connect to the database when the datasource is opened,
+            so that the cost of connection is paid while datasources are opened in parallel.
+        replicas : Sequence[str], optional
+            URLs of read replicas;
+            If specified, queries are dispatched to them according to `routing` and `url` is never used.
+        routing : ReplicaRouting | str
+            policy to choose a replica for each query; "round_robin", "least_busy" or "lag_aware"
+        lag_query : str, optional
+            query returning the replication lag in seconds, used by "lag_aware" routing;
+            If not specified, the lag is obtained by `SHOW REPLICA STATUS` on MySQL
+            and `pg_last_xact_replay_timestamp()` on PostgreSQL.
+        max_lag : float, optional
+            replicas lagging more than this number of seconds are avoided by "lag_aware" routing
+        lag_probe_interval : float
+            the replication lag of each replica is probed at most once per this number of seconds
+        **kwargs
+            other arguments passed to `sqlalchemy.create_engine()`, such as `url`.
+        """
+        engine_kwargs = dict(kwargs)
+        if pool_size is not None:
+            engine_kwargs["pool_size"] = pool_size
+        if max_overflow is not None:
+            engine_kwargs["max_overflow"] = max_overflow
+        if pool_pre_ping:
+            engine_kwargs["pool_pre_ping"] = pool_pre_ping
 
-    def __init__(self, **kwargs: t.Any) -> None:
-        self._engine = create_engine(**kwargs)
+        try:
+            routing = ReplicaRouting(routing)
+        except ValueError:
+            raise ValueError(
+                f"routing must be one of {[r.value for r in ReplicaRouting]}; actually specified: {routing}"
+            )
+
+        if replicas is not None and len(replicas) > 0:
+            replica_list = [
+                Replica({**engine_kwargs, "url": url}) for url in replicas
+            ]
+        else:
+            replica_list = [Replica(engine_kwargs)]
+
+        self._router = ReplicaRouter(
+            replica_list,
+            routing=routing,
+            lag_query=lag_query,
+            max_lag=max_lag,
+            lag_probe_interval=lag_probe_interval,
+        )
+        self._warm_up = warm_up
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
 
     def __enter__(self) -> DataSource:
-        self._session = Session(self._engine)
+        if self._warm_up:
+            for replica in self._router.replicas:
+                # the connection is returned to the pool and reused by sessions
+                with replica.engine.connect():
+                    pass
         return super().__enter__()
 
+    @property
+    def connect_seconds(self) -> t.Optional[float]:
+        # the slowest of the replicas which have connected
+        seconds = [
+            replica.connect_seconds
+            for replica in self._router.replicas
+            if replica.connect_seconds is not None
+        ]
+        return max(seconds) if len(seconds) > 0 else None
+
+    def reset(self) -> None:
+        # close the sessions of all threads; their connections return to the pools
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+            self._local = threading.local()
+        for session in sessions:
+            session.close()
+
     def close(self):
-        self._session.close()
+        self.reset()
+
+        for replica in self._router.replicas:
+            replica.dispose()
 
     @property
-    def session(self) -> t.Union[Session, scoped_session[Session]]:
-        return self._session
+    def engine(self) -> Engine:
+        """the engine of the replica used by the current thread"""
+        return self._current_replica().engine
+
+    @property
+    def session(self) -> Session:
+        """the session for the current thread
+
+        Since a session cannot be shared between threads,
+        each thread which uses this datasource gets its own session for each replica.
+        Inside `query()`, it is the session for the replica chosen for the query;
+        otherwise it is the session for a replica chosen once per thread.
+        """
+        replica = self._current_replica()
+
+        sessions: t.Optional[t.MutableMapping[Replica, Session]]
+        sessions = getattr(self._local, "sessions", None)
+        if sessions is None:
+            sessions = self._local.sessions = {}
+
+        session = sessions.get(replica)
+        if session is None:
+            session = Session(replica.engine)
+            with self._sessions_lock:
+                self._sessions.append(session)
+            sessions[replica] = session
+        return session
+
+    def _current_replica(self) -> Replica:
+        replica: t.Optional[Replica] = getattr(self._local, "replica", None)
+        if replica is None:
+            replica = getattr(self._local, "default_replica", None)
+        if replica is None:
+            replica = self._local.default_replica = self._router.choose()
+        return replica
+
+    @contextlib.contextmanager
+    def query(
+        self,
+        sql: str,
+        *,
+        params: t.Optional[t.Mapping[str, t.Any]] = None,
+        timeout: t.Optional[float] = None,
+        dedicated: bool = False,
+    ) -> t.Iterator[Result[t.Any]]:
+        """execute a read-only query on the session of the current thread
+
+        The result is streamed so that rows need not be buffered all at once,
+        and it is closed at the end of the block.
+
+        Parameters
+        ----------
+        sql : str
+            the query
+        params : Mapping[str, Any], optional
+            values of bind parameters such as `:name` in `sql`
+        timeout : float, optional
+            time limit in seconds enforced by the server if the dialect supports it;
+            `MAX_EXECUTION_TIME` hint for MySQL, `max_statement_time` for MariaDB
+            and `statement_timeout` for PostgreSQL.
+        dedicated : bool
+            whether to execute the query on a connection of its own instead of the session;
+            It allows the result to be streamed while another result of the thread is being streamed.
+
+        If the datasource has replicas, the query is dispatched to one of them according to the routing policy.
+        If a rule is being executed by `validate_db()`, the query is interrupted when the rule is cancelled.
+
+        Raises
+        ------
+        RuleTimeoutError
+            If the server stops the query because of the timeout.
+        """
+        replica = self._router.choose()
+        previous_replica = getattr(self._local, "replica", None)
+        self._local.replica = replica
+        replica.acquire()
+        try:
+            with self._query_on_current_replica(
+                sql, params=params, timeout=timeout, dedicated=dedicated
+            ) as result:
+                yield result
+        finally:
+            replica.release()
+            self._local.replica = previous_replica
+
+    @contextlib.contextmanager
+    def _query_on_current_replica(
+        self,
+        sql: str,
+        *,
+        params: t.Optional[t.Mapping[str, t.Any]],
+        timeout: t.Optional[float],
+        dedicated: bool,
+    ) -> t.Iterator[Result[t.Any]]:
+        engine = self.engine
+        dialect = engine.dialect
+        execution = current_execution()
+        timings = execution.timings if execution is not None else None
+        query_started = time.perf_counter()
+
+        with contextlib.ExitStack() as stack:
+            executor: t.Union[Session, Connection]
+            if dedicated:
+                executor = stack.enter_context(engine.connect())
+                dbapi_connection: t.Any = executor.connection.dbapi_connection
+            else:
+                executor = self.session
+                dbapi_connection = executor.connection().connection.dbapi_connection
+
+            if execution is not None:
+                # removed before the connection is returned to the pool, where other rules can check it out
+                stack.callback(
+                    execution.on_cancel(_query_canceller(engine, dbapi_connection))
+                )
+            sets_local_timeout = timeout is not None and dialect.name == "postgresql"
+            if timeout is not None:
+                sql = _with_statement_timeout(sql, timeout, dialect)
+
+            failed = False
+            try:
+                if sets_local_timeout:
+                    executor.execute(
+                        text(f"SET LOCAL statement_timeout = {_milliseconds(timeout)}")
+                    )
+                result = executor.execute(
+                    text(sql), params, execution_options={"stream_results": True}
+                )
+                if timings is not None:
+                    timings.add(Phase.QUERY, time.perf_counter() - query_started)
+                try:
+                    yield result
+                finally:
+                    result.close()
+            except DBAPIError as e:
+                failed = True
+                executor.rollback()
+                if timeout is not None and _is_statement_timeout(e):
+                    raise RuleTimeoutError(f"exceeded {timeout}s") from e
+                raise
+            finally:
+                if sets_local_timeout and not failed:
+                    executor.execute(text("SET LOCAL statement_timeout TO DEFAULT"))
+
+    def query_canceller(self) -> t.Callable[[], None]:
+        """create a function which interrupts the query running on the session of the current thread
+
+        The returned function can be called from another thread.
+        It does nothing if the database driver does not support interruption.
+        """
+        return _query_canceller(
+            self.engine, self.session.connection().connection.dbapi_connection
+        )
+
+    def explain(self, sql: str) -> t.Optional[QueryEstimate]:
+        dialect_name = self.engine.dialect.name
+        sql = sql.strip().rstrip(";")
+
+        if dialect_name in ("mysql", "mariadb"):
+            plan = self.session.execute(text(f"EXPLAIN FORMAT=JSON {sql}")).scalar()
+            return parse_mysql_plan(json.loads(plan)) if plan is not None else None
+        elif dialect_name == "postgresql":
+            plan = self.session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return parse_postgresql_plan(plan) if plan else None
+        else:
+            return None
+
+    def evaluate_prechecks(self, sqls: t.Sequence[str]) -> t.Sequence[bool]:
+        if len(sqls) <= 0:
+            return []
+
+        # evaluate all prechecks as scalar subqueries in a single round trip
+        columns = ", ".join(
+            f"({sql.strip().rstrip(';')}) AS p{i}" for i, sql in enumerate(sqls)
+        )
+        from_clause = " FROM DUAL" if self.engine.dialect.name == "oracle" else ""
+        try:
+            row = self.session.execute(text(f"SELECT {columns}{from_clause}")).one()
+            return [_precheck_passed(value) for value in row]
+        except DBAPIError as e:
+            # e.g. a precheck returns more than one row; evaluate them one by one
+            logger.debug("batched prechecks failed; evaluate one by one: %s", e)
+            self.session.rollback()
+
+        results: t.List[bool] = []
+        for sql in sqls:
+            first_row = self.session.execute(text(sql)).first()
+            results.append(first_row is not None and _precheck_passed(first_row[0]))
+        return results
+
+
+def _query_canceller(engine: Engine, dbapi_connection: t.Any) -> t.Callable[[], None]:
+    # sqlite3
+    interrupt = getattr(dbapi_connection, "interrupt", None)
+    if callable(interrupt):
+        return interrupt
+
+    # psycopg2, psycopg
+    cancel = getattr(dbapi_connection, "cancel", None)
+    if callable(cancel):
+        return cancel
+
+    # pymysql, mysqlclient
+    thread_id = getattr(dbapi_connection, "thread_id", None)
+    if callable(thread_id):
+        connection_id = int(thread_id())
+
+        def kill_query():
+            with engine.connect() as connection:
+                connection.execute(text(f"KILL QUERY {connection_id}"))
+
+        return kill_query
+
+    return lambda: None
+
+
+def _milliseconds(seconds: t.Optional[float]) -> int:
+    return max(int((seconds or 0.0) * 1000), 1)
+
+
+_SELECT_PATTERN = re.compile(r"^(\s*SELECT\b)", re.IGNORECASE)
+
+
+def _with_statement_timeout(sql: str, timeout: float, dialect: t.Any) -> str:
+    if dialect.name != "mysql":
+        return sql
+    if getattr(dialect, "is_mariadb", False):
+        return f"SET STATEMENT max_statement_time={timeout:g} FOR {sql}"
+
+    # the optimizer hint must follow the first SELECT keyword
+    return _SELECT_PATTERN.sub(
+        rf"\1 /*+ MAX_EXECUTION_TIME({_milliseconds(timeout)}) */", sql, count=1
+    )
+
+
+# error codes of MySQL (ER_QUERY_TIMEOUT) and MariaDB (ER_STATEMENT_TIMEOUT)
+_MYSQL_TIMEOUT_ERRORS = (3024, 1969)
+# SQLSTATE of PostgreSQL (query_canceled)
+_POSTGRESQL_TIMEOUT_SQLSTATE = "57014"
+
+
+def _is_statement_timeout(e: DBAPIError) -> bool:
+    orig: t.Any = e.orig
+    sqlstate = getattr(orig, "pgcode", None) or getattr(orig, "sqlstate", None)
+    if sqlstate == _POSTGRESQL_TIMEOUT_SQLSTATE:
+        return True
+
+    args = getattr(orig, "args", ())
+    return len(args) > 0 and args[0] in _MYSQL_TIMEOUT_ERRORS
+
+
+def _precheck_passed(value: t.Any) -> bool:
+    return value is not None and value != 0
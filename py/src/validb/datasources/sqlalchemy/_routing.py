@@ -0,0 +1,219 @@
+import enum
+import itertools
+import logging
+import math
+import threading
+import time
+import typing as t
+
+from sqlalchemy import create_engine, event, Engine
+from sqlalchemy.sql import text
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouting(enum.Enum):
+    """Policy to choose a replica for each query"""
+
+    ROUND_ROBIN = "round_robin"
+    """replicas are used in turn"""
+
+    LEAST_BUSY = "least_busy"
+    """the replica running the fewest queries of this process is used"""
+
+    LAG_AWARE = "lag_aware"
+    """the least busy replica among those whose replication lag is within the limit is used"""
+
+
+class Replica:
+    """A database which queries can be dispatched to"""
+
+    _engine_kwargs: t.Mapping[str, t.Any]
+    _engine: t.Optional[Engine]
+    _lock: threading.Lock
+    _busy: int
+    _lag: t.Optional[float]
+    _lag_probed_at: t.Optional[float]
+    _connect_seconds: t.Optional[float]
+
+    def __init__(self, engine_kwargs: t.Mapping[str, t.Any]) -> None:
+        self._engine_kwargs = engine_kwargs
+        self._engine = None
+        self._connect_seconds = None
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._lag = None
+        self._lag_probed_at = None
+
+    @property
+    def engine(self) -> Engine:
+        """the engine, which is created on first access"""
+        engine = self._engine
+        if engine is None:
+            with self._lock:
+                engine = self._engine
+                if engine is None:
+                    engine = create_engine(**self._engine_kwargs)
+                    self._time_first_connection(engine)
+                    self._engine = engine
+        return engine
+
+    @property
+    def connect_seconds(self) -> t.Optional[float]:
+        """wall time of the first connection to the database; None if not connected yet"""
+        return self._connect_seconds
+
+    def _time_first_connection(self, engine: Engine) -> None:
+        started = threading.local()
+
+        def connecting(*args: t.Any) -> None:
+            started.at = time.perf_counter()
+
+        def connected(*args: t.Any) -> None:
+            # only the first connection is timed; the others return at once
+            at = getattr(started, "at", None)
+            if at is None or self._connect_seconds is not None:
+                return
+            with self._lock:
+                if self._connect_seconds is None:
+                    self._connect_seconds = time.perf_counter() - at
+
+        event.listen(engine, "do_connect", connecting)
+        event.listen(engine, "connect", connected)
+
+    def dispose(self) -> None:
+        with self._lock:
+            engine, self._engine = self._engine, None
+        if engine is not None:
+            engine.dispose()
+
+    @property
+    def busy(self) -> int:
+        """number of queries running on this replica"""
+        return self._busy
+
+    def acquire(self) -> None:
+        with self._lock:
+            self._busy += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self._busy -= 1
+
+    def lag(self, lag_query: t.Optional[str], probe_interval: float) -> float:
+        """replication lag in seconds, probed at most once per the interval
+
+        It is infinite if the lag is unknown, e.g. the probe fails.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self._lag_probed_at is not None
+                and now - self._lag_probed_at < probe_interval
+            ):
+                return self._lag if self._lag is not None else math.inf
+            # other threads use the previous value while probing
+            self._lag_probed_at = now
+
+        try:
+            lag = _probe_lag(self.engine, lag_query)
+        except Exception:
+            logger.warning("failed to probe replication lag", exc_info=True)
+            lag = None
+
+        with self._lock:
+            self._lag = lag
+        return lag if lag is not None else math.inf
+
+
+class ReplicaRouter:
+    """chooses a replica for each query according to a policy"""
+
+    _replicas: t.Sequence[Replica]
+    _routing: ReplicaRouting
+    _lag_query: t.Optional[str]
+    _max_lag: t.Optional[float]
+    _lag_probe_interval: float
+    _counter: "itertools.count[int]"
+
+    def __init__(
+        self,
+        replicas: t.Sequence[Replica],
+        *,
+        routing: ReplicaRouting,
+        lag_query: t.Optional[str],
+        max_lag: t.Optional[float],
+        lag_probe_interval: float,
+    ) -> None:
+        self._replicas = replicas
+        self._routing = routing
+        self._lag_query = lag_query
+        self._max_lag = max_lag
+        self._lag_probe_interval = lag_probe_interval
+        self._counter = itertools.count()
+
+    @property
+    def replicas(self) -> t.Sequence[Replica]:
+        return self._replicas
+
+    def choose(self) -> Replica:
+        replicas = self._replicas
+        if len(replicas) == 1:
+            return replicas[0]
+
+        # rotate the candidates so that ties are broken in turn
+        offset = next(self._counter) % len(replicas)
+        rotated = [*replicas[offset:], *replicas[:offset]]
+
+        if self._routing == ReplicaRouting.ROUND_ROBIN:
+            return rotated[0]
+
+        if self._routing == ReplicaRouting.LAG_AWARE:
+            lags = [
+                replica.lag(self._lag_query, self._lag_probe_interval)
+                for replica in rotated
+            ]
+            max_lag = self._max_lag if self._max_lag is not None else math.inf
+            fresh = [
+                replica
+                for replica, lag in zip(rotated, lags)
+                if lag <= max_lag and not math.isinf(lag)
+            ]
+            if len(fresh) > 0:
+                rotated = fresh
+            else:
+                logger.warning(
+                    "no replica is within the replication lag limit; the least lagging one is used"
+                )
+                return min(zip(rotated, lags), key=lambda pair: pair[1])[0]
+
+        return min(rotated, key=lambda replica: replica.busy)
+
+
+def _probe_lag(engine: Engine, lag_query: t.Optional[str]) -> t.Optional[float]:
+    with engine.connect() as connection:
+        if lag_query is not None:
+            value = connection.execute(text(lag_query)).scalar()
+            return float(value) if value is not None else None
+
+        dialect_name = engine.dialect.name
+        if dialect_name == "mysql":
+            status = (
+                connection.execute(text("SHOW REPLICA STATUS")).mappings().first()
+            )
+            if status is None:
+                # not a replica
+                return None
+            value = status.get("Seconds_Behind_Source")
+            return float(value) if value is not None else None
+        elif dialect_name == "postgresql":
+            value = connection.execute(
+                text(
+                    "SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                )
+            ).scalar()
+            return float(value) if value is not None else None
+        else:
+            raise ValueError(
+                f"lag_query is required for lag-aware routing on {dialect_name}"
+            )
@@ -1,5 +1,6 @@
-from ._formatter import MessageFormatter
+from ._formatter import MessageFormatter, MessageTemplate
 
 __all__ = [
     "MessageFormatter",
+    "MessageTemplate",
 ]
@@ -15,3 +15,113 @@ class MessageFormatter(string.Formatter):
             return super().get_value(key, args, kwargs)
         except (KeyError, IndexError):
             return ""
+
+
+class MessageTemplate:
+    """Template parsed once and rendered like `MessageFormatter`
+
+    Rendering it many times is faster than `MessageFormatter.vformat()`,
+    which parses the template every time.
+    """
+
+    _formatter = MessageFormatter()
+
+    _template: str
+    _parts: t.Optional[t.Sequence["_Part"]]
+
+    def __init__(self, template: str) -> None:
+        """Initialize object
+
+        Parameters
+        ----------
+        template : str
+            the template, such as `too small!; SurfaceArea={1}, Population={Population}`
+        """
+        self._template = template
+        parts = list(self._formatter.parse(template))
+        if any(field_name == "" for _, field_name, _, _ in parts):
+            # automatic field numbering is left to `MessageFormatter`
+            self._parts = None
+        else:
+            self._parts = [
+                (
+                    literal_text,
+                    field_name,
+                    format_spec,
+                    conversion,
+                    _plain_key(field_name, format_spec, conversion),
+                )
+                for literal_text, field_name, format_spec, conversion in parts
+            ]
+
+    @property
+    def template(self) -> str:
+        return self._template
+
+    def render(self, args: t.Sequence[t.Any], kwargs: t.Mapping[str, t.Any]) -> str:
+        """render the template
+
+        Parameters
+        ----------
+        args : Sequence[Any]
+            positional variables
+        kwargs : Mapping[str, Any]
+            keyword variables
+
+        Returns
+        -------
+        str
+            the rendered string
+        """
+        parts = self._parts
+        formatter = self._formatter
+        if parts is None:
+            return formatter.vformat(self._template, args, kwargs)
+
+        pieces: t.List[str] = []
+        for literal_text, field_name, format_spec, conversion, key in parts:
+            if literal_text:
+                pieces.append(literal_text)
+            if field_name is None:
+                continue
+            if key is not None:
+                # fast path of `{0}` and `{name}`
+                try:
+                    value = (
+                        args[key] if isinstance(key, int) else kwargs[key]  # type: ignore
+                    )
+                except (KeyError, IndexError):
+                    continue
+                pieces.append(value if type(value) is str else format(value))
+                continue
+
+            obj, _ = formatter.get_field(field_name, args, kwargs)
+            obj = formatter.convert_field(obj, conversion)
+            if format_spec and "{" in format_spec:
+                format_spec = formatter.vformat(format_spec, args, kwargs)
+            pieces.append(formatter.format_field(obj, format_spec or ""))
+        return "".join(pieces)
+
+
+_Part = t.Tuple[
+    str,
+    t.Optional[str],
+    t.Optional[str],
+    t.Optional[str],
+    t.Optional[t.Union[int, str]],
+]
+
+
+def _plain_key(
+    field_name: t.Optional[str],
+    format_spec: t.Optional[str],
+    conversion: t.Optional[str],
+) -> t.Optional[t.Union[int, str]]:
+    """the key of a field without conversion, format spec, attribute nor index; otherwise None"""
+    if field_name is None or format_spec or conversion is not None:
+        return None
+    if field_name.isdigit():
+        return int(field_name)
+    if field_name.isidentifier():
+        return field_name
+    return None
@@ -0,0 +1,6 @@
+from ._openmetrics import DEFAULT_BUCKETS, OpenMetricsExporter
+
+__all__ = [
+    "DEFAULT_BUCKETS",
+    "OpenMetricsExporter",
+]
@@ -0,0 +1,290 @@
+import logging
+import math
+import os
+import threading
+import time
+import typing as t
+
+from .._detectiondata import DetectionData
+from .._execution import RuleExecution
+from .._hooks import ValidationHook
+from .._ruleresult import RuleResult
+from ..datasources import DataSources
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of the buckets of rule durations in seconds
+DEFAULT_BUCKETS: t.Sequence[float] = (
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    300.0,
+    1800.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+_Labels = t.Tuple[t.Tuple[str, str], ...]
+
+
+class _Histogram:
+    _buckets: t.Sequence[float]
+    counts: t.List[int]
+    count: int
+    sum: float
+
+    def __init__(self, buckets: t.Sequence[float]) -> None:
+        self._buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, upper_bound in enumerate(self._buckets):
+            if value <= upper_bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class _State:
+    """metrics shared by an exporter and its views for targets"""
+
+    lock: threading.Lock
+    gauges: t.Dict[str, t.Dict[_Labels, float]]
+    histograms: t.Dict[_Labels, _Histogram]
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.gauges = {}
+        self.histograms = {}
+
+
+# name and description of the gauges, in the order of output
+_GAUGES: t.Sequence[t.Tuple[str, str]] = (
+    ("validb_run_duration_seconds", "wall time of the validation"),
+    ("validb_run_timestamp_seconds", "time when the validation finished, in Unix time"),
+    ("validb_too_many_detection", "1 if the detections exceeded max_detection"),
+    ("validb_failed_fast", "1 if the validation was stopped by fail_fast_level"),
+    (
+        "validb_datasource_connect_seconds",
+        "wall time of the first connection to the datasource",
+    ),
+    ("validb_rules", "number of rules by outcome"),
+    ("validb_rule_last_duration_seconds", "wall time of the rule in the last validation"),
+    ("validb_rule_rows", "number of rows read by the rule in the last validation"),
+    ("validb_rule_detections", "number of anomalies detected by the rule in the last validation"),
+    ("validb_detections", "number of anomalies detected by detection type"),
+)
+_HISTOGRAM = ("validb_rule_duration_seconds", "wall time of the rule")
+
+
+class OpenMetricsExporter(ValidationHook):
+    """hook exporting metrics of validations in the OpenMetrics text format
+
+    The metrics are written to a file for the textfile collector of the node exporter with `write()`,
+    or pushed to a Pushgateway with `push()`, typically at the end of a scheduled run.
+    Only gauges and histograms are exported so that the output is also valid in the Prometheus text format.
+
+    Exported metrics:
+
+    - `validb_run_duration_seconds`, `validb_run_timestamp_seconds`
+    - `validb_too_many_detection`, `validb_failed_fast`
+    - `validb_datasource_connect_seconds{datasource}`, only for the datasources which connected
+    - `validb_rules{outcome}`
+    - `validb_rule_duration_seconds{rule,fingerprint}` (histogram),
+      `validb_rule_last_duration_seconds{rule,fingerprint}`
+    - `validb_rule_rows{rule,fingerprint}`, `validb_rule_detections{rule,fingerprint}`
+    - `validb_detections{detection_type}`
+
+    The label `rule` is the detection type of the rule and `fingerprint` is `Rule.fingerprint()`,
+    which distinguishes rules of the same detection type and is stable across runs.
+    `validb_detections` has no label of the level, since anomalies not kept because of `max_detection_per_type`
+    are counted only by detection type.
+    The metrics of `validate_targets()` have the label `target` as well.
+    """
+
+    _state: _State
+    _buckets: t.Sequence[float]
+    _labels: _Labels
+    _datasources: t.Optional[DataSources]
+
+    def __init__(self, *, buckets: t.Sequence[float] = DEFAULT_BUCKETS) -> None:
+        """create an exporter
+
+        Parameters
+        ----------
+        buckets : Sequence[float]
+            upper bounds of the buckets of `validb_rule_duration_seconds` in seconds
+        """
+        if list(buckets) != sorted(buckets) or len(set(buckets)) < len(buckets):
+            raise ValueError(
+                f"buckets must be strictly ascending; actually specified: {buckets}"
+            )
+        self._state = _State()
+        self._buckets = [bucket for bucket in buckets if not math.isinf(bucket)]
+        self._labels = ()
+        self._datasources = None
+
+    def for_target(self, target: str) -> "OpenMetricsExporter":
+        exporter = OpenMetricsExporter.__new__(OpenMetricsExporter)
+        exporter._state = self._state
+        exporter._buckets = self._buckets
+        exporter._labels = (*self._labels, ("target", target))
+        exporter._datasources = None
+        return exporter
+
+    def run_started(self, *, datasources: DataSources) -> None:
+        self._datasources = datasources
+
+    def rule_finished(self, execution: RuleExecution, result: RuleResult) -> None:
+        rule_labels = {
+            "rule": str(result.rule.detection_type()),
+            "fingerprint": result.rule.fingerprint(),
+        }
+        labels = self._with_labels(**rule_labels)
+        with self._state.lock:
+            histogram = self._state.histograms.get(labels)
+            if histogram is None:
+                histogram = self._state.histograms[labels] = _Histogram(self._buckets)
+            histogram.observe(result.elapsed)
+        self._set("validb_rule_last_duration_seconds", result.elapsed, **rule_labels)
+        self._set("validb_rule_rows", result.rows, **rule_labels)
+        self._set("validb_rule_detections", result.detections, **rule_labels)
+
+    def run_finished(
+        self, detection_data: DetectionData[t.Any, t.Any, t.Any]
+    ) -> None:
+        # read before the datasources are closed at the end of the validation
+        if self._datasources is not None:
+            for name, elapsed in self._datasources.connect_seconds().items():
+                self._set("validb_datasource_connect_seconds", elapsed, datasource=name)
+            self._datasources = None
+
+        self._set("validb_run_duration_seconds", detection_data.elapsed or 0.0)
+        self._set("validb_run_timestamp_seconds", time.time())
+        self._set("validb_too_many_detection", int(detection_data.too_many_detection))
+        self._set("validb_failed_fast", int(detection_data.failed_fast))
+
+        outcomes: t.Dict[str, int] = {}
+        for rule_result in detection_data.rule_results:
+            outcome = rule_result.outcome.value
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        for outcome, count in outcomes.items():
+            self._set("validb_rules", count, outcome=outcome)
+
+        for detection_type in detection_data.detection_types():
+            self._set(
+                "validb_detections",
+                detection_data.count_of(detection_type),
+                detection_type=str(detection_type),
+            )
+
+    def _with_labels(self, **labels: str) -> _Labels:
+        return (*self._labels, *labels.items())
+
+    def _set(self, name: str, value: float, **labels: str) -> None:
+        with self._state.lock:
+            self._state.gauges.setdefault(name, {})[self._with_labels(**labels)] = value
+
+    def render(self) -> str:
+        """the metrics in the OpenMetrics text format"""
+        lines: t.List[str] = []
+        with self._state.lock:
+            for name, description in _GAUGES:
+                samples = self._state.gauges.get(name)
+                if not samples:
+                    continue
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples.items():
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+            name, description = _HISTOGRAM
+            if len(self._state.histograms) > 0:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in self._state.histograms.items():
+                for upper_bound, count in zip(self._buckets, histogram.counts):
+                    bucket_labels = (*labels, ("le", _format_value(upper_bound)))
+                    lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {count}")
+                inf_labels = (*labels, ("le", "+Inf"))
+                lines.append(f"{name}_bucket{_format_labels(inf_labels)} {histogram.count}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+                lines.append(
+                    f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}"
+                )
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """write the metrics to a file atomically
+
+        The file is replaced at once so that the textfile collector never reads it half-written.
+
+        Parameters
+        ----------
+        path : str
+            the file, typically `*.prom` in the directory of the textfile collector
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, mode="w", encoding="utf_8") as fp:
+            fp.write(self.render())
+        os.replace(tmp_path, path)
+
+    def push(self, url: str, *, timeout: float = 10.0) -> None:
+        """push the metrics to an HTTP endpoint such as a Pushgateway
+
+        The metrics replace those previously pushed to the same URL (`PUT`).
+
+        Parameters
+        ----------
+        url : str
+            the URL, such as `http://localhost:9091/metrics/job/validb`
+        timeout : float
+            time limit of the request in seconds
+
+        Raises
+        ------
+        urllib.error.URLError
+            If the request fails.
+        """
+        # imported here since it takes long and is unnecessary unless pushing
+        import urllib.request
+
+        request = urllib.request.Request(
+            url,
+            data=self.render().encode("utf_8"),
+            method="PUT",
+            headers={"Content-Type": CONTENT_TYPE},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            logger.debug("pushed metrics to %s: %s", url, response.status)
+
+
+def _format_labels(labels: _Labels) -> str:
+    if len(labels) <= 0:
+        return ""
+    return (
+        "{"
+        + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels)
+        + "}"
+    )
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
@@ -1,10 +1,22 @@
 import abc
+import hashlib
+import time
+import types
 import typing as t
 
-from ..datasources import DataSources
+from ..datasources import DataSources, QueryEstimate
+from .._costguard import CostBudget
 from .._embedder import Embedder
 from .._embedded_vars import EmbeddedVariables
-from .._detected import ID, MSG, DETECTION_TYPE, Detected, DetectedType
+from .._execution import Phase, PhaseTimings, current_execution
+from .._detected import (
+    ID,
+    MSG,
+    DETECTION_TYPE,
+    DeferredMessage,
+    Detected,
+    DetectedType,
+)
 
 
 DEFAULT_LEVEL = 0
@@ -38,6 +50,20 @@ class Rule(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
         """
         pass
 
+    @property
+    def precheck(self) -> t.Optional[str]:
+        """cheap query which gates the rule
+
+        If it returns no rows, NULL or zero, the rule is skipped without executing `self.sql`.
+        The prechecks of rules on the same datasource are evaluated together.
+        None means that the rule is always executed.
+        """
+        return None
+
+    def datasource_names(self) -> t.Iterator[str]:
+        """an iterator of names of the datasources used by the rule"""
+        return iter(())
+
     def level(self) -> int:
         """Level of detection.
 
@@ -54,6 +80,15 @@ class Rule(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
         """
         pass
 
+    def detection_types(self) -> t.Iterator[DETECTION_TYPE]:
+        """an iterator of the detection types of the anomalies which the rule can detect
+
+        By default, it is only `detection_type()`.
+        Rules detecting anomalies of other detection types must override it,
+        so that their detection types are known when the rule is not completed.
+        """
+        return iter((self.detection_type(),))
+
     @abc.abstractmethod
     def message(self, embedded_vars: EmbeddedVariables) -> MSG:
         """Message to be used when an abnormality is detected.
@@ -80,6 +115,21 @@ class Rule(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
         """
         pass
 
+    def deferred_message(
+        self, embedded_vars: EmbeddedVariables
+    ) -> t.Optional[DeferredMessage]:
+        """Message to be rendered on demand instead of `self.message()`
+
+        If it returns a DeferredMessage, `self.detect()` uses it and `self.message()` is not called.
+        By default, it returns None, so that messages are rendered eagerly.
+
+        Parameters
+        ----------
+        embedded_vars : EmbeddedVariables
+            variables according to a result of SQL execution
+        """
+        return None
+
     @abc.abstractmethod
     def embedders(self) -> t.Iterator[str]:
         """an iterator of names of the embedders registered in self
@@ -88,6 +138,59 @@ class Rule(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
         """
         pass
 
+    def fingerprint(self) -> str:
+        """a string which identifies the rule across runs
+
+        It is used to record statistics of the rule and to restore its detections from a `Checkpoint`,
+        so it must change whenever the detections may change.
+        By default, it is a hash of the class, the query, the level, the detection type,
+        the datasources and the embedders.
+        Subclasses extend it with their other parameters affecting the detections,
+        such as the record ID and the message, with `extend_fingerprint()`.
+        """
+        source = "\0".join(
+            (
+                f"{type(self).__module__}.{type(self).__qualname__}",
+                self.sql,
+                str(self.level()),
+                str(self.detection_type()),
+                repr(list(self.datasource_names())),
+                repr(list(self.embedders())),
+            )
+        )
+        return hashlib.sha1(source.encode("utf_8")).hexdigest()
+
+    def estimate(self, *, datasources: DataSources) -> t.Optional[QueryEstimate]:
+        """estimate the cost of the rule without executing it
+
+        Parameters
+        ----------
+        datasources : DataSources
+            data sources;
+            The data sources required by the rule are used.
+
+        Returns
+        -------
+        QueryEstimate | None
+            the estimation; None if it cannot be estimated
+        """
+        return None
+
+    def cost_budget(self) -> t.Optional[CostBudget]:
+        """Upper limits of the estimated cost of the rule
+
+        It is used by `CostGuard` in preference to its global budget.
+        None means that the global budget is applied.
+        """
+        return None
+
+    def timeout(self) -> t.Optional[float]:
+        """Time limit of the rule in seconds
+
+        None means that the default timeout of `validate_db()` is applied.
+        """
+        return None
+
     @abc.abstractmethod
     def exec(
         self,
@@ -95,9 +198,12 @@ class Rule(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
         datasources: DataSources,
         detected: DetectedType[ID, DETECTION_TYPE, MSG],
         embedders: t.Mapping[str, Embedder],
-    ) -> t.Sequence[Detected[ID, DETECTION_TYPE, MSG]]:
+    ) -> t.Iterable[Detected[ID, DETECTION_TYPE, MSG]]:
         """exec validation according the rule
 
+        The detected anomalies may be returned as an iterator
+        so that they do not have to be held in memory all at once.
+
         Parameters
         ----------
         datasources : DataSources
@@ -114,8 +220,8 @@ class Rule(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
 
         Returns
         -------
-        Sequence[Detected[ID, DETECTION_TYPE, MSG]]
-            List of detected anomalies
+        Iterable[Detected[ID, DETECTION_TYPE, MSG]]
+            detected anomalies
         """
         ...
 
@@ -145,15 +251,94 @@ class Rule(t.Generic[ID, DETECTION_TYPE, MSG], abc.ABC):
         Detected
             an abnormality detection
         """
+        execution = current_execution()
+        if execution is not None and execution.timings is not None:
+            return self._detect_timed(
+                embedded_vars=embedded_vars,
+                constructor=constructor,
+                embedders=embedders,
+                timings=execution.timings,
+            )
+
         # Extend variables using embedder registered in self
-        embedded_vars = embedded_vars.extended(
-            (embedders[name] for name in self.embedders())
-        )
+        extenders = [embedders[name] for name in self.embedders()]
+        if len(extenders) > 0:
+            embedded_vars = embedded_vars.extended(extenders)
 
+        msg = self.deferred_message(embedded_vars)
         return constructor(
             self.id_of_row(embedded_vars),
             self.level(),
             self.detection_type(),
-            self.message(embedded_vars),
+            msg if msg is not None else self.message(embedded_vars),
             embedded_vars,
         )
+
+    def _detect_timed(
+        self,
+        *,
+        embedded_vars: EmbeddedVariables,
+        constructor: DetectedType[ID, DETECTION_TYPE, MSG],
+        embedders: t.Mapping[str, Embedder],
+        timings: PhaseTimings,
+    ) -> Detected[ID, DETECTION_TYPE, MSG]:
+        """`self.detect()` adding the time of each phase to the timings"""
+        started = time.perf_counter()
+        extenders = [embedders[name] for name in self.embedders()]
+        if len(extenders) > 0:
+            embedded_vars = embedded_vars.extended(extenders)
+        embedded = time.perf_counter()
+
+        msg = self.deferred_message(embedded_vars)
+        if msg is None:
+            msg = self.message(embedded_vars)
+        formatted = time.perf_counter()
+
+        detected = constructor(
+            self.id_of_row(embedded_vars),
+            self.level(),
+            self.detection_type(),
+            msg,
+            embedded_vars,
+        )
+        timings.add(Phase.EMBED, embedded - started)
+        timings.add(Phase.FORMAT, formatted - embedded)
+        timings.add(Phase.DETECT, time.perf_counter() - formatted)
+        return detected
+
+
+def extend_fingerprint(fingerprint: str, *parameters: t.Any) -> str:
+    """a fingerprint of a rule extended with its parameters
+
+    Strings are used as they are, callables are identified by `describe_callable()`
+    and the other values by `repr()`, which must not depend on the identity of objects.
+    """
+    source = "\0".join((fingerprint, *map(_describe_parameter, parameters)))
+    return hashlib.sha1(source.encode("utf_8")).hexdigest()
+
+
+def _describe_parameter(parameter: t.Any) -> str:
+    if isinstance(parameter, str):
+        return parameter
+    if callable(parameter):
+        return describe_callable(parameter)
+    return repr(parameter)
+
+
+def describe_callable(function: t.Callable[..., t.Any]) -> str:
+    """a string which identifies a function across runs"""
+    module = getattr(function, "__module__", "")
+    qualname = getattr(function, "__qualname__", type(function).__qualname__)
+    code = getattr(function, "__code__", None)
+    if code is None:
+        return f"{module}.{qualname}"
+    # lambdas share their name, so their code identifies them
+    return f"{module}.{qualname}\0{_describe_code(code)}"
+
+
+def _describe_code(code: types.CodeType) -> str:
+    consts = (
+        _describe_code(const) if isinstance(const, types.CodeType) else repr(const)
+        for const in code.co_consts
+    )
+    return "\0".join((code.co_code.hex(), *consts, *code.co_names))
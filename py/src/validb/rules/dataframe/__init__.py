@@ -0,0 +1,6 @@
+from ._rule import DataFrameRule, SimpleDataFrameRule
+
+__all__ = [
+    "DataFrameRule",
+    "SimpleDataFrameRule",
+]
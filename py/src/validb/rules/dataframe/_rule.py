@@ -0,0 +1,268 @@
+import typing as t
+
+from ...datasources import DataSources
+from ..._costguard import CostBudget
+from ..._embedder import Embedder
+from ..._execution import current_execution
+from ..._embedded_vars import EmbeddedVariables
+from ..._detected import ID, MSG, DETECTION_TYPE, Detected, DetectedType
+from .._rule import DEFAULT_LEVEL, extend_fingerprint
+from ..sqlalchemy import SQLAlchemyRule
+from ...formatter import MessageFormatter
+
+if t.TYPE_CHECKING:
+    import pandas
+
+
+DEFAULT_CHUNKSIZE = 10000
+
+Predicate = t.Union[str, t.Callable[["pandas.DataFrame"], t.Any]]
+
+
+class DataFrameRule(
+    t.Generic[ID, DETECTION_TYPE, MSG], SQLAlchemyRule[ID, DETECTION_TYPE, MSG]
+):
+    """validation rule evaluating a vectorized predicate over chunks of the query result
+
+    The result of `sql` is read in chunks of `chunksize` rows as `pandas.DataFrame`,
+    and the predicate is evaluated over whole columns of each chunk.
+    Detected instances are created only for the rows where the predicate is true,
+    so checks such as numeric ranges, ratios between columns and regular expressions
+    are much faster than predicates evaluated row by row in Python.
+
+    It requires pandas (`pip install validb[dataframe]`).
+    """
+
+    _predicate: Predicate
+    _chunksize: int
+
+    def __init__(
+        self,
+        sql: str,
+        predicate: Predicate,
+        id_of_row: t.Callable[[EmbeddedVariables], ID],
+        level: int,
+        detection_type: DETECTION_TYPE,
+        msg: t.Callable[[EmbeddedVariables], MSG],
+        datasource: str,
+        embedders: t.Optional[t.Sequence[str]] = None,
+        chunksize: int = DEFAULT_CHUNKSIZE,
+        cost_budget: t.Optional[CostBudget] = None,
+        precheck: t.Optional[str] = None,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        """create a validation rule
+
+        The created rules are used as arguments to `validate_db()`.
+
+        Parameters
+        ----------
+        sql : str
+            query whose result is validated
+        predicate : str | Callable[[pandas.DataFrame], Series]
+            the condition of anomalies, evaluated for each chunk;
+            A string is evaluated by `pandas.DataFrame.eval()`, such as `amount < 0 or amount > limit * 2`.
+            A callable must return a boolean Series (or array) aligned with the chunk.
+            Rows where it is true (not NA) are detected.
+            Note that NULL values are not excluded by themselves:
+            for example, `Code.str.match(...)` is false for NULL under pandas 2 or later,
+            so NULL rows are detected by its negation unless `Code.notna()` is also required.
+        id_of_row : Callable[[EmbeddedVariables], ID]
+            the function to calc the record ID from each detected row
+        level : int
+            the level of detection
+        detection_type : DETECTION_TYPE
+            the type of detection
+        msg : Callable[[EmbeddedVariables], MSG]
+            the function to create the message of each detected row
+        datasource : str
+            name of the datasource
+        embedders: Sequence[str], optional
+            names of embedders used when creating messages.
+        chunksize : int
+            number of rows evaluated at once
+        cost_budget : CostBudget, optional
+            upper limits of the estimated cost of `sql`
+        precheck : str, optional
+            cheap query which gates the rule
+        timeout : float, optional
+            time limit of the rule in seconds
+        """
+        if chunksize <= 0:
+            raise ValueError(
+                f"chunksize must be positive; actually specified: {chunksize}"
+            )
+
+        super().__init__(
+            sql=sql,
+            id_of_row=id_of_row,
+            level=level,
+            detection_type=detection_type,
+            msg=msg,
+            datasource=datasource,
+            embedders=embedders,
+            cost_budget=cost_budget,
+            precheck=precheck,
+            timeout=timeout,
+        )
+        self._predicate = predicate
+        self._chunksize = chunksize
+
+    def fingerprint(self) -> str:
+        # rules with the same query and different predicates are different rules
+        return extend_fingerprint(super().fingerprint(), self._predicate)
+
+    def matches(self, frame: "pandas.DataFrame") -> "pandas.DataFrame":
+        """select the rows of a chunk where the predicate is true
+
+        Parameters
+        ----------
+        frame : pandas.DataFrame
+            a chunk of the query result
+
+        Returns
+        -------
+        pandas.DataFrame
+            the rows to be detected
+        """
+        import pandas
+
+        predicate = self._predicate
+        if isinstance(predicate, str):
+            mask = frame.eval(predicate)
+        else:
+            mask = predicate(frame)
+
+        mask = pandas.Series(mask, index=frame.index).fillna(False).astype(bool)
+        return frame[mask]
+
+    def exec(
+        self,
+        *,
+        datasources: DataSources,
+        detected: DetectedType[ID, DETECTION_TYPE, MSG],
+        embedders: t.Mapping[str, Embedder],
+    ) -> t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]:
+        import pandas
+
+        datasource = self._get_datasource(datasources)
+        execution = current_execution()
+
+        with datasource.query(
+            self.sql, timeout=execution.timeout if execution is not None else None
+        ) as sql_result:
+            columns = list(sql_result.keys())
+            for rows in sql_result.partitions(self._chunksize):
+                if execution is not None:
+                    if execution.cancelled:
+                        return
+                    execution.add_rows(len(rows))
+
+                frame = pandas.DataFrame.from_records(rows, columns=columns)
+                matched = self.matches(frame)
+                # the values are taken from the rows instead of the frame,
+                # where NULL becomes NaN and integers with NULL become floats.
+                # The frame has the default index, i.e. the positions in the rows.
+                for position in matched.index:
+                    row = rows[position]
+                    yield self.detect(
+                        embedded_vars=EmbeddedVariables(row, dict(zip(columns, row))),
+                        constructor=detected,
+                        embedders=embedders,
+                    )
+
+
+class SimpleDataFrameRule(DataFrameRule[str, str, str]):
+    _formatter = MessageFormatter()
+    _id_template: str
+    _msg_template: str
+
+    def __init__(
+        self,
+        *,
+        sql: str,
+        predicate: str,
+        id: str,
+        level: int = DEFAULT_LEVEL,
+        detection_type: str,
+        msg: str,
+        datasource: str,
+        embedders: t.Optional[t.Sequence[str]] = None,
+        chunksize: int = DEFAULT_CHUNKSIZE,
+        max_estimated_rows: t.Optional[float] = None,
+        max_estimated_cost: t.Optional[float] = None,
+        precheck: t.Optional[str] = None,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        """create a validation rule
+
+        The created rules are used as arguments to `validate_db()`.
+
+        Parameters
+        ----------
+        sql : str
+            query whose result is validated
+        predicate : str
+            the condition of anomalies evaluated by `pandas.DataFrame.eval()`,
+            such as `SurfaceArea < Population` or `Code.notna() and Code.str.match('^[A-Z]{3}$') == False`;
+            See `DataFrameRule` for how NULL values are evaluated.
+        id : str
+            the template of a record ID of each detected row
+        level: int
+            the level of detection
+        detection_type : str
+            the type of detection
+        msg : str
+            the template of the message of each detected row
+        datasource : str
+            name of the datasource
+        embedders: Sequence[str], optional
+            names of embedders used when creating messages.
+        chunksize : int
+            number of rows evaluated at once
+        max_estimated_rows : float, optional
+            maximum number of rows estimated to be examined by `sql`;
+            It is checked by `CostGuard`.
+        max_estimated_cost : float, optional
+            maximum cost of `sql` estimated by the planner of the datasource;
+            It is checked by `CostGuard`.
+        precheck : str, optional
+            cheap query which gates the rule
+        timeout : float, optional
+            time limit of the rule in seconds
+        """
+        super().__init__(
+            sql=sql,
+            predicate=predicate,
+            id_of_row=self._get_id_of_row,
+            level=level,
+            detection_type=detection_type,
+            msg=self._get_message,
+            datasource=datasource,
+            embedders=embedders,
+            chunksize=chunksize,
+            cost_budget=(
+                CostBudget(max_rows=max_estimated_rows, max_cost=max_estimated_cost)
+                if max_estimated_rows is not None or max_estimated_cost is not None
+                else None
+            ),
+            precheck=precheck,
+            timeout=timeout,
+        )
+        self._id_template = id
+        self._msg_template = msg
+
+    def fingerprint(self) -> str:
+        return extend_fingerprint(
+            super().fingerprint(), self._id_template, self._msg_template
+        )
+
+    def _get_id_of_row(self, embedded_vars: EmbeddedVariables) -> str:
+        return self._id_template.format(
+            *embedded_vars.sequence, **embedded_vars.mapping
+        )
+
+    def _get_message(self, embedded_vars: EmbeddedVariables) -> str:
+        return self._formatter.vformat(
+            self._msg_template, embedded_vars.sequence, embedded_vars.mapping
+        )
@@ -0,0 +1,6 @@
+from ._rule import DBAPIRule, SimpleDBAPIRule
+
+__all__ = [
+    "DBAPIRule",
+    "SimpleDBAPIRule",
+]
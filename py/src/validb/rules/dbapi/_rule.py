@@ -0,0 +1,263 @@
+import typing as t
+
+from ...datasources import DataSources, QueryEstimate
+from ...datasources.dbapi import DBAPIDataSource
+from ..._costguard import CostBudget
+from ..._embedder import Embedder
+from ..._execution import current_execution
+from ..._embedded_vars import EmbeddedVariables
+from ..._detected import (
+    ID,
+    MSG,
+    DETECTION_TYPE,
+    DeferredMessage,
+    Detected,
+    DetectedType,
+)
+from .._rule import Rule, DEFAULT_LEVEL, extend_fingerprint
+from ...formatter import MessageTemplate
+
+
+class DBAPIRule(t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE, MSG]):
+    """validation rule executed on `DBAPIDataSource`
+
+    Each row is given to the functions as EmbeddedVariables of the tuple of the driver
+    and a view of it by column name, which shares the positions of the columns among rows.
+    """
+
+    _sql: str
+    _id_of_row: t.Callable[[EmbeddedVariables], ID]
+    _level: int
+    _detection_type: DETECTION_TYPE
+    _msg: t.Callable[[EmbeddedVariables], MSG]
+    _datasource: str
+    _embedders: t.Sequence[str]
+    _cost_budget: t.Optional[CostBudget]
+    _precheck: t.Optional[str]
+    _timeout: t.Optional[float]
+
+    def __init__(
+        self,
+        sql: str,
+        id_of_row: t.Callable[[EmbeddedVariables], ID],
+        level: int,
+        detection_type: DETECTION_TYPE,
+        msg: t.Callable[[EmbeddedVariables], MSG],
+        datasource: str,
+        embedders: t.Optional[t.Sequence[str]] = None,
+        cost_budget: t.Optional[CostBudget] = None,
+        precheck: t.Optional[str] = None,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        """create a validation rule
+
+        The created rules are used as arguments to `validate_db()`.
+
+        Parameters
+        ----------
+        sql : str
+            query to be executed to detect anomalies
+        id_of_row : Callable[[EmbeddedVariables], ID]
+            the function to calc the record ID from each row of SQL result
+        level : int
+            the level of detection
+        detection_type : DETECTION_TYPE
+            the type of detection
+        msg : Callable[[EmbeddedVariables], MSG]
+            the function to create the message of each row
+        datasource : str
+            name of the datasource, which must be `DBAPIDataSource`
+        embedders: Sequence[str], optional
+            names of embedders used when creating messages.
+        cost_budget : CostBudget, optional
+            upper limits of the estimated cost of `sql`;
+            It is checked by `CostGuard` with `DBAPIDataSource.explain()`,
+            which estimates queries of MySQL and PostgreSQL drivers.
+        precheck : str, optional
+            cheap query which gates the rule
+        timeout : float, optional
+            time limit of the rule in seconds;
+            If not specified, the default timeout of `validate_db()` is applied.
+        """
+        super().__init__()
+
+        self._sql = sql
+        self._id_of_row = id_of_row
+        self._level = level
+        self._detection_type = detection_type
+        self._msg = msg
+        self._datasource = datasource
+        self._embedders = embedders if embedders is not None else []
+        self._cost_budget = cost_budget
+        self._precheck = precheck
+        self._timeout = timeout
+
+    @property
+    def sql(self) -> str:
+        return self._sql
+
+    @property
+    def precheck(self) -> t.Optional[str]:
+        return self._precheck
+
+    def datasource_names(self) -> t.Iterator[str]:
+        return iter((self._datasource,))
+
+    def id_of_row(self, embedded_vars: EmbeddedVariables) -> ID:
+        return self._id_of_row(embedded_vars)
+
+    def level(self) -> int:
+        return self._level
+
+    def detection_type(self) -> DETECTION_TYPE:
+        return self._detection_type
+
+    def message(self, embedded_vars: EmbeddedVariables) -> MSG:
+        return self._msg(embedded_vars)
+
+    def embedders(self) -> t.Iterator[str]:
+        return iter(self._embedders)
+
+    def cost_budget(self) -> t.Optional[CostBudget]:
+        return self._cost_budget
+
+    def timeout(self) -> t.Optional[float]:
+        return self._timeout
+
+    def fingerprint(self) -> str:
+        return extend_fingerprint(super().fingerprint(), self._id_of_row, self._msg)
+
+    @property
+    def datasource_name(self) -> str:
+        return self._datasource
+
+    def _get_datasource(self, datasources: DataSources) -> DBAPIDataSource:
+        datasource = datasources[self.datasource_name]
+        if not isinstance(datasource, DBAPIDataSource):
+            raise TypeError(
+                f"the data source for ${self.__class__.__name__} must be ${DBAPIDataSource.__name__}; actual={type(datasource)}"
+            )
+        return datasource
+
+    def estimate(self, *, datasources: DataSources) -> t.Optional[QueryEstimate]:
+        return self._get_datasource(datasources).explain(self.sql)
+
+    def exec(
+        self,
+        *,
+        datasources: DataSources,
+        detected: DetectedType[ID, DETECTION_TYPE, MSG],
+        embedders: t.Mapping[str, Embedder],
+    ) -> t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]:
+        datasource = self._get_datasource(datasources)
+        execution = current_execution()
+
+        with datasource.query(
+            self.sql, timeout=execution.timeout if execution is not None else None
+        ) as (columns, rows):
+            for row in rows:
+                if execution is not None:
+                    if execution.cancelled:
+                        return
+                    execution.add_rows()
+                yield self.detect(
+                    embedded_vars=EmbeddedVariables(row, columns.mapping(row)),
+                    constructor=detected,
+                    embedders=embedders,
+                )
+
+
+class SimpleDBAPIRule(DBAPIRule[str, str, str]):
+    _id_template: str
+    _msg_template: MessageTemplate
+    _defer_msg: bool
+
+    def __init__(
+        self,
+        *,
+        sql: str,
+        id: str,
+        level: int = DEFAULT_LEVEL,
+        detection_type: str,
+        msg: str,
+        datasource: str,
+        embedders: t.Optional[t.Sequence[str]] = None,
+        max_estimated_rows: t.Optional[float] = None,
+        max_estimated_cost: t.Optional[float] = None,
+        precheck: t.Optional[str] = None,
+        timeout: t.Optional[float] = None,
+        defer_msg: bool = False,
+    ) -> None:
+        """create a validation rule
+
+        The created rules are used as arguments to `validate_db()`.
+        The arguments are the same as `SimpleSQLAlchemyRule`.
+
+        Parameters
+        ----------
+        sql : str
+            query to be executed to detect anomalies
+        id : str
+            the template of a record ID of each row of SQL result
+        level: int
+            the level of detection
+        detection_type : str
+            the type of detection
+        msg : str
+            the template of the message of detection
+        datasource : str
+            name of the datasource, which must be `DBAPIDataSource`
+        embedders: Sequence[str], optional
+            names of embedders used when creating messages.
+        max_estimated_rows : float, optional
+            maximum number of rows estimated to be examined by `sql`;
+            It is checked by `CostGuard` for MySQL and PostgreSQL drivers.
+        max_estimated_cost : float, optional
+            maximum cost of `sql` estimated by the planner of the datasource;
+            It is checked by `CostGuard` for MySQL and PostgreSQL drivers.
+        precheck : str, optional
+            cheap query which gates the rule
+        timeout : float, optional
+            time limit of the rule in seconds
+        defer_msg : bool
+            whether to render `msg` on first access of `Detected.msg` instead of on detection
+        """
+        super().__init__(
+            sql=sql,
+            id_of_row=self._get_id_of_row,
+            level=level,
+            detection_type=detection_type,
+            msg=self._get_message,
+            datasource=datasource,
+            embedders=embedders,
+            cost_budget=(
+                CostBudget(max_rows=max_estimated_rows, max_cost=max_estimated_cost)
+                if max_estimated_rows is not None or max_estimated_cost is not None
+                else None
+            ),
+            precheck=precheck,
+            timeout=timeout,
+        )
+        self._id_template = id
+        self._msg_template = MessageTemplate(msg)
+        self._defer_msg = defer_msg
+
+    def fingerprint(self) -> str:
+        return extend_fingerprint(
+            super().fingerprint(), self._id_template, self._msg_template.template
+        )
+
+    def _get_id_of_row(self, embedded_vars: EmbeddedVariables) -> str:
+        return self._id_template.format(
+            *embedded_vars.sequence, **embedded_vars.mapping
+        )
+
+    def _get_message(self, embedded_vars: EmbeddedVariables) -> str:
+        return self._msg_template.render(embedded_vars.sequence, embedded_vars.mapping)
+
+    def deferred_message(
+        self, embedded_vars: EmbeddedVariables
+    ) -> t.Optional[DeferredMessage]:
+        if not self._defer_msg:
+            return None
+        return DeferredMessage(self._msg_template, embedded_vars)
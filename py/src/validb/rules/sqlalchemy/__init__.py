@@ -1,6 +1,17 @@
+from ._comparison import (
+    Mismatch,
+    SQLAlchemyComparisonRule,
+    SimpleSQLAlchemyComparisonRule,
+)
+from ._multicheck import Check, MultiCheckRule
 from ._rule import SQLAlchemyRule, SimpleSQLAlchemyRule
 
 __all__ = [
+    "Check",
+    "Mismatch",
+    "MultiCheckRule",
+    "SQLAlchemyComparisonRule",
     "SQLAlchemyRule",
+    "SimpleSQLAlchemyComparisonRule",
     "SimpleSQLAlchemyRule",
 ]
@@ -0,0 +1,478 @@
+import contextlib
+import enum
+import typing as t
+
+from sqlalchemy import Result
+
+from ...datasources import DataSources, QueryEstimate
+from ...datasources.sqlalchemy import SQLAlchemyDataSource
+from ..._embedder import Embedder
+from ..._execution import RuleExecution, current_execution
+from ..._embedded_vars import EmbeddedVariables
+from ..._detected import ID, MSG, DETECTION_TYPE, Detected, DetectedType
+from .._rule import Rule, DEFAULT_LEVEL, extend_fingerprint
+from ...formatter import MessageFormatter
+
+
+class Mismatch(enum.Enum):
+    """Kind of difference between the two sides of a comparison"""
+
+    MISSING = "missing"
+    """the key exists only on the left side"""
+
+    EXTRA = "extra"
+    """the key exists only on the right side"""
+
+    DIFFERENT = "different"
+    """the key exists on both sides but the compared columns differ"""
+
+
+_Key = t.Tuple[t.Any, ...]
+_Keyed = t.Tuple[_Key, t.Any]
+
+
+class SQLAlchemyComparisonRule(
+    t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE, MSG]
+):
+    """rule comparing the results of queries on two datasources, e.g. a primary and a warehouse
+
+    Both queries must return the key columns and be ordered by them in ascending order,
+    in the same order as Python compares the values (e.g. numbers, or strings in a binary collation).
+    The results are compared by a merge-join while they are streamed,
+    so the memory usage does not depend on the size of the tables.
+
+    If queries of digests of chunks are specified, the digests are compared first,
+    and the rows are fetched only for chunks whose digests differ.
+
+    Each mismatch is detected with the following variables:
+
+    - the key columns, in the sequence and by name
+    - `mismatch`: "missing", "extra" or "different" (see `Mismatch`)
+    - `columns`: comma-separated names of the columns which differ
+    - `left`, `right`: the row of each side by column name; all the values are None if missing
+    """
+
+    _left_sql: str
+    _right_sql: str
+    _key: t.Sequence[str]
+    _columns: t.Optional[t.Sequence[str]]
+    _left_datasource: str
+    _right_datasource: str
+    _left_chunk_sql: t.Optional[str]
+    _right_chunk_sql: t.Optional[str]
+    _id_of_row: t.Callable[[EmbeddedVariables], ID]
+    _level: int
+    _detection_type: DETECTION_TYPE
+    _msg: t.Callable[[EmbeddedVariables], MSG]
+    _embedders: t.Sequence[str]
+    _timeout: t.Optional[float]
+
+    def __init__(
+        self,
+        left_sql: str,
+        right_sql: str,
+        key: t.Sequence[str],
+        id_of_row: t.Callable[[EmbeddedVariables], ID],
+        level: int,
+        detection_type: DETECTION_TYPE,
+        msg: t.Callable[[EmbeddedVariables], MSG],
+        left_datasource: str,
+        right_datasource: str,
+        columns: t.Optional[t.Sequence[str]] = None,
+        left_chunk_sql: t.Optional[str] = None,
+        right_chunk_sql: t.Optional[str] = None,
+        embedders: t.Optional[t.Sequence[str]] = None,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        """create a comparison rule
+
+        The created rules are used as arguments to `validate_db()`.
+
+        Parameters
+        ----------
+        left_sql : str
+            query executed on the left datasource, ordered by `key`;
+            If chunks are compared, it must filter rows by the bind parameter `:chunk`.
+        right_sql : str
+            query executed on the right datasource, ordered by `key`;
+            If chunks are compared, it must filter rows by the bind parameter `:chunk`.
+        key : Sequence[str]
+            names of the columns which identify a row; their values must not be NULL
+        id_of_row : Callable[[EmbeddedVariables], ID]
+            the function to calc the record ID of each mismatch
+        level : int
+            the level of detection
+        detection_type : DETECTION_TYPE
+            the type of detection
+        msg : Callable[[EmbeddedVariables], MSG]
+            the function to create the message of each mismatch
+        left_datasource : str
+            name of the left datasource
+        right_datasource : str
+            name of the right datasource; it may be the same as the left one
+        columns : Sequence[str], optional
+            names of the columns to be compared;
+            If not specified, all the columns of the left query except the key are compared.
+        left_chunk_sql : str, optional
+            query executed on the left datasource returning the chunk and its digest in each row,
+            ordered by the chunk, such as
+            `SELECT id DIV 10000 AS chunk, MD5(GROUP_CONCAT(id, amount ORDER BY id)) FROM t GROUP BY chunk ORDER BY chunk`
+        right_chunk_sql : str, optional
+            the same as `left_chunk_sql` for the right datasource;
+            It must be specified together with `left_chunk_sql`.
+        embedders: Sequence[str], optional
+            names of embedders used when creating messages.
+        timeout : float, optional
+            time limit of the rule in seconds;
+            If not specified, the default timeout of `validate_db()` is applied.
+        """
+        super().__init__()
+
+        if (left_chunk_sql is None) != (right_chunk_sql is None):
+            raise ValueError(
+                "left_chunk_sql and right_chunk_sql must be specified together"
+            )
+        if len(key) <= 0:
+            raise ValueError("key must contain at least one column")
+
+        self._left_sql = left_sql
+        self._right_sql = right_sql
+        self._key = key
+        self._columns = columns
+        self._left_datasource = left_datasource
+        self._right_datasource = right_datasource
+        self._left_chunk_sql = left_chunk_sql
+        self._right_chunk_sql = right_chunk_sql
+        self._id_of_row = id_of_row
+        self._level = level
+        self._detection_type = detection_type
+        self._msg = msg
+        self._embedders = embedders if embedders is not None else []
+        self._timeout = timeout
+
+    @property
+    def sql(self) -> str:
+        return self._left_sql
+
+    @property
+    def right_sql(self) -> str:
+        return self._right_sql
+
+    def datasource_names(self) -> t.Iterator[str]:
+        return iter(dict.fromkeys((self._left_datasource, self._right_datasource)))
+
+    def id_of_row(self, embedded_vars: EmbeddedVariables) -> ID:
+        return self._id_of_row(embedded_vars)
+
+    def level(self) -> int:
+        return self._level
+
+    def detection_type(self) -> DETECTION_TYPE:
+        return self._detection_type
+
+    def message(self, embedded_vars: EmbeddedVariables) -> MSG:
+        return self._msg(embedded_vars)
+
+    def embedders(self) -> t.Iterator[str]:
+        return iter(self._embedders)
+
+    def timeout(self) -> t.Optional[float]:
+        return self._timeout
+
+    def fingerprint(self) -> str:
+        # the left query alone does not identify the comparison
+        return extend_fingerprint(
+            super().fingerprint(),
+            self._right_sql,
+            list(self._key),
+            list(self._columns) if self._columns is not None else None,
+            self._id_of_row,
+            self._msg,
+        )
+
+    def _get_datasource(
+        self, datasources: DataSources, name: str
+    ) -> SQLAlchemyDataSource:
+        datasource = datasources[name]
+        if not isinstance(datasource, SQLAlchemyDataSource):
+            raise TypeError(
+                f"the data source for ${self.__class__.__name__} must be ${SQLAlchemyDataSource.__name__}; actual={type(datasource)}"
+            )
+        return datasource
+
+    def estimate(self, *, datasources: DataSources) -> t.Optional[QueryEstimate]:
+        if self._left_chunk_sql is not None:
+            # the rows fetched depend on the digests
+            return None
+
+        left_estimate = self._get_datasource(
+            datasources, self._left_datasource
+        ).explain(self._left_sql)
+        right_estimate = self._get_datasource(
+            datasources, self._right_datasource
+        ).explain(self._right_sql)
+        if left_estimate is None or right_estimate is None:
+            return None
+
+        return QueryEstimate(
+            rows=_sum_or_none(left_estimate.rows, right_estimate.rows),
+            cost=_sum_or_none(left_estimate.cost, right_estimate.cost),
+        )
+
+    def exec(
+        self,
+        *,
+        datasources: DataSources,
+        detected: DetectedType[ID, DETECTION_TYPE, MSG],
+        embedders: t.Mapping[str, Embedder],
+    ) -> t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]:
+        left = self._get_datasource(datasources, self._left_datasource)
+        right = self._get_datasource(datasources, self._right_datasource)
+        execution = current_execution()
+        timeout = execution.timeout if execution is not None else None
+
+        if self._left_chunk_sql is None or self._right_chunk_sql is None:
+            yield from self._compare(
+                left, right, None, execution, timeout, detected, embedders
+            )
+            return
+
+        # the results of digests are streamed while rows of chunks are fetched,
+        # so every query is on a connection of its own
+        with contextlib.ExitStack() as stack:
+            left_chunks = stack.enter_context(
+                left.query(self._left_chunk_sql, timeout=timeout, dedicated=True)
+            )
+            right_chunks = stack.enter_context(
+                right.query(self._right_chunk_sql, timeout=timeout, dedicated=True)
+            )
+            for chunk, left_digest, right_digest in _merge_join(
+                _chunk_digests(left_chunks),
+                _chunk_digests(right_chunks),
+            ):
+                if execution is not None and execution.cancelled:
+                    return
+                if left_digest is not None and left_digest == right_digest:
+                    continue
+                yield from self._compare(
+                    left,
+                    right,
+                    {"chunk": chunk[0]},
+                    execution,
+                    timeout,
+                    detected,
+                    embedders,
+                )
+
+    def _compare(
+        self,
+        left: SQLAlchemyDataSource,
+        right: SQLAlchemyDataSource,
+        params: t.Optional[t.Mapping[str, t.Any]],
+        execution: t.Optional[RuleExecution],
+        timeout: t.Optional[float],
+        detected: DetectedType[ID, DETECTION_TYPE, MSG],
+        embedders: t.Mapping[str, Embedder],
+    ) -> t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]:
+        with left.query(
+            self._left_sql, params=params, timeout=timeout
+        ) as left_result, right.query(
+            self._right_sql, params=params, timeout=timeout, dedicated=True
+        ) as right_result:
+            columns = self._columns
+            if columns is None:
+                columns = [c for c in left_result.keys() if c not in self._key]
+            left_missing = dict.fromkeys(left_result.keys())
+            right_missing = dict.fromkeys(right_result.keys())
+
+            for key, left_row, right_row in _merge_join(
+                self._keyed_rows(left_result, execution),
+                self._keyed_rows(right_result, execution),
+            ):
+                if execution is not None and execution.cancelled:
+                    return
+
+                if left_row is None:
+                    mismatch = Mismatch.EXTRA
+                    differences: t.Sequence[str] = columns
+                elif right_row is None:
+                    mismatch = Mismatch.MISSING
+                    differences = columns
+                else:
+                    differences = [
+                        c for c in columns if left_row.get(c) != right_row.get(c)
+                    ]
+                    if len(differences) <= 0:
+                        continue
+                    mismatch = Mismatch.DIFFERENT
+
+                yield self.detect(
+                    embedded_vars=EmbeddedVariables(
+                        key,
+                        {
+                            **dict(zip(self._key, key)),
+                            "mismatch": mismatch.value,
+                            "columns": ", ".join(differences),
+                            "left": left_row if left_row is not None else left_missing,
+                            "right": (
+                                right_row if right_row is not None else right_missing
+                            ),
+                        },
+                    ),
+                    constructor=detected,
+                    embedders=embedders,
+                )
+
+    def _keyed_rows(
+        self,
+        result: Result[t.Any],
+        execution: t.Optional[RuleExecution],
+    ) -> t.Iterator[_Keyed]:
+        key_columns = self._key
+        for row in result:
+            if execution is not None:
+                execution.add_rows()
+            mapping = row._mapping
+            yield tuple(mapping[c] for c in key_columns), mapping
+
+
+def _chunk_digests(result: Result[t.Any]) -> t.Iterator[_Keyed]:
+    for row in result:
+        yield (row[0],), row[1]
+
+
+def _sum_or_none(a: t.Optional[float], b: t.Optional[float]) -> t.Optional[float]:
+    return a + b if a is not None and b is not None else None
+
+
+def _merge_join(
+    left: t.Iterator[_Keyed], right: t.Iterator[_Keyed]
+) -> t.Iterator[t.Tuple[_Key, t.Optional[t.Any], t.Optional[t.Any]]]:
+    """full outer join of two iterators of (key, value) sorted by key
+
+    Each item is a tuple of the key and the values of each side;
+    a value is None if the key is missing on that side.
+    Only the current item of each side is held in memory.
+    """
+    left_item = _next_in_order(left, None, "left")
+    right_item = _next_in_order(right, None, "right")
+    while left_item is not None or right_item is not None:
+        if right_item is None or (
+            left_item is not None and left_item[0] < right_item[0]
+        ):
+            assert left_item is not None
+            yield left_item[0], left_item[1], None
+            left_item = _next_in_order(left, left_item[0], "left")
+        elif left_item is None or right_item[0] < left_item[0]:
+            yield right_item[0], None, right_item[1]
+            right_item = _next_in_order(right, right_item[0], "right")
+        else:
+            yield left_item[0], left_item[1], right_item[1]
+            left_item = _next_in_order(left, left_item[0], "left")
+            right_item = _next_in_order(right, right_item[0], "right")
+
+
+def _next_in_order(
+    items: t.Iterator[_Keyed], previous_key: t.Optional[_Key], side: str
+) -> t.Optional[_Keyed]:
+    item = next(items, None)
+    if item is not None and previous_key is not None and not previous_key < item[0]:
+        raise ValueError(
+            f"the {side} query must be ordered by the key without duplicates; {item[0]} follows {previous_key}"
+        )
+    return item
+
+
+class SimpleSQLAlchemyComparisonRule(SQLAlchemyComparisonRule[str, str, str]):
+    _formatter = MessageFormatter()
+    _id_template: str
+    _msg_template: str
+
+    def __init__(
+        self,
+        *,
+        left_sql: str,
+        right_sql: str,
+        key: t.Union[str, t.Sequence[str]],
+        id: str,
+        level: int = DEFAULT_LEVEL,
+        detection_type: str,
+        msg: str = "{mismatch}; columns={columns}",
+        left_datasource: str,
+        right_datasource: str,
+        columns: t.Optional[t.Sequence[str]] = None,
+        left_chunk_sql: t.Optional[str] = None,
+        right_chunk_sql: t.Optional[str] = None,
+        embedders: t.Optional[t.Sequence[str]] = None,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        """create a comparison rule
+
+        The created rules are used as arguments to `validate_db()`.
+        See `SQLAlchemyComparisonRule` for the variables which can be embedded in the templates.
+
+        Parameters
+        ----------
+        left_sql : str
+            query executed on the left datasource, ordered by `key`
+        right_sql : str
+            query executed on the right datasource, ordered by `key`
+        key : str | Sequence[str]
+            name(s) of the columns which identify a row
+        id : str
+            the template of a record ID of each mismatch, such as `{0}` or `{id}`
+        level: int
+            the level of detection
+        detection_type : str
+            the type of detection
+        msg : str
+            the template of the message of each mismatch, such as `{mismatch}; amount={left[amount]}`
+        left_datasource : str
+            name of the left datasource
+        right_datasource : str
+            name of the right datasource
+        columns : Sequence[str], optional
+            names of the columns to be compared;
+            If not specified, all the columns of the left query except the key are compared.
+        left_chunk_sql : str, optional
+            query of digests of chunks on the left datasource; see `SQLAlchemyComparisonRule`
+        right_chunk_sql : str, optional
+            query of digests of chunks on the right datasource; see `SQLAlchemyComparisonRule`
+        embedders: Sequence[str], optional
+            names of embedders used when creating messages.
+        timeout : float, optional
+            time limit of the rule in seconds
+        """
+        super().__init__(
+            left_sql=left_sql,
+            right_sql=right_sql,
+            key=[key] if isinstance(key, str) else key,
+            id_of_row=self._get_id_of_row,
+            level=level,
+            detection_type=detection_type,
+            msg=self._get_message,
+            left_datasource=left_datasource,
+            right_datasource=right_datasource,
+            columns=columns,
+            left_chunk_sql=left_chunk_sql,
+            right_chunk_sql=right_chunk_sql,
+            embedders=embedders,
+            timeout=timeout,
+        )
+        self._id_template = id
+        self._msg_template = msg
+
+    def fingerprint(self) -> str:
+        return extend_fingerprint(
+            super().fingerprint(), self._id_template, self._msg_template
+        )
+
+    def _get_id_of_row(self, embedded_vars: EmbeddedVariables) -> str:
+        return self._id_template.format(
+            *embedded_vars.sequence, **embedded_vars.mapping
+        )
+
+    def _get_message(self, embedded_vars: EmbeddedVariables) -> str:
+        return self._formatter.vformat(
+            self._msg_template, embedded_vars.sequence, embedded_vars.mapping
+        )
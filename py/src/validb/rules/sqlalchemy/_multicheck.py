@@ -0,0 +1,371 @@
+import ast
+import builtins
+from dataclasses import dataclass
+import math
+import re
+import types
+import typing as t
+
+from ...datasources import DataSources, QueryEstimate
+from ...datasources.sqlalchemy import SQLAlchemyDataSource
+from ..._costguard import CostBudget
+from ..._embedder import Embedder
+from ..._execution import current_execution
+from ..._embedded_vars import EmbeddedVariables
+from ..._detected import Detected, DetectedType
+from .._rule import Rule, DEFAULT_LEVEL, extend_fingerprint
+from ...formatter import MessageFormatter
+
+
+@dataclass(frozen=True)
+class Check:
+    """A check evaluated on each row by `MultiCheckRule`
+
+    Attributes
+    ----------
+    predicate : str | Callable[[Mapping[str, Any]], bool]
+        the condition of anomalies;
+        A string is a Python expression in which the columns can be referred by name,
+        such as `amount is not None and amount < 0`; the modules `re` and `math` are available.
+        A callable receives the row by column name.
+    detection_type : str
+        the type of detection; it must be unique in the rule
+    msg : str
+        the template of the message
+    level : int
+        the level of detection
+    id : str | None
+        the template of the record ID; if None, that of the rule is used
+    """
+
+    predicate: t.Union[str, t.Callable[[t.Mapping[str, t.Any]], t.Any]]
+    detection_type: str
+    msg: str
+    level: int = DEFAULT_LEVEL
+    id: t.Optional[str] = None
+
+
+# names available in the predicates other than columns
+_PREDICATE_GLOBALS: t.Mapping[str, t.Any] = {"re": re, "math": math}
+
+
+class MultiCheckRule(Rule[str, str, str]):
+    """validation rule evaluating many checks on each row of a single query
+
+    The result of `sql` is scanned once, and all the checks are evaluated on each row
+    by a single evaluator compiled from their predicates.
+    Each check which is true for a row is detected with its own level, detection type and message,
+    so it replaces as many rules scanning the same table.
+
+    `detection_type()` of this rule is its name and `level()` is the highest level of the checks.
+    """
+
+    _formatter = MessageFormatter()
+
+    _sql: str
+    _name: str
+    _id_template: str
+    _checks: t.Sequence[Check]
+    _checks_by_type: t.Mapping[str, Check]
+    _datasource: str
+    _embedders: t.Sequence[str]
+    _cost_budget: t.Optional[CostBudget]
+    _precheck: t.Optional[str]
+    _timeout: t.Optional[float]
+
+    def __init__(
+        self,
+        *,
+        sql: str,
+        name: str,
+        id: str,
+        checks: t.Sequence[t.Union[Check, t.Mapping[str, t.Any]]],
+        datasource: str,
+        embedders: t.Optional[t.Sequence[str]] = None,
+        max_estimated_rows: t.Optional[float] = None,
+        max_estimated_cost: t.Optional[float] = None,
+        precheck: t.Optional[str] = None,
+        timeout: t.Optional[float] = None,
+    ) -> None:
+        """create a validation rule
+
+        The created rules are used as arguments to `validate_db()`.
+
+        Parameters
+        ----------
+        sql : str
+            query whose rows are checked
+        name : str
+            the name of the rule, used as `detection_type()` of the rule
+        id : str
+            the template of a record ID of each row;
+            Checks can override it.
+        checks : Sequence[Check | Mapping[str, Any]]
+            the checks; a mapping is passed to `Check` as keyword arguments
+        datasource : str
+            name of the datasource
+        embedders: Sequence[str], optional
+            names of embedders used when creating messages.
+        max_estimated_rows : float, optional
+            maximum number of rows estimated to be examined by `sql`;
+            It is checked by `CostGuard`.
+        max_estimated_cost : float, optional
+            maximum cost of `sql` estimated by the planner of the datasource;
+            It is checked by `CostGuard`.
+        precheck : str, optional
+            cheap query which gates the rule
+        timeout : float, optional
+            time limit of the rule in seconds
+        """
+        super().__init__()
+
+        check_list = [
+            check if isinstance(check, Check) else Check(**check) for check in checks
+        ]
+        if len(check_list) <= 0:
+            raise ValueError("checks must contain at least one check")
+        checks_by_type = {check.detection_type: check for check in check_list}
+        if len(checks_by_type) < len(check_list):
+            raise ValueError("checks.*.detection_type must be unique in a rule")
+        for check in check_list:
+            if isinstance(check.predicate, str):
+                try:
+                    ast.parse(check.predicate, mode="eval")
+                except SyntaxError as e:
+                    raise ValueError(
+                        f"checks.*.predicate must be a Python expression; actually specified: {check.predicate!r} ({e.msg})"
+                    )
+
+        self._sql = sql
+        self._name = name
+        self._id_template = id
+        self._checks = check_list
+        self._checks_by_type = checks_by_type
+        self._datasource = datasource
+        self._embedders = embedders if embedders is not None else []
+        self._cost_budget = (
+            CostBudget(max_rows=max_estimated_rows, max_cost=max_estimated_cost)
+            if max_estimated_rows is not None or max_estimated_cost is not None
+            else None
+        )
+        self._precheck = precheck
+        self._timeout = timeout
+
+    @property
+    def sql(self) -> str:
+        return self._sql
+
+    @property
+    def checks(self) -> t.Sequence[Check]:
+        return self._checks
+
+    @property
+    def precheck(self) -> t.Optional[str]:
+        return self._precheck
+
+    def datasource_names(self) -> t.Iterator[str]:
+        return iter((self._datasource,))
+
+    def level(self) -> int:
+        return max(check.level for check in self._checks)
+
+    def detection_type(self) -> str:
+        return self._name
+
+    def detection_types(self) -> t.Iterator[str]:
+        return (check.detection_type for check in self._checks)
+
+    def id_of_row(self, embedded_vars: EmbeddedVariables) -> str:
+        """the record ID of a row detected by the check named by the variable `check`"""
+        check = self._checks_by_type.get(embedded_vars.get("check"))
+        template = self._id_template
+        if check is not None and check.id is not None:
+            template = check.id
+        return template.format(*embedded_vars.sequence, **embedded_vars.mapping)
+
+    def message(self, embedded_vars: EmbeddedVariables) -> str:
+        """the message of a row detected by the check named by the variable `check`"""
+        check = self._checks_by_type[embedded_vars["check"]]
+        return self._formatter.vformat(
+            check.msg, embedded_vars.sequence, embedded_vars.mapping
+        )
+
+    def embedders(self) -> t.Iterator[str]:
+        return iter(self._embedders)
+
+    def cost_budget(self) -> t.Optional[CostBudget]:
+        return self._cost_budget
+
+    def timeout(self) -> t.Optional[float]:
+        return self._timeout
+
+    def fingerprint(self) -> str:
+        return extend_fingerprint(
+            super().fingerprint(),
+            self._id_template,
+            *(
+                parameter
+                for check in self._checks
+                for parameter in (
+                    check.detection_type,
+                    check.predicate,
+                    check.msg,
+                    check.level,
+                    check.id,
+                )
+            ),
+        )
+
+    def _get_datasource(self, datasources: DataSources) -> SQLAlchemyDataSource:
+        datasource = datasources[self._datasource]
+        if not isinstance(datasource, SQLAlchemyDataSource):
+            raise TypeError(
+                f"the data source for ${self.__class__.__name__} must be ${SQLAlchemyDataSource.__name__}; actual={type(datasource)}"
+            )
+        return datasource
+
+    def estimate(self, *, datasources: DataSources) -> t.Optional[QueryEstimate]:
+        return self._get_datasource(datasources).explain(self.sql)
+
+    def exec(
+        self,
+        *,
+        datasources: DataSources,
+        detected: DetectedType[str, str, str],
+        embedders: t.Mapping[str, Embedder],
+    ) -> t.Iterator[Detected[str, str, str]]:
+        datasource = self._get_datasource(datasources)
+        execution = current_execution()
+        extenders = [embedders[name] for name in self.embedders()]
+        checks = self._checks
+
+        with datasource.query(
+            self.sql, timeout=execution.timeout if execution is not None else None
+        ) as sql_result:
+            evaluate = _compile_evaluator(checks, list(sql_result.keys()))
+            failed: t.List[int] = []
+            for row in sql_result:
+                if execution is not None:
+                    if execution.cancelled:
+                        return
+                    execution.add_rows()
+
+                evaluate(row, failed.append)
+                if len(failed) <= 0:
+                    continue
+
+                for index in failed:
+                    check = checks[index]
+                    embedded_vars = EmbeddedVariables(
+                        row,
+                        {**row._mapping, "check": check.detection_type},  # type: ignore
+                    ).extended(extenders)
+                    yield detected(
+                        self.id_of_row(embedded_vars),
+                        check.level,
+                        check.detection_type,
+                        self.message(embedded_vars),
+                        embedded_vars,
+                    )
+                failed.clear()
+
+
+def _compile_evaluator(
+    checks: t.Sequence[Check], columns: t.Sequence[str]
+) -> t.Callable[[t.Any, t.Callable[[int], None]], None]:
+    """compile the predicates of the checks into a single function
+
+    The function receives a row and a callback, and calls the callback with the index of each check which is true.
+    Only the columns referred by the predicates are read from the row, once for each row.
+    """
+    column_indexes = {column: i for i, column in enumerate(columns)}
+
+    referred: t.Dict[str, int] = {}
+    # (index of the check, compiled expression or callable, whether it assigns names)
+    predicates: t.List[t.Tuple[int, t.Any, bool]] = []
+    for i, check in enumerate(checks):
+        predicate = check.predicate
+        if not isinstance(predicate, str):
+            predicates.append((i, predicate, False))
+            continue
+
+        expression = ast.parse(predicate, mode="eval")
+        assigned = frozenset(
+            node.target.id
+            for node in ast.walk(expression)
+            if isinstance(node, ast.NamedExpr) and isinstance(node.target, ast.Name)
+        )
+        for name in _free_names(expression, assigned):
+            if name in referred:
+                continue
+            if name in column_indexes:
+                referred[name] = column_indexes[name]
+            elif name not in _PREDICATE_GLOBALS and not hasattr(builtins, name):
+                raise ValueError(
+                    f"checks.*.predicate refers to an unknown column {name!r}; columns: {list(columns)}"
+                )
+        code = compile(expression, f"<validb check {check.detection_type}>", "eval")
+        predicates.append((i, code, len(assigned) > 0))
+
+    namespace: t.Dict[str, t.Any] = {"__builtins__": builtins, **_PREDICATE_GLOBALS}
+    referred_items = list(referred.items())
+
+    def evaluate(row: t.Any, failed: t.Callable[[int], None]) -> None:
+        # the columns are globals of the expressions so that lambdas and comprehensions can refer to them
+        scope = namespace.copy()
+        for name, index in referred_items:
+            scope[name] = row[index]
+        for i, predicate, assigns in predicates:
+            if isinstance(predicate, types.CodeType):
+                # names assigned by a check are not seen by the others
+                value = eval(predicate, scope.copy() if assigns else scope)
+            else:
+                value = predicate(row._mapping)
+            if value:
+                failed(i)
+
+    return evaluate
+
+
+def _free_names(
+    node: ast.AST, bound: t.FrozenSet[str] = frozenset()
+) -> t.Iterator[str]:
+    """names referred by an expression, except those bound in it by lambdas and comprehensions"""
+    if isinstance(node, ast.Name):
+        if node.id not in bound:
+            yield node.id
+    elif isinstance(node, ast.NamedExpr):
+        yield from _free_names(node.value, bound)
+    elif isinstance(node, ast.Lambda):
+        arguments = node.args
+        for default in (*arguments.defaults, *arguments.kw_defaults):
+            if default is not None:
+                yield from _free_names(default, bound)
+        parameters = [
+            *arguments.posonlyargs,
+            *arguments.args,
+            *arguments.kwonlyargs,
+            *(arg for arg in (arguments.vararg, arguments.kwarg) if arg is not None),
+        ]
+        yield from _free_names(
+            node.body, bound | {parameter.arg for parameter in parameters}
+        )
+    elif isinstance(node, (ast.ListComp, ast.SetComp, ast.GeneratorExp, ast.DictComp)):
+        inner = bound
+        for generator in node.generators:
+            yield from _free_names(generator.iter, inner)
+            inner = inner | {
+                target.id
+                for target in ast.walk(generator.target)
+                if isinstance(target, ast.Name)
+            }
+            for condition in generator.ifs:
+                yield from _free_names(condition, inner)
+        elements = (
+            (node.key, node.value) if isinstance(node, ast.DictComp) else (node.elt,)
+        )
+        for element in elements:
+            yield from _free_names(element, inner)
+    else:
+        for child in ast.iter_child_nodes(node):
+            yield from _free_names(child, bound)
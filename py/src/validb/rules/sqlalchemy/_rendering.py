@@ -0,0 +1,196 @@
+import string
+import typing as t
+
+ID_COLUMN = "_validb_id"
+MSG_COLUMN = "_validb_msg"
+_SUBQUERY_ALIAS = "_validb_q"
+_PAGE_SIZE_PARAM = "_validb_page_size"
+
+# dialects whose concatenation of strings is known
+_CONCAT_DIALECTS = ("mysql", "mariadb", "postgresql", "sqlite")
+
+
+def columns_query(sql: str) -> str:
+    """query returning no rows but the columns of `sql`"""
+    return f"SELECT * FROM ({_strip(sql)}) {_SUBQUERY_ALIAS} WHERE 1 = 0"
+
+
+def page_query(
+    sql: str,
+    *,
+    page_by: t.Sequence[str],
+    after: t.Optional[t.Sequence[t.Any]],
+    page_size: int,
+    dialect: t.Any,
+) -> t.Tuple[str, t.Mapping[str, t.Any]]:
+    """wrap the query so that it returns a page of its rows by keyset pagination
+
+    Parameters
+    ----------
+    sql : str
+        the query
+    page_by : Sequence[str]
+        the columns of `sql` which identify a row, by which the rows are ordered
+    after : Sequence[Any] | None
+        the values of `page_by` of the last row of the previous page; None for the first page
+    page_size : int
+        the maximum number of rows of the page
+    dialect : Dialect
+        the dialect of the datasource
+
+    Returns
+    -------
+    tuple[str, Mapping[str, Any]]
+        the query and its bind parameters
+    """
+    keys = [
+        f"{_SUBQUERY_ALIAS}.{dialect.identifier_preparer.quote(column)}"
+        for column in page_by
+    ]
+    params: t.Dict[str, t.Any] = {_PAGE_SIZE_PARAM: page_size}
+    where = ""
+    if after is not None:
+        # (a, b) > (:a, :b) is expanded since not all databases support row values
+        conditions: t.List[str] = []
+        for i, (key, value) in enumerate(zip(keys, after)):
+            params[f"_validb_k{i}"] = value
+            equals = [f"{keys[j]} = :_validb_k{j}" for j in range(i)]
+            conditions.append(
+                "(" + " AND ".join((*equals, f"{key} > :_validb_k{i}")) + ")"
+            )
+        where = " WHERE " + " OR ".join(conditions)
+    return (
+        f"SELECT {_SUBQUERY_ALIAS}.* FROM ({_strip(sql)}) {_SUBQUERY_ALIAS}{where}"
+        f" ORDER BY {', '.join(keys)} LIMIT :{_PAGE_SIZE_PARAM}",
+        params,
+    )
+
+
+def compile_rendering(
+    sql: str,
+    *,
+    id_template: str,
+    msg_template: str,
+    columns: t.Sequence[str],
+    scalars: t.Mapping[str, t.Any],
+    dialect: t.Any,
+) -> t.Optional[t.Tuple[str, t.Mapping[str, str]]]:
+    """wrap the query so that it returns the rendered record ID and message
+
+    The record ID and the message are appended to the columns of `sql` as `ID_COLUMN` and `MSG_COLUMN`.
+    Literal parts of the templates and scalar variables are passed as bind parameters.
+
+    Parameters
+    ----------
+    sql : str
+        the query
+    id_template : str
+        the template of the record ID, rendered like `str.format()`
+    msg_template : str
+        the template of the message, rendered like `MessageFormatter`
+    columns : Sequence[str]
+        the columns of the query
+    scalars : Mapping[str, Any]
+        variables which do not depend on the row, such as those of embedders
+    dialect : Dialect
+        the dialect of the datasource
+
+    Returns
+    -------
+    tuple[str, Mapping[str, str]] | None
+        the query and its bind parameters; None if the templates cannot be rendered by the database
+    """
+    if dialect.name not in _CONCAT_DIALECTS:
+        return None
+
+    params: t.Dict[str, str] = {}
+    id_expr = _compile_template(
+        id_template, columns, scalars, dialect, params, missing_as_empty=False
+    )
+    msg_expr = _compile_template(
+        msg_template, columns, scalars, dialect, params, missing_as_empty=True
+    )
+    if id_expr is None or msg_expr is None:
+        return None
+
+    return (
+        f"SELECT {_SUBQUERY_ALIAS}.*, {id_expr} AS {ID_COLUMN}, {msg_expr} AS {MSG_COLUMN}"
+        f" FROM ({_strip(sql)}) {_SUBQUERY_ALIAS}",
+        params,
+    )
+
+
+def _compile_template(
+    template: str,
+    columns: t.Sequence[str],
+    scalars: t.Mapping[str, t.Any],
+    dialect: t.Any,
+    params: t.Dict[str, str],
+    *,
+    missing_as_empty: bool,
+) -> t.Optional[str]:
+    """compile a template to an SQL expression; None if it cannot be compiled"""
+    column_set = set(columns)
+
+    parts: t.List[str] = []
+    # adjacent literal texts are passed as a single parameter
+    pending: t.List[str] = []
+
+    def flush() -> None:
+        if len(pending) > 0:
+            name = f"_validb_l{len(params)}"
+            params[name] = "".join(pending)
+            parts.append(f":{name}")
+            pending.clear()
+
+    def column(name: str) -> None:
+        flush()
+        parts.append(_as_text(name, dialect))
+
+    try:
+        parsed = list(string.Formatter().parse(template))
+    except ValueError:
+        return None
+
+    for literal_text, field_name, format_spec, conversion in parsed:
+        if literal_text:
+            pending.append(literal_text)
+        if field_name is None:
+            continue
+        if format_spec or conversion is not None:
+            return None
+
+        if field_name.isdigit():
+            index = int(field_name)
+            if index >= len(columns):
+                if not missing_as_empty:
+                    return None
+                continue
+            column(columns[index])
+        elif field_name in scalars:
+            pending.append(str(scalars[field_name]))
+        elif field_name in column_set:
+            column(field_name)
+        elif field_name.isidentifier() and missing_as_empty:
+            continue
+        else:
+            # e.g. auto-numbering, attribute or index access
+            return None
+
+    flush()
+    if len(parts) <= 0:
+        return "''"
+    if dialect.name in ("mysql", "mariadb"):
+        return f"CONCAT({', '.join(parts)})"
+    return "(" + " || ".join(parts) + ")"
+
+
+def _as_text(column: str, dialect: t.Any) -> str:
+    quoted = f"{_SUBQUERY_ALIAS}.{dialect.identifier_preparer.quote(column)}"
+    text_type = "CHAR" if dialect.name in ("mysql", "mariadb") else "TEXT"
+    # str(None) in Python
+    return f"COALESCE(CAST({quoted} AS {text_type}), 'None')"
+
+
+def _strip(sql: str) -> str:
+    return sql.strip().rstrip(";")
@@ -1,14 +1,30 @@
+import logging
+import threading
 import typing as t
 
-from sqlalchemy.sql import text
+from sqlalchemy.exc import DBAPIError
 
-from ...datasources import DataSources
+from ...datasources import DataSources, QueryEstimate
 from ...datasources.sqlalchemy import SQLAlchemyDataSource
+from ..._costguard import CostBudget
 from ..._embedder import Embedder
+from ..._execution import RuleExecution, current_execution
 from ..._embedded_vars import EmbeddedVariables
-from ..._detected import ID, MSG, DETECTION_TYPE, Detected, DetectedType
-from .._rule import Rule, DEFAULT_LEVEL
-from ...formatter import MessageFormatter
+from ..._detected import (
+    ID,
+    MSG,
+    DETECTION_TYPE,
+    DeferredMessage,
+    Detected,
+    DetectedType,
+)
+from .._rule import Rule, DEFAULT_LEVEL, extend_fingerprint
+from ...formatter import MessageTemplate
+from ._rendering import columns_query, compile_rendering, page_query
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 10000
 
 
 class SQLAlchemyRule(t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE, MSG]):
@@ -21,6 +37,11 @@ class SQLAlchemyRule(t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE
     _msg: t.Callable[[EmbeddedVariables], MSG]
     _datasource: str
     _embedders: t.Sequence[str]
+    _cost_budget: t.Optional[CostBudget]
+    _precheck: t.Optional[str]
+    _timeout: t.Optional[float]
+    _page_by: t.Optional[t.Sequence[str]]
+    _page_size: int
 
     def __init__(
         self,
@@ -31,6 +52,11 @@ class SQLAlchemyRule(t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE
         msg: t.Callable[[EmbeddedVariables], MSG],
         datasource: str,
         embedders: t.Optional[t.Sequence[str]] = None,
+        cost_budget: t.Optional[CostBudget] = None,
+        precheck: t.Optional[str] = None,
+        timeout: t.Optional[float] = None,
+        page_by: t.Optional[t.Sequence[str]] = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
     ) -> None:
         """create a validation rule
 
@@ -55,9 +81,33 @@ class SQLAlchemyRule(t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE
         embedders: Sequence[Embedder]
             Generator of embedding variables to be used when creating messages.
             If not specified, only fields obtained by SQL can be embedded.
+        cost_budget : CostBudget, optional
+            upper limits of the estimated cost of `sql`;
+            If not specified, the global budget of `CostGuard` is applied.
+        precheck : str, optional
+            cheap query which gates the rule;
+            If it returns no rows, NULL or zero, `sql` is not executed.
+        timeout : float, optional
+            time limit of the rule in seconds;
+            If not specified, the default timeout of `validate_db()` is applied.
+        page_by : Sequence[str], optional
+            columns of `sql` which identify a row, such as the primary key, to read the rows page by page;
+            Each page is read by keyset pagination (`WHERE (page_by) > (last key) ORDER BY page_by LIMIT page_size`),
+            and the key of its last row is committed to the `Checkpoint` of `validate_db()`,
+            so an interrupted rule resumes from the page after it.
+            The values of the columns must be numbers or strings.
+        page_size : int
+            number of rows of each page when `page_by` is specified
         """
         super().__init__()
 
+        if page_by is not None and len(page_by) <= 0:
+            raise ValueError("page_by must contain at least one column")
+        if page_size <= 0:
+            raise ValueError(
+                f"page_size must be positive; actually specified: {page_size}"
+            )
+
         self._sql = sql
         self._id_of_row = id_of_row
         self._level = level
@@ -65,11 +115,23 @@ class SQLAlchemyRule(t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE
         self._msg = msg
         self._datasource = datasource
         self._embedders = embedders if embedders is not None else []
+        self._cost_budget = cost_budget
+        self._precheck = precheck
+        self._timeout = timeout
+        self._page_by = page_by
+        self._page_size = page_size
 
     @property
     def sql(self) -> str:
         return self._sql
 
+    @property
+    def precheck(self) -> t.Optional[str]:
+        return self._precheck
+
+    def datasource_names(self) -> t.Iterator[str]:
+        return iter((self._datasource,))
+
     def id_of_row(self, embedded_vars: EmbeddedVariables) -> ID:
         return self._id_of_row(embedded_vars)
 
@@ -85,28 +147,52 @@ class SQLAlchemyRule(t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE
     def embedders(self) -> t.Iterator[str]:
         return iter(self._embedders)
 
+    def cost_budget(self) -> t.Optional[CostBudget]:
+        return self._cost_budget
+
+    def timeout(self) -> t.Optional[float]:
+        return self._timeout
+
+    def fingerprint(self) -> str:
+        # the key to resume from depends on the columns of pages
+        return extend_fingerprint(
+            super().fingerprint(),
+            self._id_of_row,
+            self._msg,
+            list(self._page_by) if self._page_by is not None else None,
+        )
+
     @property
     def datasource_name(self) -> str:
         return self._datasource
 
-    def exec(
-        self,
-        *,
-        datasources: DataSources,
-        detected: DetectedType[ID, DETECTION_TYPE, MSG],
-        embedders: t.Mapping[str, Embedder],
-    ) -> t.Sequence[Detected[ID, DETECTION_TYPE, MSG]]:
+    def _get_datasource(self, datasources: DataSources) -> SQLAlchemyDataSource:
         datasource = datasources[self.datasource_name]
         if not isinstance(datasource, SQLAlchemyDataSource):
             raise TypeError(
                 f"the data source for ${self.__class__.__name__} must be ${SQLAlchemyDataSource.__name__}; actual={type(datasource)}"
             )
+        return datasource
 
-        sql = text(self.sql)
+    def estimate(self, *, datasources: DataSources) -> t.Optional[QueryEstimate]:
+        return self._get_datasource(datasources).explain(self.sql)
 
-        sql_result = datasource.session.execute(sql)
-        return [
-            self.detect(
+    def exec(
+        self,
+        *,
+        datasources: DataSources,
+        detected: DetectedType[ID, DETECTION_TYPE, MSG],
+        embedders: t.Mapping[str, Embedder],
+    ) -> t.Iterator[Detected[ID, DETECTION_TYPE, MSG]]:
+        datasource = self._get_datasource(datasources)
+        execution = current_execution()
+
+        for row in self._rows(datasource, self.sql, {}, execution):
+            if execution is not None:
+                if execution.cancelled:
+                    return
+                execution.add_rows()
+            yield self.detect(
                 embedded_vars=EmbeddedVariables(
                     row,
                     row._mapping,  # type: ignore
@@ -114,14 +200,54 @@ class SQLAlchemyRule(t.Generic[ID, DETECTION_TYPE, MSG], Rule[ID, DETECTION_TYPE
                 constructor=detected,
                 embedders=embedders,
             )
-            for row in sql_result
-        ]
+
+    def _rows(
+        self,
+        datasource: SQLAlchemyDataSource,
+        sql: str,
+        params: t.Mapping[str, t.Any],
+        execution: t.Optional[RuleExecution],
+    ) -> t.Iterator[t.Any]:
+        """the rows of the query, read page by page if `page_by` is specified"""
+        timeout = execution.timeout if execution is not None else None
+        if self._page_by is None:
+            with datasource.query(sql, params=params, timeout=timeout) as sql_result:
+                yield from sql_result
+            return
+
+        after = execution.resume_key if execution is not None else None
+        while True:
+            paged_sql, page_params = page_query(
+                sql,
+                page_by=self._page_by,
+                after=after,
+                page_size=self._page_size,
+                dialect=datasource.engine.dialect,
+            )
+            rows = 0
+            with datasource.query(
+                paged_sql, params={**params, **page_params}, timeout=timeout
+            ) as sql_result:
+                for row in sql_result:
+                    rows += 1
+                    after = [row._mapping[column] for column in self._page_by]
+                    yield row
+            if rows <= 0:
+                return
+            # resumed only here, once the detections of the last row have been consumed
+            if execution is not None:
+                execution.commit_progress(after)
+            if rows < self._page_size:
+                return
 
 
 class SimpleSQLAlchemyRule(SQLAlchemyRule[str, str, str]):
-    _formatter = MessageFormatter()
     _id_template: str
-    _msg_template: str
+    _msg_template: MessageTemplate
+    _render_in_sql: bool
+    _defer_msg: bool
+    _columns: t.Optional[t.Sequence[str]]
+    _columns_lock: threading.Lock
 
     def __init__(
         self,
@@ -133,6 +259,14 @@ class SimpleSQLAlchemyRule(SQLAlchemyRule[str, str, str]):
         msg: str,
         datasource: str,
         embedders: t.Optional[t.Sequence[str]] = None,
+        max_estimated_rows: t.Optional[float] = None,
+        max_estimated_cost: t.Optional[float] = None,
+        precheck: t.Optional[str] = None,
+        timeout: t.Optional[float] = None,
+        render_in_sql: bool = False,
+        defer_msg: bool = False,
+        page_by: t.Union[str, t.Sequence[str], None] = None,
+        page_size: int = DEFAULT_PAGE_SIZE,
     ) -> None:
         """create a validation rule
 
@@ -160,6 +294,36 @@ class SimpleSQLAlchemyRule(SQLAlchemyRule[str, str, str]):
         embedders: Sequence[Embedder]
             Generator of embedding variables to be used when creating messages.
             If not specified, only fields obtained by SQL can be embedded.
+        max_estimated_rows : float, optional
+            maximum number of rows estimated to be examined by `sql`;
+            It is checked by `CostGuard`.
+        max_estimated_cost : float, optional
+            maximum cost of `sql` estimated by the planner of the datasource;
+            It is checked by `CostGuard`.
+        precheck : str, optional
+            cheap query which gates the rule, such as `SELECT COUNT(*) FROM t WHERE updated_at >= CURRENT_DATE`;
+            If it returns no rows, NULL or zero, `sql` is not executed.
+        timeout : float, optional
+            time limit of the rule in seconds;
+            If not specified, the default timeout of `validate_db()` is applied.
+        render_in_sql : bool
+            whether to render `id` and `msg` by the database instead of Python;
+            The templates are compiled into concatenation of the columns wrapped around `sql`
+            (MySQL, MariaDB, PostgreSQL and SQLite), so no formatting is done for each row in Python.
+            Only plain fields such as `{1}` and `{Population}` referring to columns or
+            `Embedder.scalar_variables()` can be compiled; otherwise the templates are rendered by Python.
+            Values are converted to strings by the database, so floats and dates may be
+            rendered differently from Python.
+        defer_msg : bool
+            whether to render `msg` on first access of `Detected.msg` instead of on detection;
+            It saves the time and memory to render messages which are never output,
+            e.g. when only the counts of detections are reported.
+        page_by : str | Sequence[str], optional
+            column(s) of `sql` which identify a row, to read the rows page by page;
+            An interrupted rule resumes from the last page when the validation is resumed from a `Checkpoint`.
+            See `SQLAlchemyRule`.
+        page_size : int
+            number of rows of each page when `page_by` is specified
         """
         super().__init__(
             sql=sql,
@@ -169,9 +333,124 @@ class SimpleSQLAlchemyRule(SQLAlchemyRule[str, str, str]):
             msg=self._get_message,
             datasource=datasource,
             embedders=embedders,
+            cost_budget=(
+                CostBudget(max_rows=max_estimated_rows, max_cost=max_estimated_cost)
+                if max_estimated_rows is not None or max_estimated_cost is not None
+                else None
+            ),
+            precheck=precheck,
+            timeout=timeout,
+            page_by=[page_by] if isinstance(page_by, str) else page_by,
+            page_size=page_size,
         )
         self._id_template = id
-        self._msg_template = msg
+        self._msg_template = MessageTemplate(msg)
+        self._render_in_sql = render_in_sql
+        self._defer_msg = defer_msg
+        self._columns = None
+        self._columns_lock = threading.Lock()
+
+    def fingerprint(self) -> str:
+        # values may be rendered differently by the database
+        return extend_fingerprint(
+            super().fingerprint(),
+            self._id_template,
+            self._msg_template.template,
+            self._render_in_sql,
+        )
+
+    def exec(
+        self,
+        *,
+        datasources: DataSources,
+        detected: DetectedType[str, str, str],
+        embedders: t.Mapping[str, Embedder],
+    ) -> t.Iterator[Detected[str, str, str]]:
+        rendering = (
+            self._compile_rendering(datasources, embedders)
+            if self._render_in_sql
+            else None
+        )
+        if rendering is None:
+            yield from super().exec(
+                datasources=datasources, detected=detected, embedders=embedders
+            )
+            return
+
+        sql, params = rendering
+        datasource = self._get_datasource(datasources)
+        execution = current_execution()
+        extenders = [embedders[name] for name in self.embedders()]
+        level = self.level()
+        detection_type = self.detection_type()
+
+        for row in self._rows(datasource, sql, params, execution):
+            if execution is not None:
+                if execution.cancelled:
+                    return
+                execution.add_rows()
+            embedded_vars = EmbeddedVariables(
+                row[:-2],
+                row._mapping,  # type: ignore
+            )
+            yield detected(
+                row[-2],
+                level,
+                detection_type,
+                row[-1],
+                embedded_vars.extended(extenders) if extenders else embedded_vars,
+            )
+
+    def _compile_rendering(
+        self, datasources: DataSources, embedders: t.Mapping[str, Embedder]
+    ) -> t.Optional[t.Tuple[str, t.Mapping[str, str]]]:
+        """compile the templates into the query; None if they must be rendered by Python"""
+        scalars: t.Dict[str, t.Any] = {}
+        for name in self.embedders():
+            scalar_variables = embedders[name].scalar_variables()
+            if scalar_variables is None:
+                logger.debug(
+                    "rule %s is rendered by Python since embedder %s depends on rows",
+                    self.detection_type(),
+                    name,
+                )
+                return None
+            scalars.update(scalar_variables)
+
+        datasource = self._get_datasource(datasources)
+        columns = self._get_columns(datasource)
+        rendering = (
+            compile_rendering(
+                self.sql,
+                id_template=self._id_template,
+                msg_template=self._msg_template.template,
+                columns=columns,
+                scalars=scalars,
+                dialect=datasource.engine.dialect,
+            )
+            if columns is not None
+            else None
+        )
+        if rendering is None:
+            logger.debug(
+                "rule %s is rendered by Python since its templates cannot be compiled",
+                self.detection_type(),
+            )
+        return rendering
+
+    def _get_columns(
+        self, datasource: SQLAlchemyDataSource
+    ) -> t.Optional[t.Sequence[str]]:
+        with self._columns_lock:
+            if self._columns is None:
+                try:
+                    with datasource.query(columns_query(self.sql)) as result:
+                        self._columns = list(result.keys())
+                except DBAPIError:
+                    # e.g. the query cannot be a subquery
+                    logger.debug("failed to get columns of %s", self.sql, exc_info=True)
+                    return None
+            return self._columns
 
     def _get_id_of_row(self, embedded_vars: EmbeddedVariables) -> str:
         return self._id_template.format(
@@ -179,6 +458,11 @@ class SimpleSQLAlchemyRule(SQLAlchemyRule[str, str, str]):
         )
 
     def _get_message(self, embedded_vars: EmbeddedVariables) -> str:
-        return self._formatter.vformat(
-            self._msg_template, embedded_vars.sequence, embedded_vars.mapping
-        )
+        return self._msg_template.render(embedded_vars.sequence, embedded_vars.mapping)
+
+    def deferred_message(
+        self, embedded_vars: EmbeddedVariables
+    ) -> t.Optional[DeferredMessage]:
+        if not self._defer_msg:
+            return None
+        return DeferredMessage(self._msg_template, embedded_vars)
@@ -0,0 +1,21 @@
+from ._cron import CronSchedule, Schedule
+from ._scheduler import (
+    CostAwareScheduler,
+    LevelScheduler,
+    ScheduledRule,
+    SchedulePlan,
+    Scheduler,
+)
+from ._stats import RuleStats, RuleStatsStore
+
+__all__ = [
+    "CostAwareScheduler",
+    "CronSchedule",
+    "LevelScheduler",
+    "RuleStats",
+    "RuleStatsStore",
+    "Schedule",
+    "ScheduledRule",
+    "SchedulePlan",
+    "Scheduler",
+]
@@ -0,0 +1,199 @@
+from dataclasses import dataclass
+import datetime
+import typing as t
+
+# name, minimum and maximum of each field
+_FIELDS: t.Sequence[t.Tuple[str, int, int]] = (
+    ("minute", 0, 59),
+    ("hour", 0, 23),
+    ("day of month", 1, 31),
+    ("month", 1, 12),
+    ("day of week", 0, 7),
+)
+
+_ALIASES: t.Mapping[str, str] = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+
+# the next matching time is searched at most this far
+_MAX_SEARCH = datetime.timedelta(days=366 * 5)
+
+
+class CronSchedule:
+    """schedule written in the format of crontab
+
+    Five fields (minute, hour, day of month, month, day of week) are supported
+    with `*`, lists (`1,15`), ranges (`1-5`) and steps (`*/10`, `0-30/5`),
+    as well as aliases such as `@hourly` and `@daily`.
+    Names of months and days of week are not supported.
+    As in cron, if both the day of month and the day of week are restricted, either of them matches.
+    """
+
+    _expression: str
+    _minutes: t.FrozenSet[int]
+    _hours: t.FrozenSet[int]
+    _days: t.FrozenSet[int]
+    _months: t.FrozenSet[int]
+    _weekdays: t.FrozenSet[int]
+    _days_restricted: bool
+    _weekdays_restricted: bool
+
+    def __init__(self, expression: str) -> None:
+        """parse a schedule
+
+        Parameters
+        ----------
+        expression : str
+            the schedule such as `*/15 * * * *` or `@daily`
+
+        Raises
+        ------
+        ValueError
+            If the expression is not valid.
+        """
+        fields = _ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != len(_FIELDS):
+            raise ValueError(
+                f"cron must have {len(_FIELDS)} fields; actually specified: {expression!r}"
+            )
+
+        values = [
+            _parse_field(field, name, minimum, maximum, expression)
+            for field, (name, minimum, maximum) in zip(fields, _FIELDS)
+        ]
+        self._expression = expression
+        self._minutes, self._hours, self._days, self._months, weekdays = values
+        # both 0 and 7 are Sunday
+        self._weekdays = frozenset(weekday % 7 for weekday in weekdays)
+        self._days_restricted = fields[2] != "*"
+        self._weekdays_restricted = fields[4] != "*"
+
+    @property
+    def expression(self) -> str:
+        return self._expression
+
+    def matches(self, time: datetime.datetime) -> bool:
+        """whether the schedule fires at the minute of the time"""
+        if (
+            time.minute not in self._minutes
+            or time.hour not in self._hours
+            or time.month not in self._months
+        ):
+            return False
+
+        day_matches = time.day in self._days
+        # Monday is 0 in Python, Sunday is 0 in cron
+        weekday_matches = (time.weekday() + 1) % 7 in self._weekdays
+        if self._days_restricted and self._weekdays_restricted:
+            return day_matches or weekday_matches
+        return day_matches and weekday_matches
+
+    def next_after(self, time: datetime.datetime) -> datetime.datetime:
+        """the first time when the schedule fires after the time
+
+        Parameters
+        ----------
+        time : datetime
+            the time
+
+        Returns
+        -------
+        datetime
+            the time, at the start of a minute, in the same time zone as `time`
+
+        Raises
+        ------
+        ValueError
+            If the schedule never fires, e.g. on February 30th.
+        """
+        candidate = time.replace(second=0, microsecond=0) + datetime.timedelta(
+            minutes=1
+        )
+        limit = time + _MAX_SEARCH
+        while candidate <= limit:
+            if candidate.month not in self._months:
+                # the first minute of the next month
+                next_month = candidate.replace(day=1) + datetime.timedelta(days=32)
+                candidate = next_month.replace(day=1, hour=0, minute=0)
+                continue
+            first_of_day = candidate.replace(
+                hour=min(self._hours), minute=min(self._minutes)
+            )
+            if not self.matches(first_of_day):
+                # the first minute of the next day
+                candidate = (candidate + datetime.timedelta(days=1)).replace(
+                    hour=0, minute=0
+                )
+                continue
+            if candidate.hour not in self._hours:
+                candidate = (candidate + datetime.timedelta(hours=1)).replace(minute=0)
+                continue
+            if candidate.minute not in self._minutes:
+                candidate += datetime.timedelta(minutes=1)
+                continue
+            return candidate
+
+        raise ValueError(f"cron {self._expression!r} never fires")
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self._expression!r})"
+
+
+def _parse_field(
+    field: str, name: str, minimum: int, maximum: int, expression: str
+) -> t.FrozenSet[int]:
+    values: t.Set[int] = set()
+    for part in field.split(","):
+        range_part, _, step_part = part.partition("/")
+        try:
+            step = int(step_part) if step_part else 1
+            if range_part == "*":
+                start, end = minimum, maximum
+            elif "-" in range_part:
+                start_str, end_str = range_part.split("-", 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(range_part)
+                end = maximum if step_part else start
+        except ValueError:
+            raise ValueError(
+                f"{name} of cron must be like '*', '1,2', '1-5' or '*/10'; actually specified: {expression!r}"
+            )
+        if step <= 0:
+            raise ValueError(
+                f"step of {name} of cron must be positive; actually specified: {expression!r}"
+            )
+        if not minimum <= start <= end <= maximum:
+            raise ValueError(
+                f"{name} of cron must be between {minimum} and {maximum}; actually specified: {expression!r}"
+            )
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class Schedule:
+    """A set of rules validated on a schedule by `validb serve`
+
+    Attributes
+    ----------
+    name : str
+        the name of the schedule
+    cron : CronSchedule
+        when the rules are validated
+    detection_types : Sequence[str] | None
+        the detection types of the rules to validate; all the rules if None
+    targets : Sequence[str] | None
+        the targets to validate; all the targets if None
+    """
+
+    name: str
+    cron: CronSchedule
+    detection_types: t.Optional[t.Sequence[str]] = None
+    targets: t.Optional[t.Sequence[str]] = None
@@ -0,0 +1,265 @@
+import abc
+from dataclasses import dataclass
+import heapq
+import itertools
+import typing as t
+
+from ..datasources import DataSources
+from .._ruleresult import RuleOutcome, RuleResult
+from ..rules import Rule
+from ._stats import RuleStatsStore
+
+
+DEFAULT_SECONDS_PER_ROW = 1e-5
+
+
+@dataclass
+class ScheduledRule:
+    """A rule with its predicted wall time
+
+    Attributes
+    ----------
+    rule : Rule
+        the rule
+    predicted_elapsed : float | None
+        predicted wall time in seconds; None if unknown
+    """
+
+    rule: Rule[t.Any, t.Any, t.Any]
+    predicted_elapsed: t.Optional[float] = None
+
+
+@dataclass
+class SchedulePlan:
+    """Order of execution of rules
+
+    Attributes
+    ----------
+    stages : Sequence[Sequence[ScheduledRule]]
+        stages executed one after another;
+        Rules in a stage are started in the order of the sequence and
+        may be executed in parallel.
+    """
+
+    stages: t.Sequence[t.Sequence[ScheduledRule]]
+
+    def predicted_elapsed(self, workers: int) -> t.Optional[float]:
+        """predict wall time of the whole plan
+
+        Rules of unknown wall time are regarded as taking no time.
+
+        Parameters
+        ----------
+        workers : int
+            number of rules executed in parallel
+
+        Returns
+        -------
+        float | None
+            predicted wall time in seconds; None if no rule has a predicted time
+        """
+        if all(
+            scheduled.predicted_elapsed is None
+            for stage in self.stages
+            for scheduled in stage
+        ):
+            return None
+
+        return sum(
+            _makespan(
+                (scheduled.predicted_elapsed or 0.0 for scheduled in stage), workers
+            )
+            for stage in self.stages
+        )
+
+
+class Scheduler(abc.ABC):
+    """decides the order of execution of rules"""
+
+    @abc.abstractmethod
+    def plan(
+        self,
+        rules: t.Collection[Rule[t.Any, t.Any, t.Any]],
+        *,
+        datasources: DataSources,
+        workers: int,
+    ) -> SchedulePlan:
+        """decide the order of execution of rules
+
+        Parameters
+        ----------
+        rules : Collection[Rule]
+            rules to be executed
+        datasources : DataSources
+            datasources, which may be used for estimation
+        workers : int
+            number of rules executed in parallel
+
+        Returns
+        -------
+        SchedulePlan
+            the plan
+        """
+        ...
+
+    def record(self, results: t.Sequence[RuleResult]) -> None:
+        """receive results of executed rules
+
+        It is called after the execution of the plan.
+
+        Parameters
+        ----------
+        results : Sequence[RuleResult]
+            results of the executed rules
+        """
+        pass
+
+
+class LevelScheduler(Scheduler):
+    """Scheduler which executes rules in descending order of level
+
+    Rules of the same level are executed in the given order.
+    """
+
+    def plan(
+        self,
+        rules: t.Collection[Rule[t.Any, t.Any, t.Any]],
+        *,
+        datasources: DataSources,
+        workers: int,
+    ) -> SchedulePlan:
+        return SchedulePlan(
+            stages=[
+                [ScheduledRule(rule) for rule in rules_of_level]
+                for _, rules_of_level in _group_by_level(rules)
+            ]
+        )
+
+
+class CostAwareScheduler(Scheduler):
+    """Scheduler which executes rules in descending order of level, longest-first within each level
+
+    The wall time of each rule is predicted from statistics of past runs.
+    For rules which have never been recorded, estimation of the datasource (e.g. `EXPLAIN`)
+    is used if available. Rules whose wall time cannot be predicted are executed first
+    since they may be the longest.
+    """
+
+    _stats: RuleStatsStore
+    _use_explain: bool
+    _default_seconds_per_row: float
+    _estimated_rows: t.MutableMapping[str, float]
+
+    def __init__(
+        self,
+        stats: RuleStatsStore,
+        *,
+        use_explain: bool = True,
+        default_seconds_per_row: float = DEFAULT_SECONDS_PER_ROW,
+    ) -> None:
+        """Initialize object
+
+        Parameters
+        ----------
+        stats : RuleStatsStore
+            statistics of past runs;
+            It is updated and saved by `self.record()`.
+        use_explain : bool
+            whether to estimate rules without statistics using `Rule.estimate()`
+        default_seconds_per_row : float
+            wall time per estimated row used until it is learned from statistics
+        """
+        self._stats = stats
+        self._use_explain = use_explain
+        self._default_seconds_per_row = default_seconds_per_row
+        self._estimated_rows = {}
+
+    def plan(
+        self,
+        rules: t.Collection[Rule[t.Any, t.Any, t.Any]],
+        *,
+        datasources: DataSources,
+        workers: int,
+    ) -> SchedulePlan:
+        seconds_per_row = self._seconds_per_row()
+
+        stages: t.List[t.List[ScheduledRule]] = []
+        for _, rules_of_level in _group_by_level(rules):
+            stage = [
+                ScheduledRule(rule, self._predict(rule, datasources, seconds_per_row))
+                for rule in rules_of_level
+            ]
+            stage.sort(
+                key=lambda s: (
+                    s.predicted_elapsed is not None,
+                    -(s.predicted_elapsed or 0.0),
+                )
+            )
+            stages.append(stage)
+
+        return SchedulePlan(stages=stages)
+
+    def record(self, results: t.Sequence[RuleResult]) -> None:
+        for result in results:
+            if result.outcome != RuleOutcome.COMPLETED:
+                continue
+            key = result.rule.fingerprint()
+            self._stats.record(
+                key,
+                elapsed=result.elapsed,
+                rows=result.rows,
+                estimated_rows=self._estimated_rows.get(key),
+            )
+        self._stats.save()
+
+    def _predict(
+        self,
+        rule: Rule[t.Any, t.Any, t.Any],
+        datasources: DataSources,
+        seconds_per_row: float,
+    ) -> t.Optional[float]:
+        key = rule.fingerprint()
+
+        stats = self._stats.get(key)
+        if stats is not None:
+            return stats.elapsed
+
+        if not self._use_explain:
+            return None
+
+        estimate = rule.estimate(datasources=datasources)
+        if estimate is None or estimate.rows is None:
+            return None
+
+        self._estimated_rows[key] = estimate.rows
+        return estimate.rows * seconds_per_row
+
+    def _seconds_per_row(self) -> float:
+        """learn wall time per estimated row from the statistics"""
+        known = [
+            stats
+            for stats in self._stats.values()
+            if stats.estimated_rows is not None and stats.estimated_rows > 0
+        ]
+        total_estimated_rows = sum(stats.estimated_rows or 0.0 for stats in known)
+        if total_estimated_rows <= 0:
+            return self._default_seconds_per_row
+
+        return sum(stats.elapsed for stats in known) / total_estimated_rows
+
+
+def _group_by_level(
+    rules: t.Collection[Rule[t.Any, t.Any, t.Any]],
+) -> t.Iterator[t.Tuple[int, t.List[Rule[t.Any, t.Any, t.Any]]]]:
+    """group rules by level in descending order of level, keeping the order in each group"""
+    sorted_rules = sorted(rules, key=lambda r: r.level(), reverse=True)
+    for level, group in itertools.groupby(sorted_rules, key=lambda r: r.level()):
+        yield level, list(group)
+
+
+def _makespan(elapsed_list: t.Iterable[float], workers: int) -> float:
+    """wall time when jobs are started in the order on the first free worker"""
+    loads = [0.0] * max(workers, 1)
+    for elapsed in elapsed_list:
+        heapq.heapreplace(loads, loads[0] + elapsed)
+    return max(loads)
@@ -0,0 +1,152 @@
+from dataclasses import asdict, dataclass
+import json
+import os
+import pathlib
+import threading
+import typing as t
+
+
+@dataclass
+class RuleStats:
+    """Statistics of past executions of a rule
+
+    Attributes
+    ----------
+    elapsed : float
+        wall time of the rule, in seconds; it is smoothed over runs
+    rows : int
+        number of rows read by the rule in the last run
+    estimated_rows : float | None
+        number of rows estimated by the datasource in the last run; None if unknown
+    runs : int
+        number of recorded runs
+    """
+
+    elapsed: float
+    rows: int
+    estimated_rows: t.Optional[float] = None
+    runs: int = 1
+
+
+class RuleStatsStore:
+    """Statistics of rules stored in a local JSON file
+
+    The statistics are keyed by `Rule.fingerprint()`.
+    It can be shared between threads.
+    """
+
+    _path: pathlib.Path
+    _smoothing: float
+    _stats: t.MutableMapping[str, RuleStats]
+    _lock: threading.Lock
+
+    def __init__(
+        self, path: t.Union[str, pathlib.Path], *, smoothing: float = 0.5
+    ) -> None:
+        """Initialize object
+
+        The statistics are read from the file if it exists.
+
+        Parameters
+        ----------
+        path : str | Path
+            path to the statistics file
+        smoothing : float
+            weight of the latest run when updating `RuleStats.elapsed`;
+            1.0 means that only the latest run is used.
+        """
+        self._path = pathlib.Path(path)
+        self._smoothing = smoothing
+        self._stats = {}
+        self._lock = threading.Lock()
+
+        if self._path.exists():
+            with open(self._path, mode="r", encoding="utf_8") as fp:
+                self._stats = {
+                    key: RuleStats(**value) for key, value in json.load(fp).items()
+                }
+
+    def get(self, key: str) -> t.Optional[RuleStats]:
+        """get the statistics of the rule
+
+        Parameters
+        ----------
+        key : str
+            the fingerprint of the rule
+
+        Returns
+        -------
+        RuleStats | None
+            the statistics; None if the rule has never been recorded
+        """
+        with self._lock:
+            return self._stats.get(key)
+
+    def values(self) -> t.Iterable[RuleStats]:
+        with self._lock:
+            return list(self._stats.values())
+
+    def record(
+        self,
+        key: str,
+        *,
+        elapsed: float,
+        rows: int,
+        estimated_rows: t.Optional[float] = None,
+    ) -> None:
+        """record an execution of the rule
+
+        Parameters
+        ----------
+        key : str
+            the fingerprint of the rule
+        elapsed : float
+            wall time of the rule, in seconds
+        rows : int
+            number of rows read by the rule
+        estimated_rows : float | None
+            number of rows estimated by the datasource
+        """
+        with self._lock:
+            self._record(
+                key, elapsed=elapsed, rows=rows, estimated_rows=estimated_rows
+            )
+
+    def _record(
+        self,
+        key: str,
+        *,
+        elapsed: float,
+        rows: int,
+        estimated_rows: t.Optional[float],
+    ) -> None:
+        previous = self._stats.get(key)
+        if previous is None:
+            self._stats[key] = RuleStats(
+                elapsed=elapsed, rows=rows, estimated_rows=estimated_rows
+            )
+        else:
+            self._stats[key] = RuleStats(
+                elapsed=self._smoothing * elapsed
+                + (1 - self._smoothing) * previous.elapsed,
+                rows=rows,
+                estimated_rows=(
+                    estimated_rows
+                    if estimated_rows is not None
+                    else previous.estimated_rows
+                ),
+                runs=previous.runs + 1,
+            )
+
+    def save(self) -> None:
+        """write the statistics to the file"""
+        with self._lock:
+            tmp_path = self._path.with_name(self._path.name + ".tmp")
+            with open(tmp_path, mode="w", encoding="utf_8") as fp:
+                json.dump(
+                    {key: asdict(value) for key, value in self._stats.items()},
+                    fp,
+                    indent=2,
+                    sort_keys=True,
+                )
+            os.replace(tmp_path, self._path)
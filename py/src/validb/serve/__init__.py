@@ -0,0 +1,8 @@
+from ._http import create_server
+from ._service import ServiceRun, ValidationService
+
+__all__ = [
+    "ServiceRun",
+    "ValidationService",
+    "create_server",
+]
@@ -0,0 +1,182 @@
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import socketserver
+import stat
+import typing as t
+import urllib.parse
+
+from ._service import ValidationService
+
+logger = logging.getLogger(__name__)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """the endpoints of `validb serve`
+
+    - `GET /health`: the state of the service and its schedules
+    - `GET /metrics`: the metrics of the last validation in the OpenMetrics text format
+    - `POST /validate`: validate the rules and return the counts;
+      the query parameters (or the keys of a JSON body) `detection_type` and `target` select the rules and targets,
+      and `detections` is the maximum number of detections listed in the response
+    - `POST /reload`: reload the config even if its file is unchanged
+    """
+
+    server: t.Union["_TCPServer", "_UnixServer"]
+
+    def do_GET(self) -> None:
+        path = urllib.parse.urlsplit(self.path).path
+        if path == "/health":
+            self._send_json(HTTPStatus.OK, self.server.service.status())
+        elif path == "/metrics":
+            metrics = self.server.service.metrics()
+            if metrics is None:
+                self._send_json(HTTPStatus.NOT_FOUND, {"error": "no validation has run"})
+            else:
+                self._send(
+                    HTTPStatus.OK,
+                    metrics.encode("utf_8"),
+                    "application/openmetrics-text; version=1.0.0; charset=utf-8",
+                )
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"not found: {path}"})
+
+    def do_POST(self) -> None:
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/validate":
+            self._validate(url.query)
+        elif url.path == "/reload":
+            reloaded = self.server.service.reload(force=True)
+            self._send_json(HTTPStatus.OK, {"reloaded": reloaded})
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": f"not found: {url.path}"})
+
+    def _validate(self, query: str) -> None:
+        try:
+            params = self._params(query)
+            detection_types = _strings(params.get("detection_type"), "detection_type")
+            targets = _strings(params.get("target"), "target")
+            max_detections = int(_single(params.get("detections", 0)))
+            if max_detections < 0:
+                raise ValueError(
+                    f"detections must not be negative; actually specified: {max_detections}"
+                )
+            run = self.server.service.validate(
+                detection_types=detection_types, targets=targets
+            )
+        except ValueError as e:
+            self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+
+        status = HTTPStatus.OK if run.error is None else HTTPStatus.INTERNAL_SERVER_ERROR
+        self._send_json(status, run.to_dict(max_detections=max_detections))
+
+    def _params(self, query: str) -> t.Dict[str, t.Any]:
+        params: t.Dict[str, t.Any] = dict(urllib.parse.parse_qs(query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > 0:
+            body = json.loads(self.rfile.read(length))
+            if not isinstance(body, dict):
+                raise ValueError("body must be a JSON object")
+            params.update(body)
+        return params
+
+    def _send_json(self, status: HTTPStatus, body: t.Mapping[str, t.Any]) -> None:
+        self._send(status, json.dumps(body).encode("utf_8"), "application/json")
+
+    def _send(self, status: HTTPStatus, body: bytes, content_type: str) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # the address of a client of a Unix socket is empty
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "unix"
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        logger.info("%s %s", self.address_string(), format % args)
+
+
+def _strings(value: t.Any, name: str) -> t.Optional[t.List[str]]:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value]
+    if isinstance(value, list) and all(isinstance(v, str) for v in value):
+        return value
+    raise ValueError(f"{name} must be a string or a list of strings; actually specified: {value!r}")
+
+
+def _single(value: t.Any) -> t.Any:
+    # a query parameter is parsed into a list
+    return value[-1] if isinstance(value, list) else value
+
+
+class _TCPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    service: ValidationService
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    service: ValidationService
+
+    def server_bind(self) -> None:
+        # a socket left by a previous process which did not exit cleanly
+        try:
+            if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+        super().server_bind()
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+
+def create_server(
+    service: ValidationService,
+    *,
+    host: str = "127.0.0.1",
+    port: int = 8765,
+    unix_socket: t.Optional[str] = None,
+) -> socketserver.BaseServer:
+    """create the HTTP server of a validation service
+
+    Call `serve_forever()` of the returned server to handle requests,
+    and `shutdown()` and `server_close()` to stop it.
+    The server has no authentication, so bind it only to a local address or a Unix socket.
+
+    Parameters
+    ----------
+    service : ValidationService
+        the started service
+    host : str
+        the address to listen on
+    port : int
+        the port to listen on; a free port is chosen if 0
+    unix_socket : str, optional
+        the path of the Unix socket to listen on instead of `host` and `port`
+
+    Returns
+    -------
+    BaseServer
+        the server, which handles each request in a thread of its own
+    """
+    server: t.Union[_TCPServer, _UnixServer]
+    if unix_socket is not None:
+        server = _UnixServer(unix_socket, _Handler)
+    else:
+        server = _TCPServer((host, port), _Handler)
+    server.service = service
+    return server
@@ -0,0 +1,627 @@
+from dataclasses import dataclass, field
+import datetime
+import logging
+import os
+import pathlib
+import threading
+import time
+import typing as t
+
+from .._costguard import CostBudgetExceededError
+from .._detectiondata import DetectionData
+from .._hooks import ValidationHook
+from .._targets import TargetResult, validate_targets
+from .._validate import validate_db
+from ..config import Config, load_config
+from ..datasources import DataSources
+from ..metrics import OpenMetricsExporter
+from ..scheduling import Schedule, Scheduler
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ServiceRun:
+    """A validation executed by `ValidationService`
+
+    Attributes
+    ----------
+    started_at : datetime
+        when the validation started, in local time
+    elapsed : float
+        wall time of the validation in seconds
+    detection_data : DetectionData | None
+        the result if no target is defined in the config; otherwise None
+    target_results : Mapping[str, TargetResult]
+        the results keyed by the name of the target; empty if no target is defined in the config
+    schedule : str | None
+        the name of the schedule which started the validation; None if it was requested
+    error : str | None
+        the reason why the validation failed; None if it succeeded
+    """
+
+    started_at: datetime.datetime
+    elapsed: float
+    detection_data: t.Optional[DetectionData[str, str, str]] = None
+    target_results: t.Mapping[str, TargetResult[str, str, str]] = field(
+        default_factory=dict
+    )
+    schedule: t.Optional[str] = None
+    error: t.Optional[str] = None
+
+    @property
+    def total_count(self) -> int:
+        """the number of anomalies detected, including those not kept"""
+        if self.detection_data is not None:
+            return self.detection_data.total_count
+        return sum(
+            result.detection_data.total_count
+            for result in self.target_results.values()
+            if result.detection_data is not None
+        )
+
+    def to_dict(self, *, max_detections: int = 0) -> t.Dict[str, t.Any]:
+        """the run as a JSON-serializable dict
+
+        Parameters
+        ----------
+        max_detections : int
+            the maximum number of detections listed for each result; only the counts if 0
+        """
+        run: t.Dict[str, t.Any] = {
+            "schedule": self.schedule,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "elapsed": self.elapsed,
+            "total_count": self.total_count,
+        }
+        if self.error is not None:
+            run["error"] = self.error
+        if self.detection_data is not None:
+            run.update(_summarize(self.detection_data, max_detections))
+        if len(self.target_results) > 0:
+            run["targets"] = {
+                name: (
+                    _summarize(result.detection_data, max_detections)
+                    if result.detection_data is not None
+                    else {"error": str(result.error)}
+                )
+                for name, result in self.target_results.items()
+            }
+        return run
+
+
+def _summarize(
+    detection_data: DetectionData[str, str, str], max_detections: int
+) -> t.Dict[str, t.Any]:
+    summary: t.Dict[str, t.Any] = {
+        "total_count": detection_data.total_count,
+        "counts": {
+            str(detection_type): detection_data.count_of(detection_type)
+            for detection_type in detection_data.detection_types()
+        },
+        "too_many_detection": detection_data.too_many_detection,
+        "failed_fast": detection_data.failed_fast,
+        "rules": [
+            {
+                "detection_type": str(result.rule.detection_type()),
+                "outcome": result.outcome.value,
+                "elapsed": result.elapsed,
+                "rows": result.rows,
+                "detections": result.detections,
+                "detail": result.detail,
+            }
+            for result in detection_data.rule_results
+        ],
+    }
+    if max_detections > 0:
+        detections: t.List[t.Dict[str, t.Any]] = []
+        for detected in detection_data.values():
+            if len(detections) >= max_detections:
+                break
+            detections.append(
+                {
+                    "id": detected.id_str,
+                    "detection_type": detected.detection_type_str,
+                    "level": detected.level,
+                    "msg": detected.msg_str,
+                }
+            )
+        summary["detections"] = detections
+    return summary
+
+
+class _Generation:
+    """a loaded config and its datasources, kept open while runs use them"""
+
+    config: Config[str, str, str]
+    stamp: t.Tuple[int, int]
+    loaded_at: datetime.datetime
+    users: int
+    retired: bool
+
+    def __init__(self, config: Config[str, str, str], stamp: t.Tuple[int, int]):
+        self.config = config
+        self.stamp = stamp
+        self.loaded_at = datetime.datetime.now()
+        self.users = 0
+        self.retired = False
+
+    def all_datasources(self) -> t.List[DataSources]:
+        return [self.config.datasources, *self.config.targets.values()]
+
+    def open(self) -> None:
+        """open the datasources used by the rules so that their connections are warm"""
+        names = [name for rule in self.config.rules for name in rule.datasource_names()]
+        for datasources in self.all_datasources():
+            try:
+                datasources.open(names)
+            except Exception:
+                # they are opened again on first use
+                logger.warning("failed to open datasources in advance", exc_info=True)
+
+    def close(self) -> None:
+        for datasources in self.all_datasources():
+            datasources.close()
+
+
+class ValidationService:
+    """long-lived validator which keeps the datasources open between validations
+
+    The config is reloaded when its file changes; the validations running at that time
+    finish with the old config, whose datasources are closed afterwards.
+    The rules are validated on request by `validate()` and on the schedules of the config (`Config.schedules`).
+    Resources held for threads (e.g. SQLAlchemy sessions) are released whenever no validation is running,
+    while connection pools are kept warm.
+    """
+
+    _config_path: str
+    _cache_dir: t.Union[str, pathlib.Path, None]
+    _reload_interval: float
+    _workers: int
+    _max_detection_per_type: t.Optional[int]
+    _fail_fast_level: t.Optional[int]
+    _default_timeout: t.Optional[float]
+    _scheduler: t.Optional[Scheduler]
+    _hooks: t.Sequence[ValidationHook]
+
+    _lock: threading.Lock
+    _generation: t.Optional[_Generation]
+    _failed_stamp: t.Optional[t.Tuple[int, int]]
+    _runs: threading.Semaphore
+    _running: int
+    _stopped: threading.Event
+    _threads: t.List[threading.Thread]
+    _scheduled: t.Dict[str, threading.Thread]
+    _last_runs: t.Dict[str, ServiceRun]
+    _last_exporter: t.Optional[OpenMetricsExporter]
+
+    def __init__(
+        self,
+        config_path: t.Union[str, pathlib.Path],
+        *,
+        cache_dir: t.Union[str, pathlib.Path, None] = None,
+        reload_interval: float = 2.0,
+        max_concurrent_runs: int = 1,
+        workers: int = 1,
+        max_detection_per_type: t.Optional[int] = None,
+        fail_fast_level: t.Optional[int] = None,
+        default_timeout: t.Optional[float] = None,
+        scheduler: t.Optional[Scheduler] = None,
+        hooks: t.Sequence[ValidationHook] = (),
+    ) -> None:
+        """create a service; it does nothing until `start()`
+
+        Parameters
+        ----------
+        config_path : str | Path
+            the YAML config file
+        cache_dir : str | Path, optional
+            directory to cache the parsed config in; see `load_config()`
+        reload_interval : float
+            interval in seconds to check whether the config file is changed; never checked if 0
+        max_concurrent_runs : int
+            number of validations executed at once; the others wait for them
+        workers : int
+            number of rules executed in parallel; with targets, number of targets validated in parallel
+        max_detection_per_type : int, optional
+            maximum number of detections kept for each detection type; see `validate_db()`
+        fail_fast_level : int, optional
+            the level which stops the validation; see `validate_db()`
+        default_timeout : float, optional
+            time limit in seconds of each rule without its own timeout;
+            `default_timeout` of the config is used if not specified
+        scheduler : Scheduler, optional
+            the scheduler which decides the order of execution of rules; see `validate_db()`
+        hooks : Sequence[ValidationHook]
+            observers of every validation
+        """
+        if reload_interval < 0:
+            raise ValueError(
+                f"reload_interval must not be negative; actually specified: {reload_interval}"
+            )
+        if max_concurrent_runs <= 0:
+            raise ValueError(
+                f"max_concurrent_runs must be positive; actually specified: {max_concurrent_runs}"
+            )
+        self._config_path = os.fspath(config_path)
+        self._cache_dir = cache_dir
+        self._reload_interval = reload_interval
+        self._workers = workers
+        self._max_detection_per_type = max_detection_per_type
+        self._fail_fast_level = fail_fast_level
+        self._default_timeout = default_timeout
+        self._scheduler = scheduler
+        self._hooks = hooks
+
+        self._lock = threading.Lock()
+        self._generation = None
+        self._failed_stamp = None
+        self._runs = threading.Semaphore(max_concurrent_runs)
+        self._running = 0
+        self._stopped = threading.Event()
+        self._threads = []
+        self._scheduled = {}
+        self._last_runs = {}
+        self._last_exporter = None
+
+    def start(self) -> None:
+        """load the config, open the datasources and start the threads watching the config and the schedules
+
+        Raises
+        ------
+        Exception
+            If the config cannot be loaded.
+        """
+        stamp = self._stamp()
+        generation = _Generation(
+            load_config(self._config_path, cache_dir=self._cache_dir), stamp
+        )
+        generation.open()
+        with self._lock:
+            self._generation = generation
+
+        self._stopped.clear()
+        if self._reload_interval > 0:
+            self._start_thread(self._watch_config, "validb-config-watcher")
+        self._start_thread(self._run_schedules, "validb-schedules")
+
+    def _start_thread(self, target: t.Callable[[], None], name: str) -> None:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def close(self) -> None:
+        """stop the threads, wait for the running validations and close the datasources"""
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        with self._lock:
+            scheduled = list(self._scheduled.values())
+        for thread in scheduled:
+            thread.join()
+
+        with self._lock:
+            generation, self._generation = self._generation, None
+            if generation is None:
+                return
+            generation.retired = True
+            idle = generation.users <= 0
+        if idle:
+            generation.close()
+
+    def __enter__(self) -> "ValidationService":
+        self.start()
+        return self
+
+    def __exit__(self, *args: t.Any) -> None:
+        self.close()
+
+    def _stamp(self) -> t.Tuple[int, int]:
+        stat = os.stat(self._config_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, *, force: bool = False) -> bool:
+        """reload the config if its file is changed
+
+        If the new config cannot be loaded, the error is logged and the current config is kept.
+
+        Parameters
+        ----------
+        force : bool
+            whether to reload the config even if its file is unchanged
+
+        Returns
+        -------
+        bool
+            whether the config is reloaded
+        """
+        try:
+            stamp = self._stamp()
+        except OSError:
+            logger.warning("config %s cannot be read", self._config_path, exc_info=True)
+            return False
+        with self._lock:
+            current = self._generation
+        if current is None:
+            return False
+        if not force and stamp in (current.stamp, self._failed_stamp):
+            return False
+
+        try:
+            generation = _Generation(
+                load_config(self._config_path, cache_dir=self._cache_dir), stamp
+            )
+        except Exception:
+            logger.error(
+                "failed to reload config %s; the previous one is kept",
+                self._config_path,
+                exc_info=True,
+            )
+            self._failed_stamp = stamp
+            return False
+        generation.open()
+
+        with self._lock:
+            if self._generation is not current:
+                # closed or reloaded by another thread meanwhile
+                retired = generation
+            else:
+                self._generation, retired = generation, current
+            retired.retired = True
+            idle = retired.users <= 0
+        if idle:
+            retired.close()
+        if retired is current:
+            logger.info("reloaded config %s", self._config_path)
+        return retired is current
+
+    def _watch_config(self) -> None:
+        while not self._stopped.wait(self._reload_interval):
+            self.reload()
+
+    def _acquire(self) -> _Generation:
+        with self._lock:
+            generation = self._generation
+            if generation is None:
+                raise RuntimeError("service is not started")
+            generation.users += 1
+            self._running += 1
+            return generation
+
+    def _release(self, generation: _Generation) -> None:
+        with self._lock:
+            generation.users -= 1
+            self._running -= 1
+            if generation.users > 0:
+                return
+            if not generation.retired:
+                # under the lock so that no validation starts meanwhile
+                for datasources in generation.all_datasources():
+                    datasources.reset()
+                return
+        generation.close()
+
+    def validate(
+        self,
+        *,
+        detection_types: t.Optional[t.Collection[str]] = None,
+        targets: t.Optional[t.Collection[str]] = None,
+        schedule: t.Optional[str] = None,
+    ) -> ServiceRun:
+        """validate the rules with the current config
+
+        Parameters
+        ----------
+        detection_types : Collection[str], optional
+            the detection types of the rules to validate; all the rules if not specified
+        targets : Collection[str], optional
+            the targets to validate; all the targets if not specified
+        schedule : str, optional
+            the name of the schedule starting the validation, recorded in the result
+
+        Returns
+        -------
+        ServiceRun
+            the result
+
+        Raises
+        ------
+        ValueError
+            If unknown detection types or targets are specified.
+        """
+        with self._runs:
+            generation = self._acquire()
+            try:
+                return self._validate(generation, detection_types, targets, schedule)
+            finally:
+                self._release(generation)
+
+    def _validate(
+        self,
+        generation: _Generation,
+        detection_types: t.Optional[t.Collection[str]],
+        target_names: t.Optional[t.Collection[str]],
+        schedule: t.Optional[str],
+    ) -> ServiceRun:
+        config = generation.config
+        rules = config.rules
+        if detection_types is not None:
+            known = {str(rule.detection_type()) for rule in rules}
+            unknown = sorted(set(detection_types) - known)
+            if len(unknown) > 0:
+                raise ValueError(f"unknown detection types: {', '.join(unknown)}")
+            rules = [
+                rule for rule in rules if str(rule.detection_type()) in detection_types
+            ]
+        if target_names is not None:
+            if len(config.targets) <= 0:
+                raise ValueError("no targets are defined in the config")
+            unknown = sorted(set(target_names) - set(config.targets))
+            if len(unknown) > 0:
+                raise ValueError(f"unknown targets: {', '.join(unknown)}")
+
+        exporter = OpenMetricsExporter()
+        hooks = [*self._hooks, exporter]
+        default_timeout = (
+            self._default_timeout
+            if self._default_timeout is not None
+            else config.default_timeout
+        )
+        started_at = datetime.datetime.now()
+        started = time.perf_counter()
+        run = ServiceRun(started_at=started_at, elapsed=0.0, schedule=schedule)
+        try:
+            if len(config.targets) > 0:
+                run.target_results = validate_targets(
+                    targets={
+                        name: datasources
+                        for name, datasources in config.targets.items()
+                        if target_names is None or name in target_names
+                    },
+                    rules=rules,
+                    embedders=config.embedders,
+                    max_workers=self._workers,
+                    max_detection_per_type=self._max_detection_per_type,
+                    scheduler=self._scheduler,
+                    cost_guard=config.cost_guard,
+                    fail_fast_level=self._fail_fast_level,
+                    default_timeout=default_timeout,
+                    hooks=hooks,
+                    close_datasources=False,
+                )
+            else:
+                run.detection_data = validate_db(
+                    rules=rules,
+                    datasources=config.datasources,
+                    embedders=config.embedders,
+                    max_detection_per_type=self._max_detection_per_type,
+                    workers=self._workers,
+                    scheduler=self._scheduler,
+                    cost_guard=config.cost_guard,
+                    fail_fast_level=self._fail_fast_level,
+                    default_timeout=default_timeout,
+                    hooks=hooks,
+                )
+        except CostBudgetExceededError as e:
+            run.error = "over budget: " + ", ".join(
+                f"{rule.detection_type()} ({violation})" for rule, violation in e.violations
+            )
+        except Exception as e:
+            logger.error("validation failed", exc_info=True)
+            run.error = repr(e)
+        run.elapsed = time.perf_counter() - started
+
+        with self._lock:
+            self._last_exporter = exporter
+            if schedule is not None:
+                self._last_runs[schedule] = run
+        return run
+
+    def _run_schedules(self) -> None:
+        last_minute = datetime.datetime.now().replace(second=0, microsecond=0)
+        while True:
+            now = datetime.datetime.now()
+            # wake up just after the start of the next minute
+            if self._stopped.wait(60.0 - now.second - now.microsecond / 1e6 + 0.01):
+                return
+            minute = datetime.datetime.now().replace(second=0, microsecond=0)
+            if minute <= last_minute:
+                continue
+            last_minute = minute
+
+            for schedule in self.schedules():
+                if schedule.cron.matches(minute):
+                    self._start_schedule(schedule)
+
+    def _start_schedule(self, schedule: Schedule) -> None:
+        with self._lock:
+            running = self._scheduled.get(schedule.name)
+            if running is not None and running.is_alive():
+                logger.warning(
+                    "schedule %s is skipped since its previous run is not finished",
+                    schedule.name,
+                )
+                return
+            thread = threading.Thread(
+                target=self._run_schedule,
+                args=(schedule,),
+                name=f"validb-schedule-{schedule.name}",
+                daemon=True,
+            )
+            self._scheduled[schedule.name] = thread
+        thread.start()
+
+    def _run_schedule(self, schedule: Schedule) -> None:
+        logger.info("schedule %s started", schedule.name)
+        try:
+            run = self.validate(
+                detection_types=schedule.detection_types,
+                targets=schedule.targets,
+                schedule=schedule.name,
+            )
+        except Exception:
+            # e.g. the rules of the schedule are removed from the reloaded config
+            logger.error("schedule %s failed", schedule.name, exc_info=True)
+            return
+        logger.info(
+            "schedule %s finished in %.2fs: %d detected%s",
+            schedule.name,
+            run.elapsed,
+            run.total_count,
+            f" ({run.error})" if run.error is not None else "",
+        )
+
+    def schedules(self) -> t.Sequence[Schedule]:
+        """the schedules of the current config"""
+        with self._lock:
+            return self._generation.config.schedules if self._generation else []
+
+    def last_run(self, schedule: str) -> t.Optional[ServiceRun]:
+        """the last validation started by the schedule; None if it has never run"""
+        with self._lock:
+            return self._last_runs.get(schedule)
+
+    def metrics(self) -> t.Optional[str]:
+        """the metrics of the last validation in the OpenMetrics text format; None if nothing has run"""
+        with self._lock:
+            exporter = self._last_exporter
+        return exporter.render() if exporter is not None else None
+
+    def status(self) -> t.Dict[str, t.Any]:
+        """the state of the service as a JSON-serializable dict"""
+        now = datetime.datetime.now()
+        with self._lock:
+            generation = self._generation
+            running = self._running
+        if generation is None:
+            return {"status": "stopped"}
+        config = generation.config
+        return {
+            "status": "ok",
+            "config": self._config_path,
+            "loaded_at": generation.loaded_at.isoformat(timespec="seconds"),
+            "rules": len(config.rules),
+            "targets": list(config.targets),
+            "running": running,
+            "schedules": [
+                self._schedule_status(schedule, now) for schedule in config.schedules
+            ],
+        }
+
+    def _schedule_status(
+        self, schedule: Schedule, now: datetime.datetime
+    ) -> t.Dict[str, t.Any]:
+        last_run = self.last_run(schedule.name)
+        try:
+            next_run: t.Optional[str] = schedule.cron.next_after(now).isoformat(
+                timespec="minutes"
+            )
+        except ValueError:
+            next_run = None
+        return {
+            "name": schedule.name,
+            "cron": schedule.cron.expression,
+            "next_run": next_run,
+            "last_run": last_run.to_dict() if last_run is not None else None,
+        }
@@ -0,0 +1,156 @@
+import datetime
+import logging
+import marshal
+import os
+import pathlib
+import time
+import typing as t
+
+import pytest
+
+from validb.config import _cache
+from validb.config._cache import load_cached
+
+HOUR_NS = 3600 * 10**9
+
+
+class CountingCompiler:
+    def __init__(self) -> None:
+        self.sources: t.List[bytes] = []
+
+    def __call__(self, source: bytes) -> t.Dict[str, t.Any]:
+        self.sources.append(source)
+        return {"source": source.decode("utf_8")}
+
+
+def write(path: pathlib.Path, content: str, mtime_ns: t.Optional[int] = None) -> None:
+    path.write_text(content)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def an_hour_ago() -> int:
+    return time.time_ns() - HOUR_NS
+
+
+@pytest.fixture
+def config_path(tmp_path: pathlib.Path) -> pathlib.Path:
+    path = tmp_path / "validb.yml"
+    write(path, "a: 1", an_hour_ago())
+    return path
+
+
+def test_unchanged_file_is_not_compiled_again(config_path, tmp_path):
+    compile = CountingCompiler()
+    cache_dir = tmp_path / "cache"
+
+    assert load_cached(config_path, cache_dir, compile) == {"source": "a: 1"}
+    assert load_cached(str(config_path), cache_dir, compile) == {"source": "a: 1"}
+    assert len(compile.sources) == 1
+    assert len(list(cache_dir.iterdir())) == 1
+
+
+def test_changed_file_is_compiled_again(config_path, tmp_path):
+    compile = CountingCompiler()
+    load_cached(config_path, tmp_path, compile)
+
+    write(config_path, "a: 22")
+    assert load_cached(config_path, tmp_path, compile) == {"source": "a: 22"}
+    assert len(compile.sources) == 2
+
+
+def test_touched_file_is_verified_by_hash(config_path, tmp_path):
+    compile = CountingCompiler()
+    load_cached(config_path, tmp_path, compile)
+
+    os.utime(config_path)
+    assert load_cached(config_path, tmp_path, compile) == {"source": "a: 1"}
+    assert len(compile.sources) == 1
+
+
+def test_file_modified_within_mtime_granularity_is_verified_by_hash(tmp_path):
+    compile = CountingCompiler()
+    path = tmp_path / "validb.yml"
+    mtime_ns = time.time_ns()
+    write(path, "a: 1", mtime_ns)
+    load_cached(path, tmp_path, compile)
+
+    # modified again within the same tick of a coarse clock:
+    # mtime and size are unchanged
+    write(path, "a: 2", mtime_ns)
+    assert load_cached(path, tmp_path, compile) == {"source": "a: 2"}
+    assert len(compile.sources) == 2
+
+
+def test_old_file_is_trusted_by_mtime_and_size(config_path, tmp_path):
+    compile = CountingCompiler()
+    load_cached(config_path, tmp_path, compile)
+    mtime_ns = config_path.stat().st_mtime_ns
+
+    # the content is not read, so a change hiding mtime and size is not noticed
+    write(config_path, "a: 2", mtime_ns)
+    assert load_cached(config_path, tmp_path, compile) == {"source": "a: 1"}
+    assert len(compile.sources) == 1
+
+
+def test_entries_of_other_versions_are_ignored(config_path, tmp_path, monkeypatch):
+    compile = CountingCompiler()
+    load_cached(config_path, tmp_path, compile)
+
+    monkeypatch.setattr(_cache, "__version__", "0.0.0")
+    load_cached(config_path, tmp_path, compile)
+    assert len(compile.sources) == 2
+
+
+def test_broken_entry_is_ignored(config_path, tmp_path, caplog):
+    compile = CountingCompiler()
+    load_cached(config_path, tmp_path, compile)
+    [entry_path] = [path for path in tmp_path.iterdir() if path.suffix == ".marshal"]
+    entry_path.write_bytes(b"broken")
+
+    with caplog.at_level(logging.WARNING):
+        assert load_cached(config_path, tmp_path, compile) == {"source": "a: 1"}
+    assert len(compile.sources) == 2
+    assert "broken config cache" in caplog.text
+    # the entry is repaired
+    assert marshal.loads(entry_path.read_bytes())["data"] == {"source": "a: 1"}
+
+
+def test_unserializable_result_is_not_cached(config_path, tmp_path):
+    calls: t.List[bytes] = []
+
+    def compile(source: bytes) -> t.Any:
+        calls.append(source)
+        return {"date": datetime.date(2020, 1, 1)}
+
+    cache_dir = tmp_path / "cache"
+    assert load_cached(config_path, cache_dir, compile) == {
+        "date": datetime.date(2020, 1, 1)
+    }
+    load_cached(config_path, cache_dir, compile)
+    assert len(calls) == 2
+    assert not cache_dir.exists() or list(cache_dir.iterdir()) == []
+
+
+def test_load_config_with_cache(tmp_path, sqlite_path, monkeypatch):
+    pytest.importorskip("yaml")
+    pytest.importorskip("sqlalchemy")
+    from validb.config import _load, load_config
+    from tests.helpers import write_country_config
+
+    config_path = write_country_config(tmp_path / "validb.yml", sqlite_path)
+    os.utime(config_path, ns=(an_hour_ago(), an_hour_ago()))
+    cache_dir = tmp_path / "cache"
+    uncached = load_config(config_path)
+    load_config(config_path, cache_dir=cache_dir)
+
+    def parse_forbidden(source: bytes) -> t.NoReturn:
+        raise AssertionError("the config must not be parsed again")
+
+    monkeypatch.setattr(_load, "_compile_config", parse_forbidden)
+    cached = load_config(config_path, cache_dir=cache_dir)
+
+    assert [rule.fingerprint() for rule in cached.rules] == [
+        rule.fingerprint() for rule in uncached.rules
+    ]
+    assert list(cached.datasources.names()) == list(uncached.datasources.names())
@@ -0,0 +1,33 @@
+import typing as t
+
+import pytest
+
+from tests.helpers import create_countries
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--independent",
+        action="store_true",
+        default=False,
+        help="skip the tests which need external services such as the MySQL server",
+    )
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: t.List[pytest.Item]
+) -> None:
+    if not config.getoption("--independent"):
+        return
+    skip = pytest.mark.skip(reason="needs an external service (--independent)")
+    for item in items:
+        if "mysql" in item.keywords:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def sqlite_path(tmp_path: t.Any) -> str:
+    """a SQLite database of table `country` with the rows of `COUNTRIES`"""
+    path = str(tmp_path / "test.db")
+    create_countries(path)
+    return path
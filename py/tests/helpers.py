@@ -0,0 +1,160 @@
+import sqlite3
+import threading
+import time
+import typing as t
+
+from validb import CostBudget, EmbeddedVariables, current_execution
+from validb.datasources import DataSource, DataSources, QueryEstimate
+from validb.rules import Rule
+
+COUNTRIES = [
+    # Code, SurfaceArea, Population, InDepYear
+    ("AAA", 100.0, 1000, None),
+    ("BBB", 5000.0, 10, 1900),
+    ("CCC", 20.0, 300, 1950),
+    ("DDD", 7000.0, 7, None),
+    ("EEE", 1.0, 50, 2000),
+]
+
+
+def create_countries(path: str) -> None:
+    """create a SQLite database of table `country` with the rows of `COUNTRIES`"""
+    connection = sqlite3.connect(path)
+    try:
+        with connection:
+            connection.execute(
+                "CREATE TABLE country (Code text primary key,"
+                " SurfaceArea real, Population int, InDepYear int)"
+            )
+            connection.executemany("INSERT INTO country VALUES (?, ?, ?, ?)", COUNTRIES)
+    finally:
+        connection.close()
+
+
+class StaticRule(Rule[str, str, str]):
+    """a rule detecting the given IDs without a database"""
+
+    def __init__(
+        self,
+        detection_type: str,
+        ids: t.Sequence[str] = (),
+        *,
+        level: int = 0,
+        sql: str = "",
+        estimated_rows: t.Optional[float] = None,
+        delay: float = 0.0,
+        timeout: t.Optional[float] = None,
+        datasource: t.Optional[str] = None,
+        cost_budget: t.Optional[CostBudget] = None,
+    ) -> None:
+        self._detection_type = detection_type
+        self._ids = ids
+        self._level = level
+        self._sql = sql if sql != "" else f"SELECT {detection_type}"
+        self._estimated_rows = estimated_rows
+        self._delay = delay
+        self._timeout = timeout
+        self._datasource = datasource
+        self._cost_budget = cost_budget
+        self.executed = 0
+
+    @property
+    def sql(self) -> str:
+        return self._sql
+
+    def datasource_names(self) -> t.Iterator[str]:
+        return iter(() if self._datasource is None else (self._datasource,))
+
+    def id_of_row(self, embedded_vars: EmbeddedVariables) -> str:
+        return embedded_vars[0]
+
+    def level(self) -> int:
+        return self._level
+
+    def detection_type(self) -> str:
+        return self._detection_type
+
+    def message(self, embedded_vars: EmbeddedVariables) -> str:
+        return f"{self._detection_type} of {embedded_vars[0]}"
+
+    def embedders(self) -> t.Iterator[str]:
+        return iter(())
+
+    def timeout(self) -> t.Optional[float]:
+        return self._timeout
+
+    def cost_budget(self) -> t.Optional[CostBudget]:
+        return self._cost_budget
+
+    def estimate(self, *, datasources: DataSources) -> t.Optional[QueryEstimate]:
+        if self._estimated_rows is None:
+            return None
+        return QueryEstimate(rows=self._estimated_rows, cost=None)
+
+    def exec(self, *, datasources, detected, embedders):
+        self.executed += 1
+        execution = current_execution()
+        for id_ in self._ids:
+            if self._delay > 0:
+                time.sleep(self._delay)
+            if execution is not None:
+                if execution.cancelled:
+                    return
+                execution.add_rows()
+            yield self.detect(
+                embedded_vars=EmbeddedVariables((id_,), {"id": id_}),
+                constructor=detected,
+                embedders=embedders,
+            )
+
+
+class RecordingDataSource(DataSource):
+    """a datasource recording how many times it is opened and closed"""
+
+    def __init__(self, delay: float = 0.0, error: t.Optional[Exception] = None) -> None:
+        self.delay = delay
+        self.error = error
+        self.opened = 0
+        self.closed = 0
+        self.threads: t.Set[int] = set()
+
+    def __enter__(self) -> DataSource:
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        self.opened += 1
+        self.threads.add(threading.get_ident())
+        return self
+
+    def close(self):
+        self.closed += 1
+
+
+def write_country_config(path: t.Any, sqlite_path: str, extra: str = "") -> str:
+    """write a YAML config validating the database of `create_countries()`
+
+    It has two rules, NULL_YEAR and TOO_SMALL.
+    """
+    with open(path, mode="w", encoding="utf_8") as fp:
+        fp.write(f"""
+rules:
+  - class: validb.rules.sqlalchemy.SimpleSQLAlchemyRule
+    sql: "SELECT Code FROM country WHERE InDepYear IS NULL"
+    id: "{{Code}}"
+    detection_type: NULL_YEAR
+    msg: "null year; Code={{Code}}"
+    datasource: db
+  - class: validb.rules.sqlalchemy.SimpleSQLAlchemyRule
+    sql: "SELECT Code, SurfaceArea, Population FROM country
+      WHERE SurfaceArea < Population"
+    id: "{{Code}}"
+    level: 1
+    detection_type: TOO_SMALL
+    msg: "too small!; SurfaceArea={{1}}, Population={{Population}}"
+    datasource: db
+datasources:
+  db:
+    class: validb.datasources.sqlalchemy.SQLAlchemyDataSource
+    url: "sqlite:///{sqlite_path}"
+{extra}""")
+    return str(path)
@@ -0,0 +1,212 @@
+import http.server
+import threading
+import typing as t
+
+import pytest
+
+from validb import validate_db, validate_targets
+from validb.datasources import DataSources
+from validb.datasources.dbapi import DBAPIDataSource
+from validb.metrics import OpenMetricsExporter
+from validb.metrics._openmetrics import CONTENT_TYPE
+from validb.rules.dbapi import SimpleDBAPIRule
+
+from tests.helpers import StaticRule
+
+
+def samples(text: str) -> t.Dict[str, float]:
+    """the values of the samples by name with labels"""
+    values: t.Dict[str, float] = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        name, value = line.rsplit(" ", 1)
+        values[name] = float(value)
+    return values
+
+
+def rule_labels(rule: StaticRule) -> str:
+    return f'rule="{rule.detection_type()}",fingerprint="{rule.fingerprint()}"'
+
+
+def test_render():
+    exporter = OpenMetricsExporter(buckets=(0.001, 10.0))
+    a = StaticRule("A", ["1", "2"], level=1)
+    b = StaticRule("B", ["3"], delay=0.01)
+    validate_db(
+        rules=[a, b],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[exporter],
+    )
+    a_labels, b_labels = rule_labels(a), rule_labels(b)
+
+    text = exporter.render()
+    assert text.endswith("# EOF\n")
+    assert "# TYPE validb_rules gauge" in text
+    assert "# TYPE validb_rule_duration_seconds histogram" in text
+    values = samples(text)
+    assert values['validb_rules{outcome="COMPLETED"}'] == 2
+    assert values[f"validb_rule_rows{{{a_labels}}}"] == 2
+    assert values[f"validb_rule_detections{{{a_labels}}}"] == 2
+    assert values['validb_detections{detection_type="A"}'] == 2
+    assert values["validb_too_many_detection"] == 0
+    assert values["validb_run_duration_seconds"] > 0
+    # the buckets are cumulative
+    assert values[f'validb_rule_duration_seconds_bucket{{{a_labels},le="10.0"}}'] == 1
+    assert values[f'validb_rule_duration_seconds_bucket{{{b_labels},le="0.001"}}'] == 0
+    assert values[f'validb_rule_duration_seconds_bucket{{{b_labels},le="+Inf"}}'] == 1
+    assert values[f"validb_rule_duration_seconds_count{{{b_labels}}}"] == 1
+    assert values[f"validb_rule_duration_seconds_sum{{{b_labels}}}"] >= 0.01
+
+
+def test_rules_of_the_same_detection_type():
+    exporter = OpenMetricsExporter()
+    rules = [
+        StaticRule("A", ["1", "2"], level=0),
+        StaticRule("A", ["3"], level=1),
+        StaticRule("A", [], level=1, sql="SELECT 1"),
+    ]
+    validate_db(rules=rules, datasources=DataSources(), embedders={}, hooks=[exporter])
+
+    values = samples(exporter.render())
+    assert [values[f"validb_rule_rows{{{rule_labels(r)}}}"] for r in rules] == [2, 1, 0]
+    # counted once for all the levels
+    assert values['validb_detections{detection_type="A"}'] == 3
+
+
+def test_label_values_are_escaped():
+    exporter = OpenMetricsExporter()
+    validate_db(
+        rules=[StaticRule('say "hi"\\\n', ["1"])],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[exporter],
+    )
+    escaped = 'rule="say \\"hi\\"\\\\\\n"'
+    assert f"validb_rule_rows{{{escaped},fingerprint=" in exporter.render()
+
+
+def test_metrics_of_targets_are_labeled():
+    exporter = OpenMetricsExporter()
+    validate_targets(
+        targets={"a": DataSources(), "b": DataSources()},
+        rules=[StaticRule("A", ["1"])],
+        embedders={},
+        hooks=[exporter],
+    )
+
+    labels = rule_labels(StaticRule("A", ["1"]))
+    values = samples(exporter.render())
+    assert values[f'validb_rule_rows{{target="a",{labels}}}'] == 1
+    assert values[f'validb_rule_rows{{target="b",{labels}}}'] == 1
+    assert 'validb_rules{outcome="COMPLETED"}' not in values
+
+
+def test_connect_seconds_of_datasources(sqlite_path: str):
+    exporter = OpenMetricsExporter()
+    rule = SimpleDBAPIRule(
+        sql="SELECT Code FROM country WHERE InDepYear IS NULL",
+        id="{Code}",
+        detection_type="NULL_YEAR",
+        msg="{Code}",
+        datasource="used",
+    )
+    with DataSources(
+        {
+            "used": DBAPIDataSource(driver="sqlite3", database=sqlite_path),
+            "unused": DBAPIDataSource(driver="sqlite3", database=sqlite_path),
+        }
+    ) as datasources:
+        validate_db(
+            rules=[rule], datasources=datasources, embedders={}, hooks=[exporter]
+        )
+
+    text = exporter.render()
+    values = samples(text)
+    assert values['validb_datasource_connect_seconds{datasource="used"}'] > 0
+    assert "unused" not in text
+
+
+def test_invalid_buckets():
+    with pytest.raises(ValueError, match="buckets must be strictly ascending"):
+        OpenMetricsExporter(buckets=(1.0, 0.5))
+
+
+def test_write(tmp_path):
+    exporter = OpenMetricsExporter()
+    validate_db(
+        rules=[StaticRule("A", ["1"])],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[exporter],
+    )
+    path = tmp_path / "validb.prom"
+    exporter.write(str(path))
+
+    assert path.read_text() == exporter.render()
+    assert [p.name for p in tmp_path.iterdir()] == ["validb.prom"]
+
+
+def test_push():
+    received: t.List[t.Tuple[str, str, str, bytes]] = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_PUT(self) -> None:
+            body = self.rfile.read(int(self.headers["Content-Length"]))
+            received.append(
+                (self.command, self.path, self.headers["Content-Type"], body)
+            )
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args: t.Any) -> None:
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        exporter = OpenMetricsExporter()
+        validate_db(
+            rules=[StaticRule("A", ["1"])],
+            datasources=DataSources(),
+            embedders={},
+            hooks=[exporter],
+        )
+        exporter.push(f"http://127.0.0.1:{server.server_port}/metrics/job/validb")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(received) == 1
+    method, path, content_type, body = received[0]
+    assert (method, path, content_type) == ("PUT", "/metrics/job/validb", CONTENT_TYPE)
+    assert body.decode("utf_8") == exporter.render()
+
+
+def test_cli_metrics_file(tmp_path, sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("yaml")
+    pytest.importorskip("click")
+    from click.testing import CliRunner
+
+    from validb.__main__ import main
+    from tests.helpers import write_country_config
+
+    config_path = write_country_config(tmp_path / "validb.yml", sqlite_path)
+    metrics_path = tmp_path / "validb.prom"
+
+    result = CliRunner().invoke(
+        main,
+        [
+            *("-c", config_path),
+            *("-D", str(tmp_path / "out.csv")),
+            *("--metrics-file", str(metrics_path)),
+        ],
+    )
+
+    assert metrics_path.exists(), result.output
+    values = samples(metrics_path.read_text())
+    assert values['validb_rules{outcome="COMPLETED"}'] == 2
+    assert values['validb_datasource_connect_seconds{datasource="db"}'] > 0
@@ -0,0 +1,164 @@
+import sqlite3
+import typing as t
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from validb import DataSources, RuleOutcome, validate_db
+from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+from validb.rules.sqlalchemy import SimpleSQLAlchemyComparisonRule
+from validb.rules.sqlalchemy._comparison import _merge_join
+
+LEFT = [(1, 10, "a"), (2, 20, "b"), (3, 30, "c"), (5, 50, "e"), (12, 120, "l")]
+RIGHT = [(1, 10, "a"), (2, 21, "b"), (4, 40, "d"), (5, 50, "E"), (12, 120, "l")]
+
+ORDERED = "SELECT id, amount, name FROM account ORDER BY id"
+CHUNKED = "SELECT id, amount, name FROM account WHERE id / 10 = :chunk ORDER BY id"
+DIGESTS = (
+    "SELECT id / 10 AS chunk, group_concat(id || ':' || amount || ':' || name, ',')"
+    " FROM account GROUP BY chunk ORDER BY chunk"
+)
+
+
+def create_accounts(path: str, rows: t.Sequence[t.Tuple[int, int, str]]) -> None:
+    connection = sqlite3.connect(path)
+    try:
+        with connection:
+            connection.execute(
+                "CREATE TABLE account (id int primary key, amount int, name text)"
+            )
+            connection.executemany("INSERT INTO account VALUES (?, ?, ?)", rows)
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def datasources(tmp_path) -> t.Iterator[DataSources]:
+    urls = {}
+    for name, rows in (("left", LEFT), ("right", RIGHT)):
+        path = str(tmp_path / f"{name}.db")
+        create_accounts(path, rows)
+        urls[name] = f"sqlite:///{path}"
+    with DataSources(
+        {name: SQLAlchemyDataSource(url=url) for name, url in urls.items()}
+    ) as datasources:
+        yield datasources
+
+
+def comparison_rule(**kwargs: t.Any) -> SimpleSQLAlchemyComparisonRule:
+    return SimpleSQLAlchemyComparisonRule(
+        **{
+            "left_sql": ORDERED,
+            "right_sql": ORDERED,
+            "key": "id",
+            "id": "{id}",
+            "detection_type": "DIFF",
+            "msg": (
+                "{mismatch}; columns={columns};"
+                " left={left[amount]}; right={right[amount]}"
+            ),
+            "left_datasource": "left",
+            "right_datasource": "right",
+            **kwargs,
+        }
+    )
+
+
+def test_mismatches_are_detected(datasources):
+    data = validate_db(rules=[comparison_rule()], datasources=datasources, embedders={})
+
+    assert {d.id: d.msg for d in data.values()} == {
+        "2": "different; columns=amount; left=20; right=21",
+        "3": "missing; columns=amount, name; left=30; right=None",
+        "4": "extra; columns=amount, name; left=None; right=40",
+        "5": "different; columns=name; left=50; right=50",
+    }
+    assert data.rule_results[0].rows == len(LEFT) + len(RIGHT)
+
+
+def test_only_specified_columns_are_compared(datasources):
+    data = validate_db(
+        rules=[comparison_rule(columns=["amount"])],
+        datasources=datasources,
+        embedders={},
+    )
+
+    assert sorted(d.id for d in data.values()) == ["2", "3", "4"]
+
+
+def test_only_chunks_with_different_digests_are_fetched(datasources):
+    rule = comparison_rule(
+        left_sql=CHUNKED,
+        right_sql=CHUNKED,
+        left_chunk_sql=DIGESTS,
+        right_chunk_sql=DIGESTS,
+    )
+    data = validate_db(rules=[rule], datasources=datasources, embedders={})
+
+    assert sorted(d.id for d in data.values()) == ["2", "3", "4", "5"]
+    # chunk 1 (id 12) is equal on both sides, so only the rows of chunk 0 are read
+    assert data.rule_results[0].rows == 8
+
+
+def test_both_sides_on_the_same_datasource(datasources):
+    rule = comparison_rule(
+        right_sql="SELECT id, amount + 1 AS amount, name FROM account ORDER BY id",
+        right_datasource="left",
+        columns=["amount"],
+    )
+    data = validate_db(rules=[rule], datasources=datasources, embedders={})
+
+    assert data.count_of("DIFF") == len(LEFT)
+
+
+def test_unordered_query_is_rejected(datasources):
+    rule = comparison_rule(
+        right_sql="SELECT id, amount, name FROM account ORDER BY id DESC"
+    )
+
+    with pytest.raises(ValueError, match="the right query must be ordered by the key"):
+        validate_db(rules=[rule], datasources=datasources, embedders={})
+
+
+def test_rule_is_cancelled_by_timeout(datasources):
+    rule = comparison_rule(
+        left_sql="WITH RECURSIVE c(id) AS (SELECT 1 UNION ALL SELECT id + 1 FROM c) "
+        "SELECT id, id AS amount FROM c",
+        right_sql="SELECT id, amount FROM account WHERE id < 0",
+        timeout=0.3,
+    )
+    data = validate_db(rules=[rule], datasources=datasources, embedders={})
+
+    assert data.rule_results[0].outcome == RuleOutcome.TIMED_OUT
+
+
+@pytest.mark.parametrize(
+    "kwargs, error",
+    [
+        ({"left_chunk_sql": DIGESTS}, "must be specified together"),
+        ({"key": []}, "at least one column"),
+    ],
+)
+def test_invalid_arguments(kwargs, error):
+    with pytest.raises(ValueError, match=error):
+        comparison_rule(**kwargs)
+
+
+def test_merge_join():
+    left = iter([((1,), "l1"), ((3,), "l3"), ((4,), "l4")])
+    right = iter([((2,), "r2"), ((3,), "r3")])
+
+    assert list(_merge_join(left, right)) == [
+        ((1,), "l1", None),
+        ((2,), None, "r2"),
+        ((3,), "l3", "r3"),
+        ((4,), "l4", None),
+    ]
+
+
+def test_merge_join_rejects_duplicated_keys():
+    left = iter([((1,), "a"), ((1,), "b")])
+
+    with pytest.raises(ValueError, match=r"the left query .* \(1,\) follows \(1,\)"):
+        list(_merge_join(left, iter([])))
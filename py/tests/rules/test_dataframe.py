@@ -0,0 +1,161 @@
+import typing as t
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("pandas")
+
+from validb import DataSources, validate_db
+from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+from validb.rules.dataframe import DataFrameRule, SimpleDataFrameRule
+
+
+@pytest.fixture
+def datasources(sqlite_path: str) -> t.Iterator[DataSources]:
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+    ) as datasources:
+        yield datasources
+
+
+def dataframe_rule(**kwargs: t.Any) -> SimpleDataFrameRule:
+    return SimpleDataFrameRule(
+        **{
+            "sql": "SELECT Code, SurfaceArea, Population FROM country ORDER BY Code",
+            "predicate": "SurfaceArea < Population",
+            "id": "{Code}",
+            "detection_type": "TOO_SMALL",
+            "msg": "SurfaceArea={SurfaceArea}, Population={Population}",
+            "datasource": "db",
+            **kwargs,
+        }
+    )
+
+
+@pytest.mark.parametrize("chunksize", [1, 2, 3, 5, 100])
+def test_every_chunk_is_evaluated(datasources, chunksize):
+    data = validate_db(
+        rules=[dataframe_rule(chunksize=chunksize)],
+        datasources=datasources,
+        embedders={},
+    )
+
+    assert sorted(d.id for d in data.values()) == ["AAA", "CCC", "EEE"]
+    assert data["AAA"][0].msg == "SurfaceArea=100.0, Population=1000"
+    assert data.rule_results[0].rows == 5
+
+
+def test_callable_predicate(datasources):
+    rule: DataFrameRule[str, str, str] = DataFrameRule(
+        sql="SELECT Code, InDepYear FROM country",
+        predicate=lambda frame: frame["InDepYear"] > 1920,
+        id_of_row=lambda embedded_vars: embedded_vars["Code"],
+        level=0,
+        detection_type="RECENT",
+        msg=lambda embedded_vars: str(embedded_vars["InDepYear"]),
+        datasource="db",
+        chunksize=2,
+    )
+    data = validate_db(rules=[rule], datasources=datasources, embedders={})
+
+    # NULL years are not detected since the comparison is false (or NA)
+    assert sorted(d.id for d in data.values()) == ["CCC", "EEE"]
+
+
+def test_null_is_excluded_explicitly(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "codes.db")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE code (Code text)")
+        connection.executemany(
+            "INSERT INTO code VALUES (?)", [("AAA",), ("b1",), (None,)]
+        )
+    connection.close()
+
+    rule = dataframe_rule(
+        sql="SELECT rowid AS id, Code FROM code",
+        predicate="Code.notna() and Code.str.match('^[A-Z]{3}$') == False",
+        id="{id}",
+        msg="{Code}",
+    )
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{path}")}
+    ) as datasources:
+        data = validate_db(rules=[rule], datasources=datasources, embedders={})
+
+    assert [d.msg for d in data.values()] == ["b1"]
+
+
+def test_fingerprint_depends_on_predicate():
+    assert dataframe_rule().fingerprint() == dataframe_rule().fingerprint()
+    assert (
+        dataframe_rule().fingerprint()
+        != dataframe_rule(predicate="SurfaceArea > Population").fingerprint()
+    )
+
+    def rule_of(predicate: t.Callable[[t.Any], t.Any]) -> DataFrameRule[str, str, str]:
+        return DataFrameRule(
+            sql="SELECT 1",
+            predicate=predicate,
+            id_of_row=str,
+            level=0,
+            detection_type="T",
+            msg=str,
+            datasource="db",
+        )
+
+    assert (
+        rule_of(lambda frame: frame["a"] > 1).fingerprint()
+        == rule_of(lambda frame: frame["a"] > 1).fingerprint()
+    )
+    assert (
+        rule_of(lambda frame: frame["a"] > 1).fingerprint()
+        != rule_of(lambda frame: frame["a"] > 2).fingerprint()
+    )
+
+
+def test_invalid_chunksize():
+    with pytest.raises(ValueError, match="chunksize must be positive"):
+        dataframe_rule(chunksize=0)
+
+
+def test_values_are_not_converted_by_pandas(tmp_path):
+    import sqlite3
+
+    from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+    path = str(tmp_path / "values.db")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE t (id integer, n integer)")
+        connection.executemany("INSERT INTO t VALUES (?, ?)", [(1, None), (2, 5)])
+    connection.close()
+
+    kwargs = dict(
+        sql="SELECT id, n FROM t ORDER BY id",
+        id="{id}",
+        detection_type="T",
+        msg="n={n}",
+        datasource="db",
+    )
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{path}")}
+    ) as datasources:
+        data = validate_db(
+            rules=[dataframe_rule(**kwargs, predicate="id > 0")],
+            datasources=datasources,
+            embedders={},
+        )
+        expected = validate_db(
+            rules=[SimpleSQLAlchemyRule(**kwargs)],
+            datasources=datasources,
+            embedders={},
+        )
+
+    # NULL is not rendered as nan, nor 5 as 5.0
+    assert [(d.id, d.msg) for d in data.values()] == [("1", "n=None"), ("2", "n=5")]
+    assert [(d.id, d.msg) for d in data.values()] == [
+        (d.id, d.msg) for d in expected.values()
+    ]
@@ -0,0 +1,157 @@
+import sqlite3
+import typing as t
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from validb import DataSources, validate_db
+from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+from validb.rules.sqlalchemy import Check, MultiCheckRule
+from validb.rules.sqlalchemy._multicheck import _compile_evaluator, _free_names
+
+
+class Row(tuple):
+    """a row of a result, which is also accessible by column name"""
+
+    _mapping: t.Mapping[str, t.Any]
+
+    def __new__(cls, columns: t.Sequence[str], values: t.Sequence[t.Any]) -> "Row":
+        row = super().__new__(cls, values)
+        row._mapping = dict(zip(columns, values))
+        return row
+
+
+def failed_checks(
+    predicates: t.Sequence[t.Any], columns: t.Sequence[str], values: t.Sequence[t.Any]
+) -> t.List[int]:
+    checks = [
+        Check(predicate=p, detection_type=f"T{i}", msg="")
+        for i, p in enumerate(predicates)
+    ]
+    failed: t.List[int] = []
+    _compile_evaluator(checks, columns)(Row(columns, values), failed.append)
+    return failed
+
+
+def test_checks_are_evaluated_on_each_row(sqlite_path: str):
+    rule = MultiCheckRule(
+        sql="SELECT Code, SurfaceArea, Population, InDepYear FROM country",
+        name="COUNTRY",
+        id="{Code}",
+        checks=[
+            {
+                "predicate": "InDepYear is None",
+                "detection_type": "NULL_YEAR",
+                "msg": "null year",
+            },
+            Check(
+                predicate="SurfaceArea < Population",
+                detection_type="TOO_SMALL",
+                msg="{SurfaceArea} < {Population}",
+                level=2,
+            ),
+            Check(
+                predicate=lambda row: row["Code"] == "BBB",
+                detection_type="BBB",
+                msg="BBB",
+                id="code:{Code}",
+            ),
+        ],
+        datasource="db",
+    )
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+    ) as datasources:
+        data = validate_db(rules=[rule], datasources=datasources, embedders={})
+
+    assert rule.level() == 2
+    assert sorted((d.detection_type, d.id, d.level) for d in data.values()) == [
+        ("BBB", "code:BBB", 0),
+        ("NULL_YEAR", "AAA", 0),
+        ("NULL_YEAR", "DDD", 0),
+        ("TOO_SMALL", "AAA", 2),
+        ("TOO_SMALL", "CCC", 2),
+        ("TOO_SMALL", "EEE", 2),
+    ]
+    assert data["CCC"][0].msg == "20.0 < 300"
+    assert data.rule_results[0].rows == 5
+
+
+def test_trailing_comment():
+    assert failed_checks(["a < 0  # negative"], ["a"], [-1]) == [0]
+
+
+def test_variables_of_comprehensions_and_lambdas_are_not_columns():
+    predicates = [
+        "any(c < 0 for c in (a, b))",
+        "[x for x in (a, b) if x > limit]",
+        "(lambda v, w=b: v > w)(a)",
+        "{k: v for k, v in [('a', a)]}['a'] > 10",
+        "(n := a + b) > 0 and n < 100",
+    ]
+
+    assert failed_checks(predicates, ["a", "b", "limit"], [-1, 5, 4]) == [0, 1, 4]
+    assert failed_checks(predicates, ["a", "b", "limit"], [20, 5, 100]) == [2, 3, 4]
+
+
+def test_names_assigned_by_a_check_are_not_seen_by_others():
+    predicates = ["(a := 100) > 0", "a < 0"]
+
+    assert failed_checks(predicates, ["a"], [-1]) == [0, 1]
+
+
+@pytest.mark.parametrize("column", ["_row", "_failed", "_evaluate", "re"])
+def test_columns_can_have_any_names(column):
+    assert failed_checks([f"{column} == 1", "1 < 2"], [column], [1]) == [0, 1]
+
+
+def test_unknown_column():
+    with pytest.raises(ValueError, match="unknown column 'b'"):
+        failed_checks(["any(c < b for c in (a,))"], ["a"], [1])
+
+
+def test_invalid_predicate():
+    with pytest.raises(ValueError, match="must be a Python expression"):
+        MultiCheckRule(
+            sql="SELECT 1",
+            name="R",
+            id="{0}",
+            checks=[Check(predicate="a <", detection_type="T", msg="")],
+            datasource="db",
+        )
+
+
+def test_free_names():
+    import ast
+
+    expression = ast.parse(
+        "f(x) + sum(y * z for y in ys if y > w) + (lambda p, *q, r=d: p + q + s)(e)",
+        mode="eval",
+    )
+
+    assert set(_free_names(expression)) == {
+        "f",
+        "x",
+        "z",
+        "ys",
+        "w",
+        "d",
+        "s",
+        "e",
+        "sum",
+    }
+
+
+def test_fingerprint_depends_on_checks():
+    def rule_of(predicate: str) -> MultiCheckRule:
+        return MultiCheckRule(
+            sql="SELECT a FROM t",
+            name="R",
+            id="{a}",
+            checks=[Check(predicate=predicate, detection_type="T", msg="")],
+            datasource="db",
+        )
+
+    assert rule_of("a < 0").fingerprint() == rule_of("a < 0").fingerprint()
+    assert rule_of("a < 0").fingerprint() != rule_of("a > 0").fingerprint()
@@ -0,0 +1,165 @@
+import typing as t
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from validb import DataSources, Embedder, validate_db
+from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+from validb.rules.sqlalchemy._rendering import columns_query, compile_rendering
+
+
+class ScalarEmbedder(Embedder):
+    def extend(self, vars_seq, vars_map):
+        return {**vars_map, "today": "2026-10-19"}
+
+    def scalar_variables(self) -> t.Optional[t.Mapping[str, t.Any]]:
+        return {"today": "2026-10-19"}
+
+
+class RowEmbedder(Embedder):
+    def extend(self, vars_seq, vars_map):
+        return {**vars_map, "today": "2026-10-19"}
+
+
+EMBEDDERS: t.Mapping[str, Embedder] = {"scalar": ScalarEmbedder(), "row": RowEmbedder()}
+
+
+def rule_of(**kwargs: t.Any) -> SimpleSQLAlchemyRule:
+    return SimpleSQLAlchemyRule(
+        **{
+            "sql": "SELECT Code, Population, InDepYear FROM country ORDER BY Code",
+            "detection_type": "T",
+            "datasource": "db",
+            **kwargs,
+        }
+    )
+
+
+def detections(sqlite_path: str, **kwargs: t.Any) -> t.List[t.Tuple[str, str]]:
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+    ) as datasources:
+        data = validate_db(
+            rules=[rule_of(**kwargs)], datasources=datasources, embedders=EMBEDDERS
+        )
+    return [(d.id, d.msg) for d in data.values()]
+
+
+@pytest.mark.parametrize(
+    "id, msg, embedders, compiled",
+    [
+        ("{Code}", "Population={Population}, year={InDepYear}", None, True),
+        ("{0}-{1}", "{0}: {2}; missing={missing}, {9}", None, True),
+        ("{Code}", "checked on {today}", ["scalar"], True),
+        # rendered by Python
+        ("{Code}", "checked on {today}", ["row"], False),
+        ("{Code}", "{Population:>6}", None, False),
+        ("{Code!r}", "{Population}", None, False),
+    ],
+)
+def test_rendered_in_sql_as_in_python(sqlite_path, id, msg, embedders, compiled):
+    kwargs = {"id": id, "msg": msg, "embedders": embedders}
+
+    expected = detections(sqlite_path, **kwargs)
+    assert detections(sqlite_path, render_in_sql=True, **kwargs) == expected
+    assert len(expected) == 5
+
+    rule = rule_of(render_in_sql=True, **kwargs)
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+    ) as datasources:
+        assert (rule._compile_rendering(datasources, EMBEDDERS) is not None) == compiled
+
+
+def test_query_ending_with_semicolon(sqlite_path):
+    assert detections(
+        sqlite_path,
+        sql="SELECT Code FROM country WHERE InDepYear IS NULL;",
+        id="{Code}",
+        msg="null year of {Code}",
+        render_in_sql=True,
+    ) == [("AAA", "null year of AAA"), ("DDD", "null year of DDD")]
+
+
+def test_compiled_for_each_dialect():
+    rendering = compile_rendering(
+        "SELECT a, b FROM t;",
+        id_template="{a}",
+        msg_template="a={0}, b={b}, c={c}",
+        columns=["a", "b"],
+        scalars={},
+        dialect=mysql.dialect(),
+    )
+    assert rendering == (
+        "SELECT _validb_q.*,"
+        " CONCAT(COALESCE(CAST(_validb_q.a AS CHAR), 'None')) AS _validb_id,"
+        " CONCAT(:_validb_l0, COALESCE(CAST(_validb_q.a AS CHAR), 'None'), :_validb_l1,"
+        " COALESCE(CAST(_validb_q.b AS CHAR), 'None'), :_validb_l2) AS _validb_msg"
+        " FROM (SELECT a, b FROM t) _validb_q",
+        {"_validb_l0": "a=", "_validb_l1": ", b=", "_validb_l2": ", c="},
+    )
+
+    rendering = compile_rendering(
+        "SELECT a FROM t",
+        id_template="{a}",
+        msg_template="fixed",
+        columns=["a"],
+        scalars={},
+        dialect=postgresql.dialect(),
+    )
+    assert rendering is not None
+    assert "(COALESCE(CAST(_validb_q.a AS TEXT), 'None')) AS _validb_id" in rendering[0]
+    assert "(:_validb_l0) AS _validb_msg" in rendering[0]
+
+
+@pytest.mark.parametrize(
+    "id_template, msg_template",
+    [
+        ("{unknown}", "msg"),
+        ("{3}", "msg"),
+        ("{}", "msg"),
+        ("{a}", "{a[0]}"),
+        ("{a}", "{a.real}"),
+        ("{a}", "{a:x}"),
+        ("{a}", "{"),
+    ],
+)
+def test_not_compiled(id_template, msg_template):
+    assert (
+        compile_rendering(
+            "SELECT a FROM t",
+            id_template=id_template,
+            msg_template=msg_template,
+            columns=["a"],
+            scalars={},
+            dialect=sqlite.dialect(),
+        )
+        is None
+    )
+
+
+def test_unknown_dialect_is_not_compiled():
+    from sqlalchemy.dialects import mssql
+
+    assert (
+        compile_rendering(
+            "SELECT a FROM t",
+            id_template="{a}",
+            msg_template="{a}",
+            columns=["a"],
+            scalars={},
+            dialect=mssql.dialect(),
+        )
+        is None
+    )
+
+
+def test_columns_query():
+    assert (
+        columns_query(" SELECT a FROM t; ")
+        == "SELECT * FROM (SELECT a FROM t) _validb_q WHERE 1 = 0"
+    )
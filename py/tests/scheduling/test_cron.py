@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+
+from validb.scheduling import CronSchedule
+
+
+def at(text: str) -> datetime.datetime:
+    return datetime.datetime.fromisoformat(text)
+
+
+@pytest.mark.parametrize(
+    "expression, time, expected",
+    [
+        ("* * * * *", "2024-03-15 10:07", True),
+        ("*/15 * * * *", "2024-03-15 10:30", True),
+        ("*/15 * * * *", "2024-03-15 10:31", False),
+        ("0-30/10 9-17 * * *", "2024-03-15 17:20", True),
+        ("0-30/10 9-17 * * *", "2024-03-15 17:40", False),
+        ("5,35 * * * *", "2024-03-15 10:35", True),
+        ("0 0 1 1 *", "2025-01-01 00:00", True),
+        ("@yearly", "2025-01-01 00:00", True),
+        ("@hourly", "2024-03-15 10:01", False),
+        # 2024-03-17 is a Sunday, which is both 0 and 7
+        ("0 0 * * 0", "2024-03-17 00:00", True),
+        ("0 0 * * 7", "2024-03-17 00:00", True),
+        ("0 0 * * 1-5", "2024-03-17 00:00", False),
+        # either the day of month or the day of week matches if both are restricted
+        ("0 0 1 * 0", "2024-03-17 00:00", True),
+        ("0 0 1 * 0", "2024-03-01 00:00", True),
+        ("0 0 1 * 0", "2024-03-02 00:00", False),
+        # both must match if only one is restricted
+        ("0 0 * 3 0", "2024-04-07 00:00", False),
+    ],
+)
+def test_matches(expression: str, time: str, expected: bool):
+    assert CronSchedule(expression).matches(at(time)) is expected
+
+
+@pytest.mark.parametrize(
+    "expression, time, expected",
+    [
+        ("*/15 * * * *", "2024-03-15 10:07:30", "2024-03-15 10:15"),
+        ("*/15 * * * *", "2024-03-15 10:15:00", "2024-03-15 10:30"),
+        ("@daily", "2024-12-31 23:59", "2025-01-01 00:00"),
+        ("30 2 * * *", "2024-03-15 03:00", "2024-03-16 02:30"),
+        ("0 0 1 */3 *", "2024-02-10 00:00", "2024-04-01 00:00"),
+        ("0 12 * * 1", "2024-03-15 10:00", "2024-03-18 12:00"),
+        ("0 0 29 2 *", "2024-03-01 00:00", "2028-02-29 00:00"),
+    ],
+)
+def test_next_after(expression: str, time: str, expected: str):
+    assert CronSchedule(expression).next_after(at(time)) == at(expected)
+
+
+def test_next_after_keeps_time_zone():
+    tz = datetime.timezone(datetime.timedelta(hours=9))
+    time = datetime.datetime(2024, 3, 15, 10, 7, tzinfo=tz)
+    assert CronSchedule("@hourly").next_after(time) == datetime.datetime(
+        2024, 3, 15, 11, 0, tzinfo=tz
+    )
+
+
+def test_never_fires():
+    with pytest.raises(ValueError, match="never fires"):
+        CronSchedule("0 0 30 2 *").next_after(at("2024-01-01 00:00"))
+
+
+@pytest.mark.parametrize(
+    "expression, error",
+    [
+        ("* * * *", "cron must have 5 fields"),
+        ("@often", "cron must have 5 fields"),
+        ("60 * * * *", "minute of cron must be between 0 and 59"),
+        ("* 5-2 * * *", "hour of cron must be between 0 and 23"),
+        ("* * 0 * *", "day of month of cron must be between 1 and 31"),
+        ("* * * JAN *", "month of cron must be like"),
+        ("*/0 * * * *", "step of minute of cron must be positive"),
+    ],
+)
+def test_invalid_expressions(expression: str, error: str):
+    with pytest.raises(ValueError, match=error):
+        CronSchedule(expression)
@@ -0,0 +1,98 @@
+import json
+
+from validb import DataSources, RuleOutcome, RuleResult
+from validb.scheduling import (
+    CostAwareScheduler,
+    LevelScheduler,
+    RuleStatsStore,
+    ScheduledRule,
+    SchedulePlan,
+)
+
+from tests.helpers import StaticRule
+
+
+def names(plan: SchedulePlan):
+    return [[s.rule.detection_type() for s in stage] for stage in plan.stages]
+
+
+def test_level_scheduler_orders_by_descending_level():
+    rules = [
+        StaticRule("A", level=0),
+        StaticRule("B", level=2),
+        StaticRule("C", level=0),
+    ]
+    plan = LevelScheduler().plan(rules, datasources=DataSources(), workers=1)
+
+    assert names(plan) == [["B"], ["A", "C"]]
+
+
+def test_cost_aware_scheduler_runs_unknown_rules_first_then_longest(tmp_path):
+    fast, slow, unknown = StaticRule("FAST"), StaticRule("SLOW"), StaticRule("UNKNOWN")
+    high = StaticRule("HIGH", level=1)
+    stats = RuleStatsStore(tmp_path / "stats.json")
+    stats.record(fast.fingerprint(), elapsed=1.0, rows=10)
+    stats.record(slow.fingerprint(), elapsed=5.0, rows=10)
+    stats.record(high.fingerprint(), elapsed=0.1, rows=10)
+
+    plan = CostAwareScheduler(stats).plan(
+        [fast, slow, unknown, high], datasources=DataSources(), workers=2
+    )
+
+    assert names(plan) == [["HIGH"], ["UNKNOWN", "SLOW", "FAST"]]
+    assert [s.predicted_elapsed for s in plan.stages[1]] == [None, 5.0, 1.0]
+
+
+def test_cost_aware_scheduler_uses_estimates_of_unrecorded_rules(tmp_path):
+    rules = [
+        StaticRule("SMALL", estimated_rows=10),
+        StaticRule("LARGE", estimated_rows=1000),
+    ]
+    scheduler = CostAwareScheduler(
+        RuleStatsStore(tmp_path / "stats.json"), default_seconds_per_row=0.001
+    )
+    plan = scheduler.plan(rules, datasources=DataSources(), workers=1)
+
+    assert names(plan) == [["LARGE", "SMALL"]]
+    assert plan.stages[0][0].predicted_elapsed == 1.0
+
+    no_explain = CostAwareScheduler(
+        RuleStatsStore(tmp_path / "other.json"), use_explain=False
+    )
+    plan = no_explain.plan(rules, datasources=DataSources(), workers=1)
+    assert [s.predicted_elapsed for s in plan.stages[0]] == [None, None]
+
+
+def test_cost_aware_scheduler_records_completed_rules(tmp_path):
+    completed, cancelled = StaticRule("COMPLETED"), StaticRule("CANCELLED")
+    path = tmp_path / "stats.json"
+    CostAwareScheduler(RuleStatsStore(path)).record(
+        [
+            RuleResult(
+                completed, RuleOutcome.COMPLETED, elapsed=2.0, rows=3, detections=1
+            ),
+            RuleResult(
+                cancelled, RuleOutcome.CANCELLED, elapsed=9.0, rows=3, detections=1
+            ),
+        ]
+    )
+
+    saved = json.loads(path.read_text())
+    assert list(saved) == [completed.fingerprint()]
+    assert RuleStatsStore(path).get(completed.fingerprint()).elapsed == 2.0
+
+
+def test_predicted_elapsed_is_makespan_of_stages():
+    plan = SchedulePlan(
+        stages=[
+            [ScheduledRule(StaticRule("A"), 3.0), ScheduledRule(StaticRule("B"), 1.0)],
+            [ScheduledRule(StaticRule("C"), 2.0), ScheduledRule(StaticRule("D"), None)],
+        ]
+    )
+
+    assert plan.predicted_elapsed(workers=2) == 5.0
+    assert plan.predicted_elapsed(workers=1) == 6.0
+    assert (
+        SchedulePlan(stages=[[ScheduledRule(StaticRule("A"))]]).predicted_elapsed(1)
+        is None
+    )
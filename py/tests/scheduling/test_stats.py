@@ -0,0 +1,51 @@
+import threading
+
+from validb.scheduling import RuleStatsStore
+
+
+def test_record_smooths_elapsed(tmp_path):
+    stats = RuleStatsStore(tmp_path / "stats.json", smoothing=0.5)
+    stats.record("rule", elapsed=4.0, rows=10, estimated_rows=100)
+    stats.record("rule", elapsed=2.0, rows=20)
+
+    recorded = stats.get("rule")
+    assert recorded is not None
+    assert recorded.elapsed == 3.0
+    assert recorded.rows == 20
+    assert recorded.estimated_rows == 100
+    assert recorded.runs == 2
+    assert stats.get("unknown") is None
+
+
+def test_save_and_load(tmp_path):
+    path = tmp_path / "stats.json"
+    stats = RuleStatsStore(path)
+    stats.record("rule", elapsed=1.5, rows=3)
+    stats.save()
+
+    loaded = RuleStatsStore(path)
+    assert loaded.get("rule") == stats.get("rule")
+    assert not (tmp_path / "stats.json.tmp").exists()
+
+
+def test_concurrent_record_and_get(tmp_path):
+    stats = RuleStatsStore(tmp_path / "stats.json")
+    errors = []
+
+    def record(i: int) -> None:
+        try:
+            for j in range(200):
+                stats.record(f"rule{i}-{j}", elapsed=1.0, rows=1)
+                stats.get(f"rule{i}-{j}")
+                list(stats.values())
+        except Exception as e:  # pragma: no cover
+            errors.append(e)
+
+    threads = [threading.Thread(target=record, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert len(list(stats.values())) == 800
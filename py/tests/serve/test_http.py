@@ -0,0 +1,147 @@
+import json
+import socket
+import threading
+import typing as t
+import urllib.error
+import urllib.request
+
+import pytest
+
+pytest.importorskip("yaml")
+pytest.importorskip("sqlalchemy")
+
+from validb.serve import ValidationService, create_server
+
+from tests.helpers import write_country_config
+
+
+@pytest.fixture
+def service(tmp_path, sqlite_path: str) -> t.Iterator[ValidationService]:
+    config_path = write_country_config(tmp_path / "validb.yml", sqlite_path)
+    with ValidationService(config_path, reload_interval=0) as service:
+        yield service
+
+
+@pytest.fixture
+def base_url(service: ValidationService) -> t.Iterator[str]:
+    server = create_server(service, port=0)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def request(
+    url: str, *, method: str = "GET", body: t.Optional[t.Any] = None
+) -> t.Tuple[int, str, bytes]:
+    data = json.dumps(body).encode("utf_8") if body is not None else None
+    req = urllib.request.Request(url, data=data, method=method)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, response.headers["Content-Type"], response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers["Content-Type"], e.read()
+
+
+def test_health(base_url: str):
+    status, content_type, body = request(f"{base_url}/health")
+    assert (status, content_type) == (200, "application/json")
+    health = json.loads(body)
+    assert health["status"] == "ok"
+    assert health["rules"] == 2
+    assert health["running"] == 0
+
+
+def test_validate(base_url: str):
+    status, _, body = request(
+        f"{base_url}/validate?detection_type=NULL_YEAR&detections=5", method="POST"
+    )
+    assert status == 200
+    run = json.loads(body)
+    assert run["counts"] == {"NULL_YEAR": 2}
+    assert sorted(detection["id"] for detection in run["detections"]) == ["AAA", "DDD"]
+
+
+def test_validate_with_json_body(base_url: str):
+    status, _, body = request(
+        f"{base_url}/validate",
+        method="POST",
+        body={"detection_type": ["NULL_YEAR", "TOO_SMALL"], "detections": 1},
+    )
+    assert status == 200
+    run = json.loads(body)
+    assert run["total_count"] == 5
+    assert len(run["detections"]) == 1
+
+
+@pytest.mark.parametrize(
+    "query, body, error",
+    [
+        ("detection_type=UNKNOWN", None, "unknown detection types: UNKNOWN"),
+        ("detections=-1", None, "detections must not be negative"),
+        ("", {"target": 1}, "target must be a string or a list of strings"),
+        ("", [1], "body must be a JSON object"),
+    ],
+)
+def test_bad_requests(base_url: str, query: str, body: t.Any, error: str):
+    status, _, response = request(
+        f"{base_url}/validate?{query}", method="POST", body=body
+    )
+    assert status == 400
+    assert error in json.loads(response)["error"]
+
+
+def test_metrics(base_url: str):
+    status, _, _ = request(f"{base_url}/metrics")
+    assert status == 404
+
+    request(f"{base_url}/validate", method="POST")
+    status, content_type, body = request(f"{base_url}/metrics")
+    assert status == 200
+    assert content_type.startswith("application/openmetrics-text")
+    assert b'validb_rules{outcome="COMPLETED"} 2' in body
+
+
+def test_reload(base_url: str):
+    status, _, body = request(f"{base_url}/reload", method="POST")
+    assert status == 200
+    assert json.loads(body) == {"reloaded": True}
+
+
+def test_unknown_path(base_url: str):
+    assert request(f"{base_url}/unknown")[0] == 404
+    assert request(f"{base_url}/unknown", method="POST")[0] == 404
+
+
+def test_unix_socket(tmp_path, service: ValidationService):
+    path = str(tmp_path / "validb.sock")
+    server = create_server(service, unix_socket=path)
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True
+    )
+    thread.start()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(10)
+            client.connect(path)
+            client.sendall(b"GET /health HTTP/1.0\r\n\r\n")
+            response = b""
+            while True:
+                chunk = client.recv(65536)
+                if not chunk:
+                    break
+                response += chunk
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    head, _, body = response.partition(b"\r\n\r\n")
+    assert head.startswith(b"HTTP/1.0 200")
+    assert json.loads(body)["status"] == "ok"
+    # the socket file is removed
+    assert not (tmp_path / "validb.sock").exists()
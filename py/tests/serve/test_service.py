@@ -0,0 +1,200 @@
+import logging
+import threading
+import typing as t
+
+import pytest
+
+pytest.importorskip("yaml")
+pytest.importorskip("sqlalchemy")
+
+from validb import RuleExecution, ValidationHook
+from validb.serve import ValidationService
+
+from tests.helpers import write_country_config
+
+SCHEDULES = """
+schedules:
+  - name: nightly
+    cron: "@daily"
+    detection_types: [NULL_YEAR]
+"""
+
+TARGETS = """
+targets:
+  - a
+  - b
+"""
+
+
+class BlockingHook(ValidationHook):
+    """a hook which stops every rule until it is released"""
+
+    def __init__(self) -> None:
+        self.started = threading.Event()
+        self.released = threading.Event()
+
+    def rule_started(self, execution: RuleExecution) -> None:
+        self.started.set()
+        assert self.released.wait(10)
+
+
+def engine_of(service: ValidationService) -> t.Any:
+    generation = service._generation
+    assert generation is not None
+    return generation.config.datasources["db"]._router.replicas[0]._engine
+
+
+@pytest.fixture
+def config_path(tmp_path, sqlite_path: str) -> str:
+    return write_country_config(tmp_path / "validb.yml", sqlite_path, SCHEDULES)
+
+
+def test_validate(config_path: str):
+    with ValidationService(config_path, reload_interval=0) as service:
+        run = service.validate()
+        assert run.error is None
+        assert run.schedule is None
+        assert run.total_count == 5
+
+        summary = run.to_dict(max_detections=1)
+        assert summary["counts"] == {"NULL_YEAR": 2, "TOO_SMALL": 3}
+        assert [rule["outcome"] for rule in summary["rules"]] == ["COMPLETED"] * 2
+        assert len(summary["detections"]) == 1
+        assert "detections" not in run.to_dict()
+
+        run = service.validate(detection_types=["TOO_SMALL"])
+        assert run.to_dict()["counts"] == {"TOO_SMALL": 3}
+
+
+@pytest.mark.parametrize(
+    "kwargs, error",
+    [
+        ({"detection_types": ["UNKNOWN"]}, "unknown detection types: UNKNOWN"),
+        ({"targets": ["a"]}, "no targets are defined"),
+    ],
+)
+def test_invalid_selection(config_path: str, kwargs: t.Mapping[str, t.Any], error: str):
+    with ValidationService(config_path, reload_interval=0) as service:
+        with pytest.raises(ValueError, match=error):
+            service.validate(**kwargs)
+
+
+def test_datasources_are_kept_open_between_validations(config_path: str):
+    service = ValidationService(config_path, reload_interval=0)
+    service.start()
+    generation = service._generation
+
+    service.validate()
+    engine = engine_of(service)
+    assert engine is not None
+    service.validate()
+    assert engine_of(service) is engine
+    # the sessions of the threads are released while no validation is running
+    assert generation.config.datasources["db"]._sessions == []
+
+    service.close()
+    assert generation.config.datasources["db"]._router.replicas[0]._engine is None
+    assert service.status() == {"status": "stopped"}
+
+
+def test_targets(tmp_path, sqlite_path: str):
+    config_path = write_country_config(tmp_path / "validb.yml", sqlite_path, TARGETS)
+    with ValidationService(config_path, reload_interval=0) as service:
+        run = service.validate(targets=["b"])
+        assert list(run.target_results) == ["b"]
+        assert run.total_count == 5
+        assert run.to_dict()["targets"]["b"]["counts"]["NULL_YEAR"] == 2
+
+        with pytest.raises(ValueError, match="unknown targets: c"):
+            service.validate(targets=["c"])
+
+
+def test_reload(tmp_path, sqlite_path: str, config_path: str, caplog):
+    with ValidationService(config_path, reload_interval=0) as service:
+        old_generation = service._generation
+        service.validate()
+        assert not service.reload()
+
+        # a rule is removed
+        with open(config_path, encoding="utf_8") as fp:
+            text = fp.read()
+        start = text.index("  - class", text.index("NULL_YEAR"))
+        end = text.index("datasources:")
+        with open(config_path, mode="w", encoding="utf_8") as fp:
+            fp.write(text[:start] + text[end:] + "# changed\n")
+        assert service.reload()
+        assert service.status()["rules"] == 1
+        assert service.validate().to_dict()["counts"] == {"NULL_YEAR": 2}
+        # the previous datasources are closed since nothing uses them
+        assert (
+            old_generation.config.datasources["db"]._router.replicas[0]._engine is None
+        )
+
+        # a broken config is ignored
+        with open(config_path, mode="a", encoding="utf_8") as fp:
+            fp.write("rules: [{class: unknown}]\n")
+        with caplog.at_level(logging.ERROR):
+            assert not service.reload()
+        assert "the previous one is kept" in caplog.text
+        assert service.status()["rules"] == 1
+        assert service.reload(force=True) is False
+
+
+def test_reload_waits_for_running_validations(config_path: str):
+    hook = BlockingHook()
+    with ValidationService(config_path, reload_interval=0, hooks=[hook]) as service:
+        old_generation = service._generation
+        thread = threading.Thread(target=service.validate)
+        thread.start()
+        assert hook.started.wait(10)
+
+        assert service.reload(force=True)
+        assert old_generation.retired
+        # still open for the running validation
+        old_datasources = old_generation.config.datasources
+        assert old_datasources._opened == {"db"}
+
+        hook.released.set()
+        thread.join(10)
+        assert old_datasources._opened == set()
+
+
+def test_schedules(config_path: str, caplog):
+    hook = BlockingHook()
+    with ValidationService(config_path, reload_interval=0, hooks=[hook]) as service:
+        [schedule] = service.schedules()
+        assert schedule.name == "nightly"
+        assert service.last_run("nightly") is None
+
+        service._start_schedule(schedule)
+        assert hook.started.wait(10)
+        with caplog.at_level(logging.WARNING):
+            service._start_schedule(schedule)
+        assert "schedule nightly is skipped" in caplog.text
+        hook.released.set()
+        service._scheduled["nightly"].join(10)
+
+        run = service.last_run("nightly")
+        assert run is not None and run.schedule == "nightly"
+        assert run.to_dict()["counts"] == {"NULL_YEAR": 2}
+
+        [status] = service.status()["schedules"]
+        assert status["cron"] == "@daily"
+        assert status["next_run"].endswith("T00:00")
+        assert status["last_run"]["schedule"] == "nightly"
+
+
+def test_metrics_of_last_validation(config_path: str):
+    with ValidationService(config_path, reload_interval=0) as service:
+        assert service.metrics() is None
+        service.validate()
+        metrics = service.metrics()
+        assert metrics is not None
+        assert 'validb_rules{outcome="COMPLETED"} 2' in metrics
+
+
+def test_invalid_arguments(config_path: str):
+    with pytest.raises(ValueError, match="reload_interval must not be negative"):
+        ValidationService(config_path, reload_interval=-1)
+    with pytest.raises(ValueError, match="max_concurrent_runs must be positive"):
+        ValidationService(config_path, max_concurrent_runs=0)
@@ -0,0 +1,229 @@
+import csv
+import typing as t
+
+import pytest
+
+from validb import (
+    Baseline,
+    DataSources,
+    DetectionData,
+    EmbeddedVariables,
+    ResultArchive,
+    TextDetected,
+    validate_db,
+)
+
+from tests.helpers import StaticRule
+
+NO_VARS = EmbeddedVariables((), {})
+
+DETECTIONS = [
+    # id, level, detection_type, msg
+    ("b", 1, "TYPE_X", "x of b"),
+    ("a", 0, "TYPE_Y", "y of a"),
+    ("b", 0, "TYPE_Y", "y of b"),
+    ("é", 1, "TYPE_X", "x of é"),
+    ("a", 1, "TYPE_X", "x of a"),
+    (None, 2, "TYPE_Z", None),
+    ("𝔸", 1, "TYPE_X", "x of 𝔸"),
+]
+
+
+def detection_data(
+    detections: t.Iterable[t.Tuple[t.Any, int, str, t.Any]] = DETECTIONS,
+    max_detection_per_type: t.Optional[int] = None,
+) -> DetectionData[str, str, str]:
+    data: DetectionData[str, str, str] = DetectionData(
+        max_detection=None, max_detection_per_type=max_detection_per_type
+    )
+    for id_, level, detection_type, msg in detections:
+        data.append(TextDetected(id_, level, detection_type, msg, NO_VARS))
+    return data
+
+
+def rows(detections: t.Iterable[t.Any]) -> t.List[t.Tuple[t.Any, ...]]:
+    return [(d.id, d.level, d.detection_type, d.msg) for d in detections]
+
+
+@pytest.fixture
+def archive(tmp_path) -> t.Iterator[ResultArchive]:
+    data = detection_data()
+    data.record_elapsed(1.5, 2.0)
+    ResultArchive.write(tmp_path / "archive", data)
+    with ResultArchive(tmp_path / "archive") as archive:
+        yield archive
+
+
+def test_of_id(archive: ResultArchive):
+    # in the order of values()
+    assert rows(archive.of_id("b")) == [
+        ("b", 1, "TYPE_X", "x of b"),
+        ("b", 0, "TYPE_Y", "y of b"),
+    ]
+    assert rows(archive.of_id("é")) == [("é", 1, "TYPE_X", "x of é")]
+    assert rows(archive.of_id("𝔸")) == [("𝔸", 1, "TYPE_X", "x of 𝔸")]
+    assert rows(archive.of_id(None)) == [(None, 2, "TYPE_Z", None)]
+    assert len(archive.of_id("c")) == 0
+    # a string in the table which is not an ID
+    assert len(archive.of_id("TYPE_X")) == 0
+
+
+def test_of_detection_type(archive: ResultArchive):
+    detections = archive.of_detection_type("TYPE_X")
+
+    # in the order of values()
+    assert rows(detections) == [
+        row for row in rows(detection_data().values()) if row[2] == "TYPE_X"
+    ]
+    assert rows(detections[1:3]) == rows(list(detections)[1:3])
+    assert detections[-1].id == "𝔸"
+    assert len(archive.of_detection_type("TYPE_W")) == 0
+
+
+def test_of_level_detection_type(archive: ResultArchive):
+    assert [d.id for d in archive.of_level_detection_type(0, "TYPE_Y")] == [
+        "b",
+        "a",
+    ]
+    assert len(archive.of_level_detection_type(1, "TYPE_Y")) == 0
+    assert len(archive.of_level_detection_type(2, "TYPE_X")) == 0
+    assert [d.id for d in archive.of_level_detection_type(2, "TYPE_Z")] == [None]
+
+
+def test_getitem(archive: ResultArchive):
+    assert [d.detection_type for d in archive["a"]] == ["TYPE_Y", "TYPE_X"]
+    assert [d.id for d in archive["TYPE_Y"]] == ["b", "a"]
+    assert [d.id for d in archive[(2, "TYPE_Z")]] == [None]
+    with pytest.raises(KeyError):
+        archive["missing"]
+
+
+def test_behaves_as_detection_data(archive: ResultArchive):
+    data = detection_data()
+
+    assert rows(archive.values()) == rows(data.values())
+    assert list(archive.ids()) == sorted(
+        {id_ for id_, _, _, _ in DETECTIONS if id_ is not None}
+    ) + [None]
+    assert sorted(archive.detection_types()) == ["TYPE_X", "TYPE_Y", "TYPE_Z"]
+    assert sorted(archive.levels_detection_types(), key=str) == sorted(
+        data.levels_detection_types(), key=str
+    )
+    assert (archive.count, archive.total_count) == (7, 7)
+    assert archive.count_of("TYPE_X") == 4
+    assert list(archive.truncated_detection_types()) == []
+    assert (archive.too_many_detection, archive.failed_fast) == (False, False)
+    assert (archive.elapsed, archive.predicted_elapsed) == (1.5, 2.0)
+    assert archive.rule_results == ()
+
+
+def test_is_read_only(archive: ResultArchive):
+    with pytest.raises(TypeError, match="read-only"):
+        archive.append(TextDetected("c", 0, "TYPE_X", "", NO_VARS))
+    with pytest.raises(TypeError, match="read-only"):
+        archive.mark_failed_fast()
+
+
+def test_truncated_detection_types(tmp_path):
+    data = detection_data(max_detection_per_type=2)
+    ResultArchive.write(tmp_path / "archive", data)
+
+    with ResultArchive(tmp_path / "archive") as archive:
+        assert archive.count_of("TYPE_X") == 4
+        assert len(archive.of_detection_type("TYPE_X")) == 2
+        assert list(archive.truncated_detection_types()) == ["TYPE_X"]
+        assert (archive.count, archive.total_count) == (5, 7)
+
+
+def test_empty_archive(tmp_path):
+    ResultArchive.write(tmp_path / "archive", detection_data(()))
+
+    with ResultArchive(tmp_path / "archive") as archive:
+        assert archive.count == 0
+        assert list(archive.values()) == []
+        assert list(archive.ids()) == []
+        assert len(archive.of_id("a")) == 0
+        assert len(archive.of_detection_type("TYPE_X")) == 0
+
+
+def test_diff_with_baseline(tmp_path):
+    Baseline.write(tmp_path / "baseline", detection_data(DETECTIONS[:-1]))
+    ResultArchive.write(tmp_path / "archive", detection_data(DETECTIONS[1:]))
+
+    with Baseline(tmp_path / "baseline") as baseline, ResultArchive(
+        tmp_path / "archive"
+    ) as archive:
+        diff = archive.diff(baseline)
+
+    assert rows(diff.new) == [("𝔸", 1, "TYPE_X", "x of 𝔸")]
+    assert [(e.id, e.detection_type) for e in diff.resolved] == [("b", "TYPE_X")]
+    assert diff.unchanged == 5
+
+
+def test_unfinished_detection_types(tmp_path):
+    data = validate_db(
+        rules=[StaticRule("A", ["x"]), StaticRule("B", ["y"], timeout=0.05, delay=0.2)],
+        datasources=DataSources(),
+        embedders={},
+    )
+    ResultArchive.write(tmp_path / "archive", data)
+
+    with ResultArchive(tmp_path / "archive") as archive:
+        assert list(archive.unfinished_detection_types()) == ["B"]
+
+
+@pytest.mark.parametrize("content", [b"", b"VALIDBRA", b"NOTVALIDB" + b"\0" * 300])
+def test_invalid_file(tmp_path, content: bytes):
+    (tmp_path / "archive").write_bytes(content)
+
+    with pytest.raises(ValueError, match="archive"):
+        ResultArchive(tmp_path / "archive")
+
+
+def test_cli_archive_and_query(tmp_path, sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("yaml")
+    pytest.importorskip("click")
+    from click.testing import CliRunner
+
+    from validb.__main__ import main
+    from tests.helpers import write_country_config
+
+    config_path = write_country_config(tmp_path / "validb.yml", sqlite_path)
+    archive_path = str(tmp_path / "archive")
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["-c", config_path, "--archive", archive_path])
+    assert "Detected: 5" in result.output, result.output
+
+    def query(*args: str) -> t.List[t.List[str]]:
+        result = runner.invoke(main, ["query", archive_path, *args])
+        assert result.exit_code == 0, result.output
+        return list(csv.reader(result.output.splitlines()))
+
+    assert sorted(row[:3] for row in query("--id", "AAA")) == [
+        ["AAA", "0", "NULL_YEAR"],
+        ["AAA", "1", "TOO_SMALL"],
+    ]
+    assert sorted(row[0] for row in query("--detection-type", "TOO_SMALL")) == [
+        "AAA",
+        "CCC",
+        "EEE",
+    ]
+    assert sorted(query("--id", "AAA", "--id", "DDD", "--level", "0")) == sorted(
+        query("--detection-type", "NULL_YEAR")
+    )
+    assert query("--id", "BBB") == []
+
+    result = runner.invoke(main, ["query", archive_path, "--count"])
+    assert "Detected: 5" in result.output, result.output
+    result = runner.invoke(main, ["query", archive_path, "--count", "--level", "1"])
+    assert "Detected: 3" in result.output, result.output
+
+    output = tmp_path / "out.csv"
+    result = runner.invoke(
+        main, ["query", archive_path, "--id", "CCC", "-D", str(output)]
+    )
+    assert result.exit_code == 0, result.output
+    with open(output, newline="", encoding="utf_8") as fp:
+        assert [row[:3] for row in csv.reader(fp)] == [["CCC", "1", "TOO_SMALL"]]
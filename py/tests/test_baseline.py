@@ -0,0 +1,283 @@
+import csv
+import sqlite3
+import typing as t
+
+import pytest
+
+from validb import (
+    Baseline,
+    BaselineEntry,
+    CostBudget,
+    CostGuard,
+    CostGuardAction,
+    DataSources,
+    DetectionData,
+    EmbeddedVariables,
+    RuleOutcome,
+    TextDetected,
+    validate_db,
+)
+
+from tests.helpers import StaticRule
+
+NO_VARS = EmbeddedVariables((), {})
+
+
+def detection_data(
+    *detections: t.Tuple[str, int, str, str],
+    max_detection_per_type: t.Optional[int] = None,
+) -> DetectionData[str, str, str]:
+    """detections of (id, level, detection_type, msg)"""
+    data: DetectionData[str, str, str] = DetectionData(
+        max_detection=None, max_detection_per_type=max_detection_per_type
+    )
+    for id_, level, detection_type, msg in detections:
+        data.append(TextDetected(id_, level, detection_type, msg, NO_VARS))
+    return data
+
+
+def keys(detections) -> t.List[t.Tuple[str, str]]:
+    return sorted((d.detection_type, d.id) for d in detections)
+
+
+def test_diff_reports_new_changed_and_resolved(tmp_path):
+    path = tmp_path / "baseline"
+    Baseline.write(
+        path,
+        detection_data(
+            ("1", 0, "A", "same"),
+            ("2", 0, "A", "before"),
+            ("3", 1, "A", "level"),
+            ("4", 0, "B", "resolved"),
+        ),
+    )
+
+    current = detection_data(
+        ("1", 0, "A", "same"),
+        ("2", 0, "A", "after"),
+        ("3", 2, "A", "level"),
+        ("4", 0, "A", "new since the detection type differs"),
+        ("5", 0, "B", "new"),
+    )
+    with Baseline(path) as baseline:
+        assert len(baseline) == 4
+        diff = current.diff(baseline)
+
+    assert keys(diff.new) == [("A", "4"), ("B", "5")]
+    assert keys(diff.changed) == [("A", "2"), ("A", "3")]
+    assert diff.resolved == [BaselineEntry("B", "4", 0, "resolved")]
+    assert diff.unchanged == 1
+
+
+def test_diff_with_itself_is_empty(tmp_path):
+    data = detection_data(
+        *((str(i), i % 3, f"T{i % 4}", f"msg {i}") for i in range(1000))
+    )
+    Baseline.write(tmp_path / "baseline", data)
+
+    with Baseline(tmp_path / "baseline") as baseline:
+        diff = data.diff(baseline)
+
+    assert (diff.new, diff.changed, diff.resolved) == ([], [], [])
+    assert diff.unchanged == 1000
+
+
+def test_key_detected_many_times(tmp_path):
+    Baseline.write(
+        tmp_path / "baseline",
+        detection_data(("1", 0, "A", "x"), ("1", 0, "A", "y")),
+    )
+
+    with Baseline(tmp_path / "baseline") as baseline:
+        # the order of the detections of a key does not matter
+        assert (
+            detection_data(("1", 0, "A", "y"), ("1", 0, "A", "x"))
+            .diff(baseline)
+            .unchanged
+            == 1
+        )
+        changed = detection_data(("1", 0, "A", "x")).diff(baseline).changed
+        # only the first detection of a key is kept in the baseline
+        assert baseline.lookup("A", "1") == BaselineEntry("A", "1", 0, "x")
+
+    assert keys(changed) == [("A", "1")]
+
+
+def test_none_is_distinguished_from_the_string(tmp_path):
+    Baseline.write(tmp_path / "baseline", detection_data((None, 0, "A", "m")))
+
+    with Baseline(tmp_path / "baseline") as baseline:
+        assert baseline.lookup("A", None) == BaselineEntry("A", None, 0, "m")
+        assert baseline.lookup("A", "None") is None
+        diff = detection_data(("None", 0, "A", "m")).diff(baseline)
+
+    assert keys(diff.new) == [("A", "None")]
+    assert diff.resolved == [BaselineEntry("A", None, 0, "m")]
+
+
+def test_lookup(tmp_path):
+    Baseline.write(
+        tmp_path / "baseline",
+        detection_data(*((str(i), 1, "A", f"msg {i}") for i in range(100))),
+    )
+
+    with Baseline(tmp_path / "baseline") as baseline:
+        for i in range(100):
+            assert baseline.lookup("A", i) == BaselineEntry("A", str(i), 1, f"msg {i}")
+        assert baseline.lookup("A", 100) is None
+        assert baseline.lookup("B", 0) is None
+        records = list(baseline.records())
+
+    assert [key for key, _, _ in records] == sorted(key for key, _, _ in records)
+
+
+def test_empty_baseline(tmp_path):
+    Baseline.write(tmp_path / "baseline", detection_data())
+
+    with Baseline(tmp_path / "baseline") as baseline:
+        assert len(baseline) == 0
+        assert baseline.lookup("A", "1") is None
+        diff = detection_data(("1", 0, "A", "m")).diff(baseline)
+
+    assert keys(diff.new) == [("A", "1")]
+
+
+def test_truncated_detection_types_are_not_resolved(tmp_path):
+    Baseline.write(
+        tmp_path / "baseline",
+        detection_data(("1", 0, "A", "m"), ("2", 0, "A", "m"), ("3", 0, "B", "m")),
+    )
+
+    current = detection_data(
+        ("3", 0, "A", "m"), ("4", 0, "A", "m"), max_detection_per_type=1
+    )
+    with Baseline(tmp_path / "baseline") as baseline:
+        diff = current.diff(baseline)
+
+    assert diff.resolved == [BaselineEntry("B", "3", 0, "m")]
+
+
+def validate(*rules: StaticRule, **kwargs: t.Any) -> DetectionData[str, str, str]:
+    return validate_db(rules=rules, datasources=DataSources(), embedders={}, **kwargs)
+
+
+def test_rule_skipped_by_cost_guard_is_not_resolved(tmp_path):
+    path = tmp_path / "baseline"
+    Baseline.write(path, validate(StaticRule("A", ["x", "y"]), StaticRule("B", ["z"])))
+
+    data = validate(
+        StaticRule("A", ["x", "y"], estimated_rows=1000),
+        StaticRule("B", []),
+        cost_guard=CostGuard(CostBudget(max_rows=100), action=CostGuardAction.SKIP),
+    )
+    with Baseline(path) as baseline:
+        diff = data.diff(baseline)
+
+    assert list(data.unfinished_detection_types()) == ["A"]
+    assert diff.resolved == [BaselineEntry("B", "z", 0, "B of z")]
+
+    # the keys of the skipped rule are kept in the new baseline
+    with Baseline(path) as previous:
+        Baseline.write(path, data, previous=previous)
+    with Baseline(path) as baseline:
+        assert len(baseline) == 2
+        assert baseline.lookup("A", "x") == BaselineEntry("A", "x", 0, "A of x")
+        assert baseline.lookup("B", "z") is None
+        diff = validate(StaticRule("A", ["x", "y"])).diff(baseline)
+    assert (diff.new, diff.changed, diff.unchanged) == ([], [], 2)
+
+
+def test_rules_not_started_after_fail_fast_are_not_resolved(tmp_path):
+    Baseline.write(
+        tmp_path / "baseline",
+        validate(StaticRule("A", ["x", "y"]), StaticRule("FATAL", [], level=2)),
+    )
+
+    data = validate(
+        StaticRule("A", ["x", "y"]),
+        StaticRule("FATAL", ["f"], level=2),
+        fail_fast_level=2,
+    )
+    with Baseline(tmp_path / "baseline") as baseline:
+        diff = data.diff(baseline)
+
+    assert data.failed_fast
+    results = {r.rule.detection_type(): r for r in data.rule_results}
+    assert (results["A"].outcome, results["A"].detail) == (
+        RuleOutcome.SKIPPED,
+        "fail-fast",
+    )
+    # FATAL is stopped at its first detection
+    assert sorted(data.unfinished_detection_types()) == ["A", "FATAL"]
+    assert keys(diff.new) == [("FATAL", "f")]
+    assert diff.resolved == []
+
+
+def test_baseline_is_replaced_atomically(tmp_path):
+    path = tmp_path / "baseline"
+    Baseline.write(path, detection_data(("1", 0, "A", "m")))
+
+    with Baseline(path) as baseline:
+        # the open baseline keeps its content while the file is replaced
+        Baseline.write(path, detection_data(("2", 0, "A", "m")))
+        assert baseline.lookup("A", "1") is not None
+
+    with Baseline(path) as baseline:
+        assert baseline.lookup("A", "1") is None
+        assert baseline.lookup("A", "2") is not None
+    assert [p.name for p in tmp_path.iterdir()] == ["baseline"]
+
+
+@pytest.mark.parametrize("content", [b"", b"VALIDB", b"NOTVALIDB" + b"\0" * 32])
+def test_invalid_file(tmp_path, content: bytes):
+    (tmp_path / "baseline").write_bytes(content)
+
+    with pytest.raises(ValueError, match="baseline"):
+        Baseline(tmp_path / "baseline")
+
+
+def test_cli_baseline(tmp_path, sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("yaml")
+    pytest.importorskip("click")
+    from click.testing import CliRunner
+
+    from validb.__main__ import main
+    from tests.helpers import write_country_config
+
+    config_path = write_country_config(tmp_path / "validb.yml", sqlite_path)
+    baseline_path = str(tmp_path / "baseline")
+    output = tmp_path / "out.csv"
+    runner = CliRunner()
+
+    result = runner.invoke(
+        main,
+        [
+            *("-c", config_path),
+            *("--baseline", baseline_path),
+            *("--save-baseline", baseline_path),
+        ],
+    )
+    assert "all detections are new" in result.output, result.output
+    assert "New: 5, Changed: 0, Resolved: 0, Unchanged: 0" in result.output
+
+    connection = sqlite3.connect(sqlite_path)
+    with connection:
+        connection.execute("DELETE FROM country WHERE Code = 'CCC'")
+        connection.execute("UPDATE country SET Population = 2000 WHERE Code = 'AAA'")
+        connection.execute("INSERT INTO country VALUES ('FFF', 1.0, 1, NULL)")
+    connection.close()
+
+    result = runner.invoke(
+        main, ["-c", config_path, "--baseline", baseline_path, "-D", str(output)]
+    )
+    assert (
+        "New: 1, Changed: 1, Resolved: 1, Unchanged: 3" in result.output
+    ), result.output
+    with open(output, newline="", encoding="utf_8") as fp:
+        rows = sorted((row[0], row[1], row[3]) for row in csv.reader(fp))
+    assert rows == [
+        ("CHANGED", "AAA", "TOO_SMALL"),
+        ("NEW", "FFF", "NULL_YEAR"),
+        ("RESOLVED", "CCC", "TOO_SMALL"),
+    ]
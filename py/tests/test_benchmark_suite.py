@@ -0,0 +1,117 @@
+import copy
+import importlib.util
+import json
+import os
+import pathlib
+import subprocess
+import sys
+import types
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+SUITE_PATH = ROOT / "benchmarks" / "suite.py"
+
+
+def load_suite() -> types.ModuleType:
+    spec = importlib.util.spec_from_file_location("benchmark_suite", SUITE_PATH)
+    assert spec is not None and spec.loader is not None
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def run_suite(*args: str) -> subprocess.CompletedProcess:
+    env = {**os.environ, "PYTHONPATH": str(ROOT / "src")}
+    return subprocess.run(
+        [sys.executable, str(SUITE_PATH), *args],
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        timeout=120,
+    )
+
+
+def test_small_run(tmp_path):
+    output = tmp_path / "result.json"
+    completed = run_suite(
+        "--rows",
+        "500",
+        "--anomaly-rates",
+        "0.1",
+        "--rules",
+        "1",
+        "3",
+        "--workers",
+        "1",
+        "2",
+        "--workdir",
+        str(tmp_path),
+        "-o",
+        str(output),
+    )
+    assert completed.returncode == 0, completed.stderr
+
+    result = json.loads(output.read_text())
+    assert [(case["rules"], case["workers"]) for case in result["cases"]] == [
+        (1, 1),
+        (1, 2),
+        (3, 1),
+        (3, 2),
+    ]
+    detections = {case["metrics"]["detections"] for case in result["cases"]}
+    # the rules divide the categories, so they detect the same anomalies in total
+    assert len(detections) == 1 and 0 < detections.pop() < 500
+    for case in result["cases"]:
+        assert case["rows_in_table"] == 500
+        assert case["metrics"]["peak_rss_bytes"] > 0
+        assert case["metrics"]["result_rows"] == case["metrics"]["detections"]
+
+    # the database is reused,
+    # and the same run is not a regression of itself with a large tolerance
+    completed = run_suite(
+        "--rows",
+        "500",
+        "--anomaly-rates",
+        "0.1",
+        "--rules",
+        "1",
+        "--workdir",
+        str(tmp_path),
+        "-o",
+        str(tmp_path / "again.json"),
+        "--baseline",
+        str(output),
+        "--tolerance",
+        "100",
+    )
+    assert completed.returncode == 0, completed.stderr
+
+
+def test_compare():
+    suite = load_suite()
+    case = {
+        "rows_in_table": 100,
+        "anomaly_rate": 0.01,
+        "rules": 1,
+        "workers": 1,
+        "metrics": {"rows_per_sec": 1000.0, "validate_elapsed": 1.0, "detections": 1},
+    }
+    baseline = {"cases": [case]}
+    result = {"cases": [copy.deepcopy(case)]}
+    assert suite.compare(result, baseline, 0.2) == []
+
+    result["cases"][0]["metrics"].update(
+        rows_per_sec=700.0, validate_elapsed=1.1, detections=5
+    )
+    assert suite.compare(result, baseline, 0.2) == [
+        "(100, 0.01, 1, 1) rows_per_sec: 1000 -> 700 (-30.0%)"
+    ]
+
+    result["cases"][0]["metrics"].update(rows_per_sec=1000.0, validate_elapsed=1.5)
+    assert suite.compare(result, baseline, 0.2) == [
+        "(100, 0.01, 1, 1) validate_elapsed: 1 -> 1.5 (+50.0%)"
+    ]
@@ -0,0 +1,312 @@
+import json
+import typing as t
+
+import pytest
+
+from validb import (
+    Checkpoint,
+    DataSources,
+    RuleOutcome,
+    ValidationHook,
+    validate_db,
+    validate_targets,
+)
+
+from tests.helpers import RecordingDataSource, StaticRule
+
+
+def static_datasources() -> DataSources:
+    return DataSources({})
+
+
+def run(rules, checkpoint: Checkpoint, **kwargs):
+    return validate_db(
+        rules=rules,
+        datasources=kwargs.pop("datasources", None) or static_datasources(),
+        embedders={},
+        checkpoint=checkpoint,
+        **kwargs,
+    )
+
+
+def outcomes(data) -> t.Dict[str, t.Tuple[RuleOutcome, t.Optional[str]]]:
+    return {
+        str(result.rule.detection_type()): (result.outcome, result.detail)
+        for result in data.rule_results
+    }
+
+
+def test_completed_rules_are_skipped_and_merged_on_resume(tmp_path):
+    first = [StaticRule("A", ["1", "2"]), StaticRule("B", ["3"])]
+    run(first, Checkpoint(tmp_path))
+
+    second = [StaticRule("A", ["1", "2"]), StaticRule("B", ["3"])]
+    data = run(second, Checkpoint(tmp_path, resume=True))
+
+    assert [rule.executed for rule in second] == [0, 0]
+    assert sorted(detected.id for detected in data.values()) == ["1", "2", "3"]
+    assert [detected.msg for detected in data["A"]] == ["A of 1", "A of 2"]
+    assert outcomes(data) == {
+        "A": (RuleOutcome.COMPLETED, "checkpoint"),
+        "B": (RuleOutcome.COMPLETED, "checkpoint"),
+    }
+    assert {result.rows for result in data.rule_results} == {2, 1}
+
+
+def test_not_resuming_clears_the_directory(tmp_path):
+    run([StaticRule("A", ["1"])], Checkpoint(tmp_path))
+    assert (tmp_path / "manifest.json").exists()
+
+    checkpoint = Checkpoint(tmp_path)
+
+    assert list(tmp_path.iterdir()) == []
+    rule = StaticRule("A", ["1"])
+    run([rule], checkpoint)
+    assert rule.executed == 1
+
+
+@pytest.mark.parametrize(
+    "changed",
+    [
+        StaticRule("A", ["1"], level=1),
+        StaticRule("A", ["1"], sql="SELECT 1"),
+        StaticRule("A", ["1"], datasource="db"),
+    ],
+)
+def test_changed_rule_is_executed_again(tmp_path, changed):
+    run([StaticRule("A", ["1"])], Checkpoint(tmp_path))
+
+    run(
+        [changed],
+        Checkpoint(tmp_path, resume=True),
+        datasources=DataSources({"db": RecordingDataSource()}),
+    )
+
+    assert changed.executed == 1
+
+
+def test_broken_or_foreign_manifest_is_ignored(tmp_path):
+    run([StaticRule("A", ["1"])], Checkpoint(tmp_path))
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+
+    manifest["format"] += 1
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest))
+    rule = StaticRule("A", ["1"])
+    run([rule], Checkpoint(tmp_path, resume=True))
+    assert rule.executed == 1
+
+    (tmp_path / "manifest.json").write_text("{broken")
+    rule = StaticRule("A", ["1"])
+    run([rule], Checkpoint(tmp_path, resume=True))
+    assert rule.executed == 1
+
+
+def test_unserializable_detections_are_executed_again(tmp_path):
+    class ObjectRule(StaticRule):
+        def id_of_row(self, embedded_vars):
+            return object()
+
+    run([ObjectRule("A", ["1"])], Checkpoint(tmp_path))
+
+    rule = ObjectRule("A", ["1"])
+    run([rule], Checkpoint(tmp_path, resume=True))
+    assert rule.executed == 1
+
+
+@pytest.mark.parametrize("target", ["", ".", "..", "../x", "a/b", "a..b"])
+def test_target_must_be_a_plain_name(tmp_path, target):
+    with pytest.raises(ValueError, match="target must be a name"):
+        Checkpoint(tmp_path).for_target(target)
+
+
+def test_targets_are_checkpointed_in_subdirectories(tmp_path):
+    def targets() -> t.Dict[str, DataSources]:
+        return {name: DataSources({"db": RecordingDataSource()}) for name in ("a", "b")}
+
+    validate_targets(
+        targets=targets(),
+        rules=[StaticRule("A", ["1"], datasource="db")],
+        embedders={},
+        checkpoint=Checkpoint(tmp_path),
+    )
+    assert sorted(path.name for path in (tmp_path / "targets").iterdir()) == ["a", "b"]
+
+    rule = StaticRule("A", ["1"], datasource="db")
+    results = validate_targets(
+        targets=targets(),
+        rules=[rule],
+        embedders={},
+        checkpoint=Checkpoint(tmp_path, resume=True),
+    )
+
+    assert rule.executed == 0
+    assert {
+        name: result.detection_data.count_of("A") for name, result in results.items()
+    } == {"a": 1, "b": 1}
+
+
+def test_invalid_target_name_fails_only_the_target(tmp_path):
+    results = validate_targets(
+        targets={
+            name: DataSources({"db": RecordingDataSource()}) for name in ("ok", "../up")
+        },
+        rules=[StaticRule("A", ["1"], datasource="db")],
+        embedders={},
+        checkpoint=Checkpoint(tmp_path),
+    )
+
+    assert results["ok"].error is None
+    assert isinstance(results["../up"].error, ValueError)
+    assert not (tmp_path / "up").exists()
+
+
+class InterruptAfterPages(ValidationHook):
+    """a hook cancelling rules after the given number of committed pages"""
+
+    def __init__(self, pages: int) -> None:
+        self.pages = pages
+        self.keys: t.List[t.Any] = []
+
+    def rule_started(self, execution) -> None:
+        def committed(key: t.Any) -> None:
+            self.keys.append(key)
+            if len(self.keys) >= self.pages:
+                execution.cancel("interrupted")
+
+        execution.on_progress(committed)
+
+
+@pytest.mark.parametrize("render_in_sql", [False, True])
+def test_paginated_rule_resumes_from_the_last_page(
+    tmp_path, sqlite_path, render_in_sql
+):
+    pytest.importorskip("sqlalchemy")
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+    from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+    def rule() -> SimpleSQLAlchemyRule:
+        return SimpleSQLAlchemyRule(
+            sql="SELECT Code, Population FROM country WHERE Population < 500",
+            id="{Code}",
+            detection_type="SMALL",
+            msg="{Code}: {Population}",
+            datasource="db",
+            page_by="Code",
+            page_size=1,
+            render_in_sql=render_in_sql,
+        )
+
+    def validate(checkpoint: Checkpoint, hooks=()):
+        with DataSources(
+            {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+        ) as datasources:
+            return validate_db(
+                rules=[rule()],
+                datasources=datasources,
+                embedders={},
+                checkpoint=checkpoint,
+                hooks=hooks,
+            )
+
+    interrupt = InterruptAfterPages(2)
+    interrupted = validate(Checkpoint(tmp_path), hooks=[interrupt])
+
+    assert interrupt.keys == [["BBB"], ["CCC"]]
+    assert outcomes(interrupted) == {"SMALL": (RuleOutcome.CANCELLED, "interrupted")}
+    assert [detected.id for detected in interrupted["SMALL"]] == ["BBB", "CCC"]
+
+    resumed_keys = InterruptAfterPages(100)
+    resumed = validate(Checkpoint(tmp_path, resume=True), hooks=[resumed_keys])
+
+    # the rule continues after CCC instead of the beginning
+    assert resumed_keys.keys == [["DDD"], ["EEE"]]
+    assert [(detected.id, detected.msg) for detected in resumed["SMALL"]] == [
+        ("BBB", "BBB: 10"),
+        ("CCC", "CCC: 300"),
+        ("DDD", "DDD: 7"),
+        ("EEE", "EEE: 50"),
+    ]
+    (result,) = resumed.rule_results
+    assert (result.outcome, result.rows, result.detections) == (
+        RuleOutcome.COMPLETED,
+        4,
+        4,
+    )
+
+    # completed by the resumed validation
+    completed = validate(Checkpoint(tmp_path, resume=True))
+    assert outcomes(completed) == {"SMALL": (RuleOutcome.COMPLETED, "checkpoint")}
+    assert completed.count_of("SMALL") == 4
+
+
+def test_page_query():
+    sqlalchemy = pytest.importorskip("sqlalchemy")
+    from validb.rules.sqlalchemy._rendering import page_query
+
+    dialect = sqlalchemy.create_engine("sqlite://").dialect
+
+    sql, params = page_query(
+        "SELECT * FROM t", page_by=["a"], after=None, page_size=10, dialect=dialect
+    )
+    assert " ".join(sql.split()) == (
+        "SELECT _validb_q.* FROM (SELECT * FROM t) _validb_q"
+        " ORDER BY _validb_q.a LIMIT :_validb_page_size"
+    )
+    assert params == {"_validb_page_size": 10}
+
+    sql, params = page_query(
+        "SELECT * FROM t",
+        page_by=["a", "order"],
+        after=[1, "x"],
+        page_size=10,
+        dialect=dialect,
+    )
+    assert " ".join(sql.split()).endswith(
+        "WHERE (_validb_q.a > :_validb_k0)"
+        ' OR (_validb_q.a = :_validb_k0 AND _validb_q."order" > :_validb_k1)'
+        ' ORDER BY _validb_q.a, _validb_q."order" LIMIT :_validb_page_size'
+    )
+    assert params == {"_validb_k0": 1, "_validb_k1": "x", "_validb_page_size": 10}
+
+
+def test_paging_parameters_are_validated():
+    pytest.importorskip("sqlalchemy")
+    from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+    kwargs = dict(sql="SELECT 1", id="", detection_type="T", msg="", datasource="db")
+    with pytest.raises(ValueError, match="page_size must be positive"):
+        SimpleSQLAlchemyRule(**kwargs, page_by="a", page_size=0)
+    with pytest.raises(ValueError, match="page_by must contain"):
+        SimpleSQLAlchemyRule(**kwargs, page_by=[])
+
+
+def test_fingerprint_covers_the_templates():
+    pytest.importorskip("sqlalchemy")
+    from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+    def fingerprint(**kwargs: t.Any) -> str:
+        return SimpleSQLAlchemyRule(
+            **{
+                "sql": "SELECT Code FROM country",
+                "id": "{Code}",
+                "detection_type": "T",
+                "msg": "{Code}",
+                "datasource": "db",
+                **kwargs,
+            }
+        ).fingerprint()
+
+    assert fingerprint() == fingerprint()
+    assert (
+        len(
+            {
+                fingerprint(),
+                fingerprint(msg="code {Code}"),
+                fingerprint(id="id-{Code}"),
+                fingerprint(embedders=["e"]),
+                fingerprint(page_by="Code"),
+                fingerprint(render_in_sql=True),
+            }
+        )
+        == 6
+    )
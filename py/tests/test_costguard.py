@@ -0,0 +1,162 @@
+import typing as t
+
+import pytest
+
+from validb import (
+    CostBudget,
+    CostBudgetExceededError,
+    CostGuard,
+    CostGuardAction,
+    DataSources,
+    RuleOutcome,
+    validate_db,
+)
+from validb.datasources import QueryEstimate
+
+from tests.helpers import StaticRule
+
+
+def test_budget_violation():
+    budget = CostBudget(max_rows=100, max_cost=50)
+
+    assert budget.violation(QueryEstimate(rows=100, cost=50)) is None
+    assert budget.violation(QueryEstimate(rows=None, cost=None)) is None
+    assert (
+        budget.violation(QueryEstimate(rows=101, cost=None))
+        == "estimated rows 101 > 100"
+    )
+    assert budget.violation(QueryEstimate(rows=1, cost=51)) == "estimated cost 51 > 50"
+
+
+def test_check_prefers_budget_of_rule():
+    large = StaticRule("LARGE", estimated_rows=1000)
+    allowed = StaticRule(
+        "ALLOWED", estimated_rows=1000, cost_budget=CostBudget(max_rows=5000)
+    )
+    unknown = StaticRule("UNKNOWN")
+    guard = CostGuard(CostBudget(max_rows=100))
+
+    violations = guard.check([large, allowed, unknown], datasources=DataSources())
+
+    assert violations == [(large, "estimated rows 1000 > 100")]
+
+
+def test_check_without_budget_does_not_estimate():
+    rule = StaticRule("LARGE", estimated_rows=1000)
+
+    assert CostGuard().check([rule], datasources=DataSources()) == []
+
+
+def test_fail_action_raises():
+    rule = StaticRule("LARGE", estimated_rows=1000)
+    guard = CostGuard(CostBudget(max_rows=100), action=CostGuardAction.FAIL)
+
+    with pytest.raises(CostBudgetExceededError) as e:
+        validate_db(
+            rules=[rule], datasources=DataSources(), embedders={}, cost_guard=guard
+        )
+    assert e.value.violations == [(rule, "estimated rows 1000 > 100")]
+    assert rule.executed == 0
+
+
+def test_skip_action_skips_rules_over_budget():
+    large = StaticRule("LARGE", ["x"], estimated_rows=1000)
+    small = StaticRule("SMALL", ["y"], estimated_rows=10)
+    guard = CostGuard(CostBudget(max_rows=100), action=CostGuardAction.SKIP)
+
+    data = validate_db(
+        rules=[large, small], datasources=DataSources(), embedders={}, cost_guard=guard
+    )
+
+    assert list(data.detection_types()) == ["SMALL"]
+    skipped = [r for r in data.rule_results if r.outcome == RuleOutcome.SKIPPED]
+    assert [(r.rule, r.detail) for r in skipped] == [
+        (large, "estimated rows 1000 > 100")
+    ]
+
+
+def test_warn_action_executes_rules_over_budget():
+    large = StaticRule("LARGE", ["x"], estimated_rows=1000)
+    guard = CostGuard(CostBudget(max_rows=100), action=CostGuardAction.WARN)
+
+    data = validate_db(
+        rules=[large], datasources=DataSources(), embedders={}, cost_guard=guard
+    )
+
+    assert data.count_of("LARGE") == 1
+
+
+def test_parse_plans():
+    from validb.datasources._plans import parse_mysql_plan, parse_postgresql_plan
+
+    mysql_plan = {
+        "query_block": {
+            "cost_info": {"query_cost": "12.5"},
+            "nested_loop": [
+                {"table": {"rows_examined_per_scan": 10}},
+                {"table": {"rows_examined_per_scan": 5}},
+            ],
+        }
+    }
+    # the second table is scanned once for each row of the first one
+    assert parse_mysql_plan(mysql_plan) == QueryEstimate(rows=60.0, cost=12.5)
+    assert parse_postgresql_plan([{"Plan": {"Plan Rows": 7, "Total Cost": 3.25}}]) == (
+        QueryEstimate(rows=7.0, cost=3.25)
+    )
+
+
+def test_mysql_nested_loop_is_estimated_by_running_products():
+    from validb.datasources._plans import parse_mysql_plan
+
+    def table(examined: float, produced: float, **others: t.Any) -> t.Any:
+        return {
+            "table": {
+                "rows_examined_per_scan": examined,
+                "rows_produced_per_join": produced,
+                **others,
+            }
+        }
+
+    # an unindexed join of 1000 x 1000 rows filtered to 100 rows of the first table
+    unindexed = {
+        "query_block": {
+            "nested_loop": [table(1000, 100), table(1000, 100000)],
+        }
+    }
+    assert parse_mysql_plan(unindexed).rows == 1000 + 100 * 1000
+
+    # the rows of a derived table are examined once
+    derived = {
+        "query_block": {
+            "nested_loop": [
+                table(
+                    10,
+                    10,
+                    materialized_from_subquery={
+                        "query_block": {"table": {"rows_examined_per_scan": 500}}
+                    },
+                ),
+                table(1, 10),
+            ],
+        }
+    }
+    assert parse_mysql_plan(derived).rows == 10 + 500 + 10 * 1
+
+    assert parse_mysql_plan({"query_block": {"message": "No tables used"}}).rows is None
+
+
+def test_postgresql_rows_are_the_largest_scan():
+    from validb.datasources._plans import parse_postgresql_plan
+
+    def node(node_type: str, rows: float, *children: t.Any) -> t.Any:
+        return {"Node Type": node_type, "Plan Rows": rows, "Plans": list(children)}
+
+    # SELECT COUNT(*) FROM t: one output row from a full scan
+    count = node("Aggregate", 1, node("Seq Scan", 100000))
+    assert parse_postgresql_plan([{"Plan": count}]).rows == 100000
+
+    # the inner scan is repeated for each row of the outer scan
+    join = node("Nested Loop", 50, node("Seq Scan", 200), node("Index Scan", 3))
+    assert parse_postgresql_plan([{"Plan": join}]).rows == 200 * 3
+
+    assert parse_postgresql_plan([{"Plan": node("Result", 1)}]).rows == 1
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from validb import validate_db
+from validb.datasources import DataSources
+
+from tests.helpers import RecordingDataSource, StaticRule
+
+
+def test_datasources_are_opened_on_first_access():
+    a, b = RecordingDataSource(), RecordingDataSource()
+    with DataSources({"a": a, "b": b}) as datasources:
+        assert a.opened == 0
+        assert datasources["a"] is a
+        assert datasources["a"] is a
+        assert sorted(datasources.names()) == ["a", "b"]
+
+    assert (a.opened, a.closed) == (1, 1)
+    assert (b.opened, b.closed) == (0, 0)
+
+
+def test_open_in_parallel():
+    children = {name: RecordingDataSource(delay=0.2) for name in ("a", "b", "c")}
+    datasources = DataSources(dict(children))
+
+    started = time.perf_counter()
+    datasources.open(["a", "b", "c", "a", "unknown"])
+    elapsed = time.perf_counter() - started
+
+    assert all(child.opened == 1 for child in children.values())
+    assert len(set().union(*(child.threads for child in children.values()))) == 3
+    assert elapsed < 0.5
+    datasources.close()
+
+
+def test_connect_seconds_of_connected_datasources(sqlite_path: str):
+    from validb.datasources.dbapi import DBAPIDataSource
+
+    connected = DBAPIDataSource(driver="sqlite3", database=sqlite_path)
+    opened_only = DBAPIDataSource(driver="sqlite3", database=sqlite_path)
+    unopened = DBAPIDataSource(driver="sqlite3", database=sqlite_path)
+    datasources = DataSources(
+        {"connected": connected, "opened_only": opened_only, "unopened": unopened}
+    )
+    datasources.open(["connected", "opened_only"])
+    assert datasources.connect_seconds() == {}
+
+    with connected.connection():
+        pass
+    seconds = datasources.connect_seconds()
+    assert list(seconds) == ["connected"]
+    assert seconds["connected"] > 0
+    # only the first connection is timed
+    with connected.connection(), connected.connection():
+        pass
+    assert datasources.connect_seconds() == seconds
+    datasources.close()
+
+
+def test_validate_db_opens_only_datasources_of_rules():
+    used, unused = RecordingDataSource(), RecordingDataSource()
+    with DataSources({"used": used, "unused": unused}) as datasources:
+        validate_db(
+            rules=[StaticRule("A", ["1"], datasource="used")],
+            datasources=datasources,
+            embedders={},
+        )
+        assert used.opened == 1
+        assert unused.opened == 0
+
+
+def test_sqlalchemy_engine_is_created_on_use(sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+
+    datasource = SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}", warm_up=False)
+    replica = datasource._router.replicas[0]
+    with DataSources({"db": datasource}) as datasources:
+        assert replica._engine is None
+        datasources["db"]
+        assert replica._engine is None
+        with datasource.query("SELECT count(*) FROM country") as result:
+            assert result.scalar() == 5
+        assert replica._engine is not None
+    assert replica._engine is None
+
+
+def test_sqlalchemy_warm_up_connects_when_opened(sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+
+    datasource = SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}", warm_up=True)
+    with DataSources({"db": datasource}) as datasources:
+        datasources.open(["db"])
+        engine = datasource._router.replicas[0]._engine
+        assert engine is not None
+        assert engine.pool.checkedin() == 1
+
+
+def test_sqlalchemy_connect_seconds(sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+
+    lazy = SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")
+    warm = SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}", warm_up=True)
+    with DataSources({"lazy": lazy, "warm": warm}) as datasources:
+        datasources.open(["lazy", "warm"])
+        assert lazy.connect_seconds is None
+        assert warm.connect_seconds is not None and warm.connect_seconds > 0
+
+        with lazy.query("SELECT count(*) FROM country") as result:
+            assert result.scalar() == 5
+        assert lazy.connect_seconds is not None and lazy.connect_seconds > 0
+        assert sorted(datasources.connect_seconds()) == ["lazy", "warm"]
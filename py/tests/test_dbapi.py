@@ -0,0 +1,260 @@
+import json
+import sqlite3
+import types
+import typing as t
+
+import pytest
+
+from validb import (
+    CostBudget,
+    CostGuard,
+    CostGuardAction,
+    DataSources,
+    RuleExecution,
+    RuleOutcome,
+    validate_db,
+)
+from validb._execution import executing
+from validb.datasources import QueryEstimate
+from validb.datasources.dbapi import ColumnIndex, DBAPIDataSource
+from validb.rules.dbapi import SimpleDBAPIRule
+
+from tests.helpers import COUNTRIES, StaticRule
+
+
+def dbapi_rule(**kwargs: t.Any) -> SimpleDBAPIRule:
+    return SimpleDBAPIRule(
+        **{
+            "sql": (
+                "SELECT Code, SurfaceArea, Population FROM country"
+                " WHERE SurfaceArea < Population ORDER BY Code"
+            ),
+            "id": "{Code}",
+            "detection_type": "TOO_SMALL",
+            "msg": "too small!; SurfaceArea={1}, Population={Population}",
+            "datasource": "db",
+            **kwargs,
+        }
+    )
+
+
+def test_rows_are_read_by_column_name(sqlite_path: str):
+    with DataSources(
+        {"db": DBAPIDataSource(driver="sqlite3", database=sqlite_path, arraysize=2)}
+    ) as datasources:
+        data = validate_db(rules=[dbapi_rule()], datasources=datasources, embedders={})
+
+    assert [(d.id, d.msg) for d in data.values()] == [
+        ("AAA", "too small!; SurfaceArea=100.0, Population=1000"),
+        ("CCC", "too small!; SurfaceArea=20.0, Population=300"),
+        ("EEE", "too small!; SurfaceArea=1.0, Population=50"),
+    ]
+    assert data.rule_results[0].rows == 3
+
+
+def test_connections_are_pooled(sqlite_path: str):
+    datasource = DBAPIDataSource(driver="sqlite3", database=sqlite_path, pool_size=1)
+    with datasource:
+        for _ in range(3):
+            with datasource.query("SELECT count(*) FROM country") as (columns, rows):
+                assert list(rows) == [(5,)]
+        assert len(datasource._connections) == 1
+    assert len(datasource._connections) == 0
+
+
+def test_query_is_interrupted_by_timeout(sqlite_path: str):
+    rule = dbapi_rule(
+        sql="WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) "
+        "SELECT x AS Code FROM c WHERE x < 0",
+        timeout=0.3,
+    )
+    with DataSources(
+        {"db": DBAPIDataSource(driver="sqlite3", database=sqlite_path)}
+    ) as datasources:
+        data = validate_db(rules=[rule], datasources=datasources, embedders={})
+
+    assert data.rule_results[0].outcome == RuleOutcome.TIMED_OUT
+
+
+def test_cancelling_a_finished_query_does_not_interrupt_the_pooled_connection(
+    sqlite_path: str,
+):
+    finished = RuleExecution(StaticRule("FINISHED"))
+    running = RuleExecution(StaticRule("RUNNING"))
+    datasource = DBAPIDataSource(
+        driver="sqlite3", database=sqlite_path, pool_size=1, arraysize=1
+    )
+    with datasource:
+        with executing(finished):
+            with datasource.query("SELECT Code FROM country") as (columns, rows):
+                assert len(list(rows)) == 5
+        assert finished._cancel_callbacks == []
+
+        with executing(running):
+            with datasource.query("SELECT Code FROM country") as (columns, rows):
+                first = next(rows)
+                # e.g. the watchdog of the finished rule
+                finished.cancel("timeout")
+                assert [first, *rows] == [(code,) for code, *_ in COUNTRIES]
+
+
+def test_column_index():
+    columns = ColumnIndex(["a", "b", "a"])
+    row = columns.mapping((1, 2, 3))
+
+    assert columns.names == ("a", "b", "a")
+    assert dict(row) == {"a": 1, "b": 2}
+
+
+class LazyDescriptionCursor:
+    """a cursor which describes the result after the first fetch
+
+    It behaves like named cursors of psycopg2.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor) -> None:
+        self._cursor = cursor
+        self._fetched = False
+
+    @property
+    def description(self) -> t.Any:
+        return self._cursor.description if self._fetched else None
+
+    def execute(self, *args: t.Any) -> None:
+        self._cursor.execute(*args)
+
+    def fetchmany(self, size: int) -> t.List[t.Any]:
+        self._fetched = True
+        return self._cursor.fetchmany(size)
+
+    def close(self) -> None:
+        self._cursor.close()
+
+
+class FakeConnection:
+    """a connection of sqlite3 whose cursors are `LazyDescriptionCursor`"""
+
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self._connection = connection
+
+    def cursor(self, name: t.Optional[str] = None) -> LazyDescriptionCursor:
+        return LazyDescriptionCursor(self._connection.cursor())
+
+    def rollback(self) -> None:
+        self._connection.rollback()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+def fake_driver(name: str, connect: t.Callable[[], t.Any]) -> types.SimpleNamespace:
+    return types.SimpleNamespace(
+        __name__=name, connect=lambda **kwargs: connect(), Error=sqlite3.Error
+    )
+
+
+@pytest.mark.parametrize("arraysize", [1, 2, 1000])
+def test_columns_described_after_first_fetch(sqlite_path: str, arraysize: int):
+    datasource = DBAPIDataSource(driver="sqlite3", arraysize=arraysize)
+    datasource._driver = fake_driver(
+        "psycopg2", lambda: FakeConnection(sqlite3.connect(sqlite_path))
+    )
+
+    with DataSources({"db": datasource}) as datasources:
+        data = validate_db(rules=[dbapi_rule()], datasources=datasources, embedders={})
+        with datasource.query("SELECT Code FROM country WHERE Code = 'ZZZ'") as (
+            columns,
+            rows,
+        ):
+            assert columns.names == ("Code",)
+            assert list(rows) == []
+
+    assert [d.id for d in data.values()] == ["AAA", "CCC", "EEE"]
+
+
+class PlanCursor:
+    def __init__(self, plan: t.Any) -> None:
+        self._plan = plan
+        self.executed: t.List[str] = []
+
+    def execute(self, sql: str) -> None:
+        self.executed.append(sql)
+
+    def fetchone(self) -> t.Any:
+        return (self._plan,)
+
+    def close(self) -> None:
+        pass
+
+
+class PlanConnection:
+    def __init__(self, cursor: PlanCursor) -> None:
+        self._cursor = cursor
+
+    def cursor(self) -> PlanCursor:
+        return self._cursor
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+MYSQL_PLAN = {
+    "query_block": {
+        "cost_info": {"query_cost": "1200.5"},
+        "table": {"rows_examined_per_scan": 10000},
+    }
+}
+
+
+@pytest.mark.parametrize(
+    "driver, plan, explain, expected",
+    [
+        (
+            "pymysql",
+            json.dumps(MYSQL_PLAN),
+            "EXPLAIN FORMAT=JSON",
+            QueryEstimate(rows=10000.0, cost=1200.5),
+        ),
+        (
+            "psycopg2",
+            [{"Plan": {"Plan Rows": 70, "Total Cost": 3.5}}],
+            "EXPLAIN (FORMAT JSON)",
+            QueryEstimate(rows=70.0, cost=3.5),
+        ),
+    ],
+)
+def test_explain(driver, plan, explain, expected):
+    cursor = PlanCursor(plan)
+    datasource = DBAPIDataSource(driver="sqlite3")
+    datasource._driver = fake_driver(driver, lambda: PlanConnection(cursor))
+
+    assert datasource.explain("SELECT a FROM t;") == expected
+    assert cursor.executed == [f"{explain} SELECT a FROM t"]
+
+
+def test_explain_of_unsupported_driver(sqlite_path: str):
+    assert (
+        DBAPIDataSource(driver="sqlite3", database=sqlite_path).explain("SELECT 1")
+        is None
+    )
+
+
+def test_cost_budget_is_enforced():
+    datasource = DBAPIDataSource(driver="sqlite3")
+    datasource._driver = fake_driver(
+        "pymysql", lambda: PlanConnection(PlanCursor(json.dumps(MYSQL_PLAN)))
+    )
+    rules = [
+        dbapi_rule(detection_type="LARGE", max_estimated_rows=100),
+        dbapi_rule(detection_type="ALLOWED", max_estimated_rows=100000),
+    ]
+
+    assert rules[0].estimate(
+        datasources=DataSources({"db": datasource})
+    ) == QueryEstimate(rows=10000.0, cost=1200.5)
+    guard = CostGuard(CostBudget(max_rows=1), action=CostGuardAction.SKIP)
+    violations = guard.check(rules, datasources=DataSources({"db": datasource}))
+    assert [rule.detection_type() for rule, _ in violations] == ["LARGE"]
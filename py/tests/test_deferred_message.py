@@ -0,0 +1,106 @@
+import datetime
+import typing as t
+
+import pytest
+
+from validb import DeferredMessage, EmbeddedVariables, TextDetected
+from validb.formatter import MessageFormatter, MessageTemplate
+
+
+class CountingTemplate(MessageTemplate):
+    def __init__(self, template: str) -> None:
+        super().__init__(template)
+        self.rendered = 0
+
+    def render(self, args: t.Sequence[t.Any], kwargs: t.Mapping[str, t.Any]) -> str:
+        self.rendered += 1
+        return super().render(args, kwargs)
+
+
+ARGS = ("AAA", 1000, None, 12.5)
+KWARGS = {
+    "Code": "AAA",
+    "Population": 1000,
+    "day": datetime.date(2026, 10, 19),
+    "items": [1, 2],
+}
+
+
+@pytest.mark.parametrize(
+    "template",
+    [
+        "plain text",
+        "{0}: Population={Population}, {2}, {3}",
+        "missing={missing}, {9}",
+        "{Population:>8}|{3:.3f}|{Code!r}|{day:%Y/%m/%d}",
+        "{items[1]} {day.year}",
+        "{3:{Population}}",
+        "{} and {}",
+        "{{escaped}} {Code}",
+    ],
+)
+def test_template_renders_as_formatter(template):
+    expected = MessageFormatter().vformat(template, ARGS, KWARGS)
+
+    assert MessageTemplate(template).render(ARGS, KWARGS) == expected
+
+
+def test_message_is_rendered_on_first_access():
+    template = CountingTemplate("{Code}: {Population}")
+    embedded_vars = EmbeddedVariables(ARGS, KWARGS)
+    detected = TextDetected(
+        "AAA", 0, "T", DeferredMessage(template, embedded_vars), embedded_vars
+    )
+
+    assert template.rendered == 0
+    assert detected.msg == "AAA: 1000"
+    assert detected.msg_str == "AAA: 1000"
+    assert template.rendered == 1
+
+
+def test_identical_messages_share_a_string():
+    template = MessageTemplate("population is {Population}")
+    messages = [
+        TextDetected(
+            str(i),
+            0,
+            "T",
+            DeferredMessage(template, EmbeddedVariables((), {"Population": 10**6})),
+            EmbeddedVariables((), {}),
+        ).msg
+        for i in range(2)
+    ]
+
+    assert messages[0] == "population is 1000000"
+    assert messages[0] is messages[1]
+
+
+def test_rule_renders_deferred_messages_as_eager_ones(sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    from validb import DataSources, validate_db
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+    from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+    def detections(defer_msg: bool) -> t.List[t.Tuple[str, t.Any, str]]:
+        rule = SimpleSQLAlchemyRule(
+            sql="SELECT Code, SurfaceArea, Population FROM country ORDER BY Code",
+            id="{Code}",
+            detection_type="T",
+            msg="too small!; SurfaceArea={1}, Population={Population:,}",
+            datasource="db",
+            defer_msg=defer_msg,
+        )
+        with DataSources(
+            {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+        ) as datasources:
+            data = validate_db(rules=[rule], datasources=datasources, embedders={})
+        return [(d.id, type(d._msg), d.msg) for d in data.values()]
+
+    deferred = detections(True)
+    eager = detections(False)
+    assert all(msg_type is DeferredMessage for _, msg_type, _ in deferred)
+    assert all(msg_type is str for _, msg_type, _ in eager)
+    assert [(id_, msg) for id_, _, msg in deferred] == [
+        (id_, msg) for id_, _, msg in eager
+    ]
+    assert eager[0][2] == "too small!; SurfaceArea=100.0, Population=1,000"
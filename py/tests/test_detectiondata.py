@@ -0,0 +1,83 @@
+import pytest
+
+from validb import DetectionData, EmbeddedVariables, TextDetected
+from validb._detectiondata import TooManyDetectionException
+
+NO_VARS = EmbeddedVariables((), {})
+
+
+def detected(id: str, detection_type: str, level: int = 0) -> TextDetected:
+    return TextDetected(id, level, detection_type, f"{detection_type} of {id}", NO_VARS)
+
+
+def test_max_detection_per_type_keeps_first_detections():
+    data = DetectionData(max_detection=None, max_detection_per_type=3)
+    data.extend(detected(f"a{i}", "A") for i in range(5))
+    data.extend(detected(f"b{i}", "B") for i in range(2))
+
+    assert [d.id for d in data["A"]] == ["a0", "a1", "a2"]
+    assert len(data["B"]) == 2
+    assert data.count == 5
+
+
+def test_max_detection_per_type_counts_exactly():
+    data = DetectionData(max_detection=None, max_detection_per_type=3)
+    data.extend(detected(f"a{i}", "A") for i in range(5))
+    data.extend(detected(f"b{i}", "B") for i in range(2))
+
+    assert data.count_of("A") == 5
+    assert data.count_of("B") == 2
+    assert data.count_of("C") == 0
+    assert data.total_count == 7
+    assert list(data.truncated_detection_types()) == ["A"]
+    assert list(data.detection_types()) == ["A", "B"]
+
+
+def test_max_detection_per_type_zero_only_counts():
+    data = DetectionData(max_detection=None, max_detection_per_type=0)
+    data.extend(detected(f"a{i}", "A") for i in range(2))
+
+    assert data.count == 0
+    assert data.total_count == 2
+    assert list(data.detection_types()) == ["A"]
+    assert list(data.truncated_detection_types()) == ["A"]
+    assert len(data["A"]) == 0
+    assert list(data.values()) == []
+
+
+def test_truncated_detection_types_creates_no_key():
+    data = DetectionData(max_detection=None, max_detection_per_type=0)
+    data.append(detected("a0", "A"))
+    list(data.truncated_detection_types())
+
+    assert list(data.truncated_detection_types()) == ["A"]
+    assert list(data.levels_detection_types()) == []
+
+
+def test_too_many_detection_leaves_no_phantom_type():
+    data = DetectionData(max_detection=2)
+    data.append(detected("a0", "A"))
+    data.append(detected("a1", "A"))
+    with pytest.raises(TooManyDetectionException):
+        data.append(detected("c0", "C"))
+
+    assert data.too_many_detection
+    assert list(data.detection_types()) == ["A"]
+    assert list(data.truncated_detection_types()) == []
+    assert data.count_of("C") == 0
+    assert data.total_count == 2
+    with pytest.raises(KeyError):
+        data["C"]
+
+
+def test_getitem_by_id_and_level_detection_type():
+    data = DetectionData(max_detection=None)
+    data.append(detected("x", "A", level=1))
+    data.append(detected("x", "B", level=0))
+    data.append(detected("y", "A", level=0))
+
+    assert [d.detection_type for d in data["x"]] == ["A", "B"]
+    assert [d.id for d in data[(1, "A")]] == ["x"]
+    assert list(data.levels_detection_types()) == [(1, "A"), (0, "B"), (0, "A")]
+    with pytest.raises(KeyError):
+        data[(2, "A")]
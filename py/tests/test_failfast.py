@@ -0,0 +1,89 @@
+import pytest
+
+from validb import DataSources, DetectionData, RuleOutcome, RuleResult, validate_db
+
+from tests.helpers import StaticRule
+
+
+def test_fail_fast_stops_before_lower_levels():
+    high = StaticRule("HIGH", ["x"], level=2)
+    low = StaticRule("LOW", ["y"], level=0)
+
+    data = validate_db(
+        rules=[low, high], datasources=DataSources(), embedders={}, fail_fast_level=2
+    )
+
+    assert data.failed_fast
+    assert low.executed == 0
+    assert list(data.detection_types()) == ["HIGH"]
+    assert [(r.rule, r.outcome, r.detail) for r in data.rule_results] == [
+        (high, RuleOutcome.FAILED_FAST, None),
+        (low, RuleOutcome.SKIPPED, "fail-fast"),
+    ]
+
+
+def test_detections_below_fail_fast_level_do_not_stop():
+    high = StaticRule("HIGH", ["x"], level=1)
+    low = StaticRule("LOW", ["y"], level=0)
+
+    data = validate_db(
+        rules=[low, high], datasources=DataSources(), embedders={}, fail_fast_level=2
+    )
+
+    assert not data.failed_fast
+    assert data.total_count == 2
+
+
+def test_fail_fast_cancels_running_rules():
+    fatal = StaticRule("FATAL", ["x"], level=1)
+    # it would stop the validation too, but it is cancelled before its first detection
+    slow = StaticRule("SLOW", [str(i) for i in range(1000)], level=1, delay=0.05)
+
+    data = validate_db(
+        # the slow rule is started first, so that it is running when it is cancelled
+        rules=[slow, fatal],
+        datasources=DataSources(),
+        embedders={},
+        fail_fast_level=1,
+        workers=2,
+    )
+
+    assert data.failed_fast
+    results = {r.rule.detection_type(): r for r in data.rule_results}
+    assert data.count_of("FATAL") == 1
+    # only the other rules are cancelled by the rule which failed fast
+    assert (results["FATAL"].outcome, results["FATAL"].detail) == (
+        RuleOutcome.FAILED_FAST,
+        None,
+    )
+    assert results["SLOW"].outcome == RuleOutcome.CANCELLED
+    assert results["SLOW"].detail == "fail-fast"
+    assert data.count_of("SLOW") == 0
+
+
+def test_cli_outputs_unfinished_rules(capsys):
+    pytest.importorskip("click")
+    from validb.__main__ import _output_unfinished
+
+    data: DetectionData[str, str, str] = DetectionData(max_detection=None)
+    for detection_type, outcome, detail in [
+        ("A", RuleOutcome.COMPLETED, None),
+        ("B", RuleOutcome.FAILED_FAST, None),
+        ("C", RuleOutcome.CANCELLED, "fail-fast"),
+        ("D", RuleOutcome.SKIPPED, "fail-fast"),
+        ("E", RuleOutcome.TIMED_OUT, "timeout"),
+        ("F", RuleOutcome.ABORTED, None),
+    ]:
+        data.add_rule_result(
+            RuleResult(StaticRule(detection_type), outcome, 1.5, 0, 0, detail=detail)
+        )
+
+    _output_unfinished(data, target="t")
+
+    assert capsys.readouterr().out.splitlines() == [
+        "Failed fast: t B (after 1.50s)",
+        "Cancelled: t C (fail-fast, after 1.50s)",
+        "Skipped: t D (fail-fast)",
+        "Timed out: t E (after 1.50s)",
+        "Aborted: t F (too many detections)",
+    ]
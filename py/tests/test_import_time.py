@@ -0,0 +1,89 @@
+"""Import time of validb, measured with `python -X importtime`.
+
+The time of a command is the total time of the modules it imports
+minus that of an empty command, taking the minimum of some repetitions to cut the noise.
+"""
+
+import os
+import pathlib
+import subprocess
+import sys
+import typing as t
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+REPEAT = 5
+
+IMPORT_BUDGET_MS = 30.0
+HELP_BUDGET_MS = 80.0
+
+# modules which `import validb` must not import
+LAZY_MODULES = (
+    "click",
+    "concurrent.futures",
+    "http.server",
+    "pandas",
+    "sqlalchemy",
+    "tracemalloc",
+    "urllib.request",
+    "validb._validate",
+    "yaml",
+)
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, *args],
+        check=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        env={
+            **os.environ,
+            "PYTHONPATH": str(ROOT / "src"),
+            "PYTHONDONTWRITEBYTECODE": "1",
+        },
+        timeout=60,
+    )
+
+
+def import_time_us(args: t.Sequence[str]) -> int:
+    """the total import time of a command in microseconds"""
+    total = 0
+    for line in run_python("-X", "importtime", *args).stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        # only the top-level imports,
+        # whose cumulative time includes those of nested ones
+        if not cumulative.strip().isdigit() or name.startswith("  "):
+            continue
+        total += int(cumulative)
+    return total
+
+
+def import_time_ms(args: t.Sequence[str]) -> float:
+    """the import time of a command on top of that of an empty one in milliseconds"""
+    baseline = min(import_time_us(["-c", "pass"]) for _ in range(REPEAT))
+    elapsed = min(import_time_us(args) for _ in range(REPEAT))
+    return (elapsed - baseline) / 1000
+
+
+def test_import_budget():
+    elapsed_ms = import_time_ms(["-c", "import validb"])
+    assert elapsed_ms <= IMPORT_BUDGET_MS
+
+
+def test_help_budget():
+    pytest.importorskip("click")
+    elapsed_ms = import_time_ms(["-m", "validb", "--help"])
+    assert elapsed_ms <= HELP_BUDGET_MS
+
+
+def test_import_does_not_import_lazy_modules():
+    completed = run_python("-c", "import sys, validb; print('\\n'.join(sys.modules))")
+    imported = set(completed.stdout.splitlines())
+    assert "validb" in imported
+    assert [module for module in LAZY_MODULES if module in imported] == []
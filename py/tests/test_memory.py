@@ -0,0 +1,286 @@
+import json
+import os
+import sys
+import threading
+import tracemalloc
+import typing as t
+
+import pytest
+
+from validb import (
+    MemoryProfiler,
+    RuleExecution,
+    RuleOutcome,
+    RuleResult,
+    validate_db,
+    validate_targets,
+)
+from validb import _memory
+from validb._memory import _stage_of, current_rss
+from validb.datasources import DataSources
+
+from tests.helpers import StaticRule
+
+MIB = 2**20
+
+
+class AllocatingRule(StaticRule):
+    """a rule holding a large buffer for a while, then releasing it"""
+
+    def __init__(self, detection_type: str, size: int, hold: float) -> None:
+        super().__init__(detection_type, ["1"])
+        self._size = size
+        self._hold = hold
+
+    def exec(self, *, datasources, detected, embedders):
+        buffer = bytearray(self._size)
+        # touch every page so that the buffer is resident
+        for i in range(0, self._size, 4096):
+            buffer[i] = 1
+        threading.Event().wait(self._hold)
+        del buffer
+        yield from super().exec(
+            datasources=datasources, detected=detected, embedders=embedders
+        )
+
+
+def test_current_rss():
+    assert current_rss() > MIB
+
+
+def test_current_rss_without_resource(monkeypatch):
+    def no_proc(*args: t.Any, **kwargs: t.Any) -> t.Any:
+        raise OSError("no /proc")
+
+    # as on Windows without psutil
+    monkeypatch.setattr(_memory, "open", no_proc, raising=False)
+    monkeypatch.setitem(sys.modules, "psutil", None)
+    monkeypatch.setitem(sys.modules, "resource", None)
+    assert current_rss() is None
+
+    profiler = MemoryProfiler(sampling_interval=0.01)
+    validate_db(
+        rules=[StaticRule("A", ["1"]), StaticRule("B", ["2"], delay=0.05)],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[profiler],
+    )
+    assert [(p.rss_delta, p.peak_rss_delta) for p in profiler.top()] == [
+        (None, None),
+        (None, None),
+    ]
+
+
+def test_rss_of_each_rule():
+    profiler = MemoryProfiler(sampling_interval=0.01)
+    rules = [StaticRule("A", ["1", "2"]), AllocatingRule("B", 64 * MIB, hold=0.2)]
+    validate_db(rules=rules, datasources=DataSources(), embedders={}, hooks=[profiler])
+
+    profiles = {profile.detection_type: profile for profile in profiler.profiles}
+    assert sorted(profiles) == ["A", "B"]
+    assert profiles["A"].fingerprint == rules[0].fingerprint()
+    assert profiles["A"].target is None
+    assert profiles["A"].traced_peak is None
+    assert profiles["A"].traced_by_stage == {}
+    # the peak of B is seen by the sampler though the buffer is released at the end
+    assert profiles["B"].peak_rss_delta >= 32 * MIB
+    assert profiles["B"].rss_delta < profiles["B"].peak_rss_delta
+    assert [profile.detection_type for profile in profiler.top(1)] == ["B"]
+
+
+def test_sampler_runs_only_during_validation():
+    profiler = MemoryProfiler(sampling_interval=0.01)
+    validate_db(
+        rules=[StaticRule("A", ["1"])],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[profiler],
+    )
+    assert profiler._state.sampler is None
+    assert not any(
+        thread.name == "validb-memory-sampler" for thread in threading.enumerate()
+    )
+
+
+def test_targets_share_profiles():
+    profiler = MemoryProfiler()
+    validate_targets(
+        targets={"a": DataSources(), "b": DataSources()},
+        rules=[StaticRule("A", ["1"])],
+        embedders={},
+        hooks=[profiler],
+    )
+    assert sorted(profile.target for profile in profiler.profiles) == ["a", "b"]
+    assert profiler._state.sampler is None
+
+
+def test_traced_rules():
+    assert not tracemalloc.is_tracing()
+    profiler = MemoryProfiler(trace_rate=1.0, top=3)
+    validate_db(
+        rules=[StaticRule("A", [str(i) for i in range(1000)])],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[profiler],
+    )
+
+    [profile] = profiler.profiles
+    assert profile.traced_peak is not None and profile.traced_peak > 0
+    # the detections are held by DetectionData at the end of the rule
+    assert profile.traced_by_stage.get("detection_data", 0) > 0
+    assert 0 < len(profile.top_allocations) <= 3
+    assert all(size > 0 for _, size in profile.top_allocations)
+    # tracing started by the profiler is stopped
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_started_by_others_is_kept():
+    tracemalloc.start()
+    try:
+        profiler = MemoryProfiler(trace_rate=1.0)
+        validate_db(
+            rules=[StaticRule("A", ["1"])],
+            datasources=DataSources(),
+            embedders={},
+            hooks=[profiler],
+        )
+        assert tracemalloc.is_tracing()
+        assert profiler.profiles[0].traced_peak is not None
+    finally:
+        tracemalloc.stop()
+
+
+def test_tracing_is_stopped_when_snapshot_fails(monkeypatch):
+    profiler = MemoryProfiler(trace_rate=1.0)
+    rule = StaticRule("A", ["1"])
+    execution = RuleExecution(rule)
+    profiler.run_started(datasources=DataSources())
+    profiler.rule_started(execution)
+    assert tracemalloc.is_tracing()
+
+    def fail() -> t.Any:
+        raise MemoryError()
+
+    monkeypatch.setattr(tracemalloc, "take_snapshot", fail)
+    with pytest.raises(MemoryError):
+        profiler.rule_finished(
+            execution, RuleResult(rule, RuleOutcome.COMPLETED, 0.0, 1, 1)
+        )
+    assert not tracemalloc.is_tracing()
+    with pytest.raises(MemoryError):
+        profiler.rule_started(RuleExecution(StaticRule("B", ["1"])))
+    assert not tracemalloc.is_tracing()
+
+
+def test_tracing_of_unfinished_rules_is_stopped():
+    profiler = MemoryProfiler(trace_rate=1.0)
+    profiler.run_started(datasources=DataSources())
+    profiler.rule_started(RuleExecution(StaticRule("A", ["1"])))
+    assert tracemalloc.is_tracing()
+
+    # rule_finished() is not called, e.g. since another hook failed
+    profiler.run_finished(t.cast(t.Any, None))
+    assert not tracemalloc.is_tracing()
+
+
+def test_trace_rate_chooses_rules():
+    profiler = MemoryProfiler(trace_rate=0.5, seed=1)
+    validate_db(
+        rules=[StaticRule(f"R{i}", ["1"]) for i in range(40)],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[profiler],
+    )
+    traced = [
+        profile for profile in profiler.profiles if profile.traced_peak is not None
+    ]
+    assert 0 < len(traced) < 40
+
+
+def test_report_is_json_serializable():
+    profiler = MemoryProfiler(trace_rate=1.0)
+    validate_db(
+        rules=[StaticRule("A", ["1"]), StaticRule("B", [])],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[profiler],
+    )
+    report = json.loads(json.dumps(profiler.report()))
+
+    assert report["trace_rate"] == 1.0
+    assert sorted(rule["detection_type"] for rule in report["rules"]) == ["A", "B"]
+    assert set(report["rules"][0]) == {
+        "target",
+        "detection_type",
+        "fingerprint",
+        "rss_delta",
+        "peak_rss_delta",
+        "traced_peak",
+        "traced_by_stage",
+        "top_allocations",
+    }
+
+
+@pytest.mark.parametrize(
+    "filename, stage",
+    [
+        ("/site-packages/validb/_detectiondata.py", "detection_data"),
+        ("/site-packages/validb/_embedded_vars.py", "embedded_vars"),
+        ("/site-packages/validb/formatter/_template.py", "messages"),
+        ("/site-packages/sqlalchemy/engine/result.py", "query_result"),
+        ("/site-packages/validb/datasources/dbapi/_datasource.py", "query_result"),
+        ("/app/rules.py", "other"),
+    ],
+)
+def test_stage_of(filename: str, stage: str):
+    assert _stage_of(filename.replace("/", os.sep)) == stage
+
+
+@pytest.mark.parametrize(
+    "kwargs, error",
+    [
+        ({"sampling_interval": 0}, "sampling_interval must be positive"),
+        ({"trace_rate": 1.5}, "trace_rate must be between 0 and 1"),
+        ({"trace_frames": 0}, "trace_frames must be positive"),
+    ],
+)
+def test_invalid_arguments(kwargs: t.Mapping[str, t.Any], error: str):
+    with pytest.raises(ValueError, match=error):
+        MemoryProfiler(**kwargs)
+
+
+def test_cli_memory_profile(tmp_path, sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("yaml")
+    pytest.importorskip("click")
+    from click.testing import CliRunner
+
+    from validb.__main__ import main
+    from tests.helpers import write_country_config
+
+    config_path = write_country_config(tmp_path / "validb.yml", sqlite_path)
+    report_path = tmp_path / "profile.json"
+    output = str(tmp_path / "out.csv")
+    runner = CliRunner()
+
+    result = runner.invoke(main, ["-c", config_path, "-D", output, "--memory-profile"])
+    assert result.exit_code != 0
+    assert "--profile-report is required" in result.output
+
+    result = runner.invoke(
+        main,
+        [
+            *("-c", config_path),
+            *("-D", output),
+            "--memory-profile",
+            *("--memory-trace-rate", "1"),
+            *("--profile-report", str(report_path)),
+        ],
+    )
+    assert "Rules using the most memory" in result.output, result.output
+    memory = json.loads(report_path.read_text())["memory"]
+    assert sorted(rule["detection_type"] for rule in memory["rules"]) == [
+        "NULL_YEAR",
+        "TOO_SMALL",
+    ]
+    assert all(rule["traced_peak"] is not None for rule in memory["rules"])
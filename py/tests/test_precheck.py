@@ -0,0 +1,86 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from validb import DataSources, RuleOutcome, validate_db
+from validb.datasources import DataSource
+from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+
+def rule(
+    detection_type: str, precheck: str, datasource: str = "db"
+) -> SimpleSQLAlchemyRule:
+    return SimpleSQLAlchemyRule(
+        sql="SELECT Code FROM country",
+        id="{Code}",
+        detection_type=detection_type,
+        msg="{Code}",
+        datasource=datasource,
+        precheck=precheck,
+    )
+
+
+@pytest.fixture
+def datasources(sqlite_path: str):
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+    ) as datasources:
+        yield datasources
+
+
+def test_evaluate_prechecks(datasources: DataSources):
+    passed = datasources["db"].evaluate_prechecks(
+        [
+            "SELECT COUNT(*) FROM country",
+            "SELECT COUNT(*) FROM country WHERE Population < 0",
+            "SELECT NULL",
+            "SELECT MAX(Code) FROM country",
+        ]
+    )
+
+    assert passed == [True, False, False, True]
+
+
+def test_evaluate_prechecks_one_by_one_when_batch_fails(datasources: DataSources):
+    # a pragma cannot be a subquery, so the batch fails
+    passed = datasources["db"].evaluate_prechecks(
+        [
+            "SELECT 1",
+            "PRAGMA user_version",
+            "SELECT Code FROM country WHERE Code = 'none'",
+        ]
+    )
+
+    assert passed == [True, False, False]
+
+
+def test_rules_are_skipped_by_prechecks(datasources: DataSources):
+    gated = rule("GATED", "SELECT COUNT(*) FROM country WHERE Population < 0")
+    passing = rule("PASSING", "SELECT COUNT(*) FROM country")
+
+    data = validate_db(rules=[gated, passing], datasources=datasources, embedders={})
+
+    assert list(data.detection_types()) == ["PASSING"]
+    results = {r.rule.detection_type(): r for r in data.rule_results}
+    assert results["GATED"].outcome == RuleOutcome.SKIPPED
+    assert results["GATED"].detail == "precheck"
+    assert results["PASSING"].outcome == RuleOutcome.COMPLETED
+
+
+class _NoPrecheckDataSource(DataSource):
+    def close(self):
+        pass
+
+
+def test_prechecks_unsupported_by_datasource_are_ignored(sqlite_path: str):
+    gated = rule("GATED", "SELECT 0", datasource="other")
+    with DataSources(
+        {
+            "db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}"),
+            "other": _NoPrecheckDataSource(),
+        }
+    ) as datasources:
+        from validb._validate import _failed_prechecks
+
+        assert _failed_prechecks([gated], datasources=datasources) == {}
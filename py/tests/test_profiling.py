@@ -0,0 +1,161 @@
+import json
+import typing as t
+
+import pytest
+
+from validb import (
+    DataSources,
+    Phase,
+    Profiler,
+    RuleExecution,
+    RuleResult,
+    ValidationHook,
+    validate_db,
+    validate_targets,
+)
+
+from tests.helpers import StaticRule, write_country_config
+
+
+class TimingsHook(ValidationHook):
+    def __init__(self) -> None:
+        self.timings: t.List[t.Any] = []
+
+    def rule_finished(self, execution: RuleExecution, result: RuleResult) -> None:
+        self.timings.append(execution.timings)
+
+
+def test_phases_of_each_rule():
+    profiler = Profiler()
+    rules = [
+        StaticRule("SLOW", [str(i) for i in range(5)], delay=0.02),
+        StaticRule("FAST", ["1"]),
+    ]
+
+    validate_db(rules=rules, datasources=DataSources(), embedders={}, hooks=[profiler])
+
+    profiles = {profile.detection_type: profile for profile in profiler.profiles}
+    slow = profiles["SLOW"]
+    assert (slow.rows, slow.detections, slow.outcome) == (5, 5, "COMPLETED")
+    assert slow.fingerprint == rules[0].fingerprint()
+    assert slow.target is None
+    assert set(slow.phases) == set(Phase)
+    # the delay of the rule is spent reading rows
+    assert slow.phases[Phase.FETCH] >= 0.09
+    assert sum(slow.phases.values()) == pytest.approx(slow.elapsed)
+    assert slow.rows_per_sec == pytest.approx(5 / slow.elapsed)
+    assert [profile.detection_type for profile in profiler.top(1)] == ["SLOW"]
+
+
+def test_timings_are_disabled_without_profiler():
+    hook = TimingsHook()
+
+    validate_db(
+        rules=[StaticRule("A", ["1"])],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[hook],
+    )
+
+    assert hook.timings == [None]
+
+
+def test_query_time_of_datasource(sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+    from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+    profiler = Profiler()
+    rule = SimpleSQLAlchemyRule(
+        sql="SELECT Code FROM country",
+        id="{Code}",
+        detection_type="ALL",
+        msg="{Code}",
+        datasource="db",
+    )
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+    ) as datasources:
+        validate_db(
+            rules=[rule], datasources=datasources, embedders={}, hooks=[profiler]
+        )
+
+    (profile,) = profiler.profiles
+    assert profile.phases[Phase.QUERY] > 0
+    assert profile.phases[Phase.FORMAT] > 0
+    assert profile.phases[Phase.SINK] > 0
+
+
+def test_profiles_are_labeled_with_targets():
+    profiler = Profiler()
+
+    validate_targets(
+        targets={"a": DataSources(), "b": DataSources()},
+        rules=[StaticRule("A", ["1"])],
+        embedders={},
+        hooks=[profiler],
+    )
+
+    assert sorted(profile.target for profile in profiler.profiles) == ["a", "b"]
+
+
+def test_report(tmp_path):
+    profiler = Profiler()
+    validate_db(
+        rules=[StaticRule("A", ["1", "2"]), StaticRule("B", [], delay=0.01)],
+        datasources=DataSources(),
+        embedders={},
+        hooks=[profiler],
+    )
+    with profiler.measure_output("csv"):
+        pass
+    with profiler.measure_output("csv"):
+        pass
+
+    path = tmp_path / "profile.json"
+    profiler.write_report(str(path))
+    report = json.loads(path.read_text())
+
+    assert set(report["phases"]) == {phase.value for phase in Phase}
+    assert list(report["output"]) == ["csv"]
+    assert [rule["detection_type"] for rule in report["rules"]] == [
+        profile.detection_type for profile in profiler.top()
+    ]
+    assert {rule["detection_type"]: rule["detections"] for rule in report["rules"]} == {
+        "A": 2,
+        "B": 0,
+    }
+
+
+def test_cli_profile_report(tmp_path, sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("yaml")
+    pytest.importorskip("click")
+    from click.testing import CliRunner
+
+    from validb.__main__ import main
+
+    config_path = write_country_config(tmp_path / "validb.yml", sqlite_path)
+    report_path = tmp_path / "profile.json"
+
+    result = CliRunner().invoke(
+        main,
+        [
+            "-c",
+            config_path,
+            "-D",
+            str(tmp_path / "out.csv"),
+            "--profile-report",
+            str(report_path),
+            "--profile-top",
+            "1",
+        ],
+    )
+
+    assert "Slowest rules" in result.output, result.output
+    report = json.loads(report_path.read_text())
+    assert sorted(rule["detection_type"] for rule in report["rules"]) == [
+        "NULL_YEAR",
+        "TOO_SMALL",
+    ]
+    assert "csv" in report["output"]
@@ -0,0 +1,82 @@
+import sqlite3
+import typing as t
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+
+
+@pytest.fixture
+def replica_urls(tmp_path) -> t.List[str]:
+    """three SQLite databases, each knowing its own name and replication lag"""
+    urls = []
+    for name, lag in (("r0", 0.0), ("r1", 100.0), ("r2", 1.0)):
+        path = tmp_path / f"{name}.sqlite"
+        with sqlite3.connect(path) as connection:
+            connection.execute("CREATE TABLE replica (name text, lag real)")
+            connection.execute("INSERT INTO replica VALUES (?, ?)", (name, lag))
+        connection.close()
+        urls.append(f"sqlite:///{path}")
+    return urls
+
+
+def replica_name(datasource: SQLAlchemyDataSource) -> str:
+    with datasource.query("SELECT name FROM replica") as result:
+        return result.scalar()
+
+
+def test_round_robin(replica_urls):
+    datasource = SQLAlchemyDataSource(url="sqlite://", replicas=replica_urls)
+    with datasource:
+        names = [replica_name(datasource) for _ in range(6)]
+    assert names == ["r0", "r1", "r2", "r0", "r1", "r2"]
+
+
+def test_least_busy_avoids_replicas_running_queries(replica_urls):
+    datasource = SQLAlchemyDataSource(
+        url="sqlite://", replicas=replica_urls[:2], routing="least_busy"
+    )
+    with datasource:
+        with datasource.query("SELECT name FROM replica", dedicated=True) as running:
+            busy = running.scalar()
+            assert {replica_name(datasource) for _ in range(4)} == {"r0", "r1"} - {busy}
+
+
+def test_lag_aware_avoids_lagging_replicas(replica_urls):
+    datasource = SQLAlchemyDataSource(
+        url="sqlite://",
+        replicas=replica_urls,
+        routing="lag_aware",
+        lag_query="SELECT lag FROM replica",
+        max_lag=10.0,
+    )
+    with datasource:
+        names = {replica_name(datasource) for _ in range(6)}
+    assert names == {"r0", "r2"}
+
+
+def test_lag_aware_uses_least_lagging_replica_if_all_lag(replica_urls):
+    datasource = SQLAlchemyDataSource(
+        url="sqlite://",
+        replicas=replica_urls,
+        routing="lag_aware",
+        lag_query="SELECT lag FROM replica",
+        max_lag=0.5,
+    )
+    with datasource:
+        names = {replica_name(datasource) for _ in range(3)}
+    assert names == {"r0"}
+
+
+def test_primary_is_used_without_replicas(sqlite_path: str):
+    datasource = SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")
+    with datasource:
+        with datasource.query("SELECT count(*) FROM country") as result:
+            assert result.scalar() == 5
+
+
+def test_unknown_routing():
+    with pytest.raises(ValueError, match="routing must be one of"):
+        SQLAlchemyDataSource(url="sqlite://", routing="random")
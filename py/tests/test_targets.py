@@ -0,0 +1,213 @@
+import threading
+import time
+import typing as t
+
+import pytest
+
+from validb import validate_targets
+from validb.datasources import DataSource, DataSources
+
+from tests.helpers import RecordingDataSource, StaticRule, create_countries
+
+
+class CountingDataSource(DataSource):
+    """a datasource counting how many of its kind are open at once"""
+
+    lock = threading.Lock()
+    open_now = 0
+    max_open = 0
+
+    def __enter__(self) -> DataSource:
+        with self.lock:
+            CountingDataSource.open_now += 1
+            CountingDataSource.max_open = max(
+                CountingDataSource.max_open, CountingDataSource.open_now
+            )
+        return self
+
+    def close(self):
+        with self.lock:
+            CountingDataSource.open_now -= 1
+
+
+def test_each_target_is_validated_with_its_own_datasources():
+    targets = {
+        name: DataSources({"db": RecordingDataSource()}) for name in ("a", "b", "c")
+    }
+
+    results = validate_targets(
+        targets=targets,
+        rules=[StaticRule("A", ["1", "2"], datasource="db")],
+        embedders={},
+    )
+
+    assert list(results) == ["a", "b", "c"]
+    for name, result in results.items():
+        assert result.target == name
+        assert result.error is None
+        assert result.detection_data is not None
+        assert result.detection_data.count_of("A") == 2
+        datasource = targets[name]._datasources["db"]
+        assert (datasource.opened, datasource.closed) == (1, 1)
+
+
+def test_failing_target_does_not_stop_others():
+    targets = {
+        "ok": DataSources({"db": RecordingDataSource()}),
+        "down": DataSources({"db": RecordingDataSource(error=ConnectionError("down"))}),
+    }
+
+    results = validate_targets(
+        targets=targets,
+        rules=[StaticRule("A", ["1"], datasource="db")],
+        embedders={},
+    )
+
+    assert results["ok"].error is None
+    assert results["down"].detection_data is None
+    assert isinstance(results["down"].error, ConnectionError)
+
+
+def test_number_of_targets_holding_connections_is_bounded(monkeypatch):
+    monkeypatch.setattr(CountingDataSource, "open_now", 0)
+    monkeypatch.setattr(CountingDataSource, "max_open", 0)
+    targets = {str(i): DataSources({"db": CountingDataSource()}) for i in range(8)}
+
+    results = validate_targets(
+        targets=targets,
+        rules=[StaticRule("A", ["1", "2"], datasource="db", delay=0.02)],
+        embedders={},
+        max_workers=3,
+    )
+
+    assert all(result.error is None for result in results.values())
+    assert CountingDataSource.max_open == 3
+    assert CountingDataSource.open_now == 0
+
+
+def test_datasources_are_kept_open_if_requested():
+    datasource = RecordingDataSource()
+
+    validate_targets(
+        targets={"a": DataSources({"db": datasource})},
+        rules=[StaticRule("A", ["1"], datasource="db")],
+        embedders={},
+        close_datasources=False,
+    )
+
+    assert (datasource.opened, datasource.closed) == (1, 0)
+
+
+def test_config_templates_datasources_for_targets(tmp_path):
+    pytest.importorskip("yaml")
+    from validb.config._load import _compile_config
+
+    compiled = _compile_config(b"""
+datasources:
+  db:
+    class: "validb.{target}.DataSource"
+    url: "sqlite:///{target}_{suffix}.db"
+    connect_args:
+      path: ["{target}"]
+      # braces other than the placeholders are kept
+      pattern: "^[a-z]{3}$"
+      options: "{}"
+      json: '{"a": 1}'
+targets:
+  - name: a
+    suffix: x
+  - name: b
+    suffix: y
+""")
+
+    assert compiled["targets"] == {
+        "a": {
+            "db": {
+                "class": "validb.{target}.DataSource",
+                "url": "sqlite:///a_x.db",
+                "connect_args": {
+                    "path": ["a"],
+                    "pattern": "^[a-z]{3}$",
+                    "options": "{}",
+                    "json": '{"a": 1}',
+                },
+            }
+        },
+        "b": {
+            "db": {
+                "class": "validb.{target}.DataSource",
+                "url": "sqlite:///b_y.db",
+                "connect_args": {
+                    "path": ["b"],
+                    "pattern": "^[a-z]{3}$",
+                    "options": "{}",
+                    "json": '{"a": 1}',
+                },
+            }
+        },
+    }
+
+
+@pytest.mark.parametrize(
+    "targets, error",
+    [
+        (
+            "[{name: a, suffix: x}, {name: a, suffix: y}]",
+            r"targets\.\*\.name must be unique",
+        ),
+        ("[{suffix: x}]", r"must be a string or a mapping with 'name'"),
+        ("[{name: a, suffix: x}, b]", "cannot be templated for target b"),
+    ],
+)
+def test_config_rejects_invalid_targets(targets, error):
+    pytest.importorskip("yaml")
+    from validb.config._load import _compile_config
+
+    source = f"""
+datasources:
+  db:
+    class: validb.datasources.sqlalchemy.SQLAlchemyDataSource
+    url: "sqlite:///{{target}}_{{suffix}}.db"
+targets: {targets}
+"""
+    with pytest.raises(ValueError, match=error):
+        _compile_config(source.encode())
+
+
+def test_cli_reports_failed_targets(tmp_path):
+    pytest.importorskip("sqlalchemy")
+    pytest.importorskip("yaml")
+    pytest.importorskip("click")
+    from click.testing import CliRunner
+
+    from validb.__main__ import EXIT_TARGET_FAILED, main
+
+    create_countries(str(tmp_path / "a.db"))
+    create_countries(str(tmp_path / "b.db"))
+    # the database of target c has no table
+    (tmp_path / "c.db").touch()
+    config_path = tmp_path / "validb.yml"
+    config_path.write_text(f"""
+rules:
+  - class: validb.rules.sqlalchemy.SimpleSQLAlchemyRule
+    sql: "SELECT Code FROM country WHERE InDepYear IS NULL"
+    id: "{{Code}}"
+    detection_type: NULL_YEAR
+    msg: "null year; Code={{Code}}"
+    datasource: db
+datasources:
+  db:
+    class: validb.datasources.sqlalchemy.SQLAlchemyDataSource
+    url: "sqlite:///{tmp_path}/{{target}}.db"
+targets: [a, b, c]
+""")
+
+    result = CliRunner().invoke(
+        main, ["-c", str(config_path), "-j", "2", "-t", "a", "-t", "c"]
+    )
+
+    assert result.exit_code == EXIT_TARGET_FAILED, result.output
+    assert "Failed: c" in result.output
+    lines = result.output.splitlines()
+    assert any(line.split() == ["a", "2"] for line in lines)
+    assert not any(line.split()[:1] == ["b"] for line in lines)
@@ -0,0 +1,149 @@
+import threading
+
+import pytest
+
+from validb import DataSources, RuleExecution, RuleOutcome, validate_db
+from validb._execution import executing
+
+from tests.helpers import StaticRule
+
+
+def test_rule_exceeding_its_timeout_is_timed_out():
+    slow = StaticRule("SLOW", [str(i) for i in range(100)], delay=0.05, timeout=0.2)
+    fast = StaticRule("FAST", ["x"])
+
+    data = validate_db(rules=[slow, fast], datasources=DataSources(), embedders={})
+
+    results = {r.rule.detection_type(): r for r in data.rule_results}
+    assert results["SLOW"].outcome == RuleOutcome.TIMED_OUT
+    assert results["SLOW"].detail == "timeout"
+    assert 0 < data.count_of("SLOW") < 100
+    assert results["FAST"].outcome == RuleOutcome.COMPLETED
+
+
+def test_default_timeout_applies_to_rules_without_timeout():
+    slow = StaticRule("SLOW", [str(i) for i in range(100)], delay=0.05)
+    own = StaticRule("OWN", [str(i) for i in range(5)], delay=0.05, timeout=10.0)
+
+    data = validate_db(
+        rules=[slow, own], datasources=DataSources(), embedders={}, default_timeout=0.2
+    )
+
+    results = {r.rule.detection_type(): r for r in data.rule_results}
+    assert results["SLOW"].outcome == RuleOutcome.TIMED_OUT
+    assert results["OWN"].outcome == RuleOutcome.COMPLETED
+    assert data.count_of("OWN") == 5
+
+
+def test_cancel_calls_callbacks_once():
+    execution = RuleExecution(StaticRule("A"), timeout=1.0)
+    called = []
+    execution.on_cancel(lambda: called.append("registered"))
+
+    execution.cancel("timeout")
+    execution.cancel("fail-fast")
+    execution.on_cancel(lambda: called.append("late"))
+
+    assert execution.cancelled
+    assert execution.timed_out
+    assert execution.cancel_reason == "timeout"
+    assert called == ["registered", "late"]
+
+
+def test_removed_callback_is_not_called():
+    execution = RuleExecution(StaticRule("A"))
+    called = []
+    remove = execution.on_cancel(lambda: called.append("removed"))
+    execution.on_cancel(lambda: called.append("kept"))
+
+    remove()
+    remove()
+    execution.cancel("fail-fast")
+
+    assert called == ["kept"]
+
+
+class RaisingRule(StaticRule):
+    def exec(self, *, datasources, detected, embedders):
+        raise TypeError("the datasource is of another type")
+
+
+def test_rule_raising_before_its_first_detection_is_released():
+    with pytest.raises(TypeError, match="another type"):
+        validate_db(
+            rules=[RaisingRule("A", timeout=30.0)],
+            datasources=DataSources(),
+            embedders={},
+        )
+
+    # the watchdog of the timeout is cancelled
+    for thread in threading.enumerate():
+        if isinstance(thread, threading.Timer):
+            thread.join(1.0)
+            assert not thread.is_alive()
+
+
+@pytest.mark.parametrize("dedicated", [False, True])
+def test_query_canceller_is_removed_after_query(sqlite_path: str, dedicated: bool):
+    pytest.importorskip("sqlalchemy")
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+
+    execution = RuleExecution(StaticRule("A"))
+    called = []
+    execution.on_cancel(lambda: called.append("rule"))
+    with SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}") as datasource:
+        with executing(execution):
+            for _ in range(3):
+                with datasource.query(
+                    "SELECT Code FROM country", dedicated=dedicated
+                ) as result:
+                    assert len(execution._cancel_callbacks) == 2
+                    assert len(list(result)) == 5
+
+    assert len(execution._cancel_callbacks) == 1
+    execution.cancel("timeout")
+    assert called == ["rule"]
+
+
+def test_sqlite_query_is_interrupted(sqlite_path: str):
+    pytest.importorskip("sqlalchemy")
+    from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+    from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+    endless = SimpleSQLAlchemyRule(
+        sql="WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) "
+        "SELECT x AS Code FROM c WHERE x < 0",
+        id="{Code}",
+        detection_type="ENDLESS",
+        msg="{Code}",
+        datasource="db",
+        timeout=0.3,
+    )
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+    ) as datasources:
+        data = validate_db(rules=[endless], datasources=datasources, embedders={})
+
+    assert data.rule_results[0].outcome == RuleOutcome.TIMED_OUT
+
+
+def test_statement_timeout_hints():
+    pytest.importorskip("sqlalchemy")
+    from sqlalchemy.dialects import mysql, sqlite
+
+    from validb.datasources.sqlalchemy._datasource import _with_statement_timeout
+
+    mysql_dialect = mysql.dialect()
+    assert (
+        _with_statement_timeout("SELECT a FROM t", 1.5, mysql_dialect)
+        == "SELECT /*+ MAX_EXECUTION_TIME(1500) */ a FROM t"
+    )
+    mysql_dialect.is_mariadb = True
+    assert (
+        _with_statement_timeout("SELECT a FROM t", 1.5, mysql_dialect)
+        == "SET STATEMENT max_statement_time=1.5 FOR SELECT a FROM t"
+    )
+    assert (
+        _with_statement_timeout("SELECT a FROM t", 1.5, sqlite.dialect())
+        == "SELECT a FROM t"
+    )
@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from validb import DataSources, validate_db
+from validb.datasources.sqlalchemy import SQLAlchemyDataSource
+from validb.rules.sqlalchemy import SimpleSQLAlchemyRule
+
+
+def rule(
+    detection_type: str, sql: str = "SELECT Code FROM country"
+) -> SimpleSQLAlchemyRule:
+    return SimpleSQLAlchemyRule(
+        sql=sql,
+        id="{Code}",
+        detection_type=detection_type,
+        msg="{Code}",
+        datasource="db",
+    )
+
+
+def test_max_detection_per_type_runs_all_rules(sqlite_path: str):
+    with DataSources(
+        {"db": SQLAlchemyDataSource(url=f"sqlite:///{sqlite_path}")}
+    ) as datasources:
+        data = validate_db(
+            rules=[rule("ALL"), rule("TWO", "SELECT Code FROM country LIMIT 2")],
+            datasources=datasources,
+            embedders={},
+            max_detection_per_type=3,
+        )
+
+    assert data.count_of("ALL") == 5
+    assert len(data["ALL"]) == 3
+    assert data.count_of("TWO") == 2
+    assert data.total_count == 7
+    assert list(data.truncated_detection_types()) == ["ALL"]
+    assert not data.too_many_detection